@@ -0,0 +1,196 @@
+"""
+文章事件推送 (SSE) 的負載測試。
+
+以 uvicorn 啟動閘道，建立大量閒置的 /events/stream 連線，量測每個連線增加的常駐記憶體，
+再以簽章的 /webhook/article-events 發布事件，回報扇出延遲 (發布到每個連線收到) 的百分位數與送達率。
+
+用法 (在 fastapi/ 目錄下):
+    python -m benchmarks.bench_events --connections 2000 --events 20
+    python -m benchmarks.bench_events --connections 20000 --tenants 50 --output events.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from jose import jwt
+
+from benchmarks.bench_gateway import JWT_SECRET, free_port, git_commit, percentile, wait_ready
+from gateway.events import SIGNATURE_HEADER, sign_payload
+
+WEBHOOK_SECRET = "benchmark_webhook_secret"
+
+
+def rss_kib(pid: int) -> int:
+    """讀取程序的常駐記憶體 (KiB，僅限 Linux)。"""
+    with open(f"/proc/{pid}/status", encoding="ascii") as handle:
+        for line in handle:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def raise_file_limit(needed: int) -> int:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard if hard == resource.RLIM_INFINITY else min(hard, max(soft, needed))
+    if target > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return target
+
+
+class Listener:
+    """一個以原始 socket 讀取 SSE 的閒置連線 (比每個連線一個 httpx 客戶端便宜得多)。"""
+
+    def __init__(self, latencies: List[float]):
+        self.latencies = latencies
+        self.received = 0
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self, host: str, port: int, token: str) -> None:
+        reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(
+            f"GET /events/stream HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n".encode("ascii")
+        )
+        await self.writer.drain()
+        status = await reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(f"訂閱失敗: {status!r}")
+        await reader.readuntil(b"\r\n\r\n")
+        self.reader = reader
+
+    async def listen(self) -> None:
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    return
+                index = line.find(b'"sent_at":')
+                if index != -1:
+                    sent_at = float(line[index + 10:].split(b",")[0].split(b"}")[0])
+                    self.latencies.append(time.time() - sent_at)
+                    self.received += 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run(args: argparse.Namespace, host: str, port: int, gateway_pid: int) -> Dict[str, Any]:
+    tokens = [
+        jwt.encode({"sub": f"reader-{index}", "tenant_id": f"tenant-{index}", "exp": int(time.time()) + 3600}, JWT_SECRET, algorithm="HS256")
+        for index in range(args.tenants)
+    ]
+    latencies: List[float] = []
+    listeners = [Listener(latencies) for _ in range(args.connections)]
+    rss_before = rss_kib(gateway_pid)
+
+    start = time.perf_counter()
+    for offset in range(0, len(listeners), args.connect_batch):
+        batch = listeners[offset:offset + args.connect_batch]
+        await asyncio.gather(*(
+            listener.connect(host, port, tokens[(offset + index) % args.tenants]) for index, listener in enumerate(batch)
+        ))
+    connect_seconds = time.perf_counter() - start
+    listen_tasks = [asyncio.create_task(listener.listen()) for listener in listeners]
+    await asyncio.sleep(1.0) # 讓閘道端的記憶體穩定
+    rss_connected = rss_kib(gateway_pid)
+    print(f"{args.connections} 個連線已建立 ({connect_seconds:.1f} s)，閘道 RSS {rss_before / 1024:.1f} -> {rss_connected / 1024:.1f} MiB")
+
+    async with httpx.AsyncClient(base_url=f"http://{host}:{port}", timeout=30.0) as client:
+        publish_latencies = []
+        for index in range(args.events):
+            tenant = f"tenant-{index % args.tenants}"
+            body = json.dumps({"tenant_id": tenant, "article_id": str(index), "data": {"to": "published", "sent_at": time.time()}}).encode("utf-8")
+            headers = {SIGNATURE_HEADER: sign_payload(WEBHOOK_SECRET, body, int(time.time())), "Content-Type": "application/json"}
+            sent = time.perf_counter()
+            response = await client.post("/webhook/article-events", content=body, headers=headers)
+            response.raise_for_status()
+            publish_latencies.append(time.perf_counter() - sent)
+            await asyncio.sleep(args.interval)
+    await asyncio.sleep(2.0) # 等待最後的事件送達
+
+    expected = sum(
+        sum(1 for connection in range(args.connections) if connection % args.tenants == index % args.tenants)
+        for index in range(args.events)
+    )
+    for listener in listeners:
+        listener.close()
+    for task in listen_tasks:
+        task.cancel()
+
+    ordered, publish_ordered = sorted(latencies), sorted(publish_latencies)
+    return {
+        "connections": args.connections,
+        "tenants": args.tenants,
+        "events": args.events,
+        "connect_seconds": round(connect_seconds, 3),
+        "gateway_rss_mib": {"idle": round(rss_before / 1024, 1), "connected": round(rss_connected / 1024, 1)},
+        "rss_kib_per_connection": round((rss_connected - rss_before) / max(1, args.connections), 2),
+        "deliveries": {"expected": expected, "received": len(latencies), "ratio": round(len(latencies) / expected, 4) if expected else 0.0},
+        "fanout_latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+        "webhook_latency_ms": {"p50": round(percentile(publish_ordered, 0.50) * 1000, 3), "p99": round(percentile(publish_ordered, 0.99) * 1000, 3)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="文章事件推送 (SSE) 負載測試")
+    parser.add_argument("--connections", type=int, default=2000, help="閒置的 SSE 連線數")
+    parser.add_argument("--tenants", type=int, default=10, help="連線平均分配到的租戶數")
+    parser.add_argument("--events", type=int, default=20, help="發布的事件數 (依序輪流發給各租戶)")
+    parser.add_argument("--interval", type=float, default=0.05, help="每個事件之間的間隔秒數")
+    parser.add_argument("--connect-batch", type=int, default=500, help="同時建立的連線數")
+    parser.add_argument("--buffer-size", type=int, default=64)
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    args = parser.parse_args()
+
+    raise_file_limit(args.connections + 256)
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    host, port = "127.0.0.1", free_port()
+    env = {
+        **os.environ,
+        "JWT_SECRET_KEY": JWT_SECRET,
+        "GCP_TTS_API_KEY": "benchmark",
+        "SENTRY_DSN": "",
+        "WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "EVENTS_MAX_CONNECTIONS": str(args.connections + 1000),
+        "EVENTS_BUFFER_SIZE": str(args.buffer_size),
+        "EVENTS_REDIS_URL": "",
+        "TENANT_REGISTRY_SNAPSHOT_PATH": "",
+        "METRICS_MULTIPROC_DIR": "",
+    }
+    # 閘道程序同樣需要足夠的檔案描述符上限 (子程序繼承本程序提高後的限制)
+    gateway = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", host, "--port", str(port), "--backlog", str(max(2048, args.connect_batch * 2)),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=cwd,
+        env=env,
+    )
+    try:
+        wait_ready(f"http://{host}:{port}/", gateway)
+        result = asyncio.run(run(args, host, port, gateway.pid))
+    finally:
+        gateway.terminate()
+        gateway.wait(timeout=30)
+
+    result = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "git_commit": git_commit(), **result}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(result, handle, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+閘道的負載測試與延遲基準測試。
+
+啟動本地替身後端 (benchmarks.fake_laravel) 與以 uvicorn 執行的閘道，對每個腳本化工作負載
+分別經由閘道與直接呼叫替身後端發送相同的請求，回報 RPS、p50/p95/p99 延遲與閘道增加的延遲。
+結果以 JSON 輸出，可與上一個版本的結果比較以發現效能退步。
+
+工作負載：
+- crud_mix：讀取為主的文章 CRUD 混合 (70% GET、15% POST、10% PUT、5% DELETE)
+- search_burst：高並行的文章搜尋突發流量
+- graphql_fanout：每個請求包含多個操作的 GraphQL 陣列批次
+- large_export：低並行的大型報表匯出
+- tts_synthesis：不重複文本的語音合成 (快取未命中)
+
+用法 (在 fastapi/ 目錄下):
+    python -m benchmarks.bench_gateway --output results.json
+    python -m benchmarks.bench_gateway --workloads crud_mix,search_burst --latency-ms 20 --baseline previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from jose import jwt
+
+SCHEMA_VERSION = 1
+JWT_SECRET = "benchmark_jwt_secret_key_at_least_32_bytes"
+TENANT_ID = "bench"
+UNLIMITED_RATE = "1000000/minute"
+
+# (HTTP 方法, 閘道路徑, 直接呼叫替身後端的路徑, JSON 主體)
+RequestSpec = Tuple[str, str, str, Optional[Any]]
+
+
+@dataclass
+class Workload:
+    name: str
+    concurrency: int
+    requests: int
+    make_request: Callable[[int], RequestSpec]
+
+
+def _tenant(method: str, path: str, body: Optional[Any] = None) -> RequestSpec:
+    return method, f"/tenant-api/{path}", f"/tenant-routes/{path}", body
+
+
+def crud_mix(index: int) -> RequestSpec:
+    bucket = index % 20
+    if bucket < 14:
+        return _tenant("GET", f"articles/{index % 200}")
+    if bucket < 17:
+        return _tenant("POST", "articles", {"title": f"新文章 {index}", "content": "基準測試內容", "status": "draft"})
+    if bucket < 19:
+        return _tenant("PUT", f"articles/{index % 200}", {"title": f"更新的文章 {index}"})
+    return _tenant("DELETE", f"articles/{index % 200}")
+
+
+def search_burst(index: int) -> RequestSpec:
+    return _tenant("GET", f"articles/search?q=term{index % 50}")
+
+
+def graphql_fanout(index: int) -> RequestSpec:
+    operations = [
+        {"query": "query Articles($page: Int) { articles(page: $page) { id title } }", "variables": {"page": index * 5 + offset}}
+        for offset in range(5)
+    ]
+    return "POST", "/graphql", "/graphql", operations
+
+
+def large_export(index: int) -> RequestSpec:
+    return _tenant("GET", "reports/export")
+
+
+def tts_synthesis(index: int) -> RequestSpec:
+    text = f"基準測試第 {index} 段語音，時間 {time.time_ns()}。"
+    payload = {"input": {"text": text}, "voice": {"languageCode": "zh-TW", "name": "cmn-TW-Wavenet-A"}, "audioConfig": {"audioEncoding": "MP3"}}
+    return "POST", "/tts", "/v1/text:synthesize", {"gateway": {"text": text, "tenant_id": TENANT_ID}, "direct": payload}
+
+
+WORKLOADS: Dict[str, Workload] = {
+    workload.name: workload
+    for workload in [
+        Workload("crud_mix", concurrency=32, requests=2000, make_request=crud_mix),
+        Workload("search_burst", concurrency=128, requests=3000, make_request=search_burst),
+        Workload("graphql_fanout", concurrency=32, requests=1000, make_request=graphql_fanout),
+        Workload("large_export", concurrency=4, requests=100, make_request=large_export),
+        Workload("tts_synthesis", concurrency=16, requests=500, make_request=tts_synthesis),
+    ]
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], errors: int, elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "status_counts": statuses,
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+    }
+
+
+async def run_workload(client: httpx.AsyncClient, workload: Workload, target: str, headers: Dict[str, str], warmup: int) -> Dict[str, Any]:
+    """以 concurrency 個並行工作者的封閉迴圈送出 workload.requests 個請求 (前 warmup 個不計入)。"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    counter = iter(range(workload.requests + warmup))
+
+    async def send(index: int) -> None:
+        nonlocal errors
+        method, gateway_path, direct_path, body = workload.make_request(index)
+        if isinstance(body, dict) and "gateway" in body:
+            body = body[target]
+        path = gateway_path if target == "gateway" else direct_path
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body, headers=headers)
+            await response.aread()
+        except httpx.HTTPError:
+            if index >= warmup:
+                errors += 1
+            return
+        if index >= warmup:
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    async def worker() -> None:
+        for index in counter:
+            await send(index)
+
+    for index in range(warmup): # 暖機 (建立連線、填入 JIT 與解析快取)
+        await send(index)
+    counter = iter(range(warmup, workload.requests + warmup))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workload.concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - start)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} 的程序已結束 (exit code {process.returncode})")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"等待 {url} 就緒逾時")
+
+
+def gateway_environment(backend_url: str, args: argparse.Namespace) -> Dict[str, str]:
+    env = {
+        **os.environ,
+        "LARAVEL_BACKEND_BASE_URL": backend_url,
+        "LARAVEL_GRAPHQL_URL": f"{backend_url}/graphql",
+        "GCP_TTS_URL": f"{backend_url}/v1/text:synthesize",
+        "GCP_TTS_API_KEY": "benchmark",
+        "JWT_SECRET_KEY": JWT_SECRET,
+        "SENTRY_DSN": "",
+        "RATE_LIMIT_BACKEND": "memory",
+        "RATE_LIMIT_TENANT_API": UNLIMITED_RATE,
+        "RATE_LIMIT_TENANT_API_PER_TENANT": UNLIMITED_RATE,
+        "RATE_LIMIT_GRAPHQL": UNLIMITED_RATE,
+        "RATE_LIMIT_GRAPHQL_PER_TENANT": UNLIMITED_RATE,
+        "RATE_LIMIT_TTS": UNLIMITED_RATE,
+        "TENANT_TIER_LIMITS": "standard=1000:1", # 單一基準測試租戶不受租戶並行上限影響
+        "TENANT_ADMISSION_MAX_IN_FLIGHT": "1000",
+        "TENANT_REGISTRY_SNAPSHOT_PATH": "",
+        "METRICS_MULTIPROC_DIR": "",
+        "TTS_CACHE_DIR": "",
+    }
+    if args.disable_caches:
+        env.update({"RESPONSE_CACHE_ENABLED": "false", "SINGLEFLIGHT_ENABLED": "false", "TTS_CACHE_ENABLED": "false"})
+    for item in args.gateway_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """比較閘道的 RPS 與 p95 延遲，返回超過容許退步比例的項目。"""
+    regressions = []
+    for name, current in results["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if previous is None:
+            continue
+        now, before = current["gateway"], previous["gateway"]
+        if before["rps"] and now["rps"] < before["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: RPS {before['rps']} -> {now['rps']}")
+        if before["latency_ms"]["p95"] and now["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before['latency_ms']['p95']} ms -> {now['latency_ms']['p95']} ms")
+    return regressions
+
+
+async def run(args: argparse.Namespace, gateway_url: str, backend_url: str) -> Dict[str, Any]:
+    token = jwt.encode({"sub": "bench-user", "tenant_id": TENANT_ID, "exp": int(time.time()) + 3600}, JWT_SECRET, algorithm="HS256")
+    gateway_headers = {"Authorization": f"Bearer {token}", "X-Tenant-ID": TENANT_ID, "Accept": "application/json"}
+    limits = httpx.Limits(max_connections=512, max_keepalive_connections=512)
+    results: Dict[str, Any] = {}
+    async with httpx.AsyncClient(base_url=gateway_url, limits=limits, timeout=60.0) as gateway, \
+            httpx.AsyncClient(base_url=backend_url, limits=limits, timeout=60.0) as direct:
+        for name in args.workloads.split(","):
+            workload = WORKLOADS[name.strip()]
+            if args.scale != 1.0:
+                workload = Workload(workload.name, workload.concurrency, max(1, int(workload.requests * args.scale)), workload.make_request)
+            direct_stats = await run_workload(direct, workload, "direct", {}, args.warmup)
+            gateway_stats = await run_workload(gateway, workload, "gateway", gateway_headers, args.warmup)
+            overhead = {
+                key: round(gateway_stats["latency_ms"][key] - direct_stats["latency_ms"][key], 3)
+                for key in ("p50", "p95", "p99")
+            }
+            results[workload.name] = {
+                "concurrency": workload.concurrency,
+                "gateway": gateway_stats,
+                "direct": direct_stats,
+                "overhead_ms": overhead,
+            }
+            print(
+                f"{workload.name:<16} gateway {gateway_stats['rps']:>9,.1f} rps "
+                f"p50 {gateway_stats['latency_ms']['p50']:8.2f} p95 {gateway_stats['latency_ms']['p95']:8.2f} p99 {gateway_stats['latency_ms']['p99']:8.2f} ms | "
+                f"direct {direct_stats['rps']:>9,.1f} rps | overhead p50 {overhead['p50']:+.2f} ms p99 {overhead['p99']:+.2f} ms "
+                f"| errors {gateway_stats['errors']}"
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="閘道負載測試 (本地替身後端)")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="逗號分隔的工作負載名稱")
+    parser.add_argument("--scale", type=float, default=1.0, help="每個工作負載請求數的倍率")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="替身後端的平均延遲")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--articles", type=int, default=50, help="列表與搜尋返回的文章數")
+    parser.add_argument("--article-bytes", type=int, default=1500)
+    parser.add_argument("--export-articles", type=int, default=2000)
+    parser.add_argument("--gateway-workers", type=int, default=1)
+    parser.add_argument("--disable-caches", action="store_true", help="停用響應快取與請求合併，只量測代理本身的成本")
+    parser.add_argument("--gateway-env", action="append", default=[], metavar="KEY=VALUE", help="覆寫閘道設定")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    parser.add_argument("--baseline", help="與先前的 JSON 結果比較，退步超過 --max-regression 時以非零狀態結束")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    backend_port, gateway_port = free_port(), free_port()
+    backend_url, gateway_url = f"http://127.0.0.1:{backend_port}", f"http://127.0.0.1:{gateway_port}"
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_laravel", "--port", str(backend_port), "--latency-ms", str(args.latency_ms),
+         "--jitter-ms", str(args.jitter_ms), "--articles", str(args.articles), "--article-bytes", str(args.article_bytes),
+         "--export-articles", str(args.export_articles)],
+        cwd=cwd,
+    )
+    gateway = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(gateway_port),
+         "--workers", str(args.gateway_workers), "--log-level", "warning", "--no-access-log"],
+        cwd=cwd,
+        env=gateway_environment(backend_url, args),
+    )
+    try:
+        wait_ready(f"{backend_url}/up", backend)
+        wait_ready(f"{gateway_url}/", gateway)
+        workloads = asyncio.run(run(args, gateway_url, backend_url))
+    finally:
+        for process in (gateway, backend):
+            process.terminate()
+            process.wait(timeout=10)
+
+    results = {
+        "schema_version": SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("latency_ms", "jitter_ms", "articles", "article_bytes", "export_articles", "gateway_workers", "disable_caches", "scale", "gateway_env")
+        },
+        "workloads": workloads,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+代理 JSON 響應的 CPU 成本基準測試 (大型文章列表)。
+
+比較每個請求的處理方式：
+- 舊版：標準庫解碼後再以 JSONResponse 重新編碼 (JSONResponse(content=response.json()))
+- 各個可用的 JSON 實作 (orjson / msgspec / 標準庫) 解碼再編碼
+- 原始位元組：上游已是 JSON 時直接轉發，不解碼也不重新編碼
+
+用法 (在 fastapi/ 目錄下): python -m benchmarks.bench_json [文章數]
+"""
+import json
+import sys
+import time
+
+from starlette.responses import JSONResponse
+
+from gateway.jsoncodec import FastJSONResponse, available_codecs, configure, raw_json_response
+
+REPEAT = 5
+
+
+def article_payload(count: int) -> bytes:
+    articles = [
+        {
+            "id": index,
+            "title": f"第 {index} 篇文章：多租戶內容平台的效能調校",
+            "slug": f"article-{index}",
+            "status": "published" if index % 3 else "draft",
+            "content": "OrbitPress 的文章內容，包含中英文混合的段落。" * 40,
+            "tags": ["performance", "gateway", "laravel"],
+            "author": {"id": index % 17, "name": f"作者 {index % 17}"},
+            "views": index * 37,
+            "rating": index % 5 + 0.5,
+            "published_at": "2024-05-01T08:00:00Z",
+        }
+        for index in range(count)
+    ]
+    return json.dumps({"data": articles, "meta": {"total": count, "page": 1}}, ensure_ascii=False).encode("utf-8")
+
+
+def cpu_per_call(fn, number: int) -> float:
+    """以進程 CPU 時間 (而非牆鐘時間) 量測，返回每次呼叫的最佳秒數。"""
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.process_time()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.process_time() - start) / number)
+    return best
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    body = article_payload(count)
+    number = max(5, 2_000_000 // len(body))
+    print(f"payload: {count} articles, {len(body) / 1024:,.0f} KiB, {number} requests per run")
+
+    results = [("stdlib decode + JSONResponse (舊版)", cpu_per_call(lambda: JSONResponse(content=json.loads(body)), number))]
+    for codec in available_codecs():
+        configure(codec.name)
+        results.append((f"{codec.name} decode + encode", cpu_per_call(lambda: FastJSONResponse(content=codec.loads(body)), number)))
+    configure("auto")
+    results.append(("raw bytes passthrough", cpu_per_call(lambda: raw_json_response(body), number)))
+
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"{name:<38} {seconds * 1e3:9.3f} ms CPU/request {baseline / seconds:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+指標觀測成本的微基準測試。
+
+比較舊版以排序標籤並組合字串鍵的字典實作，與 gateway.metrics 的標籤元組子指標，
+每次模擬一個請求 (一次計數器遞增加一次直方圖觀測)。
+
+用法 (在 fastapi/ 目錄下): python -m benchmarks.bench_metrics
+"""
+import timeit
+
+from gateway.metrics import MetricsRegistry
+
+ITERATIONS = 200_000
+
+# 舊版實作 (main.py 中原本的 increment_counter / observe_histogram)
+request_count = {}
+request_duration_sum = {}
+request_duration_count = {}
+
+
+def increment_counter(metric_name, labels=None):
+    label_suffix = ""
+    if labels:
+        sorted_labels = sorted(labels.items())
+        label_suffix = "_" + "_".join(f"{k}_{v}" for k, v in sorted_labels)
+    key = metric_name + label_suffix
+    request_count[key] = request_count.get(key, 0) + 1
+
+
+def observe_histogram(metric_name, value, labels=None):
+    label_suffix = ""
+    if labels:
+        sorted_labels = sorted(labels.items())
+        label_suffix = "_" + "_".join(f"{k}_{v}" for k, v in sorted_labels)
+    key = metric_name + label_suffix
+    request_duration_sum[key] = request_duration_sum.get(key, 0) + value
+    request_duration_count[key] = request_duration_count.get(key, 0) + 1
+
+
+def legacy_request():
+    increment_counter("fastapi_http_requests_total", {"method": "GET", "path": "/tenant-api/articles", "status": "200"})
+    observe_histogram("fastapi_request_duration_seconds", 0.042, {"method": "GET", "path": "/tenant-api/articles"})
+
+
+registry = MetricsRegistry()
+HTTP_REQUESTS = registry.counter("fastapi_http_requests_total", "請求總數。", ("method", "path", "status"))
+HTTP_REQUEST_DURATION = registry.histogram("fastapi_request_duration_seconds", "請求持續時間 (秒)。", ("method", "path"))
+
+
+def registry_request():
+    HTTP_REQUESTS.labels("GET", "/tenant-api/articles", "200").inc()
+    HTTP_REQUEST_DURATION.labels("GET", "/tenant-api/articles").observe(0.042)
+
+
+def populate(series: int) -> None:
+    for index in range(series):
+        path = f"/tenant-api/route-{index}"
+        HTTP_REQUESTS.labels("GET", path, "200").inc()
+        HTTP_REQUEST_DURATION.labels("GET", path).observe(0.01 * (index % 100))
+
+
+def main() -> None:
+    for name, function in (("legacy dict + string key", legacy_request), ("registry label tuple", registry_request)):
+        seconds = min(timeit.repeat(function, number=ITERATIONS, repeat=5))
+        print(f"{name:<28} {seconds / ITERATIONS * 1e9:8.0f} ns/request")
+
+    populate(1000)
+    seconds = min(timeit.repeat(registry.expose, number=20, repeat=3)) / 20
+    print(f"{'exposition (1000 series)':<28} {seconds * 1e3:8.2f} ms/scrape")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+閘道啟動時間與多 worker 記憶體的基準測試。
+
+- 匯入時間：在全新的直譯器中匯入 main 的秒數 (多次取中位數)
+- 首個請求時間：從啟動程序到第一個請求成功的時間，比較單一 uvicorn 程序、uvicorn --workers
+  (每個 worker 以 spawn 重新匯入) 與 gateway.prefork (預載後 fork)
+- 記憶體：所有 worker 就緒後，整個程序樹的 RSS 與 PSS (共享分頁依共享的程序數分攤，僅限 Linux)
+
+用法 (在 fastapi/ 目錄下):
+    python -m benchmarks.bench_startup --workers 4
+    python -m benchmarks.bench_startup --workers 8 --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.bench_gateway import JWT_SECRET, free_port, git_commit
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def gateway_environment() -> Dict[str, str]:
+    return {
+        **os.environ,
+        "JWT_SECRET_KEY": JWT_SECRET,
+        "GCP_TTS_API_KEY": "benchmark",
+        "SENTRY_DSN": "",
+        "EVENTS_REDIS_URL": "",
+        "METERING_SINK_URL": "",
+        "TENANT_REGISTRY_SNAPSHOT_PATH": "",
+        "METRICS_MULTIPROC_DIR": "",
+    }
+
+
+def descendants(pid: int) -> List[int]:
+    """程序的所有子孫程序 (由 /proc/<pid>/task/*/children 讀取)。"""
+    found: List[int] = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            tasks = os.listdir(f"/proc/{current}/task")
+        except FileNotFoundError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{current}/task/{task}/children", encoding="ascii") as handle:
+                    children = [int(child) for child in handle.read().split()]
+            except FileNotFoundError:
+                continue
+            found.extend(children)
+            pending.extend(children)
+    return found
+
+
+def memory_kib(pid: int) -> Dict[str, int]:
+    """程序的 RSS 與 PSS (KiB，讀取 /proc/<pid>/smaps_rollup)。"""
+    usage = {"rss": 0, "pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as handle:
+            for line in handle:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    usage[key.lower()] = int(value.split()[0])
+    except FileNotFoundError:
+        pass
+    return usage
+
+
+def import_seconds(cwd: str, runs: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET], cwd=cwd, env=gateway_environment(), capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return {"median_ms": round(statistics.median(samples) * 1000, 1), "min_ms": round(min(samples) * 1000, 1)}
+
+
+def server_command(mode: str, port: int, workers: int) -> List[str]:
+    if mode == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning", "--no-access-log"]
+    if mode == "uvicorn_workers":
+        return [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    return [sys.executable, "-m", "gateway.prefork", "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+
+
+def measure_server(mode: str, cwd: str, workers: int, timeout: float = 60.0) -> Dict[str, Any]:
+    """啟動伺服器，量測第一個請求成功的時間，並在預期的 worker 數都就緒後讀取程序樹的記憶體。"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/"
+    expected = 1 if mode == "uvicorn" else workers
+    started = time.perf_counter()
+    process = subprocess.Popen(server_command(mode, port, workers), cwd=cwd, env=gateway_environment(), stdout=subprocess.DEVNULL)
+    try:
+        first_request = None
+        deadline = time.monotonic() + timeout
+        while first_request is None:
+            if process.poll() is not None:
+                raise RuntimeError(f"{mode} 的程序已結束 (exit code {process.returncode})")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"等待 {mode} 就緒逾時")
+            try:
+                if httpx.get(url, timeout=1.0).status_code == 200:
+                    first_request = time.perf_counter() - started
+            except httpx.HTTPError:
+                time.sleep(0.01)
+
+        # 以 worker 數 (直接子程序中的 worker，uvicorn --workers 另有 multiprocessing 的輔助程序) 判斷全部就緒
+        pids = [process.pid] + descendants(process.pid)
+        while len(pids) - 1 < expected and time.monotonic() < deadline:
+            time.sleep(0.05)
+            pids = [process.pid] + descendants(process.pid)
+        time.sleep(1.0) # 等待其餘 worker 完成 lifespan 啟動
+        pids = [process.pid] + descendants(process.pid)
+        usage = {pid: memory_kib(pid) for pid in pids}
+        children = [usage[pid] for pid in pids[1:]] or [usage[process.pid]]
+        return {
+            "first_request_ms": round(first_request * 1000, 1),
+            "processes": len(pids),
+            "total_rss_mib": round(sum(item["rss"] for item in usage.values()) / 1024, 1),
+            "total_pss_mib": round(sum(item["pss"] for item in usage.values()) / 1024, 1),
+            "worker_rss_mib": round(statistics.mean(item["rss"] for item in children) / 1024, 1),
+            "worker_pss_mib": round(statistics.mean(item["pss"] for item in children) / 1024, 1),
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="閘道啟動時間與多 worker 記憶體基準測試")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3, help="每種量測重複的次數 (取中位數)")
+    parser.add_argument("--modes", default="uvicorn,uvicorn_workers,prefork", help="比較的啟動方式 (逗號分隔)")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    servers: Dict[str, Any] = {}
+    for mode in (name.strip() for name in args.modes.split(",") if name.strip()):
+        runs = [measure_server(mode, cwd, args.workers) for _ in range(args.runs)]
+        # 每個欄位取各次的中位數
+        servers[mode] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "workers": args.workers,
+        "import": import_seconds(cwd, max(args.runs, 5)),
+        "servers": servers,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(result, handle, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+基準測試用的本地替身後端：模擬 Laravel 租戶 REST 路由、GraphQL 端點與 Google TTS API。
+
+每個響應都加上可設定的延遲 (平均值加上隨機抖動)，文章列表、搜尋與匯出的大小可調整，
+讓負載測試在沒有真實 Laravel 與 GCP 的環境中也能重現。
+
+用法 (在 fastapi/ 目錄下): python -m benchmarks.fake_laravel --port 8100 --latency-ms 5 --articles 50
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+from dataclasses import dataclass
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+
+@dataclass
+class FakeBackendConfig:
+    latency_ms: float = 5.0 # 每個請求的平均處理時間
+    jitter_ms: float = 2.0 # 延遲的隨機抖動 (均勻分佈 ±jitter)
+    articles: int = 50 # 列表與搜尋返回的文章數
+    article_bytes: int = 1500 # 每篇文章內容的大小
+    export_articles: int = 2000 # 匯出報表的文章數 (大型響應)
+    audio_bytes: int = 16 * 1024 # 每次語音合成返回的音訊大小
+
+
+def article(index: int, content_bytes: int) -> dict:
+    return {
+        "id": index,
+        "title": f"第 {index} 篇文章",
+        "slug": f"article-{index}",
+        "status": "published",
+        "content": ("OrbitPress benchmark content " * (content_bytes // 29 + 1))[:content_bytes],
+        "tags": ["benchmark", "gateway"],
+        "published_at": "2024-05-01T08:00:00Z",
+    }
+
+
+def create_app(config: FakeBackendConfig) -> Starlette:
+    # 預先產生響應主體，使替身後端本身的 CPU 成本不影響量測
+    listing = json.dumps({"data": [article(index, config.article_bytes) for index in range(config.articles)]}).encode("utf-8")
+    export = json.dumps({"data": [article(index, config.article_bytes) for index in range(config.export_articles)]}).encode("utf-8")
+    audio = base64.b64encode(b"\xff\xf3" * (config.audio_bytes // 2)).decode("ascii")
+
+    async def delay() -> None:
+        seconds = max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def json_bytes(body: bytes, status_code: int = 200) -> Response:
+        return Response(body, status_code=status_code, media_type="application/json")
+
+    async def tenant_route(request: Request) -> Response:
+        await delay()
+        path = request.path_params["path"].strip("/")
+        if request.method == "DELETE":
+            return Response(status_code=204)
+        if request.method in ("POST", "PUT", "PATCH"):
+            payload = await request.json()
+            return JSONResponse({"data": {"id": random.randint(1, 10_000), **payload}}, status_code=201 if request.method == "POST" else 200)
+        if path.startswith("reports/export"):
+            return json_bytes(export)
+        if path.startswith("articles/") and path.split("/")[1].isdigit():
+            return JSONResponse({"data": article(int(path.split("/")[1]), config.article_bytes)})
+        return json_bytes(listing)
+
+    async def graphql(request: Request) -> Response:
+        await delay()
+        payload = await request.json()
+        result = {"data": {"articles": [{"id": str(index), "title": f"第 {index} 篇文章"} for index in range(10)]}}
+        return JSONResponse([result for _ in payload] if isinstance(payload, list) else result)
+
+    async def synthesize(request: Request) -> Response:
+        await delay()
+        await request.body()
+        return JSONResponse({"audioContent": audio})
+
+    async def health(request: Request) -> Response:
+        return Response(status_code=204)
+
+    return Starlette(routes=[
+        Route("/tenant-routes/{path:path}", tenant_route, methods=["GET", "POST", "PUT", "PATCH", "DELETE"]),
+        Route("/graphql", graphql, methods=["POST"]),
+        Route("/v1/text:synthesize", synthesize, methods=["POST"]),
+        Route("/up", health),
+    ])
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="基準測試用的本地替身 Laravel / GraphQL / TTS 後端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=FakeBackendConfig.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeBackendConfig.jitter_ms)
+    parser.add_argument("--articles", type=int, default=FakeBackendConfig.articles)
+    parser.add_argument("--article-bytes", type=int, default=FakeBackendConfig.article_bytes)
+    parser.add_argument("--export-articles", type=int, default=FakeBackendConfig.export_articles)
+    args = parser.parse_args()
+    config = FakeBackendConfig(args.latency_ms, args.jitter_ms, args.articles, args.article_bytes, args.export_articles)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     # Laravel 後端服務的基礎 URL
@@ -10,6 +10,7 @@ class Settings(BaseSettings):
 
     # Google Cloud TTS API 金鑰
     GCP_TTS_API_KEY: str # 請在 .env 中設定
+    GCP_TTS_URL: str = "https://texttospeech.googleapis.com/v1/text:synthesize" # 基準測試時可指向本地替身後端
 
     # Firebase 伺服器金鑰 (用於推送通知)
     FIREBASE_SERVER_KEY: Optional[str] = "" # 請在 .env 中設定 (可選，如果實際不使用 Firebase)
@@ -17,6 +18,13 @@ class Settings(BaseSettings):
     # JWT 秘密金鑰 (用於簽名和驗證 Token)
     JWT_SECRET_KEY: str # 確保與 Laravel 的秘密金鑰匹配
 
+    # 額外的有效 JWT 金鑰 (JSON 物件 {"kid": "secret"})，用於金鑰輪替期間新舊金鑰並存
+    JWT_ADDITIONAL_KEYS: Dict[str, str] = {}
+
+    # 已驗證 JWT claims 快取 (條目在 Token 的 exp 到期)
+    JWT_CACHE_MAX_ENTRIES: int = 10000
+    JWT_CACHE_MAX_TTL: float = 300.0 # 沒有 exp 的 Token 最多快取的秒數
+
     # CORS 允許的來源 (逗號分隔的 URL 列表)
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost"
 
@@ -26,6 +34,173 @@ class Settings(BaseSettings):
     # FastAPI Tenant Init Webhook URL
     FASTAPI_TENANT_INIT_WEBHOOK_URL: str = "http://0.0.0.0:80/webhook/tenant-init"
 
+    # 上游連線池設定 (每個上游各自維護一個共享的 httpx 連線池)
+    LARAVEL_REST_MAX_CONNECTIONS: int = 100
+    LARAVEL_REST_TIMEOUT: float = 30.0
+    LARAVEL_GRAPHQL_MAX_CONNECTIONS: int = 50
+    LARAVEL_GRAPHQL_TIMEOUT: float = 60.0 # GraphQL 請求可能較長
+    GCP_TTS_MAX_CONNECTIONS: int = 20
+    GCP_TTS_TIMEOUT: float = 30.0
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20 # 每個上游保持的閒置連線數
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0 # 閒置連線保持的秒數
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_HTTP2: bool = True # 安裝 h2 時啟用 HTTP/2
+
+    # /tenant-api 串流代理模式 (False 時退回解析並重建 JSON 的緩衝模式)
+    TENANT_API_STREAMING: bool = True
+
+    # /tenant-api GET 響應快取
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_ROUTE_TTLS: str = "articles=30,articles/search=10,reports/articles-by-status=60,reports/user-activity=60" # 路由樣式=秒 (支援 fnmatch 萬用字元)
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_STALE_WHILE_REVALIDATE: float = 30.0 # 過期後仍可返回舊內容並於背景重新驗證的秒數
+    RESPONSE_CACHE_VARY_HEADERS: str = "accept-language,accept-encoding"
+
+    # 相同並行上游請求的合併 (single-flight)
+    SINGLEFLIGHT_ENABLED: bool = True
+    SINGLEFLIGHT_ROUTES: str = "articles,articles/*,reports/articles-by-status,reports/user-activity" # 非快取路由中可合併的 GET 路由樣式
+
+    # Prometheus 指標
+    METRICS_MULTIPROC_DIR: Optional[str] = "" # 多個 uvicorn worker 時共享的快照目錄 (留空表示單進程)
+    METRICS_FLUSH_INTERVAL: float = 5.0 # 每個 worker 寫入快照的間隔秒數
+    METRICS_EXPOSITION_CACHE_SECONDS: float = 0.0 # /metrics 輸出快取秒數 (0 表示每次重新產生)
+    METRICS_MAX_SERIES_PER_METRIC: int = 2000 # 每個指標的序列數上限，超出者歸入 __overflow__ 序列
+    METRICS_TENANT_LABEL: bool = False # 是否在 HTTP 指標中加入租戶標籤
+    TENANT_ROUTE_TEMPLATES: str = "" # 逗號分隔的 Laravel 租戶路由樣式 (留空使用內建清單)
+
+    # 速率限制 (memory 為進程內計數；redis 讓所有 worker 與副本共享同一個限制)
+    RATE_LIMIT_BACKEND: str = "memory" # "memory" 或 "redis"
+    RATE_LIMIT_REDIS_URL: str = "redis://redis:6379/0"
+    RATE_LIMIT_REDIS_TIMEOUT: float = 0.25 # Redis 連線與讀寫逾時 (秒)；逾時即退回進程內的限制
+    RATE_LIMIT_LOCAL_BATCH: int = 10 # 每次從共享儲存租用到本地 token bucket 的配額數
+    RATE_LIMIT_TRUST_FORWARDED: bool = False # 位於 ingress 之後時以 X-Forwarded-For 識別客戶端
+    RATE_LIMIT_TENANT_API: str = "100/minute" # 每個用戶
+    RATE_LIMIT_TENANT_API_PER_TENANT: str = "3000/minute" # 每個租戶
+    RATE_LIMIT_GRAPHQL: str = "50/minute" # 每個用戶
+    RATE_LIMIT_GRAPHQL_PER_TENANT: str = "1500/minute" # 每個租戶
+    RATE_LIMIT_TTS: str = "10/minute" # 每個客戶端 IP
+
+    # 文本轉語音快取 (以文本、語音與 audioConfig 的雜湊為鍵)
+    TTS_CACHE_ENABLED: bool = True
+    TTS_CACHE_MEMORY_MAX_BYTES: int = 32 * 1024 * 1024 # 記憶體 LRU 層的總大小上限
+    TTS_CACHE_DIR: str = "" # 磁碟層目錄；留空則只使用記憶體層
+    TTS_CACHE_DISK_MAX_BYTES: int = 1024 * 1024 * 1024 # 磁碟層的總大小上限
+
+    # 長文語音合成 (依句子切分、並行合成並依序串流)
+    TTS_CHUNK_MAX_BYTES: int = 4500 # 每個片段的 UTF-8 位元組上限 (Google TTS 單次上限為 5000)
+    TTS_FIRST_CHUNK_MAX_BYTES: int = 300 # 第一個片段較短，縮短首段音訊的等待時間
+    TTS_SYNTHESIS_CONCURRENCY: int = 4 # 每個請求同時進行的合成數
+
+    # GraphQL 持久化查詢 (APQ) 與閘道端的查詢檢查
+    GRAPHQL_PERSISTED_QUERIES_ENABLED: bool = True
+    GRAPHQL_PERSISTED_QUERIES_MAX_ENTRIES: int = 5000 # 雜湊到查詢文件的 LRU 上限
+    GRAPHQL_DOCUMENT_CACHE_MAX_ENTRIES: int = 1000 # 已解析查詢的 LRU 上限
+    GRAPHQL_MAX_DEPTH: int = 10 # 超過此深度的查詢在閘道被拒絕
+    GRAPHQL_MAX_TOKENS: int = 5000 # 解析時的 token 數上限，防止超大查詢耗用 CPU
+
+    # GraphQL 批次處理 (陣列批次請求與個別操作的微批次合併)
+    GRAPHQL_BATCH_MAX_SIZE: int = 10 # 每個批次 (陣列請求或微批次) 的操作數上限
+    GRAPHQL_MICROBATCH_ENABLED: bool = False # 將同一用戶短時間內的個別操作合併為一次批次上游呼叫
+    GRAPHQL_MICROBATCH_WAIT_MS: float = 2.0 # 微批次等待更多操作的最長時間 (毫秒)
+
+    # 上游彈性層 (斷路器、並行上限、重試預算與自適應逾時)
+    LARAVEL_REST_MAX_CONCURRENCY: int = 200 # 超過此並行請求數時直接返回 503
+    LARAVEL_GRAPHQL_MAX_CONCURRENCY: int = 100
+    GCP_TTS_MAX_CONCURRENCY: int = 40
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5 # 連續失敗次數達到此值時開啟斷路器
+    CIRCUIT_BREAKER_RESET_TIMEOUT: float = 10.0 # 開啟後多久進入半開狀態 (秒)
+    CIRCUIT_BREAKER_PER_TENANT: bool = False # 依租戶區分斷路器，單一租戶的後端故障不影響其他租戶
+    UPSTREAM_MAX_RETRIES: int = 2 # 冪等請求的最多重試次數
+    RETRY_BUDGET_RATIO: float = 0.1 # 重試量相對於原始請求量的上限比例
+    RETRY_BUDGET_MIN_PER_SECOND: float = 1.0 # 低流量時每秒至少允許的重試數
+    ADAPTIVE_TIMEOUT_PERCENTILE: float = 0.99 # 以此延遲百分位數推算逾時
+    ADAPTIVE_TIMEOUT_MULTIPLIER: float = 3.0
+    ADAPTIVE_TIMEOUT_MIN: float = 1.0 # 逾時下限 (秒)；上限為各上游的 *_TIMEOUT
+    # 執行時間差異大的路由不使用自適應逾時，一律使用各上游的 *_TIMEOUT (GraphQL 請求以 "graphql" 表示)
+    ADAPTIVE_TIMEOUT_EXEMPT_ROUTES: str = "reports/{reportType}/export,articles/search,graphql"
+
+    # 依租戶的准入控制與加權公平排隊 (/tenant-api 與 /graphql)
+    TENANT_ADMISSION_ENABLED: bool = True
+    TENANT_ADMISSION_MAX_IN_FLIGHT: int = 100 # 所有租戶同時進行的 Laravel 請求上限
+    TENANT_ADMISSION_MAX_QUEUE_WAIT: float = 2.0 # 排隊超過此時間 (秒) 即返回 503
+    TENANT_ADMISSION_MAX_QUEUE: int = 50 # 每個租戶的排隊請求上限，超過即返回 429
+    TENANT_TIER_LIMITS: str = "free=5:1,standard=20:2,premium=50:4" # 等級=並行上限:權重
+    TENANT_TIER_DEFAULT: str = "standard"
+    TENANT_TIERS: str = "" # 租戶等級，例如 "cw=premium,acme=free"
+
+    # 租戶註冊表 (由 /webhook/tenant-init 填入，用於閘道端的租戶檢查與後端路由)
+    TENANT_REGISTRY_SNAPSHOT_PATH: str = "" # 快照檔路徑，重新啟動時直接載入；留空則只保存在記憶體
+    TENANT_REGISTRY_ENFORCE: bool = False # 拒絕未註冊的租戶 (註冊表完整填入後再啟用)
+    TENANT_BACKEND_SHARDS: str = "" # Laravel 後端池，例如 "pool-a=http://laravel-a:8000,pool-b=http://laravel-b:8000"
+    TENANT_BACKEND_ALLOWLIST: str = "" # 租戶可指定為專屬 backend_url 的其他後端 (逗號分隔)；後端池與 LARAVEL_BACKEND_BASE_URL 一律允許
+
+    # Laravel 多後端負載平衡與健康檢查 (未被租戶註冊表指定後端的租戶)
+    LARAVEL_BACKEND_URLS: str = "" # 逗號分隔的後端基礎 URL；留空則只使用 LARAVEL_BACKEND_BASE_URL。GraphQL 使用各後端上與 LARAVEL_GRAPHQL_URL 相同的路徑
+    LARAVEL_LB_STRATEGY: str = "p2c" # "p2c" (power of two choices) 或 "least_outstanding"
+    LARAVEL_LB_TENANT_STICKY: bool = False # 同一租戶固定使用同一後端 (有界負載的一致性雜湊)
+    LARAVEL_LB_FAILURE_THRESHOLD: int = 5 # 連續失敗次數達到此值時剔除後端
+    LARAVEL_LB_EJECTION_TIME: float = 10.0 # 首次剔除的秒數，之後每次加倍
+    LARAVEL_LB_SLOW_START: float = 10.0 # 後端恢復後權重由低升到完整所需的秒數
+    LARAVEL_HEALTH_CHECK_PATH: str = "/up" # 主動健康檢查路徑 (任何非 5xx 響應視為存活)
+    LARAVEL_HEALTH_CHECK_INTERVAL: float = 5.0 # 主動健康檢查間隔秒數 (0 表示停用；只有一個後端時不執行)
+
+    # 對客戶端的響應壓縮與條件請求 (上游已壓縮的響應原樣轉發)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024 # 小於此位元組數的完整響應不壓縮
+    COMPRESSION_ENCODINGS: str = "zstd,br,gzip" # 伺服器偏好順序；br 與 zstd 需安裝 brotli / zstandard
+    ETAG_ENABLED: bool = True # 為沒有 ETag 的 GET 響應產生 ETag，If-None-Match 相符時返回 304
+
+    # JSON 序列化實作
+    JSON_BACKEND: str = "auto" # "auto"、"orjson"、"msgspec" 或 "json" (標準庫)；未安裝時退回標準庫
+
+    # 請求追蹤與效能剖析 (不需要 SENTRY_DSN 也會在本地記錄)
+    TRACING_ENABLED: bool = True
+    TRACING_SAMPLE_RATE: float = 0.01 # 頭部取樣比例 (設定 SENTRY_DSN 時也作為 Sentry 的 traces_sample_rate)
+    TRACING_SLOW_THRESHOLD_MS: float = 1000.0 # 尾部取樣：超過此毫秒數的請求一律保留
+    TRACING_KEEP_ERRORS: bool = True # 尾部取樣：5xx 與未處理例外的請求一律保留
+    TRACING_BUFFER_SIZE: int = 200 # 本地保留的最近追蹤數
+    TRACING_DEBUG_ENDPOINT: bool = False # 啟用 GET /debug/traces (只應在內部網路開放)
+    SENTRY_PROFILES_SAMPLE_RATE: float = 0.0 # 已取樣交易中再進行效能剖析的比例
+
+    # 批次端點 (POST /batch：一次身份驗證執行多個 /tenant-api 子請求；速率限制依子請求數計算)
+    BATCH_MAX_REQUESTS: int = 20 # 每個批次的子請求上限
+    BATCH_MAX_CONCURRENCY: int = 6 # 每個批次同時進行的子請求上限 (仍受租戶准入控制與上游並行上限約束)
+
+    # 文章事件推送 (Laravel 以 /webhook/article-events 送入，閘道以 SSE 扇出給 /events/stream 的訂閱者)
+    WEBHOOK_SECRET: str = "" # 與 Laravel 共享的 Webhook 簽章金鑰；留空時拒絕所有 Webhook
+    WEBHOOK_ALLOW_UNSIGNED: bool = False # 未設定 WEBHOOK_SECRET 時接受未簽章的 Webhook (僅供本地開發)
+    WEBHOOK_SIGNATURE_TOLERANCE: float = 300.0 # 簽章時間戳的容許誤差秒數
+    EVENTS_BUFFER_SIZE: int = 64 # 每個連線緩衝的事件數上限
+    EVENTS_OVERFLOW_POLICY: str = "drop_oldest" # 緩衝區已滿時 "drop_oldest" (捨棄最舊事件) 或 "disconnect" (中斷連線)
+    EVENTS_HISTORY_SIZE: int = 100 # 每個租戶保留供 Last-Event-ID 補齊的最近事件數
+    EVENTS_MAX_CONNECTIONS: int = 50000 # 每個 worker 的事件串流連線上限
+    EVENTS_HEARTBEAT_SECONDS: float = 20.0 # 閒置連線的心跳間隔
+    EVENTS_TICKET_TTL: float = 30.0 # /events/ticket 票證的有效秒數
+    EVENTS_RETRY_MS: int = 3000 # 告知客戶端斷線後重新連線的等待毫秒數
+    EVENTS_REDIS_URL: str = "" # 多個副本或 worker 時以 Redis pub/sub 轉送事件；留空則只在本進程扇出
+
+    # 事件迴圈監測 (迴圈延遲取樣、阻塞呼叫偵測與執行緒池使用量，經 /metrics 匯出)
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 100.0 # 延遲取樣間隔
+    LOOP_BLOCK_THRESHOLD_MS: float = 100.0 # 迴圈超過此毫秒數未排程時擷取堆疊，記錄佔用迴圈的程式碼位置
+    LOOP_SHED_LAG_MS: float = 0.0 # 延遲的移動平均超過此毫秒數時以 503 卸除 Laravel 請求；0 表示停用
+    LOOP_SHED_THREADPOOL_QUEUE: int = 0 # 等待執行緒池的工作數達到此值時卸除 Laravel 請求；0 表示停用
+    THREADPOOL_SIZE: int = 40 # 同步端點與 run_in_threadpool 使用的執行緒數 (anyio 預設 40)
+
+    # 依租戶的用量計量 (請求數、位元組、上游時間與 TTS 字元數；在記憶體彙總後整批寫入 sink)
+    METERING_SINK_URL: str = "" # "file:///路徑.jsonl"、"sqlite:///路徑.db" 或 Laravel 的 http(s):// 用量端點；留空則停用
+    METERING_FLUSH_INTERVAL: float = 10.0 # 每隔幾秒結算一次
+    METERING_FLUSH_EVENTS: int = 5000 # 累積這麼多筆用量時提前結算
+    METERING_SPOOL_DIR: str = "" # 結算後、送出前的批次暫存目錄 (sink 無法使用或進程崩潰時由重啟後的進程重送)
+    METERING_MAX_KEYS: int = 10000 # 每個窗口的 (租戶, 用戶, 路由) 鍵數上限
+
+    # 預載的多 worker 伺服器 (python -m gateway.prefork)
+    # worker 數；0 表示容器可用的 CPU 數。響應快取 (與其失效)、准入控制與上游並行上限、斷路器及 SSE 扇出
+    # 都是每個進程各自的狀態，多個 worker 時快取失效只到達處理寫入的 worker、上限乘以 worker 數，因此預設為 1
+    SERVER_WORKERS: int = 1
+    SERVER_PRELOAD_MODULES: str = "" # fork 前額外匯入、由所有 worker 共享的延遲載入模組 (例如 "graphql")
+
     # 版本資訊
     VERSION: str = "1.0.0" # FastAPI 應用程式版本
 
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Mapping, Optional, Set
+
+# 未指定等級的租戶使用的等級
+DEFAULT_TIER = "standard"
+
+
+@dataclass(frozen=True)
+class TenantTier:
+    name: str
+    max_in_flight: int # 租戶同時進行的上游請求上限
+    weight: float # 排隊時的加權公平分配比重
+
+
+def parse_tiers(spec: str) -> Dict[str, TenantTier]:
+    """解析 "free=5:1,standard=20:2,premium=50:4" 形式的等級設定 (名稱=並行上限:權重)。"""
+    tiers = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, limits = item.partition("=")
+        max_in_flight, _, weight = limits.partition(":")
+        tiers[name.strip()] = TenantTier(name.strip(), int(max_in_flight), float(weight or 1))
+    return tiers
+
+
+def parse_tenant_tiers(spec: str) -> Dict[str, str]:
+    """解析 "cw=premium,acme=free" 形式的租戶等級對應。"""
+    return {
+        tenant.strip(): tier.strip()
+        for tenant, _, tier in (item.partition("=") for item in spec.split(",") if item.strip())
+    }
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, tenant_id: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"租戶 {tenant_id} 的請求無法排入 ({reason})")
+        self.tenant_id = tenant_id
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _TenantState:
+    tier: TenantTier
+    in_flight: int = 0
+    finish: float = 0.0 # 加權公平佇列的虛擬完成時間
+    queue: Deque[asyncio.Future] = field(default_factory=deque)
+
+
+class AdmissionController:
+    """
+    依租戶的准入控制：全域並行上限內，每個租戶不超過其等級的並行上限。
+
+    有空位時請求直接通過；否則進入租戶自己的佇列，釋放的空位依加權公平佇列 (WFQ) 分配給
+    虛擬完成時間最小的租戶，因此大量請求的租戶只會佔用其權重比例的容量。排隊超過 max_queue_wait
+    秒或租戶佇列已滿時拒絕，而不是無限等待。
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 100,
+        tiers: Optional[Mapping[str, TenantTier]] = None,
+        tenant_tiers: Optional[Mapping[str, str]] = None,
+        default_tier: str = DEFAULT_TIER,
+        max_queue_wait: float = 2.0,
+        max_queue: int = 50,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.max_in_flight = max_in_flight
+        self.tiers = dict(tiers or {DEFAULT_TIER: TenantTier(DEFAULT_TIER, max_in_flight, 1.0)})
+        self.tenant_tiers = dict(tenant_tiers or {})
+        self.default_tier = default_tier
+        self.max_queue_wait = max_queue_wait
+        self.max_queue = max_queue
+        self._clock = clock
+        self._tenants: Dict[str, _TenantState] = {}
+        self._waiting: Set[str] = set() # 佇列非空的租戶
+        self._vtime = 0.0
+        self.in_flight = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+        self.queued = 0 # 曾經排隊的請求數
+        self.wait_seconds = 0.0 # 排隊等待的總時間
+
+    @classmethod
+    def from_settings(cls, settings) -> "AdmissionController":
+        return cls(
+            max_in_flight=settings.TENANT_ADMISSION_MAX_IN_FLIGHT,
+            tiers=parse_tiers(settings.TENANT_TIER_LIMITS),
+            tenant_tiers=parse_tenant_tiers(settings.TENANT_TIERS),
+            default_tier=settings.TENANT_TIER_DEFAULT,
+            max_queue_wait=settings.TENANT_ADMISSION_MAX_QUEUE_WAIT,
+            max_queue=settings.TENANT_ADMISSION_MAX_QUEUE,
+        )
+
+    def tier_for(self, tenant_id: str) -> TenantTier:
+        name = self.tenant_tiers.get(tenant_id, self.default_tier)
+        return self.tiers.get(name) or self.tiers.get(self.default_tier) or TenantTier(name, self.max_in_flight, 1.0)
+
+    def set_tenant_tier(self, tenant_id: str, tier: Optional[str]) -> None:
+        """更新租戶等級 (例如由租戶註冊表同步)；None 表示使用預設等級。"""
+        if tier is None:
+            self.tenant_tiers.pop(tenant_id, None)
+        else:
+            self.tenant_tiers[tenant_id] = tier
+        state = self._tenants.get(tenant_id)
+        if state is not None:
+            state.tier = self.tier_for(tenant_id)
+
+    def queue_depth(self) -> int:
+        return sum(len(self._tenants[tenant_id].queue) for tenant_id in self._waiting)
+
+    def _state(self, tenant_id: str) -> _TenantState:
+        state = self._tenants.get(tenant_id)
+        if state is None:
+            state = self._tenants[tenant_id] = _TenantState(self.tier_for(tenant_id))
+        return state
+
+    async def acquire(self, tenant_id: str) -> None:
+        state = self._state(tenant_id)
+        if self.in_flight < self.max_in_flight and state.in_flight < state.tier.max_in_flight and not state.queue:
+            self._grant(state, max(state.finish, self._vtime))
+            return
+        if len(state.queue) >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise AdmissionRejected(tenant_id, "queue_full")
+
+        if not state.queue:
+            # 租戶開始排隊時才對齊目前的虛擬時間；排隊期間的虛擬完成時間不再前移，避免長期排隊的租戶被餓死
+            state.finish = max(state.finish, self._vtime)
+        future = asyncio.get_running_loop().create_future()
+        state.queue.append(future)
+        self._waiting.add(tenant_id)
+        self.queued += 1
+        start = self._clock()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_queue_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._abandon(tenant_id, state, future)
+                self.rejected["queue_timeout"] += 1
+                raise AdmissionRejected(tenant_id, "queue_timeout", self.max_queue_wait)
+        except asyncio.CancelledError:
+            if future.done():
+                self.release(tenant_id) # 已分配到空位但呼叫者已離開
+            else:
+                self._abandon(tenant_id, state, future)
+            raise
+        finally:
+            self.wait_seconds += self._clock() - start
+
+    def release(self, tenant_id: str) -> None:
+        state = self._tenants[tenant_id]
+        state.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+        if state.in_flight == 0 and not state.queue:
+            del self._tenants[tenant_id] # 閒置的租戶不保留狀態；重新出現時從目前的虛擬時間開始
+
+    def _grant(self, state: _TenantState, start: float) -> None:
+        state.finish = start + 1.0 / state.tier.weight
+        self._vtime = start
+        state.in_flight += 1
+        self.in_flight += 1
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_in_flight and self._waiting:
+            chosen: Optional[str] = None
+            chosen_finish = 0.0
+            for tenant_id in self._waiting:
+                state = self._tenants[tenant_id]
+                if state.in_flight >= state.tier.max_in_flight:
+                    continue
+                finish = state.finish + 1.0 / state.tier.weight
+                if chosen is None or finish < chosen_finish:
+                    chosen, chosen_finish = tenant_id, finish
+            if chosen is None:
+                return # 所有排隊中的租戶都已達到各自的並行上限
+            state = self._tenants[chosen]
+            future = state.queue.popleft()
+            if not state.queue:
+                self._waiting.discard(chosen)
+            self._grant(state, state.finish)
+            future.set_result(None)
+
+    def _abandon(self, tenant_id: str, state: _TenantState, future: asyncio.Future) -> None:
+        future.cancel()
+        try:
+            state.queue.remove(future)
+        except ValueError:
+            pass
+        if not state.queue:
+            self._waiting.discard(tenant_id)
+            if state.in_flight == 0:
+                self._tenants.pop(tenant_id, None)
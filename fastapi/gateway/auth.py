@@ -0,0 +1,99 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+
+from jose import JWTError, jwt
+
+# 沒有 kid 標頭的 Token (例如 Laravel 簽發的 HS256 Token) 使用的金鑰 ID
+DEFAULT_KID = "default"
+
+
+@dataclass
+class _VerifiedToken:
+    claims: Dict[str, Any]
+    kid: str
+    expires_at: float
+
+
+class VerifiedTokenCache:
+    """
+    已驗證 JWT claims 的 LRU 快取。
+
+    以 Token 的 SHA-256 摘要為鍵，條目在 Token 的 exp 到期 (沒有 exp 時最多保留 max_ttl 秒)。
+    支援多個同時有效的金鑰 (kid)；金鑰輪替後，以已撤除金鑰驗證的條目會被丟棄。
+    """
+
+    def __init__(
+        self,
+        keys: Mapping[str, str],
+        algorithms: Iterable[str] = ("HS256",),
+        max_entries: int = 10000,
+        max_ttl: float = 300.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.algorithms = list(algorithms)
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._clock = clock
+        self._keys: Dict[str, str] = {}
+        self._entries: "OrderedDict[bytes, _VerifiedToken]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.set_keys(keys)
+
+    @classmethod
+    def from_settings(cls, settings, algorithms: Iterable[str] = ("HS256",)) -> "VerifiedTokenCache":
+        keys = {DEFAULT_KID: settings.JWT_SECRET_KEY, **settings.JWT_ADDITIONAL_KEYS}
+        return cls(keys, algorithms, max_entries=settings.JWT_CACHE_MAX_ENTRIES, max_ttl=settings.JWT_CACHE_MAX_TTL)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_keys(self, keys: Mapping[str, str]) -> None:
+        """替換有效金鑰集合，並丟棄以已撤除或已變更金鑰驗證的快取條目。"""
+        retired = {kid for kid, secret in self._keys.items() if keys.get(kid) != secret}
+        self._keys = {kid: secret for kid, secret in keys.items() if secret}
+        if retired:
+            for digest in [digest for digest, entry in self._entries.items() if entry.kid in retired]:
+                del self._entries[digest]
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """返回已驗證的 claims；Token 無效時拋出 JWTError。"""
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        entry = self._entries.get(digest)
+        if entry is not None:
+            if self._clock() < entry.expires_at and entry.kid in self._keys:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry.claims
+            del self._entries[digest]
+
+        self.misses += 1
+        claims, kid = self._decode(token)
+        now = self._clock()
+        expires_at = now + self.max_ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, float(claims["exp"]))
+        if expires_at > now:
+            self._entries[digest] = _VerifiedToken(claims, kid, expires_at)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return claims
+
+    def _decode(self, token: str):
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is not None:
+            secret = self._keys.get(kid)
+            if secret is None:
+                raise JWTError(f"未知的金鑰 ID: {kid}")
+            return jwt.decode(token, secret, algorithms=self.algorithms), kid
+        # 沒有 kid 時依序嘗試所有有效金鑰 (輪替期間新舊金鑰並存)
+        error: Optional[JWTError] = None
+        for candidate_kid, secret in self._keys.items():
+            try:
+                return jwt.decode(token, secret, algorithms=self.algorithms), candidate_kid
+            except JWTError as e:
+                error = e
+        raise error or JWTError("沒有可用的驗證金鑰")
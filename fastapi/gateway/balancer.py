@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+import httpx
+
+from gateway.streaming import release_on_close
+
+# 負載平衡策略
+LEAST_OUTSTANDING = "least_outstanding"
+POWER_OF_TWO = "p2c"
+STRATEGIES = (LEAST_OUTSTANDING, POWER_OF_TWO)
+
+
+def parse_backend_urls(spec: str) -> List[str]:
+    """解析逗號分隔的後端基礎 URL 列表。"""
+    return [url.strip().rstrip("/") for url in spec.split(",") if url.strip()]
+
+
+class Backend:
+    """
+    單一後端的狀態：進行中的請求數、被動健康檢查的連續失敗數、主動健康檢查結果與剔除期限。
+    剔除結束 (或恢復健康) 後經過 slow_start 秒權重才由低升到 1，避免剛恢復的後端瞬間承受全部流量。
+    """
+
+    def __init__(self, url: str, clock: Callable[[], float] = time.monotonic):
+        self.url = url
+        self._clock = clock
+        self.outstanding = 0
+        self.healthy = True # 主動健康檢查結果
+        self.consecutive_failures = 0
+        self.ejected_until = float("-inf")
+        self.ejections = 0 # 連續的被動剔除次數 (決定下次剔除時間的倍數)
+        self.ejected_total = 0
+        self.admitted_at = float("-inf") # 最近一次恢復可用的時間
+        self._health_streak = 0 # 主動檢查連續相同結果的次數 (正數為成功，負數為失敗)
+
+    def release(self) -> None:
+        self.outstanding -= 1
+
+    def available(self) -> bool:
+        return self.healthy and self._clock() >= self.ejected_until
+
+    def weight(self, slow_start: float) -> float:
+        if slow_start <= 0:
+            return 1.0
+        elapsed = self._clock() - max(self.admitted_at, self.ejected_until)
+        return min(1.0, max(0.1, elapsed / slow_start))
+
+    def load(self, slow_start: float) -> float:
+        # 加一使閒置的後端也依權重區分
+        return (self.outstanding + 1) / self.weight(slow_start)
+
+
+class BackendPool:
+    """
+    多個 Laravel 後端之間的客戶端負載平衡。
+
+    - 策略：least_outstanding (進行中請求最少) 或 p2c (隨機取兩個後端中負載較低者)，負載依慢啟動權重調整。
+    - 被動健康檢查：連續 failure_threshold 次連線錯誤或 5xx 即剔除，剔除時間依剔除次數加倍 (上限 max_ejection_time)。
+    - 主動健康檢查：check_health 定期請求 health_path，連續 unhealthy_threshold 次失敗標記為不健康，
+      連續 healthy_threshold 次成功後重新加入。
+    - 租戶黏著：sticky 時以 rendezvous hashing 將同一租戶固定到同一後端 (提高 OPcache 與查詢快取的區域性)，
+      後端剔除時只有該後端的租戶被重新分配；黏著後端的負載超過平均的 sticky_load_factor 倍時改用一般策略 (有界負載)。
+    - 所有後端都不可用時退回使用全部後端 (panic 模式)，而不是拒絕所有請求。
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        strategy: str = POWER_OF_TWO,
+        sticky: bool = False,
+        sticky_load_factor: float = 1.25,
+        failure_threshold: int = 5,
+        base_ejection_time: float = 10.0,
+        max_ejection_time: float = 300.0,
+        slow_start: float = 10.0,
+        health_path: str = "/up",
+        healthy_threshold: int = 2,
+        unhealthy_threshold: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        if not urls:
+            raise ValueError("至少需要一個後端")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的負載平衡策略: {strategy}")
+        self.backends = [Backend(url, clock) for url in urls]
+        self.strategy = strategy
+        self.sticky = sticky
+        self.sticky_load_factor = sticky_load_factor
+        self.failure_threshold = failure_threshold
+        self.base_ejection_time = base_ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.slow_start = slow_start
+        self.health_path = health_path
+        self.healthy_threshold = healthy_threshold
+        self.unhealthy_threshold = unhealthy_threshold
+        self._clock = clock
+        self._random = rng or random.Random()
+
+    @classmethod
+    def from_settings(cls, settings) -> "BackendPool":
+        return cls(
+            parse_backend_urls(settings.LARAVEL_BACKEND_URLS) or [settings.LARAVEL_BACKEND_BASE_URL.rstrip("/")],
+            strategy=settings.LARAVEL_LB_STRATEGY,
+            sticky=settings.LARAVEL_LB_TENANT_STICKY,
+            failure_threshold=settings.LARAVEL_LB_FAILURE_THRESHOLD,
+            base_ejection_time=settings.LARAVEL_LB_EJECTION_TIME,
+            slow_start=settings.LARAVEL_LB_SLOW_START,
+            health_path=settings.LARAVEL_HEALTH_CHECK_PATH,
+        )
+
+    def choose(self, key: Optional[str] = None) -> Backend:
+        candidates = [backend for backend in self.backends if backend.available()] or self.backends
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.sticky and key is not None:
+            backend = max(candidates, key=lambda candidate: _rendezvous_score(key, candidate.url))
+            # 有界負載的一致性雜湊：每個後端最多承擔平均負載的 sticky_load_factor 倍
+            total = sum(candidate.outstanding for candidate in candidates)
+            if backend.outstanding + 1 <= math.ceil(self.sticky_load_factor * (total + 1) / len(candidates)):
+                return backend
+        if self.strategy == LEAST_OUTSTANDING:
+            return min(candidates, key=lambda candidate: candidate.load(self.slow_start))
+        first, second = self._random.sample(candidates, 2)
+        return first if first.load(self.slow_start) <= second.load(self.slow_start) else second
+
+    def record_success(self, backend: Backend) -> None:
+        backend.consecutive_failures = 0
+        if backend.ejections and self._clock() >= backend.ejected_until + self.max_ejection_time:
+            backend.ejections = 0 # 長時間穩定後重置剔除時間的倍數
+
+    def record_failure(self, backend: Backend) -> None:
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.failure_threshold and self._clock() >= backend.ejected_until:
+            backend.ejections += 1
+            backend.ejected_total += 1
+            backend.ejected_until = self._clock() + min(self.max_ejection_time, self.base_ejection_time * 2 ** (backend.ejections - 1))
+            backend.consecutive_failures = 0
+
+    async def call(self, send: Callable[[str, float], Awaitable[Any]], timeout: float, key: Optional[str] = None) -> Any:
+        """
+        選擇後端並呼叫 send(base_url, timeout)，依結果更新被動健康狀態。
+        每次呼叫重新選擇後端，因此上層的重試會自然避開剛失敗的後端。
+        """
+        backend = self.choose(key)
+        backend.outstanding += 1
+        held = False # 串流響應在主體關閉前仍計入後端的進行中請求
+        try:
+            result = await send(backend.url, timeout)
+        except (httpx.TransportError, asyncio.TimeoutError):
+            self.record_failure(backend)
+            raise
+        except httpx.HTTPStatusError as e:
+            self._record_status(backend, e.response.status_code)
+            raise
+        else:
+            self._record_status(backend, getattr(result, "status_code", 200))
+            held = release_on_close(result, backend.release)
+            return result
+        finally:
+            if not held:
+                backend.release()
+
+    def _record_status(self, backend: Backend, status_code: int) -> None:
+        if status_code >= 500:
+            self.record_failure(backend)
+        else:
+            self.record_success(backend)
+
+    async def check_health(self, client: httpx.AsyncClient, timeout: float = 2.0) -> None:
+        """對所有後端進行一次主動健康檢查 (任何非 5xx 響應都視為存活)。"""
+        async def probe(backend: Backend) -> None:
+            try:
+                response = await client.get(f"{backend.url}{self.health_path}", timeout=timeout)
+                ok = response.status_code < 500
+            except (httpx.HTTPError, asyncio.TimeoutError):
+                ok = False
+            self._record_health(backend, ok)
+
+        await asyncio.gather(*(probe(backend) for backend in self.backends))
+
+    def _record_health(self, backend: Backend, ok: bool) -> None:
+        if ok:
+            backend._health_streak = max(1, backend._health_streak + 1)
+            if not backend.healthy and backend._health_streak >= self.healthy_threshold:
+                backend.healthy = True
+                backend.admitted_at = self._clock() # 以慢啟動重新加入
+        else:
+            backend._health_streak = min(-1, backend._health_streak - 1)
+            if backend.healthy and -backend._health_streak >= self.unhealthy_threshold:
+                backend.healthy = False
+
+    async def run_health_checks(self, client_factory: Callable[[], httpx.AsyncClient], interval: float) -> None:
+        while True:
+            await self.check_health(client_factory())
+            await asyncio.sleep(interval)
+
+
+def _rendezvous_score(key: str, url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{key}|{url}".encode("utf-8"), digest_size=8).digest(), "big")
@@ -0,0 +1,74 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+@dataclass
+class _PendingBatch:
+    items: List[Any] = field(default_factory=list)
+    futures: List[asyncio.Future] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    將短時間內到達、鍵相同的個別請求合併為一次批次上游呼叫 (DataLoader 式的 fan-in)。
+
+    第一個請求到達後最多等待 max_wait 秒，或累積到 max_size 個請求時立即送出；
+    send_batch 必須返回與輸入等長、順序相同的結果列表，再依序分發給各個呼叫者。
+    批次呼叫失敗時，同一批的所有呼叫者都收到相同的例外。
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+        max_size: int = 10,
+        max_wait: float = 0.002,
+    ):
+        self.send_batch = send_batch
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._pending: Dict[Hashable, _PendingBatch] = {}
+        self._tasks = set()
+        self.batches = 0 # 實際發出的上游批次呼叫數
+        self.items = 0 # 經批次處理的個別請求數
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch()
+            batch.timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush, key, batch)
+        future = asyncio.get_running_loop().create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_size:
+            self._flush(key, batch)
+        return await future
+
+    def _flush(self, key: Hashable, batch: _PendingBatch) -> None:
+        if self._pending.get(key) is not batch:
+            return # 已因達到 max_size 而送出
+        del self._pending[key]
+        batch.timer.cancel()
+        # 在獨立的 Task 中送出，個別呼叫者中斷時不影響同批的其他請求
+        task = asyncio.ensure_future(self._send(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key: Hashable, batch: _PendingBatch) -> None:
+        self.batches += 1
+        self.items += len(batch.items)
+        try:
+            results = await self.send_batch(key, batch.items)
+            if len(results) != len(batch.items):
+                raise ValueError(f"批次結果數量 ({len(results)}) 與請求數量 ({len(batch.items)}) 不符")
+        except BaseException as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,252 @@
+import asyncio
+import fnmatch
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from gateway.streaming import RawResponse
+
+# 快取狀態 (透過 X-Cache 響應標頭回報)
+HIT = "HIT"
+MISS = "MISS"
+STALE = "STALE"
+REVALIDATED = "REVALIDATED"
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...], Tuple[str, ...], str]
+
+# 接收條件請求標頭並返回已讀取完整主體的上游響應
+Fetcher = Callable[[Dict[str, str]], Awaitable[RawResponse]]
+
+
+def credentials_digest(authorization: str) -> str:
+    """請求憑證的摘要 (不在記憶體中保留原始 Token)；沒有憑證時為空字串。"""
+    return hashlib.sha256(authorization.encode("latin-1", "replace")).hexdigest() if authorization else ""
+
+
+def parse_route_ttls(spec: str) -> List[Tuple[str, float]]:
+    """
+    解析 "articles=30,articles/*/history=15" 形式的路由 TTL 設定。
+    路由樣式使用 fnmatch 萬用字元，依序比對，第一個符合者生效。
+    """
+    rules = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        pattern, _, ttl = item.rpartition("=")
+        if not pattern:
+            raise ValueError(f"無效的路由 TTL 設定: {item}")
+        rules.append((pattern.strip().strip("/"), float(ttl)))
+    return rules
+
+
+@dataclass
+class CacheEntry:
+    tenant_id: str
+    endpoint: str
+    response: RawResponse
+    etag: Optional[str]
+    fresh_until: float
+    stale_until: float
+    size: int
+    must_revalidate: bool = False # no-cache：每次使用前都以 If-None-Match 重新驗證
+
+
+class ResponseCache:
+    """
+    /tenant-api GET 響應的租戶感知快取。
+
+    鍵涵蓋租戶 ID、路徑、查詢參數、指定的 vary 標頭與請求憑證 (Authorization 的摘要)，每個使用者的響應各自快取，
+    不會提供給同租戶的其他使用者。帶有 Set-Cookie 的響應不快取；no-cache 的響應每次使用前都向後端重新驗證。條目依路由設定 TTL，
+    以 LRU 方式限制條目數與總位元組數；過期後在 stale-while-revalidate 視窗內先返回舊內容並在背景重新驗證，
+    否則以 If-None-Match 向後端條件請求重新驗證。
+    """
+
+    def __init__(
+        self,
+        route_ttls: Iterable[Tuple[str, float]],
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        stale_while_revalidate: float = 30.0,
+        vary_headers: Iterable[str] = ("accept-language", "accept-encoding"),
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.route_ttls = list(route_ttls)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_while_revalidate = stale_while_revalidate
+        self.vary_headers = tuple(header.lower() for header in vary_headers)
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._by_tenant: Dict[str, Set[CacheKey]] = {}
+        self._revalidating: Set[CacheKey] = set()
+        self._background: Set[asyncio.Task] = set()
+        self._generations: Dict[str, int] = {} # 每個租戶被失效的次數；在失效前開始的上游讀取不寫回快取
+        self._clears = 0
+        self.total_bytes = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "ResponseCache":
+        return cls(
+            parse_route_ttls(settings.RESPONSE_CACHE_ROUTE_TTLS),
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+            stale_while_revalidate=settings.RESPONSE_CACHE_STALE_WHILE_REVALIDATE,
+            vary_headers=[header.strip() for header in settings.RESPONSE_CACHE_VARY_HEADERS.split(",") if header.strip()],
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ttl_for(self, endpoint: str) -> Optional[float]:
+        endpoint = endpoint.strip("/")
+        for pattern, ttl in self.route_ttls:
+            if fnmatch.fnmatchcase(endpoint, pattern):
+                return ttl
+        return None
+
+    def make_key(self, tenant_id: str, endpoint: str, query: Iterable[Tuple[str, str]], headers: Mapping[str, str]) -> CacheKey:
+        return (
+            tenant_id,
+            endpoint.strip("/"),
+            tuple(sorted(query)),
+            tuple(headers.get(header, "") for header in self.vary_headers),
+            credentials_digest(headers.get("authorization", "")),
+        )
+
+    async def fetch(self, key: CacheKey, ttl: float, fetcher: Fetcher, if_none_match: Optional[str] = None) -> Tuple[RawResponse, str]:
+        """
+        返回 (響應, 快取狀態)。客戶端的 If-None-Match 與快取的 ETag 相符時直接返回 304。
+        """
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None and now < entry.stale_until:
+            self._entries.move_to_end(key)
+            if now < entry.fresh_until:
+                state = HIT
+            else:
+                state = STALE
+                self._revalidate_in_background(key, entry, ttl, fetcher)
+            return self._respond(entry, if_none_match), state
+
+        conditional = {"If-None-Match": entry.etag} if entry is not None and entry.etag else {}
+        generation = self._generation(key[0])
+        response = await fetcher(conditional)
+        if response.status_code == 304 and entry is not None:
+            entry = self._refresh(key, entry, ttl)
+            return self._respond(entry, if_none_match), REVALIDATED
+        if self._generation(key[0]) != generation:
+            return response, MISS # 讀取期間租戶有寫入，響應可能是寫入前的內容，不放入快取
+        stored = self._store(key, response, ttl)
+        if stored is None:
+            self._remove(key) # 不可快取的響應取代了已過期的條目
+            return response, MISS
+        entry = stored
+        return self._respond(entry, if_none_match), MISS
+
+    def invalidate(self, tenant_id: str, endpoint_prefix: Optional[str] = None) -> int:
+        """
+        移除租戶的快取條目；指定 endpoint_prefix 時僅移除符合該路徑前綴的條目。返回移除數量。
+        同時使該租戶進行中的上游讀取不再寫回快取 (即使目前沒有任何條目)。
+        """
+        self._generations[tenant_id] = self._generations.get(tenant_id, 0) + 1
+        keys = self._by_tenant.get(tenant_id)
+        if not keys:
+            return 0
+        prefix = endpoint_prefix.strip("/") if endpoint_prefix else None
+        removed = [key for key in keys if prefix is None or key[1] == prefix or key[1].startswith(prefix + "/")]
+        for key in removed:
+            self._remove(key)
+        return len(removed)
+
+    def clear(self) -> None:
+        self._clears += 1
+        self._entries.clear()
+        self._by_tenant.clear()
+        self.total_bytes = 0
+
+    def _generation(self, tenant_id: str) -> Tuple[int, int]:
+        return self._clears, self._generations.get(tenant_id, 0)
+
+    def _respond(self, entry: CacheEntry, if_none_match: Optional[str]) -> RawResponse:
+        if entry.etag and if_none_match and entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return RawResponse(304, [(b"etag", entry.etag.encode("latin-1"))], b"")
+        return entry.response
+
+    def _store(self, key: CacheKey, response: RawResponse, ttl: float) -> Optional[CacheEntry]:
+        cache_control = (response.header("cache-control") or "").lower()
+        size = len(response.body) + sum(len(k) + len(v) for k, v in response.headers)
+        if response.status_code != 200 or "no-store" in cache_control or response.header("set-cookie") is not None or size > self.max_bytes:
+            return None
+        now = self._clock()
+        must_revalidate = "no-cache" in cache_control
+        if must_revalidate:
+            ttl = 0.0 # 保留主體與 ETag 供條件請求 (304 時不必重新傳輸)，但不在未重新驗證時使用
+        self._remove(key)
+        entry = CacheEntry(
+            tenant_id=key[0],
+            endpoint=key[1],
+            response=response,
+            etag=response.header("etag"),
+            fresh_until=now + ttl,
+            stale_until=now + ttl + (0.0 if must_revalidate else self.stale_while_revalidate),
+            size=size,
+            must_revalidate=must_revalidate,
+        )
+        self._entries[key] = entry
+        self._by_tenant.setdefault(entry.tenant_id, set()).add(key)
+        self.total_bytes += size
+        self._evict()
+        return entry
+
+    def _refresh(self, key: CacheKey, entry: CacheEntry, ttl: float) -> CacheEntry:
+        now = self._clock()
+        if entry.must_revalidate:
+            entry.fresh_until = entry.stale_until = now
+        else:
+            entry.fresh_until = now + ttl
+            entry.stale_until = now + ttl + self.stale_while_revalidate
+        if key in self._entries: # 重新驗證期間已失效的條目不再放回
+            self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size
+        keys = self._by_tenant.get(entry.tenant_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_tenant[entry.tenant_id]
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _revalidate_in_background(self, key: CacheKey, entry: CacheEntry, ttl: float, fetcher: Fetcher) -> None:
+        if key in self._revalidating:
+            return
+        self._revalidating.add(key)
+
+        async def revalidate():
+            try:
+                conditional = {"If-None-Match": entry.etag} if entry.etag else {}
+                response = await fetcher(conditional)
+                if self._entries.get(key) is not entry:
+                    return # 重新驗證期間條目已失效，不要覆寫
+                if response.status_code == 304:
+                    self._refresh(key, entry, ttl)
+                elif response.status_code == 200 and self._store(key, response, ttl) is None:
+                    self._remove(key)
+            except Exception:
+                pass # 重新驗證失敗 (或後端錯誤) 時保留舊條目，直到 stale 視窗結束
+            finally:
+                self._revalidating.discard(key)
+
+        task = asyncio.create_task(revalidate())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
@@ -0,0 +1,240 @@
+import hashlib
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try: # 可選的編碼器；未安裝時不參與協商
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = "gzip"
+BROTLI = "br"
+ZSTD = "zstd"
+
+# 已壓縮或壓縮效益很低的內容類型
+INCOMPRESSIBLE_TYPES = ("audio/", "image/", "video/", "application/zip", "application/gzip", "application/octet-stream")
+
+
+def available_encodings(preference: Sequence[str] = (ZSTD, BROTLI, GZIP)) -> List[str]:
+    """依偏好順序返回已安裝編碼器的編碼 (gzip 一定可用)。"""
+    installed = {GZIP: True, BROTLI: brotli is not None, ZSTD: zstandard is not None}
+    return [encoding for encoding in preference if installed.get(encoding)]
+
+
+def negotiate(accept_encoding: Optional[str], available: Sequence[str]) -> Optional[str]:
+    """
+    依 Accept-Encoding 的 q 值選擇編碼；q 值相同時依伺服器的偏好順序 (available 的順序)。
+    沒有可接受的編碼時返回 None (不壓縮)。
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Encoder:
+    """串流編碼器：每個主體片段壓縮後立即 flush，讓串流響應 (例如 SSE) 不被延遲。"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int, zstd_level: int):
+        self.encoding = encoding
+        if encoding == GZIP:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31) # wbits 31 = gzip 格式
+        elif encoding == BROTLI:
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        if self.encoding == GZIP:
+            output = self._compressor.compress(data)
+            return output + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else output
+        if self.encoding == BROTLI:
+            output = self._compressor.process(data)
+            return output + self._compressor.flush() if flush else output
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else output
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def body_etag(body: bytes) -> str:
+    """以響應主體 (未壓縮) 的雜湊產生弱 ETag；同一內容的各種壓縮表示共用同一個 ETag。"""
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """If-None-Match 使用弱比較 (忽略 W/ 前綴)。"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in (tag.strip() for tag in if_none_match.split(",")))
+
+
+def _compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").lower()
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return False # 例如長時間閒置的事件串流：壓縮需為每個連線保留一份壓縮器狀態
+    return not content_type.startswith(INCOMPRESSIBLE_TYPES) and "content-range" not in headers
+
+
+class CompressionMiddleware:
+    """
+    閘道對客戶端的響應壓縮與條件請求。
+
+    - 依 Accept-Encoding 協商 zstd / br / gzip (只提供已安裝的編碼器)，小於 minimum_size 的完整響應不壓縮；
+      串流響應以串流編碼器逐片段壓縮。
+    - 已帶有 content-encoding 的響應 (上游壓縮後原樣轉發) 不會被解壓再重新編碼。
+    - GET 的 200 完整響應沒有 ETag 時以主體雜湊產生弱 ETag；If-None-Match 相符時 (包括上游提供的 ETag)
+      返回 304 而不送出主體。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        encodings: Sequence[str] = (ZSTD, BROTLI, GZIP),
+        etag: bool = True,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings(encodings)
+        self.etag = etag
+        self._levels = (gzip_level, brotli_quality, zstd_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding"), self.encodings)
+        conditional = self.etag and scope["method"] == "GET"
+        if encoding is None and not conditional:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(self, send, encoding, request_headers.get("if-none-match") if conditional else None, conditional)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    def __init__(self, middleware: CompressionMiddleware, send: Send, encoding: Optional[str], if_none_match: Optional[str], conditional: bool):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.if_none_match = if_none_match
+        self.conditional = conditional
+        self.start: Optional[Message] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+        self.not_modified = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            etag = headers.get("etag")
+            if self.conditional and message["status"] == 200 and etag and etag_matches(etag, self.if_none_match):
+                await self._send_not_modified(etag) # 已有 ETag (例如上游提供) 時不需讀取主體即可判斷
+                return
+            if message["status"] in (204, 304) or "content-encoding" in headers or not _compressible(headers):
+                self.encoding = None
+            if self.encoding is None and (not self.conditional or message["status"] != 200 or etag):
+                self.passthrough = True
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        if self.passthrough:
+            await self._send(message)
+            return
+        if self.not_modified:
+            return # 304 不送出主體
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start["headers"])
+        if self.encoder is None:
+            if not more_body:
+                await self._send_complete(headers, body)
+                return
+            # 串流響應：無法預先計算 ETag，直接開始逐片段壓縮
+            if self.encoding is None:
+                self.passthrough = True
+                await self._send(self.start)
+                await self._send(message)
+                return
+            self.encoder = _Encoder(self.encoding, *self.middleware._levels)
+            self._mark_encoded(headers)
+            del headers["content-length"]
+            self.start["headers"] = headers.raw
+            await self._send(self.start)
+        data = self.encoder.compress(body, flush=True) if more_body else self.encoder.compress(body, flush=False) + self.encoder.finish()
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_complete(self, headers: MutableHeaders, body: bytes) -> None:
+        if self.conditional and self.start["status"] == 200 and "etag" not in headers:
+            etag = body_etag(body)
+            if etag_matches(etag, self.if_none_match):
+                self.not_modified = True
+                await self._send_not_modified(etag)
+                return
+            headers["ETag"] = etag
+        if self.encoding is not None and len(body) >= self.middleware.minimum_size:
+            encoder = _Encoder(self.encoding, *self.middleware._levels)
+            body = encoder.compress(body, flush=False) + encoder.finish()
+            self._mark_encoded(headers)
+            headers["Content-Length"] = str(len(body))
+        self.start["headers"] = headers.raw
+        await self._send(self.start)
+        await self._send({"type": "http.response.body", "body": body, "more_body": False})
+
+    async def _send_not_modified(self, etag: str) -> None:
+        self.not_modified = True
+        headers = Headers(raw=self.start["headers"])
+        # 304 只保留與快取相關的標頭
+        raw = [(b"etag", etag.encode("latin-1"))] + [
+            (key.encode("latin-1"), value.encode("latin-1"))
+            for key, value in headers.items()
+            if key in ("cache-control", "vary", "expires", "content-location", "date")
+        ]
+        await self._send({"type": "http.response.start", "status": 304, "headers": raw})
+        await self._send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    def _mark_encoded(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}" # 壓縮後的表示與原本的強 ETag 不再逐位元組相同
@@ -0,0 +1,308 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import secrets
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from gateway import jsoncodec
+
+# 每個連線的緩衝區滿時的處理策略
+DROP_OLDEST = "drop_oldest" # 捨棄最舊的事件，客戶端可依 Last-Event-ID 重新讀取列表
+DISCONNECT = "disconnect" # 中斷跟不上的連線，讓客戶端重新連線並補齊
+
+SIGNATURE_HEADER = "X-OrbitPress-Signature"
+
+
+def sign_payload(secret: str, body: bytes, timestamp: int) -> str:
+    """Webhook 簽章："t=<unix 秒>,v1=<HMAC-SHA256(secret, "<t>." + body)>"。"""
+    digest = hmac.new(secret.encode("utf-8"), b"%d." % timestamp + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify_signature(secret: str, body: bytes, header: Optional[str], tolerance: float = 300.0, now: Optional[float] = None) -> bool:
+    """驗證 Webhook 簽章；時間戳超過 tolerance 秒的請求視為重放而拒絕。"""
+    if not header:
+        return False
+    fields = dict(part.strip().partition("=")[::2] for part in header.split(","))
+    try:
+        timestamp = int(fields.get("t", ""))
+    except ValueError:
+        return False
+    if abs((time.time() if now is None else now) - timestamp) > tolerance:
+        return False
+    expected = sign_payload(secret, body, timestamp).rpartition("v1=")[2]
+    return hmac.compare_digest(expected, fields.get("v1", ""))
+
+
+class StreamTickets:
+    """
+    事件串流的短效、一次性票證。
+
+    瀏覽器的 EventSource 無法設定 Authorization 標頭，但長期有效的 JWT 不能放在 URL 中 (會出現在存取日誌與代理日誌)。
+    客戶端先以 Bearer Token 換取票證，再以 ?ticket= 開啟串流。票證以 HMAC 簽章 (任何 worker 或副本都能驗證)，
+    ttl 秒後失效；同一進程內每張票證只能使用一次。簽章金鑰由 JWT 金鑰衍生，票證不能當作 JWT 使用。
+    """
+
+    def __init__(self, secret: str, ttl: float = 30.0, clock: Callable[[], float] = time.time):
+        self._key = hashlib.sha256(b"orbitpress-stream-ticket:" + secret.encode("utf-8")).digest()
+        self.ttl = ttl
+        self._clock = clock
+        self._redeemed: Dict[str, float] = {} # nonce -> 到期時間 (到期後即可移除)
+        self.issued = 0
+        self.rejected = 0
+
+    def issue(self, tenant_id: str, user_id: str) -> str:
+        payload = base64.urlsafe_b64encode(jsoncodec.dumps({
+            "tenant_id": tenant_id,
+            "user_id": user_id,
+            "exp": self._clock() + self.ttl,
+            "nonce": secrets.token_urlsafe(12),
+        })).rstrip(b"=")
+        self.issued += 1
+        return f"{payload.decode('ascii')}.{self._sign(payload)}"
+
+    def redeem(self, ticket: str) -> Optional[Tuple[str, str]]:
+        """驗證並使用票證，返回 (租戶 ID, 用戶 ID)；簽章無效、已過期或已使用時返回 None。"""
+        payload, _, signature = ticket.encode("ascii", "replace").partition(b".")
+        claims = None
+        if hmac.compare_digest(self._sign(payload).encode("ascii"), signature):
+            try:
+                claims = jsoncodec.loads(base64.urlsafe_b64decode(payload + b"=" * (-len(payload) % 4)))
+            except ValueError:
+                pass
+        now = self._clock()
+        for nonce in [nonce for nonce, expires in self._redeemed.items() if expires < now]:
+            del self._redeemed[nonce]
+        if claims is None or claims["exp"] < now or claims["nonce"] in self._redeemed:
+            self.rejected += 1
+            return None
+        self._redeemed[claims["nonce"]] = claims["exp"]
+        return claims["tenant_id"], claims["user_id"]
+
+    def _sign(self, payload: bytes) -> str:
+        return base64.urlsafe_b64encode(hmac.new(self._key, payload, hashlib.sha256).digest()).rstrip(b"=").decode("ascii")
+
+
+class Event:
+    """一個租戶事件；SSE 格式的位元組只編碼一次，所有訂閱者共享。"""
+
+    __slots__ = ("id", "tenant_id", "type", "data", "frame")
+
+    def __init__(self, event_id: str, tenant_id: str, event_type: str, data: bytes):
+        self.id = event_id
+        self.tenant_id = tenant_id
+        self.type = event_type
+        self.data = data
+        self.frame = b"id: %s\nevent: %s\ndata: %s\n\n" % (event_id.encode("ascii"), event_type.encode("utf-8"), data)
+
+    def to_message(self) -> bytes:
+        return jsoncodec.dumps({"id": self.id, "tenant_id": self.tenant_id, "type": self.type, "data": jsoncodec.loads(self.data)})
+
+    @classmethod
+    def from_message(cls, message: bytes) -> "Event":
+        payload = jsoncodec.loads(message)
+        return cls(payload["id"], payload["tenant_id"], payload["type"], jsoncodec.dumps(payload["data"]))
+
+
+class Subscription:
+    """
+    一個客戶端連線的訂閱：有界的事件緩衝區與喚醒旗標。
+    閒置的連線只佔用這個物件與一個等待中的協程。
+    """
+
+    __slots__ = ("tenant_id", "types", "maxsize", "policy", "dropped", "closed", "_buffer", "_ready")
+
+    def __init__(self, tenant_id: str, types: Optional[FrozenSet[str]], maxsize: int, policy: str):
+        self.tenant_id = tenant_id
+        self.types = types
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._buffer: Deque[Event] = deque()
+        self._ready = asyncio.Event()
+
+    def wants(self, event: Event) -> bool:
+        return self.types is None or event.type in self.types
+
+    def offer(self, event: Event) -> bool:
+        """放入事件；返回是否因緩衝區已滿而捨棄了事件 (或中斷了連線)。"""
+        if self.closed:
+            return False
+        overflow = len(self._buffer) >= self.maxsize
+        if overflow:
+            self.dropped += 1
+            if self.policy == DISCONNECT:
+                self.close()
+                return True
+            self._buffer.popleft()
+        self._buffer.append(event)
+        self._ready.set()
+        return overflow
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> List[Event]:
+        """等待並取出所有已緩衝的事件；timeout 秒內沒有事件時返回空列表 (用於心跳)。"""
+        if not self._buffer and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        events = list(self._buffer)
+        self._buffer.clear()
+        return events
+
+
+class SubscriberLimitReached(Exception):
+    pass
+
+
+class EventHub:
+    """
+    進程內的租戶事件扇出。
+
+    每個租戶一個主題；發布時對該租戶的訂閱者各做一次非阻塞的緩衝區放入 (不等待慢速的客戶端)。
+    每個租戶保留最近 history_size 個事件，重新連線的客戶端可依 Last-Event-ID 補齊。
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 64,
+        policy: str = DROP_OLDEST,
+        history_size: int = 100,
+        max_subscribers: int = 50000,
+        clock: Callable[[], float] = time.time,
+    ):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"未知的緩衝區策略: {policy}")
+        self.buffer_size = max(1, buffer_size)
+        self.policy = policy
+        self.history_size = history_size
+        self.max_subscribers = max_subscribers
+        self._clock = clock
+        self._sequence = itertools.count(1)
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._history: Dict[str, Deque[Event]] = {}
+        self.subscribers = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "EventHub":
+        return cls(
+            buffer_size=settings.EVENTS_BUFFER_SIZE,
+            policy=settings.EVENTS_OVERFLOW_POLICY,
+            history_size=settings.EVENTS_HISTORY_SIZE,
+            max_subscribers=settings.EVENTS_MAX_CONNECTIONS,
+        )
+
+    def create_event(self, tenant_id: str, event_type: str, data: dict) -> Event:
+        # ID 以毫秒時間戳開頭，多個副本產生的 ID 也大致依時間排序
+        event_id = f"{int(self._clock() * 1000)}-{next(self._sequence)}"
+        return Event(event_id, tenant_id, event_type, jsoncodec.dumps(data))
+
+    def subscribe(self, tenant_id: str, types: Optional[FrozenSet[str]] = None, last_event_id: Optional[str] = None) -> Subscription:
+        if self.subscribers >= self.max_subscribers:
+            raise SubscriberLimitReached(f"已達連線上限 {self.max_subscribers}")
+        subscription = Subscription(tenant_id, types, self.buffer_size, self.policy)
+        if last_event_id:
+            history = list(self._history.get(tenant_id, ()))
+            for position, event in enumerate(history):
+                if event.id == last_event_id:
+                    for missed in history[position + 1:]:
+                        if subscription.wants(missed):
+                            subscription.offer(missed)
+                    break
+        self._topics.setdefault(tenant_id, set()).add(subscription)
+        self.subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        topic = self._topics.get(subscription.tenant_id)
+        if topic is None or subscription not in topic:
+            return
+        topic.discard(subscription)
+        self.subscribers -= 1
+        if not topic:
+            del self._topics[subscription.tenant_id]
+        subscription.close()
+
+    def deliver(self, event: Event) -> int:
+        """將事件放入租戶所有訂閱者的緩衝區，返回送達的連線數。"""
+        self.published += 1
+        if self.history_size > 0:
+            history = self._history.get(event.tenant_id)
+            if history is None:
+                history = self._history[event.tenant_id] = deque(maxlen=self.history_size)
+            history.append(event)
+        delivered = 0
+        for subscription in list(self._topics.get(event.tenant_id, ())):
+            if not subscription.wants(event):
+                continue
+            if subscription.offer(event):
+                self.dropped += 1
+            if subscription.closed:
+                self.disconnected += 1
+                self.unsubscribe(subscription)
+            else:
+                delivered += 1
+        self.delivered += delivered
+        return delivered
+
+    def connections(self, tenant_id: str) -> int:
+        return len(self._topics.get(tenant_id, ()))
+
+    def close_all(self) -> None:
+        for topic in list(self._topics.values()):
+            for subscription in list(topic):
+                self.unsubscribe(subscription)
+
+
+class RedisEventRelay:
+    """
+    以 Redis pub/sub 在所有閘道副本與 worker 之間轉送事件：Webhook 只會到達其中一個進程，
+    每個進程訂閱同一個頻道，再各自扇出給本地的連線。
+    """
+
+    def __init__(self, url: str, channel: str = "orbitpress:events"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("EVENTS_REDIS_URL 需要安裝 redis 套件")
+        self._redis = redis.from_url(url)
+        self.channel = channel
+        self.errors = 0
+
+    async def publish(self, event: Event) -> None:
+        await self._redis.publish(self.channel, event.to_message())
+
+    async def run(self, hub: EventHub, retry_interval: float = 1.0) -> None:
+        """訂閱頻道並將收到的事件交給本地的 hub；連線中斷時重新訂閱 (期間的事件由 Last-Event-ID 補齊)。"""
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            try:
+                                hub.deliver(Event.from_message(message["data"]))
+                            except (ValueError, KeyError, TypeError):
+                                self.errors += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+                await asyncio.sleep(retry_interval)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
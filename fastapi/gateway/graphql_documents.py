@@ -0,0 +1,193 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional, Set
+
+if TYPE_CHECKING:
+    from graphql.language import DocumentNode, FragmentDefinitionNode, OperationDefinitionNode, SelectionSetNode
+
+# Apollo Automatic Persisted Queries 協定中的錯誤訊息與代碼
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+PERSISTED_QUERY_NOT_SUPPORTED = "PersistedQueryNotSupported"
+
+
+class GraphQLDocumentError(Exception):
+    """查詢無法通過閘道端的檢查 (語法錯誤、過深、雜湊不符等)，不需轉發到後端。"""
+
+
+class PersistedQueryNotFound(GraphQLDocumentError):
+    def __init__(self):
+        super().__init__(PERSISTED_QUERY_NOT_FOUND)
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def persisted_query_hash(extensions: Optional[Mapping[str, Any]]) -> Optional[str]:
+    """從 extensions.persistedQuery 取出 sha256Hash；不是 APQ 請求時返回 None。"""
+    persisted = (extensions or {}).get("persistedQuery")
+    if not isinstance(persisted, Mapping):
+        return None
+    if persisted.get("version", 1) != 1 or not isinstance(persisted.get("sha256Hash"), str):
+        raise GraphQLDocumentError(PERSISTED_QUERY_NOT_SUPPORTED)
+    return persisted["sha256Hash"].lower()
+
+
+class PersistedQueryStore:
+    """
+    Automatic Persisted Queries 的雜湊到查詢文件的 LRU 存放區。
+
+    客戶端先只送出 sha256 雜湊；未知的雜湊返回 PersistedQueryNotFound，客戶端再連同完整查詢重送一次以註冊。
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._queries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.registrations = 0
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def resolve(self, sha256_hash: str, query: Optional[str]) -> str:
+        """返回雜湊對應的查詢；附帶完整查詢時驗證雜湊後註冊。"""
+        if query is not None:
+            if query_hash(query) != sha256_hash:
+                raise GraphQLDocumentError("provided sha does not match query")
+            if sha256_hash not in self._queries:
+                self.registrations += 1
+            self._store(sha256_hash, query)
+            return query
+        stored = self._queries.get(sha256_hash)
+        if stored is None:
+            self.misses += 1
+            raise PersistedQueryNotFound()
+        self._queries.move_to_end(sha256_hash)
+        self.hits += 1
+        return stored
+
+    def _store(self, sha256_hash: str, query: str) -> None:
+        self._queries[sha256_hash] = query
+        self._queries.move_to_end(sha256_hash)
+        if len(self._queries) > self.max_entries:
+            self._queries.popitem(last=False)
+
+
+@dataclass(frozen=True)
+class DocumentInfo:
+    operation_type: str # "query"、"mutation" 或 "subscription"
+    depth: int
+    minified: str # 移除註解與多餘空白後的查詢，轉發給後端
+
+
+class DocumentCache:
+    """
+    已解析 GraphQL 文件的 LRU 快取 (以 graphql-core 解析)。
+
+    閘道沒有 Laravel 端的 schema，因此只做不需 schema 的檢查：語法、只允許可執行定義、
+    operationName 對應、token 數與查詢深度上限。檢查結果 (包含錯誤) 依查詢文字快取，
+    相同的查詢只解析一次。
+    """
+
+    def __init__(self, max_entries: int = 1000, max_depth: int = 10, max_tokens: int = 5000):
+        self.max_entries = max_entries
+        self.max_depth = max_depth
+        self.max_tokens = max_tokens
+        self._documents: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "DocumentCache":
+        return cls(
+            max_entries=settings.GRAPHQL_DOCUMENT_CACHE_MAX_ENTRIES,
+            max_depth=settings.GRAPHQL_MAX_DEPTH,
+            max_tokens=settings.GRAPHQL_MAX_TOKENS,
+        )
+
+    def check(self, query: str, operation_name: Optional[str] = None) -> DocumentInfo:
+        """返回查詢的操作資訊；查詢無效時拋出 GraphQLDocumentError。"""
+        cache_key = f"{operation_name or ''}\n{query}"
+        cached = self._documents.get(cache_key)
+        if cached is not None:
+            self._documents.move_to_end(cache_key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                cached = self._analyze(query, operation_name)
+            except GraphQLDocumentError as e:
+                cached = e
+            self._documents[cache_key] = cached
+            if len(self._documents) > self.max_entries:
+                self._documents.popitem(last=False)
+        if isinstance(cached, GraphQLDocumentError):
+            raise cached
+        return cached
+
+    def _analyze(self, query: str, operation_name: Optional[str]) -> DocumentInfo:
+        # graphql-core 的匯入約需 0.2 秒，延後到第一次解析查詢 (不使用 /graphql 的 worker 不必載入)
+        from graphql import GraphQLError, parse
+        from graphql.utilities import strip_ignored_characters
+
+        try:
+            document = parse(query, no_location=True, max_tokens=self.max_tokens)
+        except GraphQLError as e:
+            raise GraphQLDocumentError(f"語法錯誤: {e.message}")
+        operation = _select_operation(document, operation_name)
+        fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if definition.kind == "fragment_definition"
+        }
+        depth = _selection_depth(operation.selection_set, fragments, set())
+        if depth > self.max_depth:
+            raise GraphQLDocumentError(f"查詢深度 {depth} 超過上限 {self.max_depth}")
+        return DocumentInfo(operation.operation.value, depth, strip_ignored_characters(query))
+
+
+def _select_operation(document: "DocumentNode", operation_name: Optional[str]) -> "OperationDefinitionNode":
+    operations = []
+    for definition in document.definitions:
+        if definition.kind == "operation_definition":
+            operations.append(definition)
+        elif definition.kind != "fragment_definition":
+            raise GraphQLDocumentError("查詢只能包含 operation 與 fragment 定義")
+    if operation_name:
+        for operation in operations:
+            if operation.name and operation.name.value == operation_name:
+                return operation
+        raise GraphQLDocumentError(f"找不到名為 {operation_name} 的 operation")
+    if len(operations) != 1:
+        raise GraphQLDocumentError("包含多個 operation 時必須提供 operationName")
+    return operations[0]
+
+
+def _selection_depth(
+    selection_set: Optional["SelectionSetNode"],
+    fragments: Dict[str, "FragmentDefinitionNode"],
+    visiting: Set[str],
+) -> int:
+    if selection_set is None:
+        return 0
+    depth = 0
+    for selection in selection_set.selections:
+        if selection.kind == "field":
+            if selection.name.value.startswith("__"):
+                continue # 內省欄位 (__typename、__schema) 不計入深度
+            depth = max(depth, 1 + _selection_depth(selection.selection_set, fragments, visiting))
+        elif selection.kind == "inline_fragment":
+            depth = max(depth, _selection_depth(selection.selection_set, fragments, visiting))
+        elif selection.kind == "fragment_spread":
+            name = selection.name.value
+            fragment = fragments.get(name)
+            if fragment is None:
+                raise GraphQLDocumentError(f"未定義的 fragment: {name}")
+            if name in visiting:
+                raise GraphQLDocumentError(f"fragment 循環引用: {name}")
+            visiting.add(name)
+            depth = max(depth, _selection_depth(fragment.selection_set, fragments, visiting))
+            visiting.discard(name)
+    return depth
@@ -0,0 +1,104 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Union
+
+from starlette.responses import JSONResponse, Response
+
+from gateway.tracing import SERIALIZATION, stage
+
+try: # 可選的高速 JSON 實作；都未安裝時使用標準庫
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+AUTO = "auto"
+ORJSON = "orjson"
+MSGSPEC = "msgspec"
+STDLIB = "json"
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+@dataclass(frozen=True)
+class JSONCodec:
+    name: str
+    dumps: Callable[[Any, bool], bytes] # (物件, 是否排序鍵) -> UTF-8 位元組
+    loads: Callable[[Union[bytes, str]], Any]
+
+
+def _stdlib_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    # 與 Starlette JSONResponse 相同的輸出格式
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":"), sort_keys=sort_keys).encode("utf-8")
+
+
+def _orjson_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return orjson.dumps(obj, option=option)
+
+
+def _msgspec_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    return msgspec.json.encode(obj, order="sorted" if sort_keys else None)
+
+
+def available_codecs():
+    codecs = []
+    if orjson is not None:
+        codecs.append(JSONCodec(ORJSON, _orjson_dumps, orjson.loads))
+    if msgspec is not None:
+        codecs.append(JSONCodec(MSGSPEC, _msgspec_dumps, msgspec.json.decode))
+    codecs.append(JSONCodec(STDLIB, _stdlib_dumps, json.loads))
+    return codecs
+
+
+def get_codec(name: str = AUTO) -> JSONCodec:
+    """依名稱選擇 JSON 實作；auto 依序使用 orjson、msgspec、標準庫。指定的實作未安裝時退回標準庫。"""
+    codecs = available_codecs()
+    if name == AUTO:
+        return codecs[0]
+    for codec in codecs:
+        if codec.name == name:
+            return codec
+    return codecs[-1]
+
+
+_codec = get_codec()
+
+
+def configure(name: str) -> JSONCodec:
+    global _codec
+    _codec = get_codec(name)
+    return _codec
+
+
+def codec() -> JSONCodec:
+    return _codec
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    return _codec.dumps(obj, sort_keys)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return _codec.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """以目前設定的 JSON 實作序列化的 JSONResponse (閘道的預設響應類別)。"""
+
+    def render(self, content: Any) -> bytes:
+        with stage(SERIALIZATION):
+            return dumps(content)
+
+
+def raw_json_response(body: bytes, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """直接以上游的 JSON 位元組建立響應，不解碼也不重新編碼。"""
+    return Response(content=body, status_code=status_code, headers=headers, media_type=JSON_MEDIA_TYPE)
+
+
+def is_json_content_type(content_type: Optional[str]) -> bool:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type == JSON_MEDIA_TYPE or media_type.endswith("+json")
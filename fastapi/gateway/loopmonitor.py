@@ -0,0 +1,262 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+# 預設只把閘道自己的程式碼視為阻塞的來源 (fastapi/ 目錄，不含第三方套件)
+DEFAULT_ROOTS = (os.path.dirname(os.path.dirname(os.path.abspath(__file__))),)
+OTHER_LOCATION = "__other__" # 超過 max_locations 之後的新位置
+
+
+@dataclass
+class BlockingReport:
+    """一次事件迴圈被佔用超過門檻的紀錄。"""
+    location: str # 阻塞時最內層的閘道程式碼位置 ("路徑:行號 函式")
+    task: Optional[str] # 當時執行中的 asyncio 任務
+    started_at: float # time.time()
+    duration: float # 事件迴圈無法排程的秒數 (迴圈恢復後更新為最終值)
+    stack: List[str] = field(default_factory=list)
+    _deadline: float = field(default=0.0, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "location": self.location,
+            "task": self.task,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "stack": self.stack,
+        }
+
+
+def attribute(stack: Sequence[traceback.FrameSummary], roots: Sequence[str] = DEFAULT_ROOTS) -> str:
+    """由內而外找到第一個屬於 roots 的非第三方程式碼框架；都沒有時使用最內層的框架。"""
+    for summary in reversed(stack):
+        path = os.path.abspath(summary.filename)
+        if "site-packages" not in path and any(path.startswith(root) for root in roots):
+            relative = os.path.relpath(path, next(root for root in roots if path.startswith(root)))
+            return f"{relative}:{summary.lineno} {summary.name}"
+    if stack:
+        return f"{os.path.basename(stack[-1].filename)}:{stack[-1].lineno} {stack[-1].name}"
+    return "unknown"
+
+
+class LoopMonitor:
+    """
+    事件迴圈健康監測。
+
+    取樣任務每 interval 秒排程一次，實際醒來時間與預期的差即為事件迴圈延遲。另一個監視執行緒在
+    迴圈超過 block_threshold 秒沒有排程時擷取迴圈執行緒的堆疊，找出佔用迴圈的程式碼位置 (同步的
+    檔案或 CPU 工作、阻塞的呼叫)。取樣時也記錄 anyio 執行緒池 (同步端點與 run_in_threadpool) 的使用量。
+    延遲的移動平均或執行緒池佇列超過設定值時 overloaded() 為 True，供准入前的負載卸除使用。
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        block_threshold: float = 0.1,
+        shed_lag: float = 0.0,
+        shed_threadpool_queue: int = 0,
+        smoothing: float = 0.2,
+        window: int = 600,
+        max_reports: int = 50,
+        max_locations: int = 100,
+        stack_limit: int = 30,
+        roots: Sequence[str] = DEFAULT_ROOTS,
+        on_block: Optional[Callable[[BlockingReport], None]] = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.shed_lag = shed_lag # 0 表示不依延遲卸除負載
+        self.shed_threadpool_queue = shed_threadpool_queue # 0 表示不依執行緒池佇列卸除負載
+        self.smoothing = smoothing
+        self.max_locations = max_locations
+        self.stack_limit = stack_limit
+        self.roots = tuple(os.path.abspath(root) for root in roots)
+        self.on_block = on_block
+        self._clock = clock
+        self._lags: Deque[float] = deque(maxlen=window)
+        self._reports: Deque[BlockingReport] = deque(maxlen=max_reports)
+        self._active: Optional[BlockingReport] = None
+        self._lock = threading.Lock()
+        self._deadline: Optional[float] = None # 取樣任務預期醒來的時間 (None 表示未在取樣)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._sampler: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.lag = 0.0 # 最近一次取樣的延遲
+        self.lag_ewma = 0.0
+        self.lag_seconds = 0.0 # 累計延遲
+        self.samples = 0
+        self.blocked: Dict[str, int] = {}
+        self.blocked_seconds: Dict[str, float] = {}
+        self.threadpool_size = 0
+        self.threadpool_busy = 0
+        self.threadpool_waiting = 0
+        self.threadpool_saturated = 0 # 執行緒全部忙碌的取樣次數
+        self.shed = 0
+
+    @classmethod
+    def from_settings(cls, settings, on_block: Optional[Callable[[BlockingReport], None]] = None) -> "LoopMonitor":
+        return cls(
+            interval=settings.LOOP_MONITOR_INTERVAL_MS / 1000,
+            block_threshold=settings.LOOP_BLOCK_THRESHOLD_MS / 1000,
+            shed_lag=settings.LOOP_SHED_LAG_MS / 1000,
+            shed_threadpool_queue=settings.LOOP_SHED_THREADPOOL_QUEUE,
+            on_block=on_block,
+        )
+
+    def start(self) -> None:
+        """在事件迴圈中呼叫：啟動取樣任務與監視執行緒。"""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._sampler = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            try:
+                await self._sampler
+            except asyncio.CancelledError:
+                pass
+            self._sampler = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+        self._deadline = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = self._clock() + self.interval
+            self._deadline = expected
+            await asyncio.sleep(self.interval)
+            self._deadline = None
+            self.record_lag(max(0.0, self._clock() - expected))
+            self.sample_threadpool()
+
+    def _watch(self) -> None:
+        step = max(0.005, self.block_threshold / 4)
+        while not self._stopped.wait(step):
+            self.check()
+
+    def record_lag(self, lag: float) -> None:
+        """記錄一次延遲取樣 (在事件迴圈中)；若監視執行緒記錄了進行中的阻塞，以實際延遲結束該紀錄。"""
+        self.lag = lag
+        self.lag_ewma += self.smoothing * (lag - self.lag_ewma)
+        self.lag_seconds += lag
+        self.samples += 1
+        self._lags.append(lag)
+        with self._lock:
+            report, self._active = self._active, None
+        if report is not None:
+            report.duration = max(report.duration, lag)
+            self.blocked[report.location] = self.blocked.get(report.location, 0) + 1
+            self.blocked_seconds[report.location] = self.blocked_seconds.get(report.location, 0.0) + report.duration
+            if self.on_block is not None:
+                self.on_block(report)
+
+    def check(self) -> Optional[BlockingReport]:
+        """監視執行緒的一次檢查：迴圈超過門檻未排程時擷取堆疊 (每次阻塞只擷取一次)，返回進行中的紀錄。"""
+        deadline = self._deadline
+        if deadline is None:
+            return None
+        overdue = self._clock() - deadline
+        if overdue < self.block_threshold:
+            return None
+        with self._lock:
+            if self._deadline != deadline:
+                return None # 迴圈剛恢復排程
+            if self._active is not None and self._active._deadline == deadline:
+                self._active.duration = overdue
+                return self._active
+            stack = self._capture_stack()
+            try:
+                task = asyncio.current_task(self._loop) if self._loop is not None else None
+            except RuntimeError:
+                task = None
+            report = BlockingReport(
+                location=self._location(attribute(stack, self.roots)),
+                task=task.get_name() if task is not None else None,
+                started_at=time.time() - overdue,
+                duration=overdue,
+                stack=traceback.format_list(stack),
+                _deadline=deadline,
+            )
+            self._active = report
+            self._reports.append(report)
+            return report
+
+    def _capture_stack(self) -> List[traceback.FrameSummary]:
+        frame = sys._current_frames().get(self._thread_id) if self._thread_id is not None else None
+        if frame is None:
+            return []
+        return list(traceback.extract_stack(frame, limit=self.stack_limit))
+
+    def _location(self, location: str) -> str:
+        if location in self.blocked or len(self.blocked) < self.max_locations:
+            return location
+        return OTHER_LOCATION
+
+    def sample_threadpool(self) -> None:
+        """記錄 anyio 預設執行緒池的大小、忙碌的執行緒與等待中的工作 (在事件迴圈中)。"""
+        try:
+            from anyio import to_thread
+            limiter = to_thread.current_default_thread_limiter()
+        except (ImportError, RuntimeError):
+            return
+        statistics = limiter.statistics()
+        self.threadpool_size = int(limiter.total_tokens)
+        self.threadpool_busy = statistics.borrowed_tokens
+        self.threadpool_waiting = statistics.tasks_waiting
+        if self.threadpool_busy >= self.threadpool_size:
+            self.threadpool_saturated += 1
+
+    def lag_percentile(self, q: float) -> float:
+        """最近 window 次取樣的延遲百分位數。"""
+        if not self._lags:
+            return 0.0
+        ordered = sorted(self._lags)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def overloaded(self) -> bool:
+        return (self.shed_lag > 0 and self.lag_ewma >= self.shed_lag) or (
+            self.shed_threadpool_queue > 0 and self.threadpool_waiting >= self.shed_threadpool_queue
+        )
+
+    def shed_load(self) -> bool:
+        """過載時記錄一次負載卸除並返回 True，呼叫者應以 503 拒絕請求。"""
+        if self.overloaded():
+            self.shed += 1
+            return True
+        return False
+
+    def recent(self, limit: int = 50) -> List[BlockingReport]:
+        return list(self._reports)[-limit:][::-1]
+
+    def top_locations(self, limit: int = 10) -> List[Tuple[str, int, float]]:
+        """依累計阻塞時間排序的 (位置, 次數, 秒數)。"""
+        ranked = sorted(self.blocked_seconds.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(location, self.blocked[location], seconds) for location, seconds in ranked]
+
+    def stats(self) -> dict:
+        return {
+            "lag_ms": round(self.lag * 1000, 3),
+            "lag_ewma_ms": round(self.lag_ewma * 1000, 3),
+            "lag_p99_ms": round(self.lag_percentile(0.99) * 1000, 3),
+            "samples": self.samples,
+            "threadpool": {"size": self.threadpool_size, "busy": self.threadpool_busy, "waiting": self.threadpool_waiting},
+            "shed": self.shed,
+            "top_blocking": [
+                {"location": location, "count": count, "seconds": round(seconds, 3)} for location, count, seconds in self.top_locations()
+            ],
+        }
@@ -0,0 +1,346 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol, Tuple
+
+from gateway import jsoncodec
+
+# 用量的彙總維度與計數欄位
+UsageKey = Tuple[str, str, str] # (租戶, 用戶, 路由樣式)
+FIELDS = ("requests", "errors", "bytes_in", "bytes_out", "upstream_ms", "tts_characters")
+OVERFLOW_ROUTE = "__overflow__" # 單一窗口的鍵數超過上限時，新的鍵歸入此路由 (用量不會遺失)
+UNAUTHENTICATED_TENANT = "unauthenticated" # 未驗證身份的請求 (例如不帶 JWT 的 /tts) 一律計入此租戶
+
+
+class UsageSink(Protocol):
+    async def send(self, batch_id: str, records: List[Dict[str, Any]]) -> None:
+        """寫入一批用量紀錄；失敗時引發例外 (批次保留在暫存區稍後重送，相同 batch_id 可能重送)。"""
+
+
+class UsageBatch:
+    __slots__ = ("id", "records", "path")
+
+    def __init__(self, batch_id: str, records: List[Dict[str, Any]], path: Optional[str] = None):
+        self.id = batch_id
+        self.records = records
+        self.path = path # 暫存檔路徑 (未設定暫存目錄時為 None)
+
+
+class UsageMeter:
+    """
+    依租戶、用戶與路由彙總的用量計量。
+
+    請求路徑上只更新記憶體中的計數 (不做任何 I/O)；背景任務每 flush_interval 秒或累積 flush_events 筆後
+    將計數整批交給 sink (檔案、SQLite 或 Laravel 端點)。設定 spool_dir 時批次先寫入暫存檔再送出，
+    送出成功才刪除，因此 sink 無法使用或進程崩潰時已結算的批次不會遺失 (由重啟後的進程重送)；
+    尚未結算的計數最多遺失一個 flush_interval。
+    """
+
+    def __init__(
+        self,
+        sink: UsageSink,
+        flush_interval: float = 10.0,
+        flush_events: int = 5000,
+        spool_dir: str = "",
+        max_keys: int = 10000,
+        max_pending: int = 1000,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.sink = sink
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self.spool_dir = spool_dir
+        self.max_keys = max_keys
+        self.max_pending = max_pending
+        self._clock = clock
+        self._usage: Dict[UsageKey, List[float]] = {}
+        self._window_start = clock()
+        self._events = 0
+        self._pending: Deque[UsageBatch] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.recorded = 0
+        self.flushed_batches = 0
+        self.flushed_records = 0
+        self.failures = 0
+        self.dropped_batches = 0 # 暫存區已滿而捨棄的批次
+
+    @classmethod
+    def from_settings(cls, settings, sink: UsageSink) -> "UsageMeter":
+        return cls(
+            sink,
+            flush_interval=settings.METERING_FLUSH_INTERVAL,
+            flush_events=settings.METERING_FLUSH_EVENTS,
+            spool_dir=settings.METERING_SPOOL_DIR,
+            max_keys=settings.METERING_MAX_KEYS,
+        )
+
+    def record(
+        self,
+        tenant_id: str,
+        user_id: str,
+        route: str,
+        requests: int = 1,
+        errors: int = 0,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+        upstream_seconds: float = 0.0,
+        tts_characters: int = 0,
+    ) -> None:
+        key = (tenant_id or "", user_id or "", route)
+        counters = self._usage.get(key)
+        if counters is None:
+            if len(self._usage) >= self.max_keys:
+                key = (key[0], "", OVERFLOW_ROUTE)
+                counters = self._usage.get(key)
+            if counters is None:
+                counters = self._usage[key] = [0, 0, 0, 0, 0.0, 0]
+        counters[0] += requests
+        counters[1] += errors
+        counters[2] += bytes_in
+        counters[3] += bytes_out
+        counters[4] += upstream_seconds * 1000
+        counters[5] += tts_characters
+        self.recorded += 1
+        self._events += 1
+        if self._events >= self.flush_events and self._wakeup is not None:
+            self._wakeup.set()
+
+    def usage(self) -> Dict[UsageKey, Dict[str, float]]:
+        """目前窗口 (尚未結算) 的計數。"""
+        return {key: dict(zip(FIELDS, counters)) for key, counters in self._usage.items()}
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _close_window(self) -> Optional[UsageBatch]:
+        if not self._usage:
+            return None
+        usage, self._usage = self._usage, {}
+        window_start, window_end = self._window_start, self._clock()
+        self._window_start = window_end
+        self._events = 0
+        records = [
+            {
+                "window_start": window_start,
+                "window_end": window_end,
+                "tenant_id": tenant_id,
+                "user_id": user_id,
+                "route": route,
+                **{name: (round(value, 3) if name == "upstream_ms" else int(value)) for name, value in zip(FIELDS, counters)},
+            }
+            for (tenant_id, user_id, route), counters in usage.items()
+        ]
+        return UsageBatch(uuid.uuid4().hex, records)
+
+    async def flush(self) -> int:
+        """結算目前窗口並送出所有待送的批次，返回成功送出的批次數。"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = self._close_window()
+            if batch is not None:
+                if self.spool_dir:
+                    batch.path = os.path.join(self.spool_dir, f"{os.getpid()}-{batch.id}.json")
+                    try:
+                        await asyncio.to_thread(_write_atomic, batch.path, jsoncodec.dumps({"id": batch.id, "records": batch.records}))
+                    except OSError:
+                        batch.path = None # 暫存區無法寫入時仍嘗試直接送出
+                self._pending.append(batch)
+                while len(self._pending) > self.max_pending:
+                    dropped = self._pending.popleft()
+                    self.dropped_batches += 1
+                    if dropped.path:
+                        await asyncio.to_thread(_remove_file, dropped.path)
+
+            sent = 0
+            while self._pending:
+                batch = self._pending[0]
+                try:
+                    await self.sink.send(batch.id, batch.records)
+                except Exception:
+                    self.failures += 1
+                    break # 保留順序，下次結算時重送
+                self._pending.popleft()
+                sent += 1
+                self.flushed_batches += 1
+                self.flushed_records += len(batch.records)
+                if batch.path:
+                    await asyncio.to_thread(_remove_file, batch.path)
+            return sent
+
+    async def recover(self) -> int:
+        """載入已結束進程遺留的暫存批次 (改為本進程所有) 以便重送，返回載入的批次數。"""
+        if not self.spool_dir:
+            return 0
+        batches = await asyncio.to_thread(_claim_spool, self.spool_dir)
+        for batch in batches:
+            self._pending.append(batch)
+        return len(batches)
+
+    async def run(self) -> None:
+        """背景結算任務：每 flush_interval 秒或累積 flush_events 筆用量時送出。"""
+        self._wakeup = asyncio.Event()
+        await self.recover()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                self.failures += 1 # 暫存區的檔案操作失敗時不中斷背景任務
+
+
+class JsonLinesSink:
+    """每筆用量寫成一行 JSON (本地開發與測試)。"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def send(self, batch_id: str, records: List[Dict[str, Any]]) -> None:
+        lines = b"".join(jsoncodec.dumps({"batch_id": batch_id, **record}) + b"\n" for record in records)
+        await asyncio.to_thread(_append, self.path, lines)
+
+
+class SQLiteSink:
+    """寫入 SQLite 的 usage 資料表；同一批次重送時以 (batch_id, 租戶, 用戶, 路由) 去重。"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def send(self, batch_id: str, records: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._insert, batch_id, records)
+
+    def _insert(self, batch_id: str, records: List[Dict[str, Any]]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "batch_id TEXT, window_start REAL, window_end REAL, tenant_id TEXT, user_id TEXT, route TEXT, "
+                "requests INTEGER, errors INTEGER, bytes_in INTEGER, bytes_out INTEGER, upstream_ms REAL, tts_characters INTEGER, "
+                "PRIMARY KEY (batch_id, tenant_id, user_id, route))"
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (batch_id, record["window_start"], record["window_end"], record["tenant_id"], record["user_id"], record["route"],
+                     *(record[name] for name in FIELDS))
+                    for record in records
+                ],
+            )
+        connection.close()
+
+
+class HttpSink:
+    """
+    以 POST 送到 Laravel 的用量端點；主體為 {"batch_id", "records"}，batch_id 供 Laravel 對重送去重。
+    設定共享金鑰時以與 Webhook 相同的 HMAC 格式簽章。
+    """
+
+    def __init__(self, url: str, client: Callable[[], Any], sign: Optional[Callable[[bytes], Dict[str, str]]] = None, timeout: float = 10.0):
+        self.url = url
+        self._client = client
+        self._sign = sign
+        self.timeout = timeout
+
+    async def send(self, batch_id: str, records: List[Dict[str, Any]]) -> None:
+        body = jsoncodec.dumps({"batch_id": batch_id, "records": records})
+        headers = {"Content-Type": "application/json", "Idempotency-Key": batch_id}
+        if self._sign is not None:
+            headers.update(self._sign(body))
+        response = await self._client().post(self.url, content=body, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+def sink_from_url(url: str, http_client: Callable[[], Any], sign: Optional[Callable[[bytes], Dict[str, str]]] = None) -> UsageSink:
+    """依 URL 建立 sink："file:///路徑.jsonl"、"sqlite:///路徑.db" 或 Laravel 的 http(s):// 端點。"""
+    scheme, _, rest = url.partition("://")
+    if scheme == "file":
+        return JsonLinesSink(rest)
+    if scheme == "sqlite":
+        return SQLiteSink(rest)
+    if scheme in ("http", "https"):
+        return HttpSink(url, http_client, sign)
+    raise ValueError(f"不支援的用量 sink: {url}")
+
+
+def _append(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(data)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno()) # 批次代表計費資料，確保寫入磁碟後才視為已暫存
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claim_spool(spool_dir: str) -> List[UsageBatch]:
+    """將已結束進程 (或本進程先前執行) 的暫存檔改名為本進程所有並載入；仍在執行的 worker 的暫存檔不動。"""
+    try:
+        names = sorted(os.listdir(spool_dir))
+    except OSError:
+        return []
+    batches = []
+    pid = os.getpid()
+    for name in names:
+        owner, _, rest = name.partition("-")
+        if not name.endswith(".json") or not owner.isdigit():
+            continue
+        path = os.path.join(spool_dir, name)
+        if int(owner) != pid:
+            if _pid_alive(int(owner)):
+                continue
+            claimed = os.path.join(spool_dir, f"{pid}-{rest}")
+            try:
+                os.replace(path, claimed) # 多個 worker 同時啟動時只有一個能取得
+            except OSError:
+                continue
+            path = claimed
+        try:
+            with open(path, "rb") as f:
+                payload = json.loads(f.read())
+            batches.append(UsageBatch(payload["id"], payload["records"], path))
+        except (OSError, ValueError, KeyError):
+            continue
+    return batches
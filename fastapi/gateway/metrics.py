@@ -0,0 +1,433 @@
+import asyncio
+import fcntl
+import glob
+import json
+import math
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prometheus 預設的直方圖桶 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+# 序列數超過上限後，新的標籤組合全部歸入此溢出序列
+OVERFLOW_LABEL_VALUE = "__overflow__"
+
+# 已結束 worker 的計數器與直方圖併入的歸檔快照
+ARCHIVE_FILENAME = "metrics_archive.json"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class CounterChild:
+    __slots__ = ("_value", "_function")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._value += amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """以回呼函式提供數值 (於輸出指標時讀取)，適用於其他元件自行維護的計數。"""
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        return float(self._function()) if self._function is not None else self._value
+
+    def state(self):
+        return self.value
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self._value = float(value)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._value -= amount
+
+
+class HistogramChild:
+    __slots__ = ("_upper_bounds", "_counts", "_sum")
+
+    def __init__(self, upper_bounds: Sequence[float]):
+        self._upper_bounds = upper_bounds
+        self._counts = [0] * (len(upper_bounds) + 1) # 最後一格為 +Inf
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        # 只增加單一桶位，累積計數在輸出時計算
+        self._counts[bisect_left(self._upper_bounds, value)] += 1
+        self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def state(self):
+        return {"counts": list(self._counts), "sum": self._sum}
+
+
+class MetricFamily:
+    """一個指標家族 (名稱、說明、標籤名稱)，每組標籤值對應一個預先建立的子指標。"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: Optional[int] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._children: Dict[LabelValues, object] = {}
+        self._line_prefixes: Dict[LabelValues, object] = {} # 已格式化的 "名稱{標籤}" 前綴，輸出時只需格式化數值
+        if not self.labelnames:
+            self.labels() # 無標籤的指標從 0 開始輸出
+
+    def labels(self, *labelvalues: str):
+        child = self._children.get(labelvalues)
+        if child is None:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要標籤 {self.labelnames}，收到 {labelvalues}")
+            labelvalues = tuple(str(value) for value in labelvalues)
+            if self.max_series is not None and len(self._children) >= self.max_series and labelvalues not in self._children:
+                labelvalues = (OVERFLOW_LABEL_VALUE,) * len(self.labelnames) # 硬性上限：不再建立新序列
+            child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Dict[LabelValues, object]:
+        return {labelvalues: child.state() for labelvalues, child in list(self._children.items())}
+
+    def describe(self) -> dict:
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+    def render(self, samples: Dict[LabelValues, object], lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.type}")
+        for labelvalues, value in samples.items():
+            prefix = self._line_prefixes.get(labelvalues)
+            if prefix is None:
+                prefix = self._line_prefixes[labelvalues] = f"{self.name}{_format_labels(self.labelnames, labelvalues)} "
+            lines.append(prefix + _format_value(value))
+
+    @staticmethod
+    def merge(values: Iterable[object]) -> object:
+        return sum(values)
+
+
+class Counter(MetricFamily):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+
+class Gauge(MetricFamily):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: Optional[int] = None, multiprocess_mode: str = "sum"):
+        self.multiprocess_mode = multiprocess_mode # 多個 worker 之間的彙總方式: "sum" 或 "max"
+        super().__init__(name, documentation, labelnames, max_series)
+
+    def _new_child(self):
+        return GaugeChild()
+
+    def describe(self) -> dict:
+        return {**super().describe(), "multiprocess_mode": self.multiprocess_mode}
+
+
+class Histogram(MetricFamily):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: Optional[int] = None, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets if bucket != math.inf))
+        super().__init__(name, documentation, labelnames, max_series)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def describe(self) -> dict:
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+    def render(self, samples: Dict[LabelValues, object], lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.type}")
+        for labelvalues, state in samples.items():
+            prefixes = self._line_prefixes.get(labelvalues)
+            if prefixes is None:
+                prefixes = self._line_prefixes[labelvalues] = self._prefixes(labelvalues)
+            bucket_prefixes, sum_prefix, count_prefix = prefixes
+            cumulative = 0
+            for prefix, count in zip(bucket_prefixes, state["counts"]):
+                cumulative += count
+                lines.append(f"{prefix}{cumulative}")
+            lines.append(sum_prefix + _format_value(state["sum"]))
+            lines.append(f"{count_prefix}{cumulative}")
+
+    def _prefixes(self, labelvalues: LabelValues):
+        bounds = ['le="%s"' % _format_value(bound) for bound in self.buckets] + ['le="+Inf"']
+        labels = _format_labels(self.labelnames, labelvalues)
+        return (
+            [f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, bound)} " for bound in bounds],
+            f"{self.name}_sum{labels} ",
+            f"{self.name}_count{labels} ",
+        )
+
+    @staticmethod
+    def merge(values: Iterable[object]) -> object:
+        values = list(values)
+        return {
+            "counts": [sum(column) for column in zip(*(value["counts"] for value in values))],
+            "sum": sum(value["sum"] for value in values),
+        }
+
+
+class MetricsRegistry:
+    """
+    預先註冊的指標家族集合與 Prometheus 文字格式輸出。
+
+    熱路徑只需一次以標籤元組為鍵的字典查找與一次數值加法。輸出時重用已格式化的標籤前綴，
+    並可將完整輸出快取 cache_seconds 秒；設定 multiproc_dir 時，每個 worker 將快照寫入該目錄，
+    輸出時彙總所有 worker 的數值。
+    """
+
+    def __init__(
+        self,
+        multiproc_dir: Optional[str] = None,
+        cache_seconds: float = 0.0,
+        max_series_per_metric: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.multiproc_dir = multiproc_dir or None
+        self.max_series_per_metric = max_series_per_metric
+        self.cache_seconds = cache_seconds
+        self._clock = clock
+        self._families: Dict[str, MetricFamily] = {}
+        self._cached_output: Optional[str] = None
+        self._cached_at = 0.0
+
+    def register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self._families:
+            raise ValueError(f"指標 {family.name} 已註冊")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, self.max_series_per_metric))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "sum") -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, self.max_series_per_metric, multiprocess_mode))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, self.max_series_per_metric, buckets))
+
+    def get(self, name: str) -> MetricFamily:
+        return self._families[name]
+
+    def snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "families": {
+                name: {**family.describe(), "samples": [[list(labelvalues), state] for labelvalues, state in family.collect().items()]}
+                for name, family in self._families.items()
+            },
+        }
+
+    def write_snapshot(self) -> None:
+        """將本 worker 的數值寫入多進程目錄 (原子性替換)。"""
+        if self.multiproc_dir:
+            self._write(self.snapshot())
+
+    def _write(self, snapshot: dict) -> None:
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        path = os.path.join(self.multiproc_dir, f"metrics_{snapshot['pid']}.json")
+        _write_atomic(path, snapshot)
+
+    def expose(self) -> str:
+        now = self._clock()
+        if self._cached_output is not None and now - self._cached_at < self.cache_seconds:
+            return self._cached_output
+        samples = self._collect_all_processes(self.snapshot()) if self.multiproc_dir else self._collect_local()
+        return self._render(samples, now)
+
+    async def expose_async(self) -> str:
+        """
+        與 expose() 相同，但多進程模式下的快照寫入、目錄列舉與讀取都在執行緒中進行，
+        抓取請求不會阻塞事件迴圈；記憶體中的數值仍在事件迴圈上取得，不需額外加鎖。
+        """
+        now = self._clock()
+        if self._cached_output is not None and now - self._cached_at < self.cache_seconds:
+            return self._cached_output
+        if not self.multiproc_dir:
+            return self._render(self._collect_local(), now)
+        samples = await asyncio.to_thread(self._collect_all_processes, self.snapshot())
+        return self._render(samples, now)
+
+    def _collect_local(self) -> Dict[str, Dict[LabelValues, object]]:
+        return {name: family.collect() for name, family in self._families.items()}
+
+    def _render(self, samples: Dict[str, Dict[LabelValues, object]], now: float) -> str:
+        lines: List[str] = []
+        for name, family in self._families.items():
+            family_samples = samples.get(name)
+            if family_samples:
+                family.render(family_samples, lines)
+        self._cached_output = "\n".join(lines) + "\n"
+        self._cached_at = now
+        return self._cached_output
+
+    def _collect_all_processes(self, own_snapshot: dict) -> Dict[str, Dict[LabelValues, object]]:
+        """
+        彙總所有 worker 的快照 (檔案 I/O，可在執行緒中呼叫)。
+
+        已結束 worker 的快照在目錄鎖內併入 metrics_archive.json 後刪除：計數器與直方圖維持單調遞增，
+        檔案數也不會隨 worker 重啟無限增加。整個讀取過程持有同一把鎖，抓取不會同時看到歸檔與原檔而重複計算。
+        """
+        self._write(own_snapshot)
+        with open(os.path.join(self.multiproc_dir, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                snapshots = self._read_snapshots()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        per_family: Dict[str, Dict[LabelValues, List[object]]] = {}
+        for snapshot in snapshots:
+            alive = _pid_alive(snapshot.get("pid"))
+            for name, data in snapshot["families"].items():
+                if not self._compatible(name, data) or (data["type"] == "gauge" and not alive):
+                    continue # 已結束 worker 的 gauge 不再有意義；計數器與直方圖則保留
+                for labelvalues, state in data["samples"]:
+                    per_family.setdefault(name, {}).setdefault(tuple(labelvalues), []).append(state)
+        merged: Dict[str, Dict[LabelValues, object]] = {}
+        for name, values_by_labels in per_family.items():
+            family = self._families[name]
+            if isinstance(family, Gauge) and family.multiprocess_mode == "max":
+                merged[name] = {labels: max(values) for labels, values in values_by_labels.items()}
+            else:
+                merged[name] = {labels: family.merge(values) for labels, values in values_by_labels.items()}
+        return merged
+
+    def _compatible(self, name: str, data: dict) -> bool:
+        family = self._families.get(name)
+        if family is None:
+            return False
+        return data["type"] != "histogram" or data.get("buckets") == list(getattr(family, "buckets", []))
+
+    def _read_snapshots(self) -> List[dict]:
+        """讀取目錄中的所有快照，並將已結束 worker 的快照併入歸檔 (呼叫端須持有目錄鎖)。"""
+        archive_path = os.path.join(self.multiproc_dir, ARCHIVE_FILENAME)
+        archive = _read_json(archive_path) or {"pid": None, "families": {}}
+        live: List[dict] = []
+        dead_paths: List[str] = []
+        for path in glob.glob(os.path.join(self.multiproc_dir, "metrics_*.json")):
+            if path == archive_path:
+                continue
+            snapshot = _read_json(path)
+            if snapshot is None:
+                continue # worker 正在寫入或檔案已損壞
+            if _pid_alive(snapshot.get("pid")):
+                live.append(snapshot)
+            else:
+                self._archive(archive, snapshot)
+                dead_paths.append(path)
+        if dead_paths:
+            _write_atomic(archive_path, archive)
+            for path in dead_paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return [archive, *live]
+
+    def _archive(self, archive: dict, snapshot: dict) -> None:
+        for name, data in snapshot["families"].items():
+            if data["type"] == "gauge" or not self._compatible(name, data):
+                continue
+            family = self._families[name]
+            existing = archive["families"].get(name)
+            if existing is not None and existing.get("buckets") != data.get("buckets"):
+                existing = None # 直方圖的桶設定已變更，舊的歸檔數值無法合併
+            states = {tuple(labels): state for labels, state in (existing or {"samples": []})["samples"]}
+            for labels, state in data["samples"]:
+                key = tuple(labels)
+                states[key] = family.merge([states[key], state]) if key in states else state
+            archive["families"][name] = {
+                **{key: value for key, value in data.items() if key != "samples"},
+                "samples": [[list(labels), state] for labels, state in states.items()],
+            }
+
+    async def flush_periodically(self, interval: float) -> None:
+        """在背景定期寫入快照，讓其他 worker 處理的抓取請求也能看到本 worker 的數值。"""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.multiproc_dir:
+                continue
+            try:
+                await asyncio.to_thread(self._write, self.snapshot())
+            except OSError:
+                pass
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, data: dict) -> None:
+    # 每次寫入使用獨立的暫存檔：定期寫入與抓取可能在不同執行緒同時寫入同一個快照
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(data, handle, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
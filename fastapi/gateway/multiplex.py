@@ -0,0 +1,120 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from gateway import jsoncodec
+from gateway.jsoncodec import is_json_content_type
+
+# 依賴的子請求失敗時，被跳過的子請求使用的狀態碼
+FAILED_DEPENDENCY = 424
+
+
+class BatchPlanError(ValueError):
+    pass
+
+
+@dataclass
+class SubResponse:
+    """批次中單一子請求的結果；body 是已編碼的 JSON 值，直接嵌入批次響應而不重新編碼。"""
+    status_code: int
+    body: bytes = b"null"
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+
+def json_body(content: bytes, content_type: Optional[str]) -> bytes:
+    """上游主體轉為可嵌入的 JSON 值：有效的 JSON 原樣使用，其他內容轉為 JSON 字串，空主體為 null。"""
+    if not content.strip():
+        return b"null"
+    if is_json_content_type(content_type):
+        try:
+            jsoncodec.loads(content) # 只驗證；無效的上游 JSON 不能破壞整個批次響應
+            return content
+        except Exception:
+            pass
+    return jsoncodec.dumps(content.decode("utf-8", "replace"))
+
+
+def error_response(status_code: int, detail: str, headers: Optional[Dict[str, str]] = None) -> SubResponse:
+    return SubResponse(status_code, jsoncodec.dumps({"detail": detail}), headers or {})
+
+
+def encode_result(index: int, request_id: str, response: SubResponse) -> bytes:
+    return b"".join((
+        b'{"index":', str(index).encode("ascii"),
+        b',"id":', jsoncodec.dumps(request_id),
+        b',"status":', str(response.status_code).encode("ascii"),
+        b',"headers":', jsoncodec.dumps(response.headers),
+        b',"body":', response.body,
+        b"}",
+    ))
+
+
+def plan_batch(ids: Sequence[str], depends_on: Sequence[Sequence[str]]) -> List[List[int]]:
+    """
+    驗證子請求 ID 與依賴關係，返回每個子請求依賴的索引列表。
+    依賴只能指向批次中較前面的子請求，因此不可能形成循環。
+    """
+    positions: Dict[str, int] = {}
+    dependencies = []
+    for index, (request_id, requires) in enumerate(zip(ids, depends_on)):
+        if request_id in positions:
+            raise BatchPlanError(f"重複的子請求 ID: {request_id}")
+        resolved = []
+        for dependency in requires:
+            if dependency not in positions:
+                raise BatchPlanError(f"子請求 {request_id} 依賴的 {dependency} 不存在或不在它之前")
+            resolved.append(positions[dependency])
+        positions[request_id] = index
+        dependencies.append(resolved)
+    return dependencies
+
+
+async def run_batch(
+    dependencies: List[List[int]],
+    execute: Callable[[int], Awaitable[SubResponse]],
+    max_concurrency: int = 8,
+    sequential: bool = False,
+) -> AsyncIterator[Tuple[int, SubResponse]]:
+    """
+    並行執行子請求 (同時最多 max_concurrency 個)，依完成順序產生 (索引, 結果)。
+
+    子請求在其依賴完成後才開始；任何依賴失敗 (狀態碼 >= 400) 時以 424 跳過。
+    sequential 時依批次順序逐一執行，但前一個失敗不影響後續 (除非明確宣告依賴)。
+    """
+    count = len(dependencies)
+    results: List[Optional[SubResponse]] = [None] * count
+    finished = [asyncio.Event() for _ in range(count)]
+    completed: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(index: int) -> None:
+        try:
+            if sequential and index > 0:
+                await finished[index - 1].wait()
+            for dependency in dependencies[index]:
+                await finished[dependency].wait()
+            failed = [dependency for dependency in dependencies[index] if not results[dependency].ok]
+            if failed:
+                result = error_response(FAILED_DEPENDENCY, f"依賴的子請求 {failed[0]} 失敗，已跳過")
+            else:
+                async with semaphore:
+                    result = await execute(index)
+        except Exception as e:
+            result = error_response(500, f"發生意外錯誤: {e}")
+        results[index] = result
+        finished[index].set()
+        completed.put_nowait(index)
+
+    tasks = [asyncio.create_task(run(index)) for index in range(count)]
+    try:
+        for _ in range(count):
+            index = await completed.get()
+            yield index, results[index]
+    finally:
+        # 客戶端中斷串流時取消尚未完成的子請求
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,180 @@
+"""
+預載應用程式的多 worker 伺服器。
+
+父進程只匯入一次應用程式 (與 uvicorn 的協定實作)、綁定監聽 socket 後 fork 出 worker；worker 以
+copy-on-write 共享父進程已載入的模組與物件，不必各自重新匯入，因此啟動與擴充 worker 都更快、每個 worker
+的常駐記憶體也更少。uvicorn 的 --workers 以 spawn 啟動全新的直譯器，無法共享。父進程監看 worker，
+意外結束的 worker 會重新 fork；收到 SIGTERM / SIGINT 時通知所有 worker 優雅關閉。
+
+注意：閘道的響應快取、准入控制與上游並行上限、斷路器與 SSE 連線都是每個 worker 各自的狀態。多個 worker 時，
+寫入後與 Webhook 的快取失效只發生在處理該請求的 worker (其他 worker 在 TTL 內仍返回舊資料)，設定的並行上限
+實際上乘以 worker 數，沒有設定 EVENTS_REDIS_URL 時事件也只推送給同一 worker 的連線。因此 SERVER_WORKERS 預設為 1；
+需要更多容量時優先增加副本 (或在調整上述限制後再增加 worker)。
+
+用法 (在 fastapi/ 目錄下):
+    python -m gateway.prefork --host 0.0.0.0 --port 80 --workers 4
+"""
+import argparse
+import gc
+import importlib
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+# worker 在啟動後這麼多秒內結束時，視為啟動失敗並延遲重新 fork (避免快速的崩潰循環)
+MIN_UPTIME = 5.0
+
+
+def available_cpus() -> int:
+    """容器可使用的 CPU 數 (依 CPU affinity；不支援的平台使用 os.cpu_count)。"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def load_app(path: str):
+    """匯入應用程式，返回應用程式與模組的 before_fork 鉤子 (未定義時為 None)。"""
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or "app"), getattr(module, "before_fork", None)
+
+
+class WorkerServer(uvicorn.Server):
+    """回報從 fork 到開始接受連線所需時間的 uvicorn 伺服器。"""
+
+    def __init__(self, config: uvicorn.Config, forked_at: float):
+        super().__init__(config)
+        self.forked_at = forked_at
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            print(f"worker {os.getpid()} 已就緒 (fork 後 {(time.perf_counter() - self.forked_at) * 1000:.0f} ms)", flush=True)
+
+
+class PreforkServer:
+    def __init__(self, config: uvicorn.Config, workers: int, graceful_timeout: float = 30.0, restart_delay: float = 1.0):
+        self.config = config
+        self.workers = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.restart_delay = restart_delay
+        self._children: Dict[int, float] = {} # pid -> fork 的時間 (monotonic)
+        self._stopping = False
+        self._socket = None
+
+    def run(self) -> int:
+        self.config.load() # 在 fork 前載入協定實作與中介層，worker 共享
+        self._socket = self.config.bind_socket()
+        # 將目前的物件移出 GC 追蹤的世代：worker 的 GC 不會寫入這些物件的標頭，共享的記憶體分頁不被複製
+        gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        print(f"以 {self.workers} 個 worker 在 {self.config.host}:{self.config.port} 提供服務 (父進程 {os.getpid()})", flush=True)
+
+        deadline: Optional[float] = None
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if self._stopping:
+                    deadline = deadline or time.monotonic() + self.graceful_timeout
+                    if time.monotonic() > deadline:
+                        self._signal_children(signal.SIGKILL)
+                time.sleep(0.1)
+                continue
+            forked_at = self._children.pop(pid, None)
+            if forked_at is None or self._stopping:
+                continue
+            print(f"worker {pid} 已結束 (狀態 {os.waitstatus_to_exitcode(status)})，重新啟動", flush=True)
+            if time.monotonic() - forked_at < MIN_UPTIME:
+                time.sleep(self.restart_delay)
+            if not self._stopping:
+                self._spawn()
+        self._socket.close()
+        return 0
+
+    def _spawn(self) -> None:
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            # worker：還原預設的訊號處理 (uvicorn 在 serve 時安裝自己的處理器)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                WorkerServer(self.config, forked_at).run(sockets=[self._socket])
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self._children[pid] = time.monotonic()
+
+    def _handle_stop(self, signum, frame) -> None:
+        self._stopping = True
+        self._signal_children(signal.SIGTERM)
+
+    def _signal_children(self, signum: int) -> None:
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="預載應用程式的多 worker 伺服器")
+    parser.add_argument("--app", default="main:app", help="應用程式 (模組:屬性)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="worker 數 (預設為 SERVER_WORKERS，0 表示可用的 CPU 數；見模組說明中每個 worker 各自的狀態)")
+    parser.add_argument("--preload", default=None, help="fork 前額外匯入的模組 (逗號分隔，預設為 SERVER_PRELOAD_MODULES)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", action="store_true")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0, help="關閉時等待 worker 結束的秒數")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    app, before_fork = load_app(args.app)
+    from config.config import settings # 應用程式已載入設定
+    loaded = time.perf_counter()
+    preload = settings.SERVER_PRELOAD_MODULES if args.preload is None else args.preload
+    for module_name in (name.strip() for name in preload.split(",")):
+        if module_name:
+            importlib.import_module(module_name) # 例如 graphql：延遲匯入的子系統也在 fork 前載入，由所有 worker 共享
+    if before_fork is not None:
+        before_fork()
+    workers = args.workers if args.workers is not None else settings.SERVER_WORKERS
+    print(
+        f"已載入 {args.app} (匯入 {(loaded - started) * 1000:.0f} ms"
+        + (f"，預載模組 {(time.perf_counter() - loaded) * 1000:.0f} ms" if preload.strip() else "")
+        + ")",
+        flush=True,
+    )
+
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        backlog=args.backlog,
+        log_level=args.log_level,
+        access_log=not args.no_access_log,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    workers = workers or available_cpus()
+    if workers > 1:
+        print(f"警告: {workers} 個 worker 各自持有響應快取、准入與並行上限及斷路器狀態 (快取失效不會傳到其他 worker，上限乘以 worker 數)", file=sys.stderr, flush=True)
+    return PreforkServer(config, workers, graceful_timeout=args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+# "100/minute" 形式中可用的時間單位
+_WINDOW_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """解析 "100/minute" 形式的限制，返回 (次數, 視窗秒數)。"""
+    count, _, unit = rate.partition("/")
+    unit = unit.strip().lower().rstrip("s")
+    if unit not in _WINDOW_SECONDS:
+        raise ValueError(f"無效的速率限制: {rate}")
+    return int(count), _WINDOW_SECONDS[unit]
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, scope: str, limit: int, retry_after: float):
+        super().__init__(f"超過速率限制: {limit} 次 ({scope})")
+        self.scope = scope
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class RateLimitStore:
+    """共享計數儲存的介面：以固定視窗計數，返回遞增後的視窗總數。"""
+
+    async def incr(self, key: str, amount: int, ttl: int) -> int:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """進程內的儲存，用於測試與單進程部署。"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._counts: Dict[str, Tuple[int, float]] = {}
+
+    async def incr(self, key: str, amount: int, ttl: int) -> int:
+        now = self._clock()
+        count, expires_at = self._counts.get(key, (0, now + ttl))
+        if expires_at <= now:
+            count, expires_at = 0, now + ttl
+        count += amount
+        self._counts[key] = (count, expires_at)
+        if len(self._counts) > 10000:
+            self._counts = {k: v for k, v in self._counts.items() if v[1] > now}
+        return count
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    以 Redis 共享計數，讓所有 worker 與副本套用同一個限制。
+
+    連線與讀寫都有逾時：Redis 停止回應 (而不是拒絕連線) 時，租用在 timeout 秒內失敗並退回本地限制，
+    而不是讓等待同一個 bucket 的請求無限期卡住。
+    """
+
+    def __init__(self, url: str, timeout: float = 0.25):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis 需要安裝 redis 套件")
+        self._redis = redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+
+    async def incr(self, key: str, amount: int, ttl: int) -> int:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(key, amount)
+            pipe.expire(key, ttl) # 鍵包含視窗編號，TTL 只需涵蓋視窗剩餘時間
+            count, _ = await pipe.execute()
+        return int(count)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+@dataclass
+class _LocalBucket:
+    window: int
+    expires_at: float
+    tokens: int = 0 # 已從共享儲存租用、尚未使用的配額
+    exhausted: bool = False # 本視窗的全域配額已用盡，不必再詢問儲存
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class RateLimiter:
+    """
+    分散式速率限制器。
+
+    每個節點從共享儲存以批次方式租用配額到本地 token bucket，大多數請求只在本地扣除，
+    每 batch 個請求才需要一次網路往返。共享儲存無法使用時退回進程內的儲存 (fail open 到本地限制)。
+    """
+
+    def __init__(
+        self,
+        store: RateLimitStore,
+        batch: int = 10,
+        fallback: Optional[RateLimitStore] = None,
+        clock: Callable[[], float] = time.time,
+        max_buckets: int = 100000,
+    ):
+        self.store = store
+        self.batch = batch
+        self.fallback = fallback or MemoryRateLimitStore(clock)
+        self.max_buckets = max_buckets
+        self._clock = clock
+        self._buckets: Dict[str, _LocalBucket] = {}
+        self.store_calls = 0
+        self.store_errors = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "RateLimiter":
+        if settings.RATE_LIMIT_BACKEND == "redis":
+            store = RedisRateLimitStore(settings.RATE_LIMIT_REDIS_URL, settings.RATE_LIMIT_REDIS_TIMEOUT)
+        else:
+            store = MemoryRateLimitStore()
+        return cls(store, batch=settings.RATE_LIMIT_LOCAL_BATCH)
+
+    async def hit(self, scope: str, key: str, rate: str, cost: int = 1) -> None:
+        """為 (scope, key) 消耗 cost 次配額 (例如批次請求中的子請求數)；超過限制時拋出 RateLimitExceeded。"""
+        limit, window_seconds = parse_rate(rate)
+        now = self._clock()
+        window = int(now // window_seconds)
+        bucket_key = f"{scope}:{key}"
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None or bucket.window != window:
+            if bucket is None and len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self._buckets[bucket_key] = _LocalBucket(window, (window + 1) * window_seconds)
+
+        if bucket.tokens < cost and not bucket.exhausted:
+            async with bucket.lock:
+                while bucket.tokens < cost and not bucket.exhausted:
+                    await self._lease(bucket, f"ratelimit:{bucket_key}:{window}", limit, window_seconds)
+
+        if bucket.tokens < cost:
+            retry_after = bucket.expires_at - now
+            raise RateLimitExceeded(scope, limit, max(1.0, math.ceil(retry_after)))
+        bucket.tokens -= cost
+
+    async def _lease(self, bucket: _LocalBucket, store_key: str, limit: int, window_seconds: int) -> None:
+        # 批次大小不超過限制的十分之一，避免單一節點租走大部分配額
+        batch = max(1, min(self.batch, limit // 10))
+        self.store_calls += 1
+        try:
+            total = await self.store.incr(store_key, batch, window_seconds)
+        except Exception:
+            self.store_errors += 1
+            total = await self.fallback.incr(store_key, batch, window_seconds)
+        granted = max(0, min(batch, limit - (total - batch)))
+        bucket.tokens += granted
+        if granted < batch:
+            bucket.exhausted = True
+
+    def _prune(self, now: float) -> None:
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket.expires_at > now}
+        if len(self._buckets) >= self.max_buckets:
+            # 全部仍在視窗內時捨棄本地租約；未使用的配額只會讓限制更保守
+            self._buckets = {}
+
+    async def aclose(self) -> None:
+        await self.store.aclose()
@@ -0,0 +1,362 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+import httpx
+
+from gateway.streaming import release_on_close
+from gateway.upstream import GCP_TTS, LARAVEL_GRAPHQL, LARAVEL_REST
+
+# 斷路器狀態；數值用於指標輸出 (越大越嚴重)
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# 可安全重試的 HTTP 方法與上游狀態碼
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUS_CODES = frozenset({502, 503, 504})
+
+
+class UpstreamUnavailable(Exception):
+    """上游被斷路器隔離或並行請求已達上限；應快速返回 503，而不是佔用連線等待。"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        super().__init__(f"上游 {upstream} 暫時無法使用 ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    連續失敗達到 failure_threshold 次後開啟 (open)，reset_timeout 秒後進入半開 (half_open)，
+    只放行 half_open_max_calls 個探測請求；探測成功則關閉，失敗則重新開啟。
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0 # 開啟次數
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_timeout - self._clock())
+
+    def record_success(self) -> None:
+        self._failures = 0
+        if self._state == HALF_OPEN:
+            self._state = CLOSED
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.opened += 1
+            self._state = OPEN
+            self._opened_at = self._clock()
+            self._failures = 0
+
+    def record_abandoned(self) -> None:
+        """呼叫在得到結果前被取消 (例如客戶端中斷)；歸還半開狀態的探測名額。"""
+        if self._state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+
+class RetryBudget:
+    """
+    重試預算：每個原始請求存入 ratio 個 token，另外每秒補充 min_per_second 個；每次重試需要一個 token。
+    上游整體故障時重試量被限制在原始流量的固定比例，避免重試放大負載。
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._tokens = max_tokens
+        self._updated_at = clock()
+
+    def deposit(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        now = self._clock()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+class LatencyTracker:
+    """
+    以最近 window 個請求的延遲百分位數推算逾時：percentile 延遲乘以 multiplier，
+    並限制在 [min_timeout, max_timeout] 之間。樣本不足時使用 max_timeout (原本的固定逾時)。
+    逾時的請求以逾時值計為樣本並立即將逾時加倍，上游變慢時逾時會跟著上升，而不是停留在過低的值。
+    """
+
+    def __init__(
+        self,
+        max_timeout: float,
+        min_timeout: float = 1.0,
+        percentile: float = 0.99,
+        multiplier: float = 3.0,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._observed = 0
+        self._timeout = max_timeout
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._observed += 1
+        # 每 min_samples 個樣本才重新排序計算一次，避免每個請求都付出排序成本
+        if len(self._samples) >= self.min_samples and self._observed % self.min_samples == 0:
+            ordered = sorted(self._samples)
+            value = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+            self._timeout = min(self.max_timeout, max(self.min_timeout, value * self.multiplier))
+
+    def observe_timeout(self, timeout: float) -> None:
+        """一次以 timeout 秒逾時的嘗試：計為樣本，並將目前的逾時加倍 (不超過 max_timeout)。"""
+        self.observe(timeout)
+        self._timeout = min(self.max_timeout, max(self._timeout, timeout * 2))
+
+    def timeout(self) -> float:
+        return self._timeout
+
+    def fork(self) -> "LatencyTracker":
+        """相同設定、沒有樣本的新追蹤器 (用於個別路由)。"""
+        return LatencyTracker(self.max_timeout, self.min_timeout, self.percentile, self.multiplier, self._samples.maxlen, self.min_samples)
+
+
+class UpstreamGuard:
+    """
+    單一上游的彈性層：斷路器 (可選擇依租戶區分)、並行上限 (超過即以 503 卸載)、
+    冪等請求在重試預算內的重試，以及依觀測延遲調整的逾時。
+
+    逾時依路由樣式分別追蹤 (同一上游的快速與慢速路由不共用逾時)；exempt_routes 中的長時間路由
+    (例如報表匯出) 一律使用固定的 max_timeout。閘道自己的自適應逾時到期不計為斷路器失敗，
+    只有達到固定逾時上限的逾時才代表上游故障。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: LatencyTracker,
+        max_concurrency: int = 100,
+        max_retries: int = 2,
+        retry_budget: Optional[RetryBudget] = None,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+        per_key_breakers: bool = False,
+        max_breakers: int = 10000,
+        exempt_routes: Iterable[str] = (),
+        max_routes: int = 1000,
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        self.name = name
+        self.latency = latency # 未指定路由的呼叫使用的追蹤器
+        self.exempt_routes = frozenset(exempt_routes)
+        self.max_routes = max_routes
+        self._route_latencies: Dict[str, LatencyTracker] = {}
+        self._fixed_latency = LatencyTracker(latency.max_timeout, min_timeout=latency.max_timeout)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.per_key_breakers = per_key_breakers
+        self.max_breakers = max_breakers
+        self._breaker_factory = breaker_factory
+        self._breakers: Dict[Optional[str], CircuitBreaker] = {}
+        self._clock = clock
+        self.in_flight = 0
+        self.retries = 0
+        self.adaptive_timeouts = 0 # 自適應逾時到期 (不計入斷路器) 的次數
+        self.rejected = {"circuit_open": 0, "overloaded": 0}
+
+    def breaker(self, key: Optional[str] = None) -> CircuitBreaker:
+        key = key if self.per_key_breakers else None
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            if len(self._breakers) >= self.max_breakers:
+                # 只保留非關閉狀態的斷路器；關閉的斷路器可隨時重建
+                self._breakers = {k: b for k, b in self._breakers.items() if b.state != CLOSED}
+            breaker = self._breakers[key] = self._breaker_factory()
+        return breaker
+
+    def latency_for(self, route: Optional[str] = None) -> LatencyTracker:
+        if route is None:
+            return self.latency
+        if route in self.exempt_routes:
+            return self._fixed_latency
+        latency = self._route_latencies.get(route)
+        if latency is None:
+            if len(self._route_latencies) >= self.max_routes:
+                return self._fixed_latency # 路由數超過上限時退回固定逾時，不無限建立追蹤器
+            latency = self._route_latencies[route] = self.latency.fork()
+        return latency
+
+    def breakers(self) -> Iterable[CircuitBreaker]:
+        return self._breakers.values()
+
+    def state(self) -> str:
+        """最嚴重的斷路器狀態 (依租戶區分時，任一租戶開啟即回報 open)。"""
+        return max((breaker.state for breaker in self._breakers.values()), key=STATE_VALUES.get, default=CLOSED)
+
+    async def call(
+        self, send: Callable[[float], Awaitable[Any]], key: Optional[str] = None, idempotent: bool = False, route: Optional[str] = None,
+    ) -> Any:
+        """
+        以 route 目前的逾時呼叫 send(timeout)。連線錯誤、逾時與 5xx 計為失敗；冪等請求遇到
+        連線錯誤或 502/503/504 時在重試預算內重試。斷路器開啟或並行已滿時拋出 UpstreamUnavailable。
+        """
+        latency = self.latency_for(route)
+        breaker = self.breaker(key)
+        if not breaker.allow():
+            self.rejected["circuit_open"] += 1
+            raise UpstreamUnavailable(self.name, "circuit_open", breaker.retry_after())
+        if self.in_flight >= self.max_concurrency:
+            self.rejected["overloaded"] += 1
+            breaker.record_abandoned()
+            raise UpstreamUnavailable(self.name, "overloaded", 1.0)
+
+        self.in_flight += 1
+        self.retry_budget.deposit()
+        recorded = False
+        held = False # 串流響應的並行名額保留到主體關閉時才歸還
+        try:
+            attempt = 0
+            while True:
+                timeout = latency.timeout()
+                start = self._clock()
+                try:
+                    result = await send(timeout)
+                except httpx.HTTPStatusError as e:
+                    status_code, error = e.response.status_code, e
+                except (httpx.TransportError, asyncio.TimeoutError) as e:
+                    status_code, error = None, e
+                else:
+                    status_code, error = getattr(result, "status_code", 200), None
+
+                if status_code is not None and status_code < 500:
+                    # 上游有正常響應 (包括 4xx)，記錄延遲
+                    latency.observe(self._clock() - start)
+                    breaker.record_success()
+                    recorded = True
+                    if error is not None:
+                        raise error
+                    held = release_on_close(result, self._release)
+                    return result
+
+                timed_out = isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError))
+                if timed_out:
+                    latency.observe_timeout(timeout)
+                if timed_out and timeout < latency.max_timeout:
+                    # 閘道自己縮短的逾時到期，不代表上游故障；歸還半開探測名額但不計為失敗
+                    self.adaptive_timeouts += 1
+                    breaker.record_abandoned()
+                else:
+                    breaker.record_failure()
+                recorded = True
+                retryable = status_code is None or status_code in RETRYABLE_STATUS_CODES
+                if retryable and idempotent and attempt < self.max_retries and breaker.allow() and self.retry_budget.try_withdraw():
+                    if error is None:
+                        await _discard(result)
+                    attempt += 1
+                    self.retries += 1
+                    recorded = False
+                    await asyncio.sleep(random.uniform(0, 0.05 * 2 ** attempt)) # 指數退避加隨機抖動
+                    continue
+                if error is not None:
+                    raise error
+                held = release_on_close(result, self._release)
+                return result
+        finally:
+            if not held:
+                self.in_flight -= 1
+            if not recorded:
+                breaker.record_abandoned()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+
+async def _discard(result: Any) -> None:
+    """關閉將被重試取代的響應 (串流響應需歸還連線)。"""
+    close = getattr(result, "aclose", None)
+    if close is not None:
+        await close()
+
+
+class UpstreamGuards:
+    """每個上游一個 UpstreamGuard，逾時上限沿用各上游設定的固定逾時。"""
+
+    def __init__(self, guards: Iterable[UpstreamGuard]):
+        self._guards = {guard.name: guard for guard in guards}
+
+    @classmethod
+    def from_settings(cls, settings, upstreams) -> "UpstreamGuards":
+        def build(name: str, max_concurrency: int) -> UpstreamGuard:
+            return UpstreamGuard(
+                name,
+                LatencyTracker(
+                    max_timeout=upstreams.config(name).timeout,
+                    min_timeout=settings.ADAPTIVE_TIMEOUT_MIN,
+                    percentile=settings.ADAPTIVE_TIMEOUT_PERCENTILE,
+                    multiplier=settings.ADAPTIVE_TIMEOUT_MULTIPLIER,
+                ),
+                max_concurrency=max_concurrency,
+                max_retries=settings.UPSTREAM_MAX_RETRIES,
+                retry_budget=RetryBudget(settings.RETRY_BUDGET_RATIO, settings.RETRY_BUDGET_MIN_PER_SECOND),
+                breaker_factory=lambda: CircuitBreaker(settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD, settings.CIRCUIT_BREAKER_RESET_TIMEOUT),
+                per_key_breakers=settings.CIRCUIT_BREAKER_PER_TENANT,
+                exempt_routes=[route.strip() for route in settings.ADAPTIVE_TIMEOUT_EXEMPT_ROUTES.split(",") if route.strip()],
+            )
+
+        return cls([
+            build(LARAVEL_REST, settings.LARAVEL_REST_MAX_CONCURRENCY),
+            build(LARAVEL_GRAPHQL, settings.LARAVEL_GRAPHQL_MAX_CONCURRENCY),
+            build(GCP_TTS, settings.GCP_TTS_MAX_CONCURRENCY),
+        ])
+
+    def get(self, name: str) -> UpstreamGuard:
+        return self._guards[name]
+
+    def __iter__(self):
+        return iter(self._guards.values())
@@ -0,0 +1,80 @@
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import unquote
+
+# 與 laravel/routes/tenant.php 對應的租戶路由樣式
+DEFAULT_TENANT_ROUTE_TEMPLATES = (
+    "articles",
+    "articles/search",
+    "articles/{article}",
+    "articles/{article}/publish",
+    "articles/{article}/submit-for-review",
+    "articles/{article}/approve",
+    "articles/{article}/reject",
+    "articles/{article}/history",
+    "articles/{article}/restore/{snapshot}",
+    "users",
+    "users/{user}/assign-role",
+    "users/{user}/revoke-role",
+    "reports/articles-by-status",
+    "reports/user-activity",
+    "reports/{reportType}/export",
+)
+
+# 無法對應到任何已知路由時使用的樣式，避免未知路徑產生新的指標序列
+UNMATCHED_ROUTE = "{unmatched}"
+
+
+class InvalidEndpoint(ValueError):
+    pass
+
+
+def checked_endpoint(endpoint: str) -> str:
+    """
+    檢查相對於 /tenant-routes/ 的端點路徑 (可包含查詢參數)，返回去除開頭斜線的端點。
+
+    端點直接接在後端的 /tenant-routes/ 之後；httpx 與 Laravel 會合併 . 與 .. 路徑段，因此拒絕這些路徑段、
+    空的路徑段 (//)、反斜線、控制字元，以及經百分比編碼後成為分隔符或 . / .. 的路徑段，
+    避免請求離開租戶路由 (例如 ../api/system/tenants) 並帶著用戶的 Token 送到其他後端路由。
+    """
+    endpoint = endpoint.lstrip("/")
+    path = endpoint.partition("?")[0]
+    if any(char in path for char in "\\#") or any(ord(char) < 0x20 or ord(char) == 0x7F for char in endpoint):
+        raise InvalidEndpoint(f"無效的端點: {endpoint!r}")
+    segments = path.split("/")
+    for index, segment in enumerate(segments):
+        decoded = unquote(segment)
+        if (not segment and index < len(segments) - 1) or decoded in (".", "..") or "/" in decoded or "\\" in decoded:
+            raise InvalidEndpoint(f"無效的端點: {endpoint!r}")
+    return endpoint
+
+
+class RouteTemplates:
+    """
+    將實際的端點路徑 (例如 articles/42/publish) 正規化為路由樣式 (articles/{article}/publish)。
+
+    樣式依路徑段數分組；同段數中字面段較多者優先，因此 articles/search 優先於 articles/{article}。
+    """
+
+    def __init__(self, templates: Iterable[str] = DEFAULT_TENANT_ROUTE_TEMPLATES):
+        self._by_length: Dict[int, List[Tuple[str, Tuple[str, ...]]]] = {}
+        for template in templates:
+            segments = tuple(template.strip("/").split("/"))
+            self._by_length.setdefault(len(segments), []).append((template.strip("/"), segments))
+        for candidates in self._by_length.values():
+            candidates.sort(key=lambda candidate: -sum(1 for segment in candidate[1] if not _is_parameter(segment)))
+
+    @classmethod
+    def from_settings(cls, settings) -> "RouteTemplates":
+        templates = [template.strip() for template in settings.TENANT_ROUTE_TEMPLATES.split(",") if template.strip()]
+        return cls(templates or DEFAULT_TENANT_ROUTE_TEMPLATES)
+
+    def match(self, endpoint: str) -> str:
+        segments = endpoint.strip("/").split("/")
+        for template, template_segments in self._by_length.get(len(segments), ()):
+            if all(_is_parameter(expected) or expected == actual for expected, actual in zip(template_segments, segments)):
+                return template
+        return UNMATCHED_ROUTE
+
+
+def _is_parameter(segment: str) -> bool:
+    return segment.startswith("{") and segment.endswith("}")
@@ -0,0 +1,65 @@
+import asyncio
+import fnmatch
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from gateway import jsoncodec
+
+
+def parse_route_patterns(spec: str) -> List[str]:
+    """解析逗號分隔的路由樣式 (fnmatch 萬用字元)。"""
+    return [pattern.strip().strip("/") for pattern in spec.split(",") if pattern.strip()]
+
+
+def route_matches(endpoint: str, patterns: Iterable[str]) -> bool:
+    endpoint = endpoint.strip("/")
+    return any(fnmatch.fnmatchcase(endpoint, pattern) for pattern in patterns)
+
+
+def body_digest(body: Any) -> str:
+    """請求主體的穩定 SHA-256 摘要 (鍵排序後的 JSON)。"""
+    return hashlib.sha256(jsoncodec.dumps(body, sort_keys=True)).hexdigest()
+
+
+class SingleFlight:
+    """
+    合併相同的並行上游請求 (single-flight)。
+
+    同一鍵的第一個呼叫者 (leader) 發出上游請求，期間到達的相同請求 (follower) 共享同一個進行中的 Future。
+    上游呼叫在獨立的 Task 中執行，leader 的客戶端中斷時不會取消其他等待者。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0 # 實際發出的上游請求數
+        self.followers = 0 # 被合併 (共享結果) 的請求數
+
+    @property
+    def coalescing_ratio(self) -> float:
+        total = self.leaders + self.followers
+        return self.followers / total if total else 0.0
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        執行 fn 或加入同一鍵的進行中呼叫。返回 (結果, 是否為共享結果)。
+        """
+        task: Optional[asyncio.Task] = self._inflight.get(key)
+        if task is not None:
+            self.followers += 1
+            return await asyncio.shield(task), True
+
+        self.leaders += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), False
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception() # 標記例外已被讀取 (所有等待者都可能已中斷)
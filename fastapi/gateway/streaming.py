@@ -0,0 +1,178 @@
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+# 逐跳 (hop-by-hop) 標頭只對單一連線有效，不應轉發給客戶端
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+})
+
+# 這些狀態碼的響應沒有主體
+NO_BODY_STATUS_CODES = frozenset({204, 304})
+
+
+def request_body_stream(request: Request) -> Optional[AsyncIterator[bytes]]:
+    """
+    返回入站請求主體的位元組流；沒有主體的請求 (例如 GET) 返回 None。
+    """
+    if "content-length" in request.headers or "transfer-encoding" in request.headers:
+        return request.stream()
+    return None
+
+
+def passthrough_headers(upstream_response: httpx.Response) -> List[Tuple[bytes, bytes]]:
+    """
+    保留上游響應標頭 (包括 content-type、content-encoding 與重複的 set-cookie)，移除逐跳標頭。
+    """
+    return [
+        (key.lower().encode("latin-1"), value.encode("latin-1"))
+        for key, value in upstream_response.headers.multi_items()
+        if key.lower() not in HOP_BY_HOP_HEADERS
+    ]
+
+
+async def _iter_raw(upstream_response: httpx.Response) -> AsyncIterator[bytes]:
+    # 以原始 (未解碼) 位元組轉發，確保 content-encoding 與 content-length 保持一致
+    try:
+        async for chunk in upstream_response.aiter_raw():
+            yield chunk
+    finally:
+        await upstream_response.aclose()
+
+
+async def stream_request(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    body: Optional[AsyncIterator[bytes]] = None,
+    timeout: Optional[float] = None,
+) -> Response:
+    """
+    以串流方式代理請求：請求與響應主體都以位元組流轉發，不會完整緩衝或重新解析。
+    """
+    upstream_response = await send_streaming(client, method, url, headers, body, timeout)
+    return passthrough_response(upstream_response, method)
+
+
+async def send_streaming(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    body: Optional[AsyncIterator[bytes]] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """發送請求並返回尚未讀取主體的上游響應 (呼叫者負責關閉)。"""
+    upstream_request = client.build_request(method, url, headers=headers, content=body, timeout=request_timeout(client, timeout))
+    return await client.send(upstream_request, stream=True)
+
+
+class _CloseHookStream(httpx.AsyncByteStream):
+    """包裝上游響應的主體流，在主體關閉 (讀完、客戶端中斷或被丟棄) 時呼叫回呼一次。"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close: Optional[Callable[[], None]] = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+
+def release_on_close(result: Any, on_close: Callable[[], None]) -> bool:
+    """
+    若 result 是主體尚未讀取的串流響應，將 on_close 延後到主體關閉時呼叫並返回 True；
+    否則 (已完整讀取的響應或其他結果) 返回 False，由呼叫者立即釋放。
+    用於並行計數：串流響應在標頭到達時就返回，但上游連線要到主體轉發完才真正空出。
+    """
+    if not isinstance(result, httpx.Response) or result.is_closed or not isinstance(result.stream, httpx.AsyncByteStream):
+        return False
+    result.stream = _CloseHookStream(result.stream, on_close)
+    return True
+
+
+def request_timeout(client: httpx.AsyncClient, timeout: Optional[float]):
+    """單一請求的逾時；未指定時沿用客戶端的設定，連線逾時不超過客戶端設定值。"""
+    if timeout is None:
+        return httpx.USE_CLIENT_DEFAULT
+    return httpx.Timeout(timeout, connect=min(timeout, client.timeout.connect or timeout))
+
+
+def passthrough_response(upstream_response: httpx.Response, method: str = "GET") -> Response:
+    raw_headers = passthrough_headers(upstream_response)
+    if upstream_response.status_code in NO_BODY_STATUS_CODES or method == "HEAD":
+        response = Response(
+            status_code=upstream_response.status_code,
+            background=BackgroundTask(upstream_response.aclose),
+        )
+    else:
+        response = StreamingResponse(
+            _iter_raw(upstream_response),
+            status_code=upstream_response.status_code,
+            background=BackgroundTask(upstream_response.aclose), # 客戶端中斷時仍確保連線歸還連線池
+        )
+    response.raw_headers = raw_headers
+    return response
+
+
+@dataclass
+class RawResponse:
+    """完整讀取的上游響應，主體保持原始 (未解碼) 位元組，可被快取或共享。"""
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+    def header(self, name: str) -> Optional[str]:
+        key = name.lower().encode("latin-1")
+        for header_key, value in self.headers:
+            if header_key == key:
+                return value.decode("latin-1")
+        return None
+
+    def to_response(self, extra_headers: Optional[Dict[str, str]] = None) -> Response:
+        response = Response(content=None if self.status_code in NO_BODY_STATUS_CODES else self.body, status_code=self.status_code)
+        raw_headers = list(self.headers)
+        for key, value in (extra_headers or {}).items():
+            raw_headers.append((key.lower().encode("latin-1"), value.encode("latin-1")))
+        response.raw_headers = raw_headers
+        return response
+
+
+async def fetch_raw(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    headers: Dict[str, str],
+    body: Optional[AsyncIterator[bytes]] = None,
+    timeout: Optional[float] = None,
+) -> RawResponse:
+    """
+    發送請求並以原始位元組讀取完整響應主體 (不解碼 content-encoding、不解析 JSON)。
+    """
+    upstream_response = await send_streaming(client, method, url, headers, body, timeout)
+    try:
+        chunks = [chunk async for chunk in upstream_response.aiter_raw()]
+    finally:
+        await upstream_response.aclose()
+    return RawResponse(upstream_response.status_code, passthrough_headers(upstream_response), b"".join(chunks))
@@ -0,0 +1,220 @@
+import asyncio
+import fcntl
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# 租戶狀態
+ACTIVE = "active"
+SUSPENDED = "suspended"
+
+
+@dataclass
+class TenantRecord:
+    tenant_id: str
+    name: str = ""
+    status: str = ACTIVE
+    domain: Optional[str] = None
+    backend_url: Optional[str] = None # 此租戶專屬的 Laravel 基礎 URL (優先於 shard)
+    shard: Optional[str] = None # Laravel 後端池名稱 (對應 TENANT_BACKEND_SHARDS)
+    tier: Optional[str] = None # 准入控制等級 (對應 TENANT_TIER_LIMITS)
+    updated_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "TenantRecord":
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+class TenantUnavailable(Exception):
+    def __init__(self, tenant_id: str, reason: str):
+        super().__init__(f"租戶 {tenant_id} 無法使用 ({reason})")
+        self.tenant_id = tenant_id
+        self.reason = reason
+
+
+def parse_backend_shards(spec: str) -> Dict[str, str]:
+    """解析 "pool-a=http://laravel-a:8000,pool-b=http://laravel-b:8000" 形式的後端池設定。"""
+    shards = {}
+    for item in spec.split(","):
+        if item.strip():
+            name, _, url = item.partition("=")
+            shards[name.strip()] = url.strip().rstrip("/")
+    return shards
+
+
+class TenantRegistry:
+    """
+    閘道端的租戶註冊表：由 /webhook/tenant-init 寫入，記錄租戶狀態與所屬的 Laravel 後端。
+
+    查詢完全在記憶體中完成，讓閘道不需呼叫後端即可拒絕已停用 (或在 enforce 模式下未註冊) 的租戶，
+    並將不同租戶路由到不同的 Laravel 後端池。可選擇將內容快照到磁碟，重新啟動時直接載入；
+    多個 worker 共享同一個快照檔：寫入時在檔案鎖內與磁碟上的內容合併 (不會刪除其他 worker 註冊的租戶)，
+    查詢時至多每 reload_interval 秒檢查一次快照是否變更，載入其他 worker 寫入的新租戶與狀態、後端的變更。
+    """
+
+    def __init__(
+        self,
+        default_backend: str,
+        shards: Optional[Mapping[str, str]] = None,
+        snapshot_path: str = "",
+        enforce: bool = False,
+        allowed_backends: Iterable[str] = (),
+        reload_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.default_backend = default_backend.rstrip("/")
+        self.shards = dict(shards or {})
+        # 租戶專屬的 backend_url 只能是已知的後端 (預設後端、後端池或明確允許的 URL)，
+        # 避免竄改的註冊資料把租戶流量與使用者的 Bearer Token 轉送到任意主機
+        self.allowed_backends = {self.default_backend, *self.shards.values(), *(url.strip().rstrip("/") for url in allowed_backends if url.strip())}
+        self.snapshot_path = snapshot_path
+        self.enforce = enforce
+        self.reload_interval = reload_interval
+        self._clock = clock
+        self._tenants: Dict[str, TenantRecord] = {}
+        self._snapshot_stamp: Optional[Tuple[int, int, int]] = None # 最近載入或寫入的快照 (mtime_ns, 大小, inode)
+        self._checked_at = float("-inf")
+        self._version = 0 # 每次變更遞增；背景寫入時跳過已過時的快照
+        self._saved_version = 0
+        self._save_lock = asyncio.Lock()
+        self.rejected = {"unknown": 0, SUSPENDED: 0}
+        if snapshot_path:
+            self.load_snapshot()
+
+    @classmethod
+    def from_settings(cls, settings) -> "TenantRegistry":
+        return cls(
+            default_backend=settings.LARAVEL_BACKEND_BASE_URL,
+            shards=parse_backend_shards(settings.TENANT_BACKEND_SHARDS),
+            snapshot_path=settings.TENANT_REGISTRY_SNAPSHOT_PATH,
+            enforce=settings.TENANT_REGISTRY_ENFORCE,
+            allowed_backends=settings.TENANT_BACKEND_ALLOWLIST.split(","),
+        )
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def records(self) -> Iterable[TenantRecord]:
+        return self._tenants.values()
+
+    def get(self, tenant_id: str) -> Optional[TenantRecord]:
+        if self.snapshot_path and self._clock() - self._checked_at >= self.reload_interval:
+            # 已知的租戶也可能被其他 worker 停用或改變後端，因此不只在查不到時檢查
+            self._checked_at = self._clock()
+            self.load_snapshot(only_if_changed=True)
+        return self._tenants.get(tenant_id)
+
+    def upsert(self, record: TenantRecord) -> TenantRecord:
+        if record.shard and record.shard not in self.shards and not record.backend_url:
+            raise ValueError(f"未知的後端池: {record.shard}")
+        if record.backend_url and record.backend_url.rstrip("/") not in self.allowed_backends:
+            raise ValueError(f"後端不在允許清單中: {record.backend_url}")
+        self._tenants[record.tenant_id] = record
+        self._version += 1
+        return record
+
+    def check(self, tenant_id: str) -> Optional[TenantRecord]:
+        """返回租戶記錄；租戶已停用 (或 enforce 模式下未註冊) 時拋出 TenantUnavailable。"""
+        record = self.get(tenant_id)
+        if record is None:
+            if self.enforce:
+                self.rejected["unknown"] += 1
+                raise TenantUnavailable(tenant_id, "unknown")
+            return None
+        if record.status != ACTIVE:
+            self.rejected[SUSPENDED] += 1
+            raise TenantUnavailable(tenant_id, record.status)
+        return record
+
+    def dedicated_backend(self, tenant_id: str) -> Optional[str]:
+        """租戶指定的 Laravel 基礎 URL (專屬 URL 優先於後端池)；未指定時返回 None。"""
+        record = self._tenants.get(tenant_id)
+        if record is not None:
+            if record.backend_url:
+                return record.backend_url.rstrip("/")
+            if record.shard in self.shards:
+                return self.shards[record.shard]
+        return None
+
+    def backend_for(self, tenant_id: str) -> str:
+        """租戶的 Laravel 基礎 URL：專屬 URL > 後端池 > LARAVEL_BACKEND_BASE_URL。"""
+        return self.dedicated_backend(tenant_id) or self.default_backend
+
+    def load_snapshot(self, only_if_changed: bool = False) -> int:
+        """從快照檔載入租戶 (較新的記錄覆蓋同 ID 的記憶體記錄)，返回載入的數量。"""
+        stamp = _snapshot_stamp(self.snapshot_path)
+        if stamp is None or (only_if_changed and stamp == self._snapshot_stamp):
+            return 0 # 尚未寫入快照或沒有變更
+        records = _read_snapshot(self.snapshot_path)
+        self._snapshot_stamp = stamp
+        self._merge(records)
+        return len(records)
+
+    async def save_snapshot(self) -> bool:
+        """在執行緒中與磁碟上的快照合併後原子性寫入 (不阻塞事件迴圈)；已有更新的快照寫入時跳過。"""
+        if not self.snapshot_path:
+            return False
+        async with self._save_lock:
+            version = self._version
+            if version <= self._saved_version:
+                return False
+            merged, stamp = await asyncio.to_thread(_merge_snapshot, self.snapshot_path, list(self._tenants.values()))
+            self._merge(merged) # 同時取得其他 worker 寫入的租戶
+            self._saved_version = version
+            self._snapshot_stamp = stamp
+            return True
+
+    def _merge(self, records: Iterable[TenantRecord]) -> None:
+        for record in records:
+            current = self._tenants.get(record.tenant_id)
+            if current is None or current.updated_at < record.updated_at:
+                self._tenants[record.tenant_id] = record
+
+
+def _snapshot_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino # 原子性取代會改變 inode，即使 mtime 的精度不足
+
+
+def _read_snapshot(path: str) -> List[TenantRecord]:
+    try:
+        with open(path, encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return [] # 尚未寫入快照或檔案已損壞；由之後的 webhook 重新填入
+    return [TenantRecord.from_dict(item) for item in data.get("tenants", [])]
+
+
+def _merge_snapshot(path: str, records: List[TenantRecord]) -> Tuple[List[TenantRecord], Optional[Tuple[int, int, int]]]:
+    """在檔案鎖內讀取、合併 (同 ID 保留 updated_at 較新者) 並取代快照，返回合併後的記錄與新快照的識別。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX) # 多個 worker 的讀取-合併-取代不會互相覆蓋 (關閉檔案時釋放)
+        merged = {record.tenant_id: record for record in _read_snapshot(path)}
+        for record in records:
+            current = merged.get(record.tenant_id)
+            if current is None or current.updated_at <= record.updated_at:
+                merged[record.tenant_id] = record
+        payload = json.dumps({"tenants": [asdict(record) for record in merged.values()]}, ensure_ascii=False).encode("utf-8")
+        _write_atomic(path, payload)
+        return list(merged.values()), _snapshot_stamp(path)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path) # 其他 worker 不會讀到寫到一半的檔案
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
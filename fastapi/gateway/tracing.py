@@ -0,0 +1,246 @@
+import random
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, ContextManager, Deque, Dict, List, Optional, Tuple
+
+# 熱路徑的階段名稱
+AUTH = "auth"
+RATE_LIMIT = "rate_limit"
+ADMISSION = "admission"
+UPSTREAM_CONNECT = "upstream_connect" # TCP 連線 (含 TLS 握手)；重用連線時不會出現
+UPSTREAM_TTFB = "upstream_ttfb" # 送出請求標頭到收到響應標頭
+SERIALIZATION = "serialization"
+STAGES = (AUTH, RATE_LIMIT, ADMISSION, UPSTREAM_CONNECT, UPSTREAM_TTFB, SERIALIZATION)
+
+# 保留追蹤的原因 (頭部取樣或尾部取樣)
+KEEP_SAMPLED = "sampled"
+KEEP_SLOW = "slow"
+KEEP_ERROR = "error"
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    method: str
+    route: str
+    sampled: bool # 頭部取樣的結果；為 True 時階段也建立 Sentry span
+    start: float
+    stages: List[Tuple[str, float, float]] = field(default_factory=list) # (階段, 相對起點的秒數, 持續秒數)
+    status_code: int = 0
+    duration: float = 0.0
+    error: Optional[str] = None
+    kept: Optional[str] = None
+    span_factory: Optional[Callable[[str], ContextManager]] = field(default=None, repr=False)
+    _token: object = field(default=None, repr=False)
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        self.stages.append((name, start - self.start, duration))
+
+    def stage_totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.stages:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "route": self.route,
+            "status_code": self.status_code,
+            "duration_ms": round(self.duration * 1000, 3),
+            "kept": self.kept,
+            "error": self.error,
+            "stages": [
+                {"name": name, "offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                for name, offset, duration in self.stages
+            ],
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("orbitpress_trace", default=None)
+_NOOP = nullcontext()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "started", "span")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        if self.trace.sampled and self.trace.span_factory is not None:
+            self.span = self.trace.span_factory(self.name)
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.add(self.name, self.started, time.perf_counter() - self.started)
+        if self.span is not None:
+            self.span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def stage(name: str) -> ContextManager:
+    """量測目前請求的一個階段；沒有進行中的追蹤時返回共用的空 context manager。"""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Stage(trace, name)
+
+
+class _UpstreamTimer:
+    """httpcore 的 trace 擴充回呼：從連線與 HTTP 事件記錄上游連線與 TTFB 階段。"""
+
+    __slots__ = ("trace", "connect_started", "connected", "sent")
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self.connect_started = None
+        self.connected = None
+        self.sent = None
+
+    async def __call__(self, event_name: str, info: dict) -> None:
+        now = time.perf_counter()
+        if event_name == "connection.connect_tcp.started":
+            self.connect_started = now
+        elif event_name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connected = now
+        elif event_name.endswith("send_request_headers.started"):
+            if self.connect_started is not None and self.connected is not None:
+                self.trace.add(UPSTREAM_CONNECT, self.connect_started, self.connected - self.connect_started)
+                self.connect_started = None
+            self.sent = now
+        elif event_name.endswith("receive_response_headers.complete") and self.sent is not None:
+            self.trace.add(UPSTREAM_TTFB, self.sent, now - self.sent)
+            self.sent = None
+
+
+async def trace_upstream_request(request) -> None:
+    """httpx 的 request 事件鉤子：請求在追蹤中時附加 httpcore 的 trace 回呼。"""
+    trace = _current.get()
+    if trace is not None and "trace" not in request.extensions:
+        request.extensions["trace"] = _UpstreamTimer(trace)
+
+
+class Tracer:
+    """
+    低開銷的請求追蹤：頭部取樣 (sample_rate) 加上尾部取樣 (保留超過 slow_threshold 秒或出錯的請求)。
+
+    每個請求只在 ContextVar 中保存一個 Trace 與階段時間列表；保留的追蹤放入固定大小的環形緩衝區
+    供本地除錯端點查詢，未被頭部取樣的慢請求與錯誤交給 exporter (例如送到 Sentry)。
+    所有請求的階段時間都累加到 stage_seconds / stage_count，供 Prometheus 指標使用。
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        slow_threshold: float = 1.0,
+        keep_errors: bool = True,
+        buffer_size: int = 200,
+        sampler: Optional[Callable[[], bool]] = None,
+        span_factory: Optional[Callable[[str], ContextManager]] = None,
+        exporter: Optional[Callable[[Trace], None]] = None,
+        enabled: bool = True,
+        rng: Callable[[], float] = random.random,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.keep_errors = keep_errors
+        self.enabled = enabled
+        self._sampler = sampler or (lambda: rng() < self.sample_rate)
+        self.span_factory = span_factory
+        self.exporter = exporter
+        self._buffer: Deque[Trace] = deque(maxlen=max(1, buffer_size))
+        self.finished = 0
+        self.dropped = 0
+        self.kept = {KEEP_SAMPLED: 0, KEEP_SLOW: 0, KEEP_ERROR: 0}
+        self.stage_seconds = {name: 0.0 for name in STAGES}
+        self.stage_count = {name: 0 for name in STAGES}
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs) -> "Tracer":
+        return cls(
+            sample_rate=settings.TRACING_SAMPLE_RATE,
+            slow_threshold=settings.TRACING_SLOW_THRESHOLD_MS / 1000,
+            keep_errors=settings.TRACING_KEEP_ERRORS,
+            buffer_size=settings.TRACING_BUFFER_SIZE,
+            enabled=settings.TRACING_ENABLED,
+            **kwargs,
+        )
+
+    def start(self, method: str, route: str) -> Optional[Trace]:
+        if not self.enabled:
+            return None
+        sampled = self._sampler()
+        trace = Trace(uuid.uuid4().hex, method, route, sampled, time.perf_counter(), span_factory=self.span_factory)
+        trace._token = _current.set(trace)
+        return trace
+
+    def finish(self, trace: Optional[Trace], status_code: int, error: Optional[BaseException] = None) -> None:
+        if trace is None:
+            return
+        trace.duration = time.perf_counter() - trace.start
+        trace.status_code = status_code
+        if error is not None:
+            trace.error = f"{type(error).__name__}: {error}"
+        try:
+            _current.reset(trace._token)
+        except ValueError: # 在不同的 context 中結束 (例如由其他任務呼叫)
+            _current.set(None)
+        trace._token = None
+        trace.span_factory = None
+
+        self.finished += 1
+        for name, _, duration in trace.stages:
+            if name in self.stage_seconds:
+                self.stage_seconds[name] += duration
+                self.stage_count[name] += 1
+
+        if self.keep_errors and (status_code >= 500 or trace.error is not None):
+            trace.kept = KEEP_ERROR
+        elif trace.duration >= self.slow_threshold:
+            trace.kept = KEEP_SLOW
+        elif trace.sampled:
+            trace.kept = KEEP_SAMPLED
+        else:
+            self.dropped += 1
+            return
+        self.kept[trace.kept] += 1
+        self._buffer.append(trace)
+        # 被頭部取樣的請求已由 span 記錄；只有尾部取樣保留的請求需要另外匯出
+        if self.exporter is not None and not trace.sampled:
+            self.exporter(trace)
+
+    def recent(self, limit: int = 50, min_duration: float = 0.0, route: Optional[str] = None) -> List[Trace]:
+        """最近保留的追蹤 (新到舊)。"""
+        traces = []
+        for trace in reversed(self._buffer):
+            if trace.duration >= min_duration and (route is None or trace.route == route):
+                traces.append(trace)
+                if len(traces) >= limit:
+                    break
+        return traces
+
+    def stats(self) -> dict:
+        return {
+            "finished": self.finished,
+            "dropped": self.dropped,
+            "kept": dict(self.kept),
+            "buffered": len(self._buffer),
+            "stage_mean_ms": {
+                name: round(self.stage_seconds[name] / count * 1000, 3)
+                for name, count in self.stage_count.items() if count
+            },
+        }
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from starlette.responses import FileResponse, Response
+
+from gateway.singleflight import SingleFlight
+
+# 快取查詢結果
+MEMORY_HIT = "memory_hit"
+DISK_HIT = "disk_hit"
+MISS = "miss"
+
+AUDIO_MEDIA_TYPES = {"MP3": "audio/mpeg", "OGG_OPUS": "audio/ogg", "LINEAR16": "audio/wav"}
+
+# Google TTS 單次請求的輸入上限為 5000 位元組 (UTF-8)
+GCP_TTS_MAX_INPUT_BYTES = 5000
+
+# 句子結尾標點 (含中文全形標點)、緊接在句尾之後的收尾符號，以及過長句子的次要斷點
+_SENTENCE_TERMINATORS = "。！？；!?;…\n"
+_CLOSING_MARKS = "」』”’）)]》〉\"'"
+_CLAUSE_SEPARATORS = "，、,：:"
+
+
+def synthesis_key(payload: Mapping[str, Any]) -> str:
+    """以文本、語音、語言與 audioConfig 的正規化 JSON 計算內容位址 (SHA-256)。"""
+    canonical = json.dumps(
+        {key: payload.get(key) for key in ("input", "voice", "audioConfig")},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_synthesis_key(key: str) -> bool:
+    return len(key) == 64 and all(char in "0123456789abcdef" for char in key)
+
+
+@dataclass
+class CachedAudio:
+    key: str
+    size: int
+    data: Optional[bytes] = None # 記憶體層的內容
+    path: Optional[str] = None # 磁碟層的檔案 (data 為 None 時由檔案串流)
+
+
+class AudioCache:
+    """
+    內容位址的語音快取：記憶體 LRU 層加上大小受限的磁碟層。
+
+    相同內容的並行合成請求透過 single-flight 共享一次 Google TTS 呼叫。
+    disk_dir 為空時只使用記憶體層。
+    """
+
+    def __init__(
+        self,
+        memory_max_bytes: int = 32 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: Optional["OrderedDict[str, int]"] = None # 延遲掃描磁碟目錄建立的索引 (依最近使用排序)
+        self._disk_bytes = 0
+        self._disk_lock = asyncio.Lock()
+        self.flight = SingleFlight("gcp_tts")
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "AudioCache":
+        return cls(
+            memory_max_bytes=settings.TTS_CACHE_MEMORY_MAX_BYTES,
+            disk_dir=settings.TTS_CACHE_DIR,
+            disk_max_bytes=settings.TTS_CACHE_DISK_MAX_BYTES,
+        )
+
+    async def get(self, key: str) -> Tuple[Optional[CachedAudio], str]:
+        """返回 (快取的語音, 查詢結果)，未命中時語音為 None。"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return CachedAudio(key, len(data), data=data), MEMORY_HIT
+        if self.disk_dir:
+            index = await self._disk_index()
+            size = index.get(key)
+            if size is not None:
+                path = self._path(key)
+                if os.path.exists(path):
+                    index.move_to_end(key)
+                    self.disk_hits += 1
+                    return CachedAudio(key, size, path=path), DISK_HIT
+                self._disk_bytes -= index.pop(key)
+        self.misses += 1
+        return None, MISS
+
+    async def get_or_synthesize(self, key: str, synthesize: Callable[[], Awaitable[bytes]]) -> Tuple[CachedAudio, str]:
+        """命中時返回快取的語音；未命中時合成並寫入兩層快取 (同一鍵的並行請求只合成一次)。"""
+        audio, state = await self.get(key)
+        if audio is not None:
+            return audio, state
+        audio, _ = await self.flight.do(key, lambda: self._synthesize_and_store(key, synthesize))
+        return audio, MISS
+
+    async def _synthesize_and_store(self, key: str, synthesize: Callable[[], Awaitable[bytes]]) -> CachedAudio:
+        data = await synthesize()
+        await self.put(key, data)
+        return CachedAudio(key, len(data), data=data)
+
+    async def put(self, key: str, data: bytes) -> None:
+        if len(data) <= self.memory_max_bytes:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+        if self.disk_dir and len(data) <= self.disk_max_bytes:
+            index = await self._disk_index()
+            await asyncio.to_thread(_write_atomic, self._path(key), data)
+            async with self._disk_lock:
+                self._disk_bytes += len(data) - index.pop(key, 0)
+                index[key] = len(data)
+                evicted_keys = []
+                while self._disk_bytes > self.disk_max_bytes and len(index) > 1:
+                    evicted_key, size = index.popitem(last=False)
+                    self._disk_bytes -= size
+                    evicted_keys.append(evicted_key)
+            if evicted_keys:
+                await asyncio.to_thread(_remove_files, [self._path(evicted) for evicted in evicted_keys])
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    async def _disk_index(self) -> "OrderedDict[str, int]":
+        if self._disk is None:
+            async with self._disk_lock:
+                if self._disk is None:
+                    entries = await asyncio.to_thread(_scan_disk, self.disk_dir)
+                    self._disk = OrderedDict((key, size) for key, size, _ in sorted(entries, key=lambda entry: entry[2]))
+                    self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+
+def _scan_disk(directory: str):
+    """返回磁碟層中的 (鍵, 大小, 修改時間)；重啟後依修改時間還原 LRU 順序。"""
+    entries = []
+    os.makedirs(directory, exist_ok=True)
+    for shard in os.scandir(directory):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path) # 其他 worker 不會讀到寫到一半的檔案
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove_files(paths) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def parse_byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析單一 "bytes=start-end" 範圍，返回含頭尾的 (start, end)。
+
+    沒有 Range 標頭、格式無法辨識或多重範圍時返回 None (返回完整內容)；範圍無法滿足時拋出 ValueError。
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start, end = size - int(end_text), size - 1 # 後綴範圍 bytes=-N
+    except ValueError:
+        return None
+    start, end = max(0, start), min(end, size - 1)
+    if start > end:
+        raise ValueError(range_header)
+    return start, end
+
+
+def audio_response(audio: CachedAudio, range_header: Optional[str], media_type: str, headers: Dict[str, str]) -> Response:
+    """以支援 Range 的方式返回快取的語音 (磁碟層由檔案串流)。"""
+    headers = {"Accept-Ranges": "bytes", "ETag": f'"{audio.key}"', **headers}
+    if audio.data is None:
+        return FileResponse(audio.path, media_type=media_type, headers=headers) # FileResponse 自行處理 Range 請求
+    try:
+        byte_range = parse_byte_range(range_header, audio.size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{audio.size}"})
+    if byte_range is None:
+        return Response(audio.data, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{audio.size}"
+    return Response(audio.data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    依句子邊界切分文本，保留標點與空白，使各段串接後等於原文。
+
+    支援中文全形標點 (。！？；…) 與其後的收尾引號/括號 (例如「……。」)；
+    英文句點只在其後為空白或文本結尾時視為句尾，避免切開 3.14 或 e.g. 之類的寫法。
+    """
+    sentences, start, index, length = [], 0, 0, len(text)
+    while index < length:
+        char = text[index]
+        index += 1
+        if char in _SENTENCE_TERMINATORS or (char == "." and (index == length or text[index].isspace())):
+            while index < length and (text[index] in _SENTENCE_TERMINATORS or text[index] in _CLOSING_MARKS or text[index].isspace()):
+                index += 1
+            sentences.append(text[start:index])
+            start = index
+    if start < length:
+        sentences.append(text[start:])
+    return sentences
+
+
+def chunk_text(text: str, max_bytes: int = 4500, first_chunk_bytes: int = 300) -> List[str]:
+    """
+    將文本依句子邊界打包成不超過 max_bytes (UTF-8) 的片段。
+
+    第一個片段最多 first_chunk_bytes，讓第一句話儘早合成完成 (縮短首段音訊的等待時間)；
+    單句超過上限時再依逗號等子句斷點切分，仍過長則依位元組數硬切。
+    """
+    chunks: List[str] = []
+    current, current_bytes, limit = "", 0, first_chunk_bytes
+    for sentence in split_sentences(text):
+        for piece in _split_oversized(sentence, max_bytes):
+            piece_bytes = _utf8_len(piece)
+            if current and current_bytes + piece_bytes > limit:
+                chunks.append(current)
+                current, current_bytes, limit = "", 0, max_bytes
+            current += piece
+            current_bytes += piece_bytes
+    chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def _split_oversized(sentence: str, max_bytes: int) -> List[str]:
+    if _utf8_len(sentence) <= max_bytes:
+        return [sentence]
+    # 每次取最多 max_bytes 位元組的前綴 (在字元邊界截斷)，編碼與搜尋斷點都在 C 中完成，
+    # 不逐字元重新編碼整個片段 (沒有標點的長文也是線性時間)
+    pieces, start = [], 0
+    while start < len(sentence):
+        window = sentence[start:start + max_bytes].encode("utf-8")[:max_bytes].decode("utf-8", "ignore") or sentence[start]
+        if start + len(window) >= len(sentence):
+            pieces.append(window)
+            break
+        # 在片段內最後一個子句斷點之後切開；沒有斷點時直接硬切
+        cut = max(window.rfind(separator) for separator in _CLAUSE_SEPARATORS) + 1
+        if cut <= 0:
+            cut = len(window)
+        pieces.append(window[:cut])
+        start += cut
+    return pieces
+
+
+def strip_id3(data: bytes) -> bytes:
+    """移除 MP3 開頭的 ID3v2 標籤，讓多個片段串接後仍是連續的 MP3 frame。"""
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9] # synchsafe 整數
+        footer = 10 if data[5] & 0x10 else 0
+        return data[10 + size + footer:]
+    return data
+
+
+async def synthesize_in_order(
+    chunks: Sequence[str],
+    synthesize: Callable[[str], Awaitable[bytes]],
+    concurrency: int = 4,
+) -> AsyncIterator[bytes]:
+    """
+    以最多 concurrency 個並行請求合成所有片段，並依原順序逐段產出音訊。
+
+    片段依順序取得 semaphore，因此前面的片段優先合成；產生器被關閉 (客戶端中斷) 時取消尚未完成的合成。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(chunk: str) -> bytes:
+        async with semaphore:
+            return await synthesize(chunk)
+
+    tasks = [asyncio.ensure_future(run(chunk)) for chunk in chunks]
+    for task in tasks:
+        task.add_done_callback(_consume_exception)
+    try:
+        for index, task in enumerate(tasks):
+            data = await task
+            yield data if index == 0 else strip_id3(data)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception() # 後續片段的錯誤在串流中止後不會再被讀取
@@ -0,0 +1,107 @@
+import importlib.util
+import ssl
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+import httpx
+
+from gateway.tracing import trace_upstream_request
+
+# 上游名稱 (每個上游各自擁有一個共享的連線池)
+LARAVEL_REST = "laravel_rest"
+LARAVEL_GRAPHQL = "laravel_graphql"
+GCP_TTS = "gcp_tts"
+
+
+def http2_available() -> bool:
+    """檢查是否安裝了 httpx 的 HTTP/2 支援 (h2 套件)。"""
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class UpstreamConfig:
+    name: str
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 30.0
+    connect_timeout: float = 5.0
+    http2: bool = True
+
+
+class UpstreamClients:
+    """
+    閘道範圍的上游 HTTP 客戶端集合。
+
+    每個上游維護一個長期存在的 httpx.AsyncClient，使連線可以在請求之間重複使用，
+    避免每次代理請求都重新進行 TCP/TLS 握手。客戶端在應用程式 lifespan 中建立與關閉；
+    若在 lifespan 之外被呼叫 (例如未以 context manager 使用的 TestClient)，則延遲建立。
+    """
+
+    def __init__(self, configs: Iterable[UpstreamConfig]):
+        self._configs: Dict[str, UpstreamConfig] = {config.name: config for config in configs}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> "UpstreamClients":
+        shared = dict(
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            connect_timeout=settings.UPSTREAM_CONNECT_TIMEOUT,
+            http2=settings.UPSTREAM_HTTP2,
+        )
+        return cls([
+            UpstreamConfig(LARAVEL_REST, max_connections=settings.LARAVEL_REST_MAX_CONNECTIONS, timeout=settings.LARAVEL_REST_TIMEOUT, **shared),
+            UpstreamConfig(LARAVEL_GRAPHQL, max_connections=settings.LARAVEL_GRAPHQL_MAX_CONNECTIONS, timeout=settings.LARAVEL_GRAPHQL_TIMEOUT, **shared),
+            UpstreamConfig(GCP_TTS, max_connections=settings.GCP_TTS_MAX_CONNECTIONS, timeout=settings.GCP_TTS_TIMEOUT, **shared),
+        ])
+
+    def config(self, name: str) -> UpstreamConfig:
+        try:
+            return self._configs[name]
+        except KeyError:
+            raise KeyError(f"未知的上游: {name}")
+
+    def prepare(self) -> None:
+        """
+        載入建立客戶端所需的資源：httpx 延遲匯入的傳輸層模組與 CA 憑證。所有上游共用同一個 SSL context，
+        憑證只載入一次。預載的多 worker 伺服器在 fork 前呼叫，worker 共享這些資源，啟動時只需建立客戶端。
+        """
+        if self._ssl_context is None:
+            import httpcore # noqa: F401 (httpx 在建立第一個傳輸層時才匯入)
+            self._ssl_context = httpx.create_ssl_context()
+
+    def _build(self, config: UpstreamConfig) -> httpx.AsyncClient:
+        self.prepare()
+        limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=min(config.max_keepalive_connections, config.max_connections),
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        timeout = httpx.Timeout(config.timeout, connect=config.connect_timeout)
+        # HTTP/2 僅在安裝 h2 時啟用 (對 https 上游透過 ALPN 協商)
+        # request 鉤子在請求被追蹤時記錄上游連線與 TTFB 階段
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            verify=self._ssl_context,
+            http2=config.http2 and http2_available(),
+            event_hooks={"request": [trace_upstream_request]},
+        )
+
+    async def startup(self) -> None:
+        for name in self._configs:
+            self.get(name)
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client: Optional[httpx.AsyncClient] = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(self.config(name))
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
@@ -1,45 +1,67 @@
+import time # 用於指標與啟動計時
+IMPORT_STARTED = time.perf_counter()
+
+import base64
 import httpx
 import os
-import time # 用於指標
 import asyncio # 用於模擬非同步工作
-from fastapi import FastAPI, HTTPException, Request, Depends, status, Security
-from fastapi.responses import JSONResponse, PlainTextResponse # 用於指標
+from anyio import to_thread # 同步端點使用的執行緒池
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Depends, Body, status, Security, BackgroundTasks
+from fastapi.responses import PlainTextResponse, StreamingResponse # 用於指標
 from pydantic import BaseModel, HttpUrl
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional, Union
+from urllib.parse import parse_qsl, urlsplit
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from jose import JWTError, jwt # 導入 JWT 相關模組
+from jose import JWTError # 導入 JWT 相關模組
 from fastapi.security import OAuth2PasswordBearer # 用於身份驗證方案
-from slowapi import Limiter, _rate_limit_exceeded_handler # 導入速率限制模組
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from fastapi.routing import APIRoute # 用於自訂路由以進行指標追蹤
 from starlette.middleware.base import BaseHTTPMiddleware
-from strawberry.asgi import GraphQL
-from strawberry.exceptions import StrawberryGraphQLError
-
-# Sentry 相關導入
-import sentry_sdk
-from sentry_sdk.integrations.asgi import SentryAsgiMiddleware # 或直接使用 starlette 整合
-from sentry_sdk.integrations.httpx import HttpxIntegration # 追蹤 httpx 請求
-
 # 載入環境變數
 load_dotenv()
 
 # 從 config.py 導入設定
 from config.config import settings
+from gateway.upstream import UpstreamClients, LARAVEL_REST, LARAVEL_GRAPHQL, GCP_TTS
+from gateway.streaming import send_streaming, passthrough_response, request_body_stream, fetch_raw
+from gateway.cache import ResponseCache, credentials_digest
+from gateway.singleflight import SingleFlight, parse_route_patterns, route_matches, body_digest
+from gateway.metrics import MetricsRegistry
+from gateway.routes import InvalidEndpoint, RouteTemplates, checked_endpoint
+from gateway.auth import VerifiedTokenCache
+from gateway.ratelimit import RateLimiter, RateLimitExceeded
+from gateway.graphql_documents import DocumentCache, PersistedQueryStore, GraphQLDocumentError, PersistedQueryNotFound, persisted_query_hash
+from gateway.batching import MicroBatcher
+from gateway.resilience import UpstreamGuards, UpstreamUnavailable, IDEMPOTENT_METHODS, STATE_VALUES
+from gateway.admission import AdmissionController, AdmissionRejected
+from gateway.balancer import BackendPool
+from gateway.compression import CompressionMiddleware
+from gateway import jsoncodec
+from gateway.jsoncodec import FastJSONResponse, raw_json_response, is_json_content_type
+from gateway.events import EventHub, RedisEventRelay, StreamTickets, SubscriberLimitReached, SIGNATURE_HEADER, sign_payload, verify_signature
+from gateway.metering import UNAUTHENTICATED_TENANT, UsageMeter, sink_from_url
+from gateway.multiplex import BatchPlanError, SubResponse, encode_result, error_response, json_body, plan_batch, run_batch
+from gateway.loopmonitor import LoopMonitor, BlockingReport
+from gateway.tracing import Tracer, Trace, KEEP_ERROR, STAGES, AUTH, RATE_LIMIT, ADMISSION, UPSTREAM_CONNECT, UPSTREAM_TTFB, stage
+from gateway.tenants import TenantRegistry, TenantRecord, TenantUnavailable, ACTIVE, SUSPENDED
+from gateway.tts import AudioCache, CachedAudio, AUDIO_MEDIA_TYPES, MISS, synthesis_key, is_synthesis_key, audio_response, chunk_text, synthesize_in_order
 
-# Sentry 初始化
+# Sentry 初始化 (只在設定 SENTRY_DSN 時匯入 sentry_sdk，未使用 Sentry 時不增加啟動時間)
 # 確保 SENTRY_DSN 存在於 .env 檔案中
+sentry_sdk = None
 if settings.SENTRY_DSN:
+    import sentry_sdk
+    from sentry_sdk.integrations.httpx import HttpxIntegration # 追蹤 httpx 請求
+
+    # 以 gateway.prefork 預載後 fork 的 worker 也可使用：sentry_sdk 的背景傳送執行緒會在子進程中重新啟動
     sentry_sdk.init(
         dsn=settings.SENTRY_DSN,
         integrations=[
-            SentryAsgiMiddleware(), # 或 SentryStarletteMiddleware()
-            HttpxIntegration(), # 追蹤 httpx 請求
+            HttpxIntegration(), # 追蹤 httpx 請求 (FastAPI / Starlette 整合會自動啟用)
         ],
-        traces_sample_rate=1.0, # 調整為您的需求
-        profiles_sample_rate=1.0, # 調整為您的需求
+        traces_sample_rate=settings.TRACING_SAMPLE_RATE, # 頭部取樣；慢請求與錯誤由尾部取樣另外送出
+        profiles_sample_rate=settings.SENTRY_PROFILES_SAMPLE_RATE,
         environment=os.getenv("APP_ENV", "development"),
         release=f"fastapi@{settings.VERSION}", # 使用 config.py 中的版本
     )
@@ -47,25 +69,141 @@ if settings.SENTRY_DSN:
 else:
     print("SENTRY_DSN 未設定，Sentry 錯誤追蹤已跳過。")
 
+
+def export_trace_to_sentry(trace: Trace) -> None:
+    """將尾部取樣保留 (未被 Sentry 頭部取樣) 的慢請求或錯誤連同階段時間送到 Sentry。"""
+    with sentry_sdk.new_scope() as scope:
+        scope.set_tag("route", trace.route)
+        scope.set_tag("trace.kept", trace.kept)
+        scope.set_context("stages", {name: round(seconds * 1000, 3) for name, seconds in trace.stage_totals().items()})
+        scope.set_context("request", {"method": trace.method, "status_code": trace.status_code, "trace_id": trace.trace_id})
+        sentry_sdk.capture_message(
+            f"{trace.kept} request: {trace.method} {trace.route} {trace.duration * 1000:.0f} ms",
+            level="error" if trace.kept == KEEP_ERROR else "warning",
+        )
+
+
+# 請求追蹤：頭部取樣加上保留慢請求與錯誤的尾部取樣；設定 SENTRY_DSN 時與 Sentry 的取樣結果一致
+tracer = Tracer.from_settings(
+    settings,
+    sampler=(lambda: bool(getattr(sentry_sdk.get_current_span(), "sampled", False))) if settings.SENTRY_DSN else None,
+    span_factory=(lambda name: sentry_sdk.start_span(op=f"gateway.{name}")) if settings.SENTRY_DSN else None,
+    exporter=export_trace_to_sentry if settings.SENTRY_DSN else None,
+)
+
+# 事件迴圈延遲、阻塞呼叫與執行緒池使用量的監測 (過載時在准入前卸除負載；阻塞紀錄經 report_blocking 匯出)
+loop_monitor = LoopMonitor.from_settings(settings, on_block=lambda report: report_blocking(report))
+
+# JSON 實作 (auto 依序使用 orjson、msgspec，都未安裝時使用標準庫)
+jsoncodec.configure(settings.JSON_BACKEND)
+
 # JWT 配置
 SECRET_KEY = settings.JWT_SECRET_KEY
 ALGORITHM = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token") # Laravel token endpoint
+token_cache = VerifiedTokenCache.from_settings(settings, algorithms=[ALGORITHM]) # 已驗證 claims 的 LRU 快取
+
+# 速率限制器 (可使用 Redis 共享計數，並以本地 token bucket 批次租用配額)
+rate_limiter = RateLimiter.from_settings(settings)
+
+# 共享的上游 HTTP 客戶端 (每個上游一個連線池)
+upstreams = UpstreamClients.from_settings(settings)
 
-# 速率限制器
-limiter = Limiter(key_func=get_remote_address)
+# 每個上游的斷路器、並行上限、重試預算與自適應逾時
+upstream_guards = UpstreamGuards.from_settings(settings, upstreams)
+
+# 依租戶的准入控制 (租戶並行上限與加權公平排隊)
+tenant_admission = AdmissionController.from_settings(settings)
+
+# 租戶註冊表 (租戶狀態與所屬的 Laravel 後端池；快照中的等級同步到准入控制)
+tenant_registry = TenantRegistry.from_settings(settings)
+for tenant in tenant_registry.records():
+    if tenant.tier:
+        tenant_admission.set_tenant_tier(tenant.tenant_id, tenant.tier)
+
+# Laravel 多後端負載平衡 (被動與主動健康檢查、慢啟動、可選的租戶黏著)
+laravel_backends = BackendPool.from_settings(settings)
+
+# /tenant-api GET 響應快取
+response_cache = ResponseCache.from_settings(settings)
+
+# 文本轉語音的內容位址快取 (記憶體 LRU + 磁碟層)
+tts_cache = AudioCache.from_settings(settings)
+
+# 文章事件的 SSE 扇出 (多個副本或 worker 時以 Redis pub/sub 轉送 Webhook 收到的事件)
+event_hub = EventHub.from_settings(settings)
+stream_tickets = StreamTickets(settings.JWT_SECRET_KEY, ttl=settings.EVENTS_TICKET_TTL) # EventSource 以短效票證取代 URL 中的 JWT
+event_relay = RedisEventRelay(settings.EVENTS_REDIS_URL) if settings.EVENTS_REDIS_URL else None
+
+# 依租戶、用戶與路由的用量計量 (請求路徑上只更新記憶體計數，背景整批寫入 sink；未設定 METERING_SINK_URL 時停用)
+usage_meter = UsageMeter.from_settings(
+    settings,
+    sink_from_url(
+        settings.METERING_SINK_URL,
+        lambda: upstreams.get(LARAVEL_REST),
+        sign=(lambda body: {SIGNATURE_HEADER: sign_payload(settings.WEBHOOK_SECRET, body, int(time.time()))}) if settings.WEBHOOK_SECRET else None,
+    ),
+) if settings.METERING_SINK_URL else None
+
+# 相同並行上游請求的合併 (single-flight)
+tenant_api_flight = SingleFlight(LARAVEL_REST)
+graphql_flight = SingleFlight(LARAVEL_GRAPHQL)
+SINGLEFLIGHT_ROUTES = parse_route_patterns(settings.SINGLEFLIGHT_ROUTES)
+
+# GraphQL 持久化查詢 (APQ) 與已解析查詢的快取
+persisted_queries = PersistedQueryStore(settings.GRAPHQL_PERSISTED_QUERIES_MAX_ENTRIES)
+graphql_documents = DocumentCache.from_settings(settings)
+
+# 同一用戶短時間內的個別 GraphQL 操作合併為一次批次上游呼叫 (可選)
+graphql_batcher = MicroBatcher(
+    lambda key, items: _send_graphql_microbatch(items),
+    max_size=settings.GRAPHQL_BATCH_MAX_SIZE,
+    max_wait=settings.GRAPHQL_MICROBATCH_WAIT_MS / 1000,
+) if settings.GRAPHQL_MICROBATCH_ENABLED else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    lifespan_started = time.perf_counter()
+    if settings.THREADPOOL_SIZE > 0:
+        to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    await upstreams.startup()
+    metrics_flusher = asyncio.create_task(metrics.flush_periodically(settings.METRICS_FLUSH_INTERVAL)) if metrics.multiproc_dir else None
+    health_checker = asyncio.create_task(
+        laravel_backends.run_health_checks(lambda: upstreams.get(LARAVEL_REST), settings.LARAVEL_HEALTH_CHECK_INTERVAL)
+    ) if settings.LARAVEL_HEALTH_CHECK_INTERVAL > 0 and len(laravel_backends.backends) > 1 else None
+    event_listener = asyncio.create_task(event_relay.run(event_hub)) if event_relay is not None else None
+    usage_flusher = asyncio.create_task(usage_meter.run()) if usage_meter is not None else None
+    STARTUP_SECONDS["lifespan"] = time.perf_counter() - lifespan_started
+    try:
+        yield
+    finally:
+        if usage_flusher is not None:
+            usage_flusher.cancel()
+            await usage_meter.flush() # 送出 (或暫存) 最後一個窗口的用量；在關閉上游連線池之前
+        event_hub.close_all() # 結束所有事件串流，客戶端會重新連線到其他副本
+        if event_listener is not None:
+            event_listener.cancel()
+            await event_relay.aclose()
+        if health_checker is not None:
+            health_checker.cancel()
+        if metrics_flusher is not None:
+            metrics_flusher.cancel()
+            await asyncio.to_thread(metrics.write_snapshot) # 保留本 worker 的最終計數
+        await upstreams.aclose()
+        await rate_limiter.aclose()
+        if settings.LOOP_MONITOR_ENABLED:
+            await loop_monitor.stop()
 
 app = FastAPI(
     title="OrbitPress API 閘道",
     description="將請求路由到適當的租戶後端並處理身份驗證。它還提供了文本轉語音集成和基本的 API 指標。",
-    version=settings.VERSION # 使用 config.py 中的版本
+    version=settings.VERSION, # 使用 config.py 中的版本
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse, # 以設定的 JSON 實作 (orjson / msgspec / 標準庫) 序列化
 )
 
-# 添加速率限制中間件
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-
 # 設定 CORS
 origins = [origin.strip() for origin in settings.CORS_ORIGINS.split(',')]
 app.add_middleware(
@@ -76,42 +214,199 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 響應壓縮 (zstd / br / gzip) 與 ETag；上游已壓縮的響應不重新編碼
+if settings.COMPRESSION_ENABLED or settings.ETAG_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        encodings=[encoding.strip() for encoding in settings.COMPRESSION_ENCODINGS.split(",") if encoding.strip()] if settings.COMPRESSION_ENABLED else [],
+        etag=settings.ETAG_ENABLED,
+    )
+
 # Laravel 後端服務基礎 URL
 LARAVEL_BACKEND_BASE_URL = settings.LARAVEL_BACKEND_BASE_URL
 LARAVEL_GRAPHQL_URL = settings.LARAVEL_GRAPHQL_URL # Laravel GraphQL 端點
+LARAVEL_GRAPHQL_PATH = urlsplit(LARAVEL_GRAPHQL_URL).path # 多後端時各後端上的 GraphQL 路徑
+GRAPHQL_ROUTE = "graphql" # GraphQL 請求在上游彈性層中的路由名稱 (自適應逾時依路由追蹤)
 
-# 簡單的內存指標 (僅用於演示目的)
-request_count = {}
-request_duration_sum = {}
-request_duration_count = {}
-
-def increment_counter(metric_name: str, labels: Dict[str, str] = None):
-    # 創建一個用於指標字典鍵的標準化字符串
-    label_suffix = ""
-    if labels:
-        sorted_labels = sorted(labels.items())
-        label_suffix = "_" + "_".join(f"{k}_{v}" for k, v in sorted_labels)
-    key = metric_name + label_suffix
-    request_count[key] = request_count.get(key, 0) + 1
-
-def observe_histogram(metric_name: str, value: float, labels: Dict[str, str] = None):
-    # 創建一個用於指標字典鍵的標準化字符串
-    label_suffix = ""
-    if labels:
-        sorted_labels = sorted(labels.items())
-        label_suffix = "_" + "_".join(f"{k}_{v}" for k, v in sorted_labels)
-    key = metric_name + label_suffix
-    request_duration_sum[key] = request_duration_sum.get(key, 0) + value
-    request_duration_count[key] = request_duration_count.get(key, 0) + 1
+# Prometheus 指標 (預先註冊的指標家族；多個 uvicorn worker 時透過 METRICS_MULTIPROC_DIR 彙總)
+metrics = MetricsRegistry(
+    multiproc_dir=settings.METRICS_MULTIPROC_DIR,
+    cache_seconds=settings.METRICS_EXPOSITION_CACHE_SECONDS,
+    max_series_per_metric=settings.METRICS_MAX_SERIES_PER_METRIC, # 超過上限的新序列歸入 __overflow__
+)
+TENANT_LABEL = ("tenant",) if settings.METRICS_TENANT_LABEL else () # 可選的租戶維度
+HTTP_REQUESTS = metrics.counter("fastapi_http_requests_total", "請求總數。", ("method", "path", "status") + TENANT_LABEL)
+HTTP_REQUEST_DURATION = metrics.histogram("fastapi_request_duration_seconds", "請求持續時間 (秒)。", ("method", "path") + TENANT_LABEL)
+tenant_routes = RouteTemplates.from_settings(settings)
+TTS_REQUESTS = metrics.counter("fastapi_tts_requests_total", "文本轉語音請求總數。", ("status",))
+TTS_DURATION = metrics.histogram("fastapi_tts_duration_seconds", "Google Cloud TTS 呼叫持續時間 (秒)。")
+SINGLEFLIGHT_REQUESTS = metrics.counter(
+    "fastapi_singleflight_requests_total",
+    "經 single-flight 處理的上游請求數 (leader 為實際上游呼叫，follower 為被合併的請求)。",
+    ("upstream", "role"),
+)
+for flight in (tenant_api_flight, graphql_flight, tts_cache.flight):
+    SINGLEFLIGHT_REQUESTS.labels(flight.name, "leader").set_function(lambda flight=flight: flight.leaders)
+    SINGLEFLIGHT_REQUESTS.labels(flight.name, "follower").set_function(lambda flight=flight: flight.followers)
+JWT_CACHE_REQUESTS = metrics.counter("fastapi_jwt_cache_requests_total", "JWT 驗證快取查詢次數。", ("result",))
+JWT_CACHE_REQUESTS.labels("hit").set_function(lambda: token_cache.hits)
+JWT_CACHE_REQUESTS.labels("miss").set_function(lambda: token_cache.misses)
+TTS_CACHE_REQUESTS = metrics.counter("fastapi_tts_cache_requests_total", "文本轉語音快取查詢次數。", ("result",))
+TTS_CACHE_REQUESTS.labels("memory_hit").set_function(lambda: tts_cache.memory_hits)
+TTS_CACHE_REQUESTS.labels("disk_hit").set_function(lambda: tts_cache.disk_hits)
+TTS_CACHE_REQUESTS.labels("miss").set_function(lambda: tts_cache.misses)
+GRAPHQL_PERSISTED_QUERIES = metrics.counter("fastapi_graphql_persisted_queries_total", "GraphQL 持久化查詢 (APQ) 的查詢結果。", ("result",))
+GRAPHQL_PERSISTED_QUERIES.labels("hit").set_function(lambda: persisted_queries.hits)
+GRAPHQL_PERSISTED_QUERIES.labels("miss").set_function(lambda: persisted_queries.misses)
+GRAPHQL_PERSISTED_QUERIES.labels("registered").set_function(lambda: persisted_queries.registrations)
+GRAPHQL_DOCUMENT_CACHE = metrics.counter("fastapi_graphql_document_cache_total", "GraphQL 已解析查詢快取的查詢次數。", ("result",))
+GRAPHQL_DOCUMENT_CACHE.labels("hit").set_function(lambda: graphql_documents.hits)
+GRAPHQL_DOCUMENT_CACHE.labels("miss").set_function(lambda: graphql_documents.misses)
+if graphql_batcher is not None:
+    GRAPHQL_MICROBATCH = metrics.counter("fastapi_graphql_microbatch_total", "GraphQL 微批次的上游批次呼叫數與合併的操作數。", ("kind",))
+    GRAPHQL_MICROBATCH.labels("batches").set_function(lambda: graphql_batcher.batches)
+    GRAPHQL_MICROBATCH.labels("operations").set_function(lambda: graphql_batcher.items)
+UPSTREAM_CIRCUIT_STATE = metrics.gauge("fastapi_upstream_circuit_state", "上游斷路器狀態 (0=closed, 1=half_open, 2=open)。", ("upstream",), multiprocess_mode="max")
+UPSTREAM_CIRCUIT_OPENED = metrics.counter("fastapi_upstream_circuit_opened_total", "上游斷路器開啟次數。", ("upstream",))
+UPSTREAM_REJECTED = metrics.counter("fastapi_upstream_rejected_total", "因斷路器開啟或並行已滿而以 503 拒絕的請求數。", ("upstream", "reason"))
+UPSTREAM_RETRIES = metrics.counter("fastapi_upstream_retries_total", "上游請求的重試次數。", ("upstream",))
+UPSTREAM_IN_FLIGHT = metrics.gauge("fastapi_upstream_in_flight", "進行中的上游請求數。", ("upstream",))
+UPSTREAM_TIMEOUT = metrics.gauge("fastapi_upstream_timeout_seconds", "目前使用的自適應上游逾時 (秒)。", ("upstream",), multiprocess_mode="max")
+for guard in upstream_guards:
+    UPSTREAM_CIRCUIT_STATE.labels(guard.name).set_function(lambda guard=guard: STATE_VALUES[guard.state()])
+    UPSTREAM_CIRCUIT_OPENED.labels(guard.name).set_function(lambda guard=guard: sum(breaker.opened for breaker in guard.breakers()))
+    for reason in guard.rejected:
+        UPSTREAM_REJECTED.labels(guard.name, reason).set_function(lambda guard=guard, reason=reason: guard.rejected[reason])
+    UPSTREAM_RETRIES.labels(guard.name).set_function(lambda guard=guard: guard.retries)
+    UPSTREAM_IN_FLIGHT.labels(guard.name).set_function(lambda guard=guard: guard.in_flight)
+    UPSTREAM_TIMEOUT.labels(guard.name).set_function(lambda guard=guard: guard.latency.timeout())
+TENANT_ADMISSION_IN_FLIGHT = metrics.gauge("fastapi_tenant_admission_in_flight", "經准入控制進行中的 Laravel 請求數。")
+TENANT_ADMISSION_IN_FLIGHT.labels().set_function(lambda: tenant_admission.in_flight)
+TENANT_ADMISSION_QUEUED = metrics.gauge("fastapi_tenant_admission_queue_depth", "等待准入的請求數。")
+TENANT_ADMISSION_QUEUED.labels().set_function(tenant_admission.queue_depth)
+TENANT_ADMISSION_WAIT = metrics.counter("fastapi_tenant_admission_wait_seconds_total", "請求等待准入的總時間 (秒)。")
+TENANT_ADMISSION_WAIT.labels().set_function(lambda: tenant_admission.wait_seconds)
+TENANT_ADMISSION_REJECTED = metrics.counter("fastapi_tenant_admission_rejected_total", "准入控制拒絕的請求數。", ("reason",))
+for reason in tenant_admission.rejected:
+    TENANT_ADMISSION_REJECTED.labels(reason).set_function(lambda reason=reason: tenant_admission.rejected[reason])
+TENANT_REGISTRY_TENANTS = metrics.gauge("fastapi_tenant_registry_tenants", "租戶註冊表中的租戶數。", ("status",), multiprocess_mode="max")
+for tenant_status in (ACTIVE, SUSPENDED):
+    TENANT_REGISTRY_TENANTS.labels(tenant_status).set_function(lambda tenant_status=tenant_status: sum(1 for tenant in tenant_registry.records() if tenant.status == tenant_status))
+TENANT_REGISTRY_REJECTED = metrics.counter("fastapi_tenant_registry_rejected_total", "因租戶未註冊或已停用而在閘道拒絕的請求數。", ("reason",))
+for reason in tenant_registry.rejected:
+    TENANT_REGISTRY_REJECTED.labels(reason).set_function(lambda reason=reason: tenant_registry.rejected[reason])
+LARAVEL_BACKEND_OUTSTANDING = metrics.gauge("fastapi_laravel_backend_outstanding", "每個 Laravel 後端進行中的請求數。", ("backend",))
+LARAVEL_BACKEND_AVAILABLE = metrics.gauge("fastapi_laravel_backend_available", "Laravel 後端是否可用 (未被剔除且健康檢查通過)。", ("backend",), multiprocess_mode="max")
+LARAVEL_BACKEND_EJECTIONS = metrics.counter("fastapi_laravel_backend_ejections_total", "Laravel 後端因連續失敗被剔除的次數。", ("backend",))
+for backend in laravel_backends.backends:
+    LARAVEL_BACKEND_OUTSTANDING.labels(backend.url).set_function(lambda backend=backend: backend.outstanding)
+    LARAVEL_BACKEND_AVAILABLE.labels(backend.url).set_function(lambda backend=backend: int(backend.available()))
+    LARAVEL_BACKEND_EJECTIONS.labels(backend.url).set_function(lambda backend=backend: backend.ejected_total)
+TRACE_STAGE_SECONDS = metrics.counter("fastapi_trace_stage_seconds_total", "各請求階段的累計時間 (秒)。", ("stage",))
+TRACE_STAGE_COUNT = metrics.counter("fastapi_trace_stage_count_total", "各請求階段的執行次數。", ("stage",))
+for stage_name in STAGES:
+    TRACE_STAGE_SECONDS.labels(stage_name).set_function(lambda stage_name=stage_name: tracer.stage_seconds[stage_name])
+    TRACE_STAGE_COUNT.labels(stage_name).set_function(lambda stage_name=stage_name: tracer.stage_count[stage_name])
+TRACES_KEPT = metrics.counter("fastapi_traces_kept_total", "保留的請求追蹤數 (頭部取樣、慢請求、錯誤)。", ("reason",))
+for reason in tracer.kept:
+    TRACES_KEPT.labels(reason).set_function(lambda reason=reason: tracer.kept[reason])
+TRACES_DROPPED = metrics.counter("fastapi_traces_dropped_total", "未被取樣而捨棄的請求追蹤數。")
+TRACES_DROPPED.labels().set_function(lambda: tracer.dropped)
+EVENT_CONNECTIONS = metrics.gauge("fastapi_event_stream_connections", "進行中的文章事件串流 (SSE) 連線數。")
+EVENT_CONNECTIONS.labels().set_function(lambda: event_hub.subscribers)
+EVENT_DELIVERIES = metrics.counter("fastapi_event_stream_events_total", "文章事件的發布、送達、緩衝區溢位捨棄與中斷連線次數。", ("result",))
+for result in ("published", "delivered", "dropped", "disconnected"):
+    EVENT_DELIVERIES.labels(result).set_function(lambda result=result: getattr(event_hub, result))
+LOOP_LAG = metrics.gauge("fastapi_event_loop_lag_seconds", "事件迴圈延遲 (計時器實際與預期醒來時間的差) 的移動平均 (秒)。", multiprocess_mode="max")
+LOOP_LAG.labels().set_function(lambda: loop_monitor.lag_ewma)
+LOOP_LAG_P99 = metrics.gauge("fastapi_event_loop_lag_p99_seconds", "最近取樣的事件迴圈延遲 p99 (秒)。", multiprocess_mode="max")
+LOOP_LAG_P99.labels().set_function(lambda: loop_monitor.lag_percentile(0.99))
+LOOP_LAG_TOTAL = metrics.counter("fastapi_event_loop_lag_seconds_total", "事件迴圈延遲的累計秒數。")
+LOOP_LAG_TOTAL.labels().set_function(lambda: loop_monitor.lag_seconds)
+LOOP_BLOCKED = metrics.counter("fastapi_event_loop_blocked_total", "事件迴圈被佔用超過門檻的次數 (依佔用迴圈的程式碼位置)。", ("location",))
+LOOP_BLOCKED_SECONDS = metrics.counter("fastapi_event_loop_blocked_seconds_total", "事件迴圈被佔用超過門檻的累計秒數 (依佔用迴圈的程式碼位置)。", ("location",))
+THREADPOOL_THREADS = metrics.gauge("fastapi_threadpool_threads", "同步端點與 run_in_threadpool 使用的執行緒池 (size=上限、busy=忙碌中、waiting=等待執行緒的工作)。", ("state",))
+THREADPOOL_THREADS.labels("size").set_function(lambda: loop_monitor.threadpool_size)
+THREADPOOL_THREADS.labels("busy").set_function(lambda: loop_monitor.threadpool_busy)
+THREADPOOL_THREADS.labels("waiting").set_function(lambda: loop_monitor.threadpool_waiting)
+THREADPOOL_SATURATED = metrics.counter("fastapi_threadpool_saturated_samples_total", "執行緒池全部忙碌的取樣次數。")
+THREADPOOL_SATURATED.labels().set_function(lambda: loop_monitor.threadpool_saturated)
+LOAD_SHED = metrics.counter("fastapi_load_shed_total", "因事件迴圈或執行緒池過載而以 503 卸除的請求數。")
+LOAD_SHED.labels().set_function(lambda: loop_monitor.shed)
+if usage_meter is not None:
+    METERING_RECORDS = metrics.counter("fastapi_metering_records_total", "用量計量記錄的請求數與送出到 sink 的彙總紀錄數。", ("result",))
+    METERING_RECORDS.labels("recorded").set_function(lambda: usage_meter.recorded)
+    METERING_RECORDS.labels("flushed").set_function(lambda: usage_meter.flushed_records)
+    METERING_BATCHES = metrics.counter("fastapi_metering_batches_total", "用量批次送出成功、失敗 (稍後重送) 與因暫存區已滿捨棄的次數。", ("result",))
+    METERING_BATCHES.labels("flushed").set_function(lambda: usage_meter.flushed_batches)
+    METERING_BATCHES.labels("failed").set_function(lambda: usage_meter.failures)
+    METERING_BATCHES.labels("dropped").set_function(lambda: usage_meter.dropped_batches)
+    METERING_PENDING = metrics.gauge("fastapi_metering_pending_batches", "等待送出的用量批次數。")
+    METERING_PENDING.labels().set_function(usage_meter.pending)
+STARTUP_SECONDS = {"import": 0.0, "lifespan": 0.0} # 匯入本模組與 lifespan 啟動的秒數 (預載時匯入在父進程完成)
+STARTUP_TIME = metrics.gauge("fastapi_startup_seconds", "啟動各階段的耗時 (import=匯入應用程式、lifespan=worker 的啟動工作)。", ("phase",), multiprocess_mode="max")
+for phase in STARTUP_SECONDS:
+    STARTUP_TIME.labels(phase).set_function(lambda phase=phase: STARTUP_SECONDS[phase])
+APP_INFO = metrics.gauge("fastapi_info", "關於 FastAPI 應用程式的資訊。", ("version",), multiprocess_mode="max")
+APP_INFO.labels(settings.VERSION).set(1)
+
+def report_blocking(report: BlockingReport) -> None:
+    """記錄一次阻塞事件迴圈的呼叫；設定 SENTRY_DSN 時連同堆疊送到 Sentry。"""
+    LOOP_BLOCKED.labels(report.location).inc()
+    LOOP_BLOCKED_SECONDS.labels(report.location).inc(report.duration)
+    if settings.SENTRY_DSN:
+        with sentry_sdk.new_scope() as scope:
+            scope.set_tag("loop.location", report.location)
+            scope.set_context("blocking", {"task": report.task, "duration_ms": round(report.duration * 1000, 3), "stack": "".join(report.stack)})
+            sentry_sdk.capture_message(f"event loop blocked {report.duration * 1000:.0f} ms at {report.location}", level="warning")
+
+def meter_usage(request: Request, route: str, status_code: int, response: Any, trace: Optional[Trace]) -> None:
+    """
+    記錄一次請求的用量 (只更新記憶體中的計數)。上游時間取自請求追蹤的連線與 TTFB 階段；
+    輸出位元組為壓縮前的主體大小，串流響應在主體送完後才計入。未識別租戶的請求不計量。
+    """
+    tenant_id = getattr(request.state, "tenant_id", "")
+    if not tenant_id:
+        return
+    stages = trace.stage_totals() if trace is not None else {}
+    usage = {
+        "errors": int(status_code >= 500), # 閘道或上游的錯誤 (客戶端錯誤仍計入請求數)
+        "bytes_in": int(request.headers.get("content-length") or 0),
+        "upstream_seconds": stages.get(UPSTREAM_CONNECT, 0.0) + stages.get(UPSTREAM_TTFB, 0.0),
+        "tts_characters": getattr(request.state, "tts_characters", 0) if status_code < 400 else 0,
+    }
+    user_id = getattr(request.state, "user_id", "")
+    if isinstance(response, StreamingResponse):
+        async def counted(body):
+            sent = 0
+            try:
+                async for chunk in body:
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                usage_meter.record(tenant_id, user_id, route, bytes_out=sent, **usage)
+        response.body_iterator = counted(response.body_iterator)
+        return
+    body = getattr(response, "body", None)
+    bytes_out = len(body) if body is not None else int(response.headers.get("content-length") or 0) if response is not None else 0
+    usage_meter.record(tenant_id, user_id, route, bytes_out=bytes_out, **usage)
 
 # 自定義路由類，用於自動追蹤每個請求的指標
 class TimedRoute(APIRoute):
     def get_route_handler(self):
         original_route_handler = super().get_route_handler()
+        # 以路由樣式 (而非實際 URL 路徑) 作為標籤，避免每個文章 ID 產生新的指標序列
+        route_path = self.path
+        is_tenant_api = route_path.startswith("/tenant-api/")
+        tracked = is_tenant_api or route_path.startswith("/tts") or route_path.startswith("/graphql") or route_path == "/batch"
 
         async def custom_route_handler(request: Request) -> Any:
             start_time = time.perf_counter()
             response = None
+            status_code = 500
+            error = None
+            trace = tracer.start(request.method, route_path)
             try:
                 response = await original_route_handler(request)
                 status_code = response.status_code
@@ -120,17 +415,31 @@ class TimedRoute(APIRoute):
                 raise
             except Exception as e:
                 status_code = 500 # For unexpected errors
+                error = e
                 raise
             finally:
                 end_time = time.perf_counter()
                 duration = end_time - start_time
                 method = request.method
-                path = request.url.path
-                
+                path = route_path
+                if is_tenant_api:
+                    # 代理的 Laravel 路由樣式，例如 /tenant-api/articles/{article}/publish
+                    path = "/tenant-api/" + tenant_routes.match(request.path_params.get("endpoint", ""))
+                if trace is not None:
+                    trace.route = path
+                    tracer.finish(trace, status_code, error)
+
                 # 僅追蹤相關路徑的指標
-                if path.startswith("/tenant-api/") or path.startswith("/tts") or path.startswith("/graphql"):
-                    increment_counter("fastapi_http_requests_total", {"method": method, "path": path, "status": str(status_code)})
-                    observe_histogram("fastapi_request_duration_seconds", duration, {"method": method, "path": path})
+                if tracked and usage_meter is not None:
+                    meter_usage(request, path, status_code, response, trace)
+                if tracked:
+                    if settings.METRICS_TENANT_LABEL:
+                        tenant = getattr(request.state, "tenant_id", "")
+                        HTTP_REQUESTS.labels(method, path, str(status_code), tenant).inc()
+                        HTTP_REQUEST_DURATION.labels(method, path, tenant).observe(duration)
+                    else:
+                        HTTP_REQUESTS.labels(method, path, str(status_code)).inc()
+                        HTTP_REQUEST_DURATION.labels(method, path).observe(duration)
             return response
 
         return custom_route_handler
@@ -159,6 +468,7 @@ class TenantRequest(BaseModel):
 class ExternalServiceRequest(BaseModel):
     text: str
     tenant_id: str
+    long_form: Optional[bool] = None # 依句子切分並串流合成；未指定時在文本超過單次合成上限時啟用
 
     model_config = {
         "json_schema_extra": {
@@ -172,9 +482,10 @@ class ExternalServiceRequest(BaseModel):
     }
 
 class GraphQLRequest(BaseModel):
-    query: str
+    query: Optional[str] = None # 使用持久化查詢時可只送出 extensions.persistedQuery.sha256Hash
     variables: Optional[Dict[str, Any]] = None
     operationName: Optional[str] = None
+    extensions: Optional[Dict[str, Any]] = None
 
     model_config = {
         "json_schema_extra": {
@@ -193,23 +504,200 @@ class TenantInitWebhookPayload(BaseModel):
     tenant_name: str
     domain: Optional[str] = None
     data: Optional[Dict[str, Any]] = {}
+    status: str = ACTIVE # "active" 或 "suspended"
+    backend_url: Optional[str] = None # 租戶專屬的 Laravel 基礎 URL
+    shard: Optional[str] = None # Laravel 後端池名稱 (TENANT_BACKEND_SHARDS)
+    tier: Optional[str] = None # 准入控制等級 (TENANT_TIER_LIMITS)
 
-async def get_current_user(token: str = Security(oauth2_scheme)):
+class ArticlePublishedWebhookPayload(BaseModel):
+    tenant_id: str
+    article_id: Optional[str] = None
+
+class ArticleEventWebhookPayload(BaseModel):
+    tenant_id: str
+    type: str = "article.state_changed" # 例如 article.state_changed、article.published
+    article_id: Optional[str] = None
+    data: Dict[str, Any] = {} # 例如 {"from": "review", "to": "published"}
+
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None # 未指定時使用在批次中的序號
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE"] = "GET"
+    endpoint: str # 相對於 /tenant-api/ 的路徑，可包含查詢參數，例如 "articles?page=2"
+    body: Optional[Any] = None
+    depends_on: List[str] = [] # 必須先成功完成的子請求 ID (只能指向批次中較前面的子請求)
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+    sequential: bool = False # 依順序逐一執行 (例如先建立再列出)
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "requests": [
+                    {"id": "create", "method": "POST", "endpoint": "articles", "body": {"title": {"zh_TW": "新文章"}, "status": "draft"}},
+                    {"id": "list", "endpoint": "articles?locale=zh_TW", "depends_on": ["create"]},
+                    {"id": "profile", "endpoint": "user"},
+                ]
+            }
+        }
+    }
+
+def authenticate(request: Request, token: str) -> Dict[str, Any]:
     """
     從 JWT Token 中提取用戶資訊和租戶 ID。
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with stage(AUTH):
+            payload = token_cache.verify(token) # 相同 Token 重複請求時不再重新驗證 HMAC 與解析 claims
         tenant_id = payload.get("tenant_id")
         user_id = payload.get("sub")
         if not tenant_id or not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="無效的身份驗證 Token：缺少租戶或用戶 ID。")
+        request.state.tenant_id = tenant_id # 供指標的租戶維度與用量計量使用
+        request.state.user_id = user_id
         return {"user_id": user_id, "tenant_id": tenant_id}
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="無效的身份驗證 Token。")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"JWT 解碼錯誤：{e}")
 
+async def get_current_user(request: Request, token: str = Security(oauth2_scheme)):
+    return authenticate(request, token)
+
+async def stream_user(request: Request, ticket: Optional[str] = None):
+    """
+    事件串流的身份驗證：Bearer Token，或瀏覽器 EventSource (無法設定標頭) 使用的 ticket 查詢參數。
+    JWT 不接受放在 URL 中，避免長期有效的 Token 出現在存取日誌與代理日誌。
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return authenticate(request, token)
+    if not ticket:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="缺少身份驗證 Token。", headers={"WWW-Authenticate": "Bearer"})
+    redeemed = stream_tickets.redeem(ticket)
+    if redeemed is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="無效、已過期或已使用的串流票證。")
+    request.state.tenant_id, request.state.user_id = redeemed
+    return {"user_id": redeemed[1], "tenant_id": redeemed[0]}
+
+
+def service_unavailable(e: UpstreamUnavailable) -> HTTPException:
+    """上游被隔離或過載時快速返回 503，並提示客戶端何時重試。"""
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"服務暫時無法使用：{e}", headers={"Retry-After": str(max(1, int(e.retry_after)))})
+
+
+async def registered_tenant(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """在閘道端拒絕已停用或 (TENANT_REGISTRY_ENFORCE 時) 未註冊的租戶，不需呼叫後端。"""
+    try:
+        return tenant_registry.check(current_user["tenant_id"])
+    except TenantUnavailable as e:
+        status_code = status.HTTP_404_NOT_FOUND if e.reason == "unknown" else status.HTTP_403_FORBIDDEN
+        raise HTTPException(status_code=status_code, detail=str(e))
+
+
+def loop_overloaded() -> bool:
+    """事件迴圈延遲或執行緒池佇列超過設定值時卸除新的 Laravel 請求 (排隊只會讓延遲更糟)。"""
+    return settings.LOOP_MONITOR_ENABLED and loop_monitor.shed_load()
+
+LOOP_OVERLOADED_DETAIL = "服務暫時無法使用：閘道過載"
+
+async def tenant_admission_slot(current_user: Dict[str, Any] = Depends(get_current_user)):
+    """在租戶的並行配額內處理請求；配額已滿時依加權公平佇列排隊。"""
+    if loop_overloaded():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=LOOP_OVERLOADED_DETAIL, headers={"Retry-After": "1"})
+    if not settings.TENANT_ADMISSION_ENABLED:
+        yield
+        return
+    tenant_id = current_user["tenant_id"]
+    try:
+        with stage(ADMISSION):
+            await tenant_admission.acquire(tenant_id)
+    except AdmissionRejected as e:
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS if e.reason == "queue_full" else status.HTTP_503_SERVICE_UNAVAILABLE
+        raise HTTPException(status_code=status_code, detail=f"請求過於頻繁 (租戶並行上限)：{e}", headers={"Retry-After": str(max(1, int(e.retry_after)))})
+    try:
+        yield
+    finally:
+        tenant_admission.release(tenant_id)
+
+
+async def send_to_laravel(tenant_id: str, send, timeout: float):
+    """
+    以 send(base_url, timeout) 呼叫租戶的 Laravel 後端：註冊表指定專屬後端的租戶直接使用該後端，
+    其餘由後端池負載平衡選擇 (每次重試重新選擇，避開剛失敗的後端)。
+    """
+    backend = tenant_registry.dedicated_backend(tenant_id)
+    if backend is not None:
+        return await send(backend, timeout)
+    return await laravel_backends.call(send, timeout, key=tenant_id)
+
+
+def client_address(request: Request) -> str:
+    """客戶端 IP；位於 ingress 之後時使用 X-Forwarded-For 的第一個位址，而不是代理的 IP。"""
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def charge_rate_limit(scope: str, current_user: Dict[str, Any], per_user: str, per_tenant: Optional[str] = None, cost: int = 1):
+    """為 JWT 中的租戶與用戶扣除 cost 次配額；超過限制時返回 429。"""
+    tenant_id, user_id = current_user["tenant_id"], current_user["user_id"]
+    try:
+        with stage(RATE_LIMIT):
+            await rate_limiter.hit(f"{scope}:user", f"{tenant_id}:{user_id}", per_user, cost)
+            if per_tenant:
+                await rate_limiter.hit(f"{scope}:tenant", tenant_id, per_tenant, cost)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=f"請求過於頻繁 (速率限制)：{e}", headers={"Retry-After": str(int(e.retry_after))})
+
+def rate_limit(scope: str, per_user: str, per_tenant: Optional[str] = None):
+    """依 JWT 中的租戶與用戶套用速率限制的依賴項。"""
+    async def dependency(current_user: Dict[str, Any] = Depends(get_current_user)):
+        await charge_rate_limit(scope, current_user, per_user, per_tenant)
+    return dependency
+
+def rate_limit_by_client(scope: str, rate: str):
+    """依客戶端 IP 套用速率限制的依賴項 (用於不需要 JWT 的端點)。"""
+    async def dependency(request: Request):
+        try:
+            with stage(RATE_LIMIT):
+                await rate_limiter.hit(f"{scope}:ip", client_address(request), rate)
+        except RateLimitExceeded as e:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=f"請求過於頻繁 (速率限制)：{e}", headers={"Retry-After": str(int(e.retry_after))})
+    return dependency
+
+
+def coalesces(endpoint: str) -> bool:
+    return settings.SINGLEFLIGHT_ENABLED and route_matches(endpoint, SINGLEFLIGHT_ROUTES)
+
+async def fetch_shared_get(tenant_id: str, target_path: str, headers: Dict[str, str], request_key, cache_ttl: Optional[float], if_none_match: Optional[str] = None):
+    """
+    以原始位元組讀取可快取或可合併的 GET 響應，返回 (響應, 快取狀態)；未使用快取時快取狀態為 None。
+    相同的並行請求共享同一個進行中的上游呼叫。
+    """
+    async def fetch_upstream(conditional_headers: Dict[str, str]):
+        async def call():
+            return await upstream_guards.get(LARAVEL_REST).call(
+                lambda timeout: send_to_laravel(
+                    tenant_id,
+                    lambda base_url, timeout: fetch_raw(upstreams.get(LARAVEL_REST), "GET", f"{base_url}{target_path}", {**headers, **conditional_headers}, timeout=timeout),
+                    timeout,
+                ),
+                key=tenant_id,
+                idempotent=True,
+                route=tenant_routes.match(target_path.removeprefix("/tenant-routes/").partition("?")[0]),
+            )
+        if not settings.SINGLEFLIGHT_ENABLED:
+            return await call()
+        # request_key 包含請求憑證的摘要：只合併同一用戶的相同請求
+        upstream_response, _ = await tenant_api_flight.do((request_key, tuple(sorted(conditional_headers.items()))), call)
+        return upstream_response
+
+    if cache_ttl is not None:
+        return await response_cache.fetch(request_key, cache_ttl, fetch_upstream, if_none_match)
+    return await fetch_upstream({}), None
+
 
 @app.api_route(
     "/tenant-api/{endpoint:path}", 
@@ -221,26 +709,29 @@ async def get_current_user(token: str = Security(oauth2_scheme)):
         200: {"description": "後端成功響應"},
         201: {"description": "資源成功創建"},
         204: {"description": "資源成功刪除，無內容"},
-        400: {"description": "缺失或無效的 X-Tenant-ID 標頭"},
+        400: {"description": "缺失或無效的 X-Tenant-ID 標頭，或無效的端點路徑"},
         401: {"description": "無效或缺失的 JWT Token"},
         403: {"description": "無權限執行操作"},
         404: {"description": "找不到資源或租戶"},
         429: {"description": "請求過於頻繁 (速率限制)"},
-        500: {"description": "後端或意外錯誤"}
-    }
+        500: {"description": "後端或意外錯誤"},
+        503: {"description": "上游暫時無法使用 (斷路器開啟或過載) 或租戶排隊逾時"}
+    },
+    dependencies=[
+        Depends(rate_limit("tenant_api", settings.RATE_LIMIT_TENANT_API, settings.RATE_LIMIT_TENANT_API_PER_TENANT)),
+        Depends(registered_tenant), # 未註冊或已停用的租戶
+        Depends(tenant_admission_slot), # 租戶並行上限與公平排隊
+    ],
 )
-@limiter.limit("100/minute") # 每分鐘 100 次請求的速率限制
 async def route_to_tenant_api(endpoint: str, request: Request, current_user: Dict[str, Any] = Depends(get_current_user)):
     tenant_id = current_user["tenant_id"]
-    
-    body = None
-    if request.method in ["POST", "PUT", "PATCH"]:
-        try:
-            body = await request.json()
-        except Exception: # 捕獲 JSON 解碼錯誤
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的 JSON 請求主體")
-
-    target_url = f"{LARAVEL_BACKEND_BASE_URL}/tenant-routes/{endpoint}"
+    try:
+        endpoint = checked_endpoint(endpoint) # 路徑參數已解碼，不能含有離開租戶路由的路徑段
+    except InvalidEndpoint as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    target_path = f"/tenant-routes/{endpoint}" # 後端由 send_to_laravel 依租戶選擇
+    if request.url.query:
+        target_path = f"{target_path}?{request.url.query}" # 保留查詢參數 (例如 articles/search?q=...)
     method = request.method
 
     # 轉發相關標頭
@@ -253,79 +744,357 @@ async def route_to_tenant_api(endpoint: str, request: Request, current_user: Dic
     headers["Accept"] = "application/json" # 確保 JSON 響應
     headers["Authorization"] = request.headers.get("Authorization") # 轉發授權標頭
 
+    cache_ttl = response_cache.ttl_for(endpoint) if method == "GET" and settings.RESPONSE_CACHE_ENABLED else None
+    if cache_ttl is not None or (method == "GET" and coalesces(endpoint)):
+        # 可快取或可合併的 GET：以原始位元組讀取完整響應，依租戶、路徑、查詢參數與 vary 標頭識別相同請求
+        headers.pop("if-none-match", None) # 條件請求由快取處理，合併的請求不能依個別客戶端而異
+        headers["Accept-Encoding"] = request.headers.get("accept-encoding", "identity")
+        request_key = response_cache.make_key(tenant_id, endpoint, request.query_params.multi_items(), request.headers)
+        try:
+            upstream_response, cache_state = await fetch_shared_get(tenant_id, target_path, headers, request_key, cache_ttl, request.headers.get("if-none-match"))
+        except UpstreamUnavailable as e:
+            raise service_unavailable(e)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"發生意外錯誤: {e}")
+        return upstream_response.to_response({"X-Cache": cache_state} if cache_state else None)
+
+    if settings.TENANT_API_STREAMING:
+        # 串流模式：請求與響應主體以原始位元組流轉發，不解析 JSON，保留上游狀態碼與 content-encoding
+        if "content-length" in request.headers:
+            headers["Content-Length"] = request.headers["content-length"]
+        headers["Accept-Encoding"] = request.headers.get("accept-encoding", "identity") # 只讓上游使用客戶端接受的編碼
+        body_stream = request_body_stream(request)
+        try:
+            upstream_response = await upstream_guards.get(LARAVEL_REST).call(
+                lambda timeout: send_to_laravel(
+                    tenant_id,
+                    lambda base_url, timeout: send_streaming(upstreams.get(LARAVEL_REST), method, f"{base_url}{target_path}", headers, body_stream, timeout),
+                    timeout,
+                ),
+                key=tenant_id,
+                idempotent=method in IDEMPOTENT_METHODS and body_stream is None, # 已串流的請求主體無法重送
+                route=tenant_routes.match(endpoint),
+            )
+        except UpstreamUnavailable as e:
+            raise service_unavailable(e)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"發生意外錯誤: {e}")
+        response = passthrough_response(upstream_response, method)
+        if method != "GET" and response.status_code < 400:
+            response_cache.invalidate(tenant_id) # 寫入操作後使租戶的讀取快取失效
+        return response
+
+    body = None
+    if request.method in ["POST", "PUT", "PATCH"]:
+        body = await request.body()
+        try:
+            jsoncodec.loads(body) # 只驗證是否為有效 JSON；轉發原始位元組，不重新編碼
+        except Exception: # 捕獲 JSON 解碼錯誤
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的 JSON 請求主體")
+        headers["Content-Type"] = "application/json"
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.request(method, target_url, json=body, headers=headers, timeout=30.0)
-            response.raise_for_status() # 對 4xx/5xx 響應引發異常
-            return JSONResponse(content=response.json(), status_code=response.status_code)
+        client = upstreams.get(LARAVEL_REST)
+        response = await upstream_guards.get(LARAVEL_REST).call(
+            lambda timeout: send_to_laravel(
+                tenant_id,
+                lambda base_url, timeout: client.request(method, f"{base_url}{target_path}", content=body, headers=headers, timeout=timeout),
+                timeout,
+            ),
+            key=tenant_id,
+            idempotent=method in IDEMPOTENT_METHODS,
+            route=tenant_routes.match(endpoint),
+        )
+        response.raise_for_status() # 對 4xx/5xx 響應引發異常
+        if method != "GET":
+            response_cache.invalidate(tenant_id) # 寫入操作後使租戶的讀取快取失效
+        if is_json_content_type(response.headers.get("content-type")):
+            return raw_json_response(response.content, response.status_code) # 上游已是 JSON，不解碼再編碼
+        return FastJSONResponse(content=jsoncodec.loads(response.content), status_code=response.status_code)
             
     except httpx.HTTPStatusError as e:
         # 處理來自後端的 HTTP 錯誤 (例如，403, 404, 500)
         raise HTTPException(status_code=e.response.status_code, detail=f"後端錯誤: {e.response.text}")
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
         # 處理其他潛在錯誤
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"發生意外錯誤: {e}")
 
 
+async def execute_sub_request(tenant_id: str, headers: Dict[str, str], item: BatchSubRequest) -> SubResponse:
+    """以與 /tenant-api 相同的快取、合併、准入控制與上游保護執行一個批次子請求 (端點已由 checked_endpoint 檢查)。"""
+    endpoint = item.endpoint
+    path, _, query = endpoint.partition("?")
+    target_path = f"/tenant-routes/{endpoint}"
+    method = item.method
+    admitted = False
+    try:
+        if loop_overloaded():
+            return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, LOOP_OVERLOADED_DETAIL, {"Retry-After": "1"})
+        if settings.TENANT_ADMISSION_ENABLED:
+            with stage(ADMISSION):
+                await tenant_admission.acquire(tenant_id)
+            admitted = True
+
+        cache_ttl = response_cache.ttl_for(path) if method == "GET" and settings.RESPONSE_CACHE_ENABLED else None
+        if cache_ttl is not None or (method == "GET" and coalesces(path)):
+            # 與直接的 /tenant-api 請求共享快取與進行中的上游呼叫 (子請求一律不壓縮)
+            request_key = response_cache.make_key(
+                tenant_id, path, parse_qsl(query, keep_blank_values=True), {"accept-language": headers.get("Accept-Language", ""), "authorization": headers.get("Authorization") or ""}
+            )
+            upstream_response, cache_state = await fetch_shared_get(tenant_id, target_path, {**headers, "Accept-Encoding": "identity"}, request_key, cache_ttl)
+            return SubResponse(upstream_response.status_code, json_body(upstream_response.body, upstream_response.header("content-type")), {"X-Cache": cache_state} if cache_state else {})
+
+        body = jsoncodec.dumps(item.body) if method in ("POST", "PUT", "PATCH") and item.body is not None else None
+        send_headers = {**headers, "Content-Type": "application/json"} if body is not None else headers
+        client = upstreams.get(LARAVEL_REST)
+        response = await upstream_guards.get(LARAVEL_REST).call(
+            lambda timeout: send_to_laravel(
+                tenant_id,
+                lambda base_url, timeout: client.request(method, f"{base_url}{target_path}", content=body, headers=send_headers, timeout=timeout),
+                timeout,
+            ),
+            key=tenant_id,
+            idempotent=method in IDEMPOTENT_METHODS,
+            route=tenant_routes.match(path),
+        )
+        if method != "GET" and response.status_code < 400:
+            response_cache.invalidate(tenant_id) # 寫入操作後使租戶的讀取快取失效 (後續依賴的子請求讀到最新資料)
+        return SubResponse(response.status_code, json_body(response.content, response.headers.get("content-type")))
+    except AdmissionRejected as e:
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS if e.reason == "queue_full" else status.HTTP_503_SERVICE_UNAVAILABLE
+        return error_response(status_code, f"請求過於頻繁 (租戶並行上限)：{e}", {"Retry-After": str(max(1, int(e.retry_after)))})
+    except UpstreamUnavailable as e:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, f"服務暫時無法使用：{e}", {"Retry-After": str(max(1, int(e.retry_after)))})
+    finally:
+        if admitted:
+            tenant_admission.release(tenant_id)
+
+
+@app.post(
+    "/batch",
+    summary="在一次閘道呼叫中執行多個租戶 API 子請求",
+    description=(
+        "以單次 JWT 驗證執行多個 /tenant-api 子請求，並行呼叫 Laravel 後端 (每個批次有並行上限)。"
+        "子請求可以 depends_on 宣告依賴，或以 sequential 依序執行。預設依批次順序返回所有結果；"
+        "Accept: application/x-ndjson 時每個子請求完成即串流一行結果。速率限制依子請求數計算。"
+    ),
+    responses={
+        200: {"description": "各子請求的結果 (個別狀態碼見每個結果的 status；依賴失敗的子請求為 424)"},
+        400: {"description": "批次為空、超過上限、ID 重複、依賴無效或端點無效"},
+        401: {"description": "無效或缺失的 JWT Token"},
+        429: {"description": "請求過於頻繁 (速率限制)"},
+    },
+    dependencies=[Depends(registered_tenant)], # 未註冊或已停用的租戶
+)
+async def tenant_api_batch(batch: BatchRequest, request: Request, current_user: Dict[str, Any] = Depends(get_current_user)):
+    count = len(batch.requests)
+    if count == 0 or count > settings.BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"批次必須包含 1 到 {settings.BATCH_MAX_REQUESTS} 個子請求")
+    ids = [item.id if item.id is not None else str(index) for index, item in enumerate(batch.requests)]
+    try:
+        dependencies = plan_batch(ids, [item.depends_on for item in batch.requests])
+        for item in batch.requests:
+            item.endpoint = checked_endpoint(item.endpoint)
+    except (BatchPlanError, InvalidEndpoint) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # 每個子請求各消耗一次 /tenant-api 配額，批次不能繞過速率限制
+    await charge_rate_limit("tenant_api", current_user, settings.RATE_LIMIT_TENANT_API, settings.RATE_LIMIT_TENANT_API_PER_TENANT, cost=count)
+
+    tenant_id = current_user["tenant_id"]
+    headers = {"X-Tenant-ID": tenant_id, "Accept": "application/json", "Authorization": request.headers.get("Authorization")}
+    if "accept-language" in request.headers:
+        headers["Accept-Language"] = request.headers["accept-language"]
+    results = run_batch(
+        dependencies,
+        lambda index: execute_sub_request(tenant_id, headers, batch.requests[index]),
+        max_concurrency=settings.BATCH_MAX_CONCURRENCY,
+        sequential=batch.sequential,
+    )
+
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        async def completed_lines():
+            async for index, result in results:
+                yield encode_result(index, ids[index], result) + b"\n"
+        return StreamingResponse(completed_lines(), media_type="application/x-ndjson")
+
+    ordered: List[bytes] = [b""] * count
+    async for index, result in results:
+        ordered[index] = encode_result(index, ids[index], result)
+    return raw_json_response(b'{"responses":[' + b",".join(ordered) + b"]}")
+
+
 @app.post(
     "/tts",
-    response_model=Dict[str, Any],
     summary="使用 Google Cloud TTS 將文本轉語音",
-    description="將文本發送到 Google Cloud Text-to-Speech API 並返回音訊內容。需要 GCP_TTS_API_KEY 和 tenant_id。",
+    description="將文本發送到 Google Cloud Text-to-Speech API 並返回音訊內容 (支援 Range)。相同文本與語音設定的結果會被快取。長文依句子切分後並行合成，並依序串流 MP3。需要 GCP_TTS_API_KEY 和 tenant_id。",
     responses={
         200: {
-            "description": "成功的 TTS 響應",
+            "description": "成功的 TTS 響應 (Accept: application/json 時返回 base64 JSON)",
             "content": {
+                "audio/mpeg": {},
                 "application/json": {
                     "example": {"audioContent": "base64_encoded_audio"}
                 }
             }
         },
+        206: {"description": "部分內容 (Range 請求)"},
+        401: {"description": "Authorization 標頭中的 JWT Token 無效 (不帶 Token 的請求以未驗證租戶計量)"},
+        429: {"description": "請求過於頻繁 (速率限制)"},
         500: {"description": "GCP TTS API 錯誤或配置問題"}
-    }
+    },
+    dependencies=[Depends(rate_limit_by_client("tts", settings.RATE_LIMIT_TTS))], # 語音轉換的速率限制
 )
-@limiter.limit("10/minute") # 語音轉換的速率限制
 async def text_to_speech(req: ExternalServiceRequest, request: Request): # 添加 request 參數以進行速率限制
-    gcp_tts_url = "https://texttospeech.googleapis.com/v1/text:synthesize"
-    gcp_api_key = settings.GCP_TTS_API_KEY
-
-    if not gcp_api_key:
+    if not settings.GCP_TTS_API_KEY:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="GCP_TTS_API_KEY 未配置。")
 
-    headers = {"Content-Type": "application/json"}
-    
-    payload = {
-        "input": {"text": req.text},
-        "voice": {"languageCode": "zh-TW", "name": "cmn-TW-Wavenet-A"}, # 範例語音
-        "audioConfig": {"audioEncoding": "MP3"}
-    }
-    
-    api_url_with_key = f"{gcp_tts_url}?key={gcp_api_key}"
+    # 用量只計入已驗證的身份：帶 Bearer Token 時使用 JWT 的租戶，否則計入固定的未驗證租戶，
+    # 不信任請求主體中的 tenant_id (任何呼叫者都能填寫)
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        authenticate(request, token)
+    else:
+        request.state.tenant_id = UNAUTHENTICATED_TENANT
+    request.state.tts_characters = len(req.text)
+    payload = _tts_payload(req.text)
+    key = synthesis_key(payload)
+    media_type = AUDIO_MEDIA_TYPES.get(payload["audioConfig"]["audioEncoding"], "application/octet-stream")
+    accept = request.headers.get("accept", "")
+    wants_json = "application/json" in accept and "audio/" not in accept # 舊版客戶端：base64 JSON
+    long_form = req.long_form if req.long_form is not None else len(req.text.encode("utf-8")) > settings.TTS_CHUNK_MAX_BYTES
+    if long_form and not req.text.strip():
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="長篇合成的文本不能為空白。")
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(api_url_with_key, json=payload, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        if long_form:
+            audio, cache_state = await tts_cache.get(key) if settings.TTS_CACHE_ENABLED else (None, MISS)
+            if audio is None:
+                chunks = chunk_text(req.text, settings.TTS_CHUNK_MAX_BYTES, settings.TTS_FIRST_CHUNK_MAX_BYTES)
+                parts = synthesize_in_order(chunks, _synthesize_chunk, settings.TTS_SYNTHESIS_CONCURRENCY)
+                first_part = await parts.__anext__() # 第一段失敗時仍可返回正確的錯誤狀態碼
+                if wants_json:
+                    data = first_part + b"".join([part async for part in parts])
+                    audio = CachedAudio(key, len(data), data=data)
+                    if settings.TTS_CACHE_ENABLED:
+                        await tts_cache.put(key, data) # 與串流路徑相同，之後的請求直接命中整篇音訊
+                else:
+                    return StreamingResponse(
+                        _stream_long_form(key, first_part, parts),
+                        media_type=media_type,
+                        headers={"X-Cache": MISS.upper(), "X-TTS-Chunks": str(len(chunks))},
+                    )
+        else:
+            audio, cache_state = await _synthesize(payload)
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=f"GCP TTS API 錯誤: {e.response.text}")
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"發生意外錯誤: {e}")
 
+    if wants_json:
+        data = await _audio_bytes(audio)
+        return FastJSONResponse({"audioContent": base64.b64encode(data).decode("ascii")}, headers={"X-Cache": cache_state.upper()})
+
+    extra_headers = {"X-Cache": cache_state.upper()}
+    if settings.TTS_CACHE_ENABLED:
+        extra_headers["Content-Location"] = f"/tts/audio/{key}" # 播放器可直接以 GET + Range 讀取
+    return audio_response(audio, request.headers.get("range"), media_type, extra_headers)
+
+def _tts_payload(text: str) -> Dict[str, Any]:
+    return {
+        "input": {"text": text},
+        "voice": {"languageCode": "zh-TW", "name": "cmn-TW-Wavenet-A"}, # 範例語音
+        "audioConfig": {"audioEncoding": "MP3"}
+    }
+
+async def _call_gcp_tts(payload: Dict[str, Any]) -> bytes:
+    api_url_with_key = f"{settings.GCP_TTS_URL}?key={settings.GCP_TTS_API_KEY}"
+    start_time = time.perf_counter()
+    tts_status = "500"
+    try:
+        client = upstreams.get(GCP_TTS)
+        response = await upstream_guards.get(GCP_TTS).call(
+            lambda timeout: client.post(api_url_with_key, json=payload, headers={"Content-Type": "application/json"}, timeout=timeout),
+            idempotent=True, # 合成相同內容不會產生副作用
+        )
+        tts_status = str(response.status_code)
+        response.raise_for_status()
+        return base64.b64decode(jsoncodec.loads(response.content)["audioContent"])
+    finally:
+        TTS_REQUESTS.labels(tts_status).inc()
+        TTS_DURATION.labels().observe(time.perf_counter() - start_time)
+
+async def _synthesize(payload: Dict[str, Any]):
+    """合成單一請求的音訊，返回 (音訊, 快取查詢結果)；相同內容的並行請求共享一次合成。"""
+    key = synthesis_key(payload)
+    if settings.TTS_CACHE_ENABLED:
+        return await tts_cache.get_or_synthesize(key, lambda: _call_gcp_tts(payload))
+    data = await _call_gcp_tts(payload)
+    return CachedAudio(key, len(data), data=data), MISS
+
+async def _synthesize_chunk(text: str) -> bytes:
+    audio, _ = await _synthesize(_tts_payload(text)) # 各片段也以內容位址快取，重複的段落不必重新合成
+    return await _audio_bytes(audio)
+
+async def _audio_bytes(audio: CachedAudio) -> bytes:
+    return audio.data if audio.data is not None else await asyncio.to_thread(_read_file, audio.path)
+
+async def _stream_long_form(key: str, first_part, parts):
+    """依序串流各片段的音訊；完整合成後將整篇音訊寫入快取，之後的請求可直接以 Range 讀取。"""
+    collected = [first_part]
+    yield first_part
+    async for part in parts:
+        collected.append(part)
+        yield part
+    if settings.TTS_CACHE_ENABLED:
+        await tts_cache.put(key, b"".join(collected))
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+@app.get(
+    "/tts/audio/{key}",
+    summary="讀取快取的 TTS 音訊",
+    description="以內容位址讀取先前合成的音訊，支援 Range 請求與串流。",
+    responses={
+        206: {"description": "部分內容 (Range 請求)"},
+        404: {"description": "音訊不在快取中"},
+    },
+)
+async def cached_audio(key: str, request: Request):
+    audio, cache_state = await tts_cache.get(key) if is_synthesis_key(key) else (None, MISS)
+    if audio is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="音訊不在快取中，請重新透過 /tts 合成。")
+    return audio_response(audio, request.headers.get("range"), AUDIO_MEDIA_TYPES["MP3"], {"X-Cache": cache_state.upper()})
+
 @app.post(
     "/graphql",
     response_model=Dict[str, Any],
     summary="GraphQL 代理",
-    description="將 GraphQL 請求轉發到 Laravel 後端 GraphQL 服務。需要有效的 JWT Token 和 X-Tenant-ID 標頭。",
+    description="將 GraphQL 請求轉發到 Laravel 後端 GraphQL 服務。支援陣列批次請求與自動持久化查詢 (APQ)，無效或過深的查詢在閘道即被拒絕。需要有效的 JWT Token 和 X-Tenant-ID 標頭。",
     responses={
         200: {"description": "GraphQL 請求成功"},
-        400: {"description": "無效的 GraphQL 請求"},
+        400: {"description": "無效的 GraphQL 請求 (語法錯誤、超過深度上限或持久化查詢雜湊不符)"},
         401: {"description": "無效或缺失的 JWT Token"},
-        500: {"description": "GraphQL 後端服務錯誤"}
-    }
+        429: {"description": "請求過於頻繁 (速率限制)"},
+        500: {"description": "GraphQL 後端服務錯誤"},
+        503: {"description": "上游暫時無法使用 (斷路器開啟或過載) 或租戶排隊逾時"}
+    },
+    dependencies=[
+        Depends(rate_limit("graphql", settings.RATE_LIMIT_GRAPHQL, settings.RATE_LIMIT_GRAPHQL_PER_TENANT)), # GraphQL 查詢的速率限制
+        Depends(registered_tenant), # 未註冊或已停用的租戶
+        Depends(tenant_admission_slot), # 租戶並行上限與公平排隊
+    ],
 )
-@limiter.limit("50/minute") # GraphQL 查詢的速率限制
-async def graphql_proxy(graphql_request: GraphQLRequest, request: Request, current_user: Dict[str, Any] = Depends(get_current_user)):
+async def graphql_proxy(
+    request: Request,
+    graphql_request: Union[GraphQLRequest, List[GraphQLRequest]] = Body(...), # 陣列為批次請求
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
     tenant_id = current_user["tenant_id"]
     
     headers = {
@@ -337,16 +1106,141 @@ async def graphql_proxy(graphql_request: GraphQLRequest, request: Request, curre
     headers["Authorization"] = request.headers.get("Authorization") # 轉發授權標頭
     headers["Content-Type"] = "application/json" # 確保內容類型
 
+    if isinstance(graphql_request, list):
+        return await _graphql_array_batch(graphql_request, headers)
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(LARAVEL_GRAPHQL_URL, json=graphql_request.model_dump(by_alias=True, exclude_unset=True), headers=headers, timeout=60.0) # GraphQL 請求可能較長
-            response.raise_for_status()
-            return JSONResponse(content=response.json(), status_code=response.status_code)
+        body, document = _prepare_graphql_operation(graphql_request)
+    except PersistedQueryNotFound as e:
+        return FastJSONResponse(content=_persisted_query_not_found(e))
+    except GraphQLDocumentError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"無效的 GraphQL 請求: {e}")
+
+    idempotent = document.operation_type == "query" # 只有查詢可以安全重試
+
+    async def call():
+        if graphql_batcher is not None:
+            # 授權標頭相同的操作才會被合併，批次以該用戶的身份轉發
+            return await graphql_batcher.submit((tenant_id, headers["Authorization"]), (headers, body, idempotent))
+        return await _post_graphql(headers, body, idempotent, raw=True)
+
+    try:
+        if settings.SINGLEFLIGHT_ENABLED and idempotent:
+            # 相同租戶、相同憑證的相同查詢 (不含 mutation) 共享同一個進行中的上游呼叫；
+            # 結果可能依用戶而異 (例如 me { ... })，因此不同用戶的請求不合併
+            result, _ = await graphql_flight.do((tenant_id, credentials_digest(headers["Authorization"] or ""), body_digest(body)), call)
+        else:
+            result = await call()
+        if isinstance(result, bytes):
+            return raw_json_response(result) # 單一操作的後端響應不需在閘道解析
+        return FastJSONResponse(content=result)
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=f"GraphQL 後端錯誤: {e.response.text}")
+    except UpstreamUnavailable as e:
+        raise service_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"GraphQL 代理發生意外錯誤: {e}")
 
+def _prepare_graphql_operation(graphql_request: GraphQLRequest):
+    """展開持久化查詢並檢查查詢文件，返回 (轉發給後端的主體, 文件資訊)。"""
+    query = graphql_request.query
+    sha256_hash = persisted_query_hash(graphql_request.extensions) if settings.GRAPHQL_PERSISTED_QUERIES_ENABLED else None
+    if sha256_hash is not None:
+        query = persisted_queries.resolve(sha256_hash, query)
+    elif query is None:
+        raise GraphQLDocumentError("缺少 query")
+    document = graphql_documents.check(query, graphql_request.operationName)
+
+    # 轉發移除註解與多餘空白的查詢；extensions (persistedQuery) 只在閘道使用
+    body = {"query": document.minified}
+    if graphql_request.variables is not None:
+        body["variables"] = graphql_request.variables
+    if graphql_request.operationName is not None:
+        body["operationName"] = graphql_request.operationName
+    return body, document
+
+def _persisted_query_not_found(e: PersistedQueryNotFound) -> Dict[str, Any]:
+    # Apollo 客戶端依此錯誤碼連同完整查詢重送
+    return {"errors": [{"message": str(e), "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"}}]}
+
+def graphql_url(base_url: str) -> str:
+    """後端上的 GraphQL 端點；只有單一後端時沿用 LARAVEL_GRAPHQL_URL。"""
+    return LARAVEL_GRAPHQL_URL if base_url == tenant_registry.default_backend else f"{base_url}{LARAVEL_GRAPHQL_PATH}"
+
+async def _post_graphql(headers: Dict[str, str], payload: Any, idempotent: bool = False, raw: bool = False) -> Any:
+    """送出 GraphQL 請求；raw 時返回後端的原始 JSON 位元組，否則返回解析後的結果。"""
+    content = jsoncodec.dumps(payload)
+    response = await upstream_guards.get(LARAVEL_GRAPHQL).call(
+        lambda timeout: send_to_laravel(
+            headers["X-Tenant-ID"],
+            lambda base_url, timeout: upstreams.get(LARAVEL_GRAPHQL).post(graphql_url(base_url), content=content, headers=headers, timeout=timeout),
+            timeout,
+        ),
+        key=headers["X-Tenant-ID"],
+        idempotent=idempotent,
+        route=GRAPHQL_ROUTE,
+    )
+    response.raise_for_status()
+    return response.content if raw else jsoncodec.loads(response.content)
+
+async def _post_graphql_batch(headers: Dict[str, str], bodies: List[Dict[str, Any]], idempotent: bool = False) -> List[Any]:
+    """以一次上游呼叫送出多個操作 (陣列批次)，返回與輸入順序相同的結果。"""
+    results = await _post_graphql(headers, bodies, idempotent)
+    if not isinstance(results, list) or len(results) != len(bodies):
+        raise ValueError("GraphQL 後端未返回與批次等長的結果陣列")
+    return results
+
+async def _send_graphql_microbatch(items: List[Any]) -> List[Any]:
+    headers = items[0][0] # 同一批次的操作具有相同的租戶與授權標頭
+    bodies = [body for _, body, _ in items]
+    idempotent = all(item_idempotent for _, _, item_idempotent in items)
+    if len(bodies) == 1:
+        return [await _post_graphql(headers, bodies[0], idempotent)]
+    return await _post_graphql_batch(headers, bodies, idempotent)
+
+async def _graphql_array_batch(operations: List[GraphQLRequest], headers: Dict[str, str]) -> FastJSONResponse:
+    """處理陣列批次請求：無效的操作在閘道就返回錯誤，其餘操作以一次上游呼叫轉發後依序分發結果。"""
+    if not operations or len(operations) > settings.GRAPHQL_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"無效的 GraphQL 請求: 批次大小必須介於 1 到 {settings.GRAPHQL_BATCH_MAX_SIZE}")
+
+    results: List[Any] = [None] * len(operations)
+    bodies, positions, idempotent = [], [], True
+    for index, operation in enumerate(operations):
+        try:
+            body, document = _prepare_graphql_operation(operation)
+        except PersistedQueryNotFound as e:
+            results[index] = _persisted_query_not_found(e)
+        except GraphQLDocumentError as e:
+            results[index] = {"errors": [{"message": f"無效的 GraphQL 請求: {e}"}]}
+        else:
+            bodies.append(body)
+            positions.append(index)
+            idempotent = idempotent and document.operation_type == "query"
+
+    if bodies:
+        try:
+            for index, result in zip(positions, await _post_graphql_batch(headers, bodies, idempotent)):
+                results[index] = result
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=e.response.status_code, detail=f"GraphQL 後端錯誤: {e.response.text}")
+        except UpstreamUnavailable as e:
+            raise service_unavailable(e)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"GraphQL 代理發生意外錯誤: {e}")
+    return FastJSONResponse(content=results)
+
+async def verified_webhook(request: Request):
+    """
+    要求 Laravel 以共享金鑰簽章 (HMAC-SHA256，含時間戳防止重放)。未設定 WEBHOOK_SECRET 時拒絕所有 Webhook，
+    除非明確以 WEBHOOK_ALLOW_UNSIGNED 允許未簽章的請求 (僅供本地開發)。
+    """
+    if not settings.WEBHOOK_SECRET:
+        if settings.WEBHOOK_ALLOW_UNSIGNED:
+            return
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Webhook 簽章金鑰 (WEBHOOK_SECRET) 未設定")
+    if not verify_signature(settings.WEBHOOK_SECRET, await request.body(), request.headers.get(SIGNATURE_HEADER), settings.WEBHOOK_SIGNATURE_TOLERANCE):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="無效的 Webhook 簽章")
+
 @app.post(
     "/webhook/tenant-init",
     summary="租戶初始化 Webhook",
@@ -354,95 +1248,164 @@ async def graphql_proxy(graphql_request: GraphQLRequest, request: Request, curre
     status_code=status.HTTP_200_OK,
     responses={
         200: {"description": "租戶初始化成功"},
-        400: {"description": "無效的 Webhook 請求"},
+        400: {"description": "無效的 Webhook 請求 (例如未知的後端池或不在允許清單中的後端)"},
+        401: {"description": "無效的 Webhook 簽章"},
         500: {"description": "內部伺服器錯誤"}
-    }
+    },
+    dependencies=[Depends(verified_webhook)],
 )
-async def tenant_init_webhook(payload: TenantInitWebhookPayload):
-    # 這裡可以添加驗證 Webhook 簽名以提高安全性
-    # 例如，使用共享秘密來驗證請求是否來自可信來源
-
+async def tenant_init_webhook(payload: TenantInitWebhookPayload, background_tasks: BackgroundTasks):
+    # 註冊表決定租戶流量 (連同 Authorization 標頭) 轉送到哪個後端，因此只接受 Laravel 簽章的請求
     try:
-        # 在這裡執行 FastAPI 端的租戶初始化邏輯
-        # 例如：
-        # - 為新租戶配置特定的路由規則 (如果需要)
-        # - 在某些外部服務中註冊租戶
-        # - 清理或刷新緩存等
-
-        print(f"收到來自 Laravel 的租戶初始化請求：租戶 ID: {payload.tenant_id}, 名稱: {payload.tenant_name}")
-        # Log.info(f"FastAPI 收到租戶初始化 Webhook，租戶 ID: {payload.tenant_id}") # 如果您有更複雜的日誌記錄
-
-        # 模擬一些工作
-        await asyncio.sleep(1) 
+        # 註冊表在記憶體中立即更新，之後的請求馬上依新的狀態與後端路由
+        record = tenant_registry.upsert(TenantRecord(
+            tenant_id=payload.tenant_id,
+            name=payload.tenant_name,
+            status=payload.status,
+            domain=payload.domain,
+            backend_url=payload.backend_url,
+            shard=payload.shard,
+            tier=payload.tier,
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"無效的 Webhook 請求: {e}")
 
+    try:
+        tenant_admission.set_tenant_tier(record.tenant_id, record.tier)
+        response_cache.invalidate(payload.tenant_id) # 清除此租戶可能殘留的快取
+        # 快照寫入磁碟在響應送出後於背景執行緒進行，不延遲 Laravel 的建立租戶流程
+        background_tasks.add_task(tenant_registry.save_snapshot)
         return {"message": f"租戶 {payload.tenant_id} 在 FastAPI 端已成功初始化"}
     except Exception as e:
         # Log.error(f"FastAPI 處理租戶初始化 Webhook 失敗：{e}") # 如果您有更複雜的日誌記錄
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"處理租戶初始化失敗: {e}")
 
+@app.post(
+    "/webhook/article-published",
+    summary="文章發布 Webhook",
+    description="由 Laravel 在文章發布時調用，使閘道中該租戶的文章響應快取失效。",
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {"description": "快取已失效"},
+        400: {"description": "無效的 Webhook 請求"},
+        401: {"description": "無效的 Webhook 簽章"},
+    },
+    dependencies=[Depends(verified_webhook)],
+)
+async def article_published_webhook(payload: ArticlePublishedWebhookPayload):
+    # 文章列表、搜尋與報表都可能受影響，因此使整個租戶的快取失效
+    invalidated = response_cache.invalidate(payload.tenant_id)
+    return {"message": f"租戶 {payload.tenant_id} 的響應快取已失效", "invalidated": invalidated}
+
+@app.post(
+    "/webhook/article-events",
+    summary="文章事件 Webhook",
+    description="由 Laravel 在文章狀態變更 (草稿/審核/發布) 時調用；使租戶的響應快取失效，並推送給訂閱 /events/stream 的客戶端。",
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {"description": "事件已發布"},
+        401: {"description": "無效的 Webhook 簽章"},
+    },
+    dependencies=[Depends(verified_webhook)],
+)
+async def article_event_webhook(payload: ArticleEventWebhookPayload):
+    invalidated = response_cache.invalidate(payload.tenant_id)
+    event = event_hub.create_event(payload.tenant_id, payload.type, {"article_id": payload.article_id, **payload.data})
+    if event_relay is not None:
+        try:
+            await event_relay.publish(event) # 所有副本 (包括本進程) 從 Redis 收到後各自扇出
+            return {"message": "事件已發布", "id": event.id, "invalidated": invalidated}
+        except Exception:
+            pass # Redis 無法使用時至少送給本進程的連線
+    delivered = event_hub.deliver(event)
+    return {"message": "事件已發布", "id": event.id, "invalidated": invalidated, "delivered": delivered}
+
+@app.post(
+    "/events/ticket",
+    summary="取得事件串流票證",
+    description="以 Bearer Token 換取短效、一次性的票證，供無法設定標頭的 EventSource 以 ?ticket= 開啟 /events/stream。",
+    responses={401: {"description": "無效或缺失的 JWT Token"}},
+)
+async def event_stream_ticket(current_user: Dict[str, Any] = Depends(get_current_user)):
+    ticket = stream_tickets.issue(current_user["tenant_id"], current_user["user_id"])
+    return {"ticket": ticket, "expires_in": stream_tickets.ttl}
+
+@app.get(
+    "/events/stream",
+    summary="文章事件串流 (SSE)",
+    description=(
+        "以 Server-Sent Events 推送租戶的文章事件，取代輪詢文章列表與歷史。可用 types 篩選事件類型 (逗號分隔)；"
+        "重新連線時依 Last-Event-ID 標頭 (或 last_event_id 參數) 補齊錯過的事件。瀏覽器以 /events/ticket 取得的 ticket 參數驗證身份。"
+    ),
+    responses={
+        200: {"description": "text/event-stream 事件流", "content": {"text/event-stream": {}}},
+        401: {"description": "無效或缺失的 JWT Token"},
+        503: {"description": "本副本的連線數已達上限"},
+    },
+)
+async def event_stream(request: Request, types: Optional[str] = None, last_event_id: Optional[str] = None, current_user: Dict[str, Any] = Depends(stream_user)):
+    tenant_id = current_user["tenant_id"]
+    try:
+        tenant_registry.check(tenant_id)
+    except TenantUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND if e.reason == "unknown" else status.HTTP_403_FORBIDDEN, detail=str(e))
+    event_types = frozenset(name.strip() for name in types.split(",") if name.strip()) if types else None
+    try:
+        subscription = event_hub.subscribe(tenant_id, event_types or None, request.headers.get("last-event-id") or last_event_id)
+    except SubscriberLimitReached as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"服務暫時無法使用：{e}", headers={"Retry-After": "5"})
+
+    async def frames():
+        try:
+            yield b"retry: %d\n\n" % settings.EVENTS_RETRY_MS
+            while True:
+                events = await subscription.next_batch(settings.EVENTS_HEARTBEAT_SECONDS)
+                if events:
+                    yield b"".join(event.frame for event in events)
+                elif not subscription.closed:
+                    yield b": keepalive\n\n" # 保持閒置連線不被代理逾時中斷
+                if subscription.closed:
+                    break
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    # no-transform：不壓縮閒置的長連線 (避免每個連線保留壓縮器狀態)；關閉代理緩衝 (nginx)，事件立即送出
+    return StreamingResponse(frames(), media_type="text/event-stream", headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
 @app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus 指標", description="提供 Prometheus 格式的應用程式指標。")
-def get_metrics(request: Request): # 添加 request 參數以進行速率限制
+async def get_metrics(request: Request): # 添加 request 參數以進行速率限制
     """
     FastAPI 的 Prometheus 指標端點。
     """
-    metrics_output = ""
-
-    # 計數器
-    for key, value in request_count.items():
-        # 嘗試解析標籤，處理可能不包含標籤的情況
-        parts = key.split("_", 1)
-        metric_name = parts[0]
-        labels_str_raw = parts[1] if len(parts) > 1 else ""
-
-        labels_dict = {}
-        # 簡易解析 key-value 標籤對
-        if labels_str_raw:
-            # 假設標籤字符串格式為 "label1_value1_label2_value2"
-            label_pairs = labels_str_raw.split('_')
-            for i in range(0, len(label_pairs), 2):
-                if i + 1 < len(label_pairs):
-                    labels_dict[label_pairs[i]] = label_pairs[i+1]
-        
-        labels_formatted = ",".join(f'{k}="{v}"' for k,v in labels_dict.items())
-        
-        metrics_output += f"# HELP {metric_name} 請求總數。\n"
-        metrics_output += f"# TYPE {metric_name} counter\n"
-        metrics_output += f"{metric_name}{{{labels_formatted}}} {value}\n"
-    
-    # 直方圖 (此演示簡化為總和和計數)
-    for key, value in request_duration_sum.items():
-        parts = key.split("_", 1)
-        metric_name = parts[0]
-        labels_str_raw = parts[1] if len(parts) > 1 else ""
-
-        labels_dict = {}
-        if labels_str_raw:
-            label_pairs = labels_str_raw.split('_')
-            for i in range(0, len(label_pairs), 2):
-                if i + 1 < len(label_pairs):
-                    labels_dict[label_pairs[i]] = label_pairs[i+1]
-        
-        labels_formatted = ",".join(f'{k}="{v}"' for k,v in labels_dict.items())
-        
-        metrics_output += f"# HELP {metric_name}_sum 請求的總持續時間。\n"
-        metrics_output += f"# TYPE {metric_name}_sum gauge\n" # 為簡化使用 gauge，應為 histogram
-        metrics_output += f"{metric_name}_sum{{{labels_formatted}}} {value}\n"
-        metrics_output += f"# HELP {metric_name}_count 請求持續時間的總計數。\n"
-        metrics_output += f"# TYPE {metric_name}_count gauge\n" # 為簡化使用 gauge
-        metrics_output += f"{metric_name}_count{{{labels_formatted}}} {request_duration_count[key]}\n"
-
-
-    metrics_output += "# HELP fastapi_info 關於 FastAPI 應用程式的資訊。\n"
-    metrics_output += "# TYPE fastapi_info gauge\n"
-    metrics_output += f'fastapi_info{{version="{app.version}"}} 1\n'
-
-    return PlainTextResponse(content=metrics_output)
+    return PlainTextResponse(content=await metrics.expose_async())
+
+
+@app.get("/debug/traces", summary="最近的請求追蹤", description="列出本 worker 保留的最近請求追蹤與各階段時間 (需啟用 TRACING_DEBUG_ENDPOINT)。")
+async def debug_traces(limit: int = 50, min_duration_ms: float = 0.0, route: Optional[str] = None):
+    if not settings.TRACING_DEBUG_ENDPOINT:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    traces = tracer.recent(max(1, min(limit, 500)), min_duration_ms / 1000, route)
+    return {"stats": tracer.stats(), "traces": [trace.to_dict() for trace in traces]}
+
+
+@app.get("/debug/loop", summary="事件迴圈監測", description="列出本 worker 的事件迴圈延遲、執行緒池使用量與最近阻塞事件迴圈的呼叫堆疊 (需啟用 TRACING_DEBUG_ENDPOINT)。")
+async def debug_loop(limit: int = 20):
+    if not settings.TRACING_DEBUG_ENDPOINT:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return {"stats": loop_monitor.stats(), "blocking": [report.to_dict() for report in loop_monitor.recent(max(1, min(limit, 50)))]}
 
 
 @app.get("/", summary="健康檢查", description="API 閘道的健康檢查端點。")
-def health_check():
+async def health_check(): # 非同步：健康檢查不佔用執行緒池 (執行緒池飽和時仍能回應)
     """
     API 閘道的健康檢查端點。
     """
     return {"status": "ok", "message": "OrbitPress API 閘道正在運行。"}
 
+
+def before_fork() -> None:
+    """由預載的多 worker 伺服器 (gateway.prefork) 在 fork 前呼叫：先載入 worker 啟動時共用的資源。"""
+    upstreams.prepare()
+
+
+STARTUP_SECONDS["import"] = time.perf_counter() - IMPORT_STARTED
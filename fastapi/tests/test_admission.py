@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from gateway.admission import AdmissionController, AdmissionRejected, TenantTier, parse_tenant_tiers, parse_tiers
+
+
+def test_parse_tier_settings():
+    """測試等級與租戶等級設定的解析。"""
+    tiers = parse_tiers("free=5:1, premium=50:4")
+    assert tiers["free"] == TenantTier("free", 5, 1.0)
+    assert tiers["premium"].weight == 4.0
+    assert parse_tenant_tiers("cw=premium, acme=free") == {"cw": "premium", "acme": "free"}
+
+
+def test_per_tenant_cap_does_not_block_other_tenants():
+    """測試單一租戶達到並行上限後排隊，其他租戶仍可立即取得空位。"""
+    async def scenario():
+        controller = AdmissionController(max_in_flight=10, tiers={"standard": TenantTier("standard", 2, 1.0)})
+        await controller.acquire("big")
+        await controller.acquire("big")
+        waiting = asyncio.ensure_future(controller.acquire("big"))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(controller.acquire("small"), timeout=0.1)
+        assert not waiting.done() and controller.queue_depth() == 1
+
+        controller.release("big")
+        await asyncio.wait_for(waiting, timeout=0.1)
+        return controller.in_flight
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_weighted_fair_queuing_across_tenants():
+    """測試全域容量已滿時，釋放的空位依權重分配 (權重 3:1 的租戶約得到 3:1 的份額)，而非先到先得。"""
+    tiers = {"free": TenantTier("free", 100, 1.0), "premium": TenantTier("premium", 100, 3.0)}
+
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, tiers=tiers, tenant_tiers={"noisy": "free", "vip": "premium"}, default_tier="free", max_queue=100)
+        await controller.acquire("noisy")
+        order = []
+
+        async def request(tenant_id):
+            await controller.acquire(tenant_id)
+            order.append(tenant_id)
+            await asyncio.sleep(0)
+            controller.release(tenant_id)
+
+        # 吵鬧的租戶先排入大量請求
+        tasks = [asyncio.ensure_future(request("noisy")) for _ in range(12)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.ensure_future(request("vip")) for _ in range(12)]
+        await asyncio.sleep(0)
+        controller.release("noisy")
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order[:16].count("vip") == 12
+    assert order[:16].count("noisy") == 4
+
+
+def test_queue_limits_reject_instead_of_waiting_forever():
+    """測試租戶佇列已滿時立即拒絕，排隊超過上限時間時逾時拒絕，且不洩漏空位。"""
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue_wait=0.01, max_queue=1)
+        await controller.acquire("t1")
+        waiter = asyncio.ensure_future(controller.acquire("t1"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire("t1")
+        with pytest.raises(AdmissionRejected) as timeout:
+            await waiter
+        controller.release("t1")
+        await controller.acquire("t2")
+        return controller, full.value.reason, timeout.value.reason
+
+    controller, full_reason, timeout_reason = asyncio.run(scenario())
+    assert (full_reason, timeout_reason) == ("queue_full", "queue_timeout")
+    assert controller.in_flight == 1 and controller.queue_depth() == 0
+    assert controller.rejected == {"queue_full": 1, "queue_timeout": 1}
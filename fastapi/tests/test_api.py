@@ -124,10 +124,18 @@ async def test_graphql_proxy_success(respx_mock):
     assert response.json()["data"]["articles"][0]["title"] == "GraphQL Article"
 
 @pytest.mark.asyncio
-async def test_tenant_init_webhook_success():
-    """測試租戶初始化 webhook 端點成功。"""
+async def test_tenant_init_webhook_success(monkeypatch):
+    """測試租戶初始化 webhook 端點成功 (以共享金鑰簽章)。"""
+    import json
+    import time
+    from config.config import settings
+    from gateway.events import SIGNATURE_HEADER, sign_payload
+
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "test_webhook_secret")
     payload = {"tenant_id": "newtenant", "tenant_name": "New Company", "domain": "newcompany.localhost"}
-    response = client.post("/webhook/tenant-init", json=payload)
+    body = json.dumps(payload).encode("utf-8")
+    headers = {SIGNATURE_HEADER: sign_payload("test_webhook_secret", body, int(time.time())), "Content-Type": "application/json"}
+    response = client.post("/webhook/tenant-init", content=body, headers=headers)
     assert response.status_code == 200
     assert response.json() == {"message": "租戶 newtenant 在 FastAPI 端已成功初始化"}
 
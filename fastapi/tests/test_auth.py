@@ -0,0 +1,61 @@
+import time
+
+import pytest
+from jose import JWTError, jwt
+
+from gateway.auth import VerifiedTokenCache, DEFAULT_KID
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def test_warm_verification_hits_cache_until_exp():
+    """測試相同 Token 的重複驗證命中快取，並在 exp 到期後不再使用快取條目。"""
+    clock = FakeClock()
+    cache = VerifiedTokenCache({DEFAULT_KID: "secret"}, clock=clock)
+    token = jwt.encode({"sub": "u1", "tenant_id": "t1", "exp": int(clock.now) + 60}, "secret", algorithm="HS256")
+
+    assert cache.verify(token)["tenant_id"] == "t1"
+    assert cache.verify(token)["sub"] == "u1"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # 快取條目在 exp 到期後不再使用，必須重新驗證
+    clock.now += 61
+    cache.verify(token)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_multiple_keys_and_rotation_drop_retired_entries():
+    """測試多個有效金鑰 (含 kid)，以及金鑰輪替後丟棄以舊金鑰驗證的條目。"""
+    cache = VerifiedTokenCache({DEFAULT_KID: "old-secret", "k2": "new-secret"})
+    legacy = jwt.encode({"sub": "u1", "tenant_id": "t1"}, "old-secret", algorithm="HS256")
+    rotated = jwt.encode({"sub": "u2", "tenant_id": "t1"}, "new-secret", algorithm="HS256", headers={"kid": "k2"})
+
+    assert cache.verify(legacy)["sub"] == "u1"
+    assert cache.verify(rotated)["sub"] == "u2"
+    assert len(cache) == 2
+
+    cache.set_keys({"k2": "new-secret"})
+    assert len(cache) == 1
+    assert cache.verify(rotated)["sub"] == "u2"
+    with pytest.raises(JWTError):
+        cache.verify(legacy)
+
+
+def test_invalid_tokens_are_not_cached_and_lru_is_bounded():
+    """測試無效 Token 不會被快取，且快取大小有上限。"""
+    cache = VerifiedTokenCache({DEFAULT_KID: "secret"}, max_entries=2)
+    with pytest.raises(JWTError):
+        cache.verify(jwt.encode({"sub": "u1"}, "wrong-secret", algorithm="HS256"))
+    with pytest.raises(JWTError):
+        cache.verify(jwt.encode({"sub": "u1"}, "secret", algorithm="HS256", headers={"kid": "unknown"}))
+    assert len(cache) == 0
+
+    for user in range(5):
+        cache.verify(jwt.encode({"sub": f"u{user}"}, "secret", algorithm="HS256"))
+    assert len(cache) == 2
@@ -0,0 +1,146 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from gateway.balancer import LEAST_OUTSTANDING, BackendPool
+from gateway.streaming import send_streaming
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+async def start_stand_in_server(status_code: int):
+    """最小的本地 HTTP 伺服器，代替 Laravel 後端；返回 (server, base_url, 已處理的請求數)。"""
+    handled = []
+
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        handled.append(1)
+        body = b'{"ok":true}'
+        writer.write(b"HTTP/1.1 %d X\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (status_code, len(body), body))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}", handled
+
+
+def test_least_outstanding_and_p2c_prefer_less_loaded_backends():
+    """測試兩種策略都避開進行中請求較多的後端。"""
+    least = BackendPool(["http://a", "http://b", "http://c"], strategy=LEAST_OUTSTANDING)
+    least.backends[0].outstanding = 5
+    least.backends[1].outstanding = 1
+    least.backends[2].outstanding = 3
+    assert least.choose().url == "http://b"
+
+    p2c = BackendPool(["http://a", "http://b"], rng=random.Random(1))
+    p2c.backends[0].outstanding = 10
+    assert all(p2c.choose().url == "http://b" for _ in range(20))
+
+
+def test_streamed_responses_count_as_outstanding_until_body_is_closed():
+    """測試串流響應在主體轉發完之前仍計入後端負載，下一個請求因此選擇另一個後端。"""
+    async def body():
+        yield b"{}"
+
+    async def scenario():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        async with httpx.AsyncClient(transport=transport) as upstream:
+            pool = BackendPool(["http://a", "http://b"], strategy=LEAST_OUTSTANDING)
+            send = lambda base_url, timeout: send_streaming(upstream, "GET", f"{base_url}/articles", {}, None, timeout)
+            first = await pool.call(send, 5.0)
+            second = await pool.call(send, 5.0)
+            outstanding = [backend.outstanding for backend in pool.backends]
+            hosts = {first.request.url.host, second.request.url.host}
+            await first.aread()
+            await second.aclose()
+            return outstanding, hosts, [backend.outstanding for backend in pool.backends]
+
+    outstanding, hosts, released = asyncio.run(scenario())
+    assert outstanding == [1, 1]
+    assert hosts == {"a", "b"}
+    assert released == [0, 0]
+
+
+def test_passive_ejection_backoff_and_slow_start_readmission():
+    """測試連續失敗的後端被剔除，剔除時間加倍，恢復後以慢啟動權重逐步接收流量。"""
+    clock = FakeClock()
+    pool = BackendPool(["http://a", "http://b"], strategy=LEAST_OUTSTANDING, failure_threshold=2, base_ejection_time=10.0, slow_start=10.0, clock=clock)
+    a, b = pool.backends
+    pool.record_failure(a)
+    pool.record_failure(a)
+    assert not a.available()
+    assert all(pool.choose() is b for _ in range(5))
+
+    clock.now += 10
+    assert a.available() and a.weight(pool.slow_start) == pytest.approx(0.1)
+    b.outstanding = 2
+    assert pool.choose() is b # 剛恢復的後端權重低，負載較高的 b 仍優先
+    clock.now += 10
+    assert a.weight(pool.slow_start) == 1.0 and pool.choose() is a
+
+    pool.record_failure(a)
+    pool.record_failure(a)
+    assert a.ejected_until == clock.now + 20 # 第二次剔除時間加倍
+    assert a.ejected_total == 2
+
+
+def test_tenant_sticky_hashing_is_stable_and_bounded():
+    """測試同一租戶固定到同一後端，剔除後端只影響其上的租戶，過載時溢出到其他後端。"""
+    clock = FakeClock()
+    pool = BackendPool(["http://a", "http://b", "http://c"], sticky=True, failure_threshold=1, clock=clock)
+    tenants = [f"tenant-{index}" for index in range(30)]
+    placement = {tenant: pool.choose(tenant) for tenant in tenants}
+    assert all(pool.choose(tenant) is placement[tenant] for tenant in tenants)
+    assert len(set(placement.values())) == 3
+
+    ejected = pool.backends[0]
+    pool.record_failure(ejected)
+    moved = {tenant for tenant in tenants if pool.choose(tenant) is not placement[tenant]}
+    assert moved == {tenant for tenant in tenants if placement[tenant] is ejected}
+
+    clock.now += 60
+    home = pool.choose("tenant-0")
+    home.outstanding = 10
+    assert pool.choose("tenant-0") is not home
+
+
+def test_health_checks_and_balancing_against_local_servers():
+    """測試以本地替身伺服器進行主動健康檢查：持續返回 5xx 的後端被移出，恢復後重新加入。"""
+    async def scenario():
+        good_server, good_url, good_handled = await start_stand_in_server(200)
+        bad_server, bad_url, bad_handled = await start_stand_in_server(503)
+        pool = BackendPool([good_url, bad_url], health_path="/up", unhealthy_threshold=2, healthy_threshold=2)
+        try:
+            async with httpx.AsyncClient() as client:
+                for _ in range(2):
+                    await pool.check_health(client)
+                healthy = [backend.url for backend in pool.backends if backend.available()]
+
+                async def send(base_url, timeout):
+                    return await client.get(f"{base_url}/tenant-routes/articles", timeout=timeout)
+
+                bad_before = len(bad_handled)
+                statuses = [(await pool.call(send, timeout=5.0, key="cw")).status_code for _ in range(6)]
+
+                pool.backends[1].url = good_url # 模擬後端恢復
+                for _ in range(2):
+                    await pool.check_health(client)
+                return healthy == [good_url], statuses, len(bad_handled) - bad_before, pool.backends[1].available()
+        finally:
+            good_server.close()
+            bad_server.close()
+
+    only_good_is_healthy, statuses, bad_calls, readmitted = asyncio.run(scenario())
+    assert only_good_is_healthy
+    assert statuses == [200] * 6
+    assert bad_calls == 0
+    assert readmitted
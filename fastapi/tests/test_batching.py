@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import httpx
+import jwt
+import respx
+from fastapi.testclient import TestClient
+
+from gateway.batching import MicroBatcher
+from main import app
+
+client = TestClient(app)
+
+
+def test_microbatcher_fans_in_by_key_and_demultiplexes_results():
+    """測試相同鍵的並行請求合併為一次批次呼叫，結果依序分發，不同鍵分開送出。"""
+    sent = []
+
+    async def send_batch(key, items):
+        sent.append((key, list(items)))
+        await asyncio.sleep(0)
+        return [f"{key}:{item}" for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(send_batch, max_size=10, max_wait=0.01)
+        return await asyncio.gather(
+            batcher.submit("u1", "a"), batcher.submit("u1", "b"), batcher.submit("u2", "c"), batcher.submit("u1", "d")
+        ), batcher
+
+    results, batcher = asyncio.run(scenario())
+    assert results == ["u1:a", "u1:b", "u2:c", "u1:d"]
+    assert sorted(sent) == [("u1", ["a", "b", "d"]), ("u2", ["c"])]
+    assert (batcher.batches, batcher.items) == (2, 4)
+
+
+def test_microbatcher_flushes_at_max_size_and_fans_out_errors():
+    """測試達到 max_size 時不等待即送出，且批次失敗時所有呼叫者收到相同的例外。"""
+    sizes = []
+
+    async def send_batch(key, items):
+        sizes.append(len(items))
+        if "boom" in items:
+            raise RuntimeError("backend down")
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(send_batch, max_size=2, max_wait=10.0)
+        first = await asyncio.wait_for(asyncio.gather(batcher.submit("k", 1), batcher.submit("k", 2)), timeout=1)
+        failed = await asyncio.gather(batcher.submit("k", "boom"), batcher.submit("k", 3), return_exceptions=True)
+        return first, failed
+
+    first, failed = asyncio.run(scenario())
+    assert first == [1, 2]
+    assert sizes == [2, 2]
+    assert all(isinstance(error, RuntimeError) for error in failed)
+
+
+@respx.mock
+def test_graphql_array_batch_is_forwarded_as_one_upstream_call():
+    """測試陣列批次請求以一次上游呼叫轉發，無效的操作在閘道返回錯誤且不佔用上游位置。"""
+    def batched(request):
+        operations = json.loads(request.content)
+        return httpx.Response(200, json=[{"data": {"index": index}} for index, _ in enumerate(operations)])
+
+    route = respx.post("http://mock-laravel:8000/graphql").mock(side_effect=batched)
+    token = jwt.encode({"sub": "u1", "tenant_id": "cw"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    headers = {"X-Tenant-ID": "cw", "Authorization": f"Bearer {token}"}
+    payload = [
+        {"query": "query { articles { id } }"},
+        {"query": "query { articles { id "},
+        {"query": "query Stats { stats { total } }", "operationName": "Stats"},
+    ]
+
+    response = client.post("/graphql", headers=headers, json=payload)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0] == {"data": {"index": 0}}
+    assert "語法錯誤" in results[1]["errors"][0]["message"]
+    assert results[2] == {"data": {"index": 1}}
+    assert route.call_count == 1
+    assert [operation["query"] for operation in json.loads(route.calls.last.request.content)] == ["query{articles{id}}", "query Stats{stats{total}}"]
+
+    too_large = client.post("/graphql", headers=headers, json=[{"query": "{ a }"}] * 11)
+    assert too_large.status_code == 400
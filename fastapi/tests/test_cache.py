@@ -0,0 +1,196 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+import respx
+from fastapi.testclient import TestClient
+
+from config.config import settings
+from gateway.cache import ResponseCache, parse_route_ttls, HIT, MISS, STALE, REVALIDATED
+from gateway.events import SIGNATURE_HEADER, sign_payload
+from gateway.streaming import RawResponse
+from main import app, response_cache
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBackend:
+    def __init__(self, etag='"v1"'):
+        self.etag = etag
+        self.calls = []
+
+    async def __call__(self, conditional_headers):
+        self.calls.append(conditional_headers)
+        if conditional_headers.get("If-None-Match") == self.etag:
+            return RawResponse(304, [(b"etag", self.etag.encode())], b"")
+        return RawResponse(200, [(b"content-type", b"application/json"), (b"etag", self.etag.encode())], b'{"data": []}')
+
+
+def make_cache(clock, **kwargs):
+    return ResponseCache(parse_route_ttls("articles=30,articles/*/history=15"), stale_while_revalidate=10, clock=clock, **kwargs)
+
+
+def test_route_ttls_and_key_cover_query_and_vary_headers():
+    """測試路由 TTL 比對，以及快取鍵涵蓋租戶、查詢參數、vary 標頭與請求憑證。"""
+    cache = make_cache(FakeClock())
+    assert cache.ttl_for("articles") == 30
+    assert cache.ttl_for("articles/5/history") == 15
+    assert cache.ttl_for("articles/5/publish") is None
+
+    key_a = cache.make_key("t1", "articles", [("page", "2"), ("lang", "en")], {"accept-language": "en"})
+    key_b = cache.make_key("t1", "articles", [("lang", "en"), ("page", "2")], {"accept-language": "en"})
+    assert key_a == key_b
+    assert key_a != cache.make_key("t2", "articles", [("lang", "en"), ("page", "2")], {"accept-language": "en"})
+    assert key_a != cache.make_key("t1", "articles", [("lang", "en"), ("page", "2")], {"accept-language": "zh-TW"})
+    assert key_a != cache.make_key("t1", "articles", [("lang", "en"), ("page", "2")], {"accept-language": "en", "authorization": "Bearer other"})
+
+
+def test_hit_stale_while_revalidate_and_etag_revalidation():
+    """測試快取命中、stale-while-revalidate 背景重新驗證，以及過期後以 If-None-Match 重新驗證。"""
+    clock = FakeClock()
+    cache = make_cache(clock)
+    backend = FakeBackend()
+    key = cache.make_key("t1", "articles", [], {})
+
+    async def scenario():
+        assert (await cache.fetch(key, 30, backend))[1] == MISS
+        assert (await cache.fetch(key, 30, backend))[1] == HIT
+        assert len(backend.calls) == 1
+
+        clock.now = 35
+        response, state = await cache.fetch(key, 30, backend)
+        assert state == STALE and response.status_code == 200
+        await asyncio.sleep(0)
+        assert backend.calls[-1] == {"If-None-Match": '"v1"'}
+        assert (await cache.fetch(key, 30, backend))[1] == HIT
+
+        clock.now = 200
+        response, state = await cache.fetch(key, 30, backend)
+        assert state == REVALIDATED
+        assert response.body == b'{"data": []}'
+
+        response, _ = await cache.fetch(key, 30, backend, if_none_match='"v1"')
+        assert response.status_code == 304
+
+    asyncio.run(scenario())
+
+
+def test_lru_bounds_and_tenant_invalidation():
+    """測試 LRU 條目上限與依租戶 (及路徑前綴) 失效。"""
+    cache = make_cache(FakeClock(), max_entries=2)
+    backend = FakeBackend()
+
+    async def scenario():
+        await cache.fetch(cache.make_key("t1", "articles", [], {}), 30, backend)
+        await cache.fetch(cache.make_key("t1", "articles/1/history", [], {}), 30, backend)
+        await cache.fetch(cache.make_key("t2", "articles", [], {}), 30, backend)
+
+    asyncio.run(scenario())
+    assert len(cache) == 2
+    assert cache.invalidate("t1", "articles/1") == 1
+    assert cache.invalidate("t2") == 1
+    assert len(cache) == 0
+    assert cache.total_bytes == 0
+
+
+def test_read_started_before_invalidation_is_not_stored():
+    """測試寫入觸發失效前開始、失效後才完成的讀取不寫回快取，之後的請求向後端取得新內容。"""
+    cache = make_cache(FakeClock())
+    key = cache.make_key("t1", "articles", [], {})
+    started, release = asyncio.Event(), asyncio.Event()
+    bodies = [b'{"data": ["before-write"]}', b'{"data": ["after-write"]}']
+
+    async def backend(conditional_headers):
+        body = bodies.pop(0)
+        if body.endswith(b'["before-write"]}'):
+            started.set()
+            await release.wait()
+        return RawResponse(200, [(b"content-type", b"application/json")], body)
+
+    async def scenario():
+        slow_read = asyncio.create_task(cache.fetch(key, 30, backend))
+        await started.wait()
+        cache.invalidate("t1") # 寫入完成 (此時租戶尚無任何快取條目)
+        release.set()
+        before, before_state = await slow_read
+        after, after_state = await cache.fetch(key, 30, backend)
+        cached, cached_state = await cache.fetch(key, 30, backend)
+        return before.body, before_state, after.body, after_state, cached.body, cached_state
+
+    assert asyncio.run(scenario()) == (
+        b'{"data": ["before-write"]}', MISS, b'{"data": ["after-write"]}', MISS, b'{"data": ["after-write"]}', HIT,
+    )
+
+
+def test_private_responses_are_not_replayed_across_users_or_without_revalidation():
+    """測試 Set-Cookie 響應不被快取，no-cache 響應每次使用前都以 If-None-Match 重新驗證。"""
+    cache = make_cache(FakeClock())
+    key = cache.make_key("t1", "articles", [], {"authorization": "Bearer a"})
+
+    class CookieBackend(FakeBackend):
+        async def __call__(self, conditional_headers):
+            response = await super().__call__(conditional_headers)
+            return RawResponse(response.status_code, response.headers + [(b"set-cookie", b"laravel_session=abc")], response.body)
+
+    class NoCacheBackend(FakeBackend):
+        async def __call__(self, conditional_headers):
+            response = await super().__call__(conditional_headers)
+            return RawResponse(response.status_code, response.headers + [(b"cache-control", b"no-cache, private")], response.body)
+
+    async def scenario():
+        cookies = CookieBackend()
+        states = [(await cache.fetch(key, 30, cookies))[1] for _ in range(2)]
+        assert states == [MISS, MISS] and len(cache) == 0
+
+        revalidated = NoCacheBackend()
+        other_key = cache.make_key("t1", "articles/1/history", [], {"authorization": "Bearer a"})
+        states = [(await cache.fetch(other_key, 30, revalidated))[1] for _ in range(3)]
+        assert states == [MISS, REVALIDATED, REVALIDATED]
+        assert revalidated.calls == [{}, {"If-None-Match": '"v1"'}, {"If-None-Match": '"v1"'}]
+
+    asyncio.run(scenario())
+
+
+def signed_webhook(path: str, payload: dict):
+    body = json.dumps(payload).encode("utf-8")
+    headers = {SIGNATURE_HEADER: sign_payload("cache-secret", body, int(time.time())), "Content-Type": "application/json"}
+    return client.post(path, content=body, headers=headers)
+
+
+@respx.mock
+def test_gateway_caches_get_per_user_and_webhook_invalidates(monkeypatch):
+    """測試閘道依使用者快取 GET 響應 (其他使用者不會拿到)，且只有簽章的文章發布 webhook 能使租戶快取失效。"""
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "cache-secret")
+    response_cache.clear()
+    token = jwt.encode({"sub": "u1", "tenant_id": "cache_tenant"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    route = respx.get("http://mock-laravel:8000/tenant-routes/articles?page=1").mock(
+        return_value=httpx.Response(200, json={"data": [{"id": 1}]})
+    )
+
+    first = client.get("/tenant-api/articles?page=1", headers=headers)
+    second = client.get("/tenant-api/articles?page=1", headers=headers)
+    assert first.headers["x-cache"] == MISS
+    assert second.headers["x-cache"] == HIT
+    assert second.json() == {"data": [{"id": 1}]}
+    assert route.call_count == 1
+
+    other_token = jwt.encode({"sub": "u2", "tenant_id": "cache_tenant"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    assert client.get("/tenant-api/articles?page=1", headers={"Authorization": f"Bearer {other_token}"}).headers["x-cache"] == MISS
+    assert route.call_count == 2
+
+    assert client.post("/webhook/article-published", json={"tenant_id": "cache_tenant", "article_id": "1"}).status_code == 401
+    webhook = signed_webhook("/webhook/article-published", {"tenant_id": "cache_tenant", "article_id": "1"})
+    assert webhook.json()["invalidated"] == 2
+    assert client.get("/tenant-api/articles?page=1", headers=headers).headers["x-cache"] == MISS
+    assert route.call_count == 3
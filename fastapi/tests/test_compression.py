@@ -0,0 +1,107 @@
+import gzip
+import json
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from gateway.compression import GZIP, CompressionMiddleware, negotiate
+
+ARTICLES = [{"id": index, "title": f"文章 {index}", "content": "內容" * 20} for index in range(50)]
+
+demo = FastAPI()
+demo.add_middleware(CompressionMiddleware, minimum_size=500, encodings=[GZIP])
+
+
+@demo.get("/articles")
+def articles():
+    return ARTICLES
+
+
+@demo.get("/small")
+def small():
+    return {"ok": True}
+
+
+@demo.get("/upstream-gzip")
+def upstream_gzip():
+    body = gzip.compress(json.dumps(ARTICLES).encode("utf-8"))
+    return Response(body, media_type="application/json", headers={"Content-Encoding": "gzip", "ETag": '"v1"'})
+
+
+@demo.get("/audio")
+def audio():
+    return Response(b"\xff\xfb" * 2000, media_type="audio/mpeg")
+
+
+@demo.get("/stream")
+def stream():
+    def events():
+        for index in range(3):
+            yield f"data: {json.dumps(ARTICLES[index])}\n\n".encode("utf-8")
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@demo.get("/no-transform")
+def no_transform():
+    return JSONResponse(ARTICLES, headers={"Cache-Control": "no-cache, no-transform"})
+
+
+client = TestClient(demo)
+
+
+def test_negotiate_respects_q_values_and_server_preference():
+    """測試依 q 值選擇編碼，q 相同時依伺服器偏好，q=0 的編碼不使用。"""
+    assert negotiate("gzip, br", ["zstd", "br", "gzip"]) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate("br;q=0, *;q=0.1", ["br", "gzip"]) == "gzip"
+    assert negotiate("identity", ["br", "gzip"]) is None
+    assert negotiate(None, ["gzip"]) is None
+
+
+def test_large_responses_are_compressed_and_small_ones_are_not():
+    """測試超過門檻的 JSON 以 gzip 壓縮並加上 Vary，小響應、音訊與上游已壓縮的響應保持原樣。"""
+    response = client.get("/articles", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(json.dumps(ARTICLES, ensure_ascii=False).encode("utf-8"))
+    assert response.json() == ARTICLES
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/audio", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/articles", headers={"Accept-Encoding": "identity"}).headers
+
+    passthrough = client.get("/upstream-gzip", headers={"Accept-Encoding": "gzip"})
+    assert passthrough.headers["etag"] == '"v1"' # 未重新編碼，上游的強 ETag 保持不變
+    assert passthrough.json() == ARTICLES
+
+
+def test_etag_is_generated_and_validated():
+    """測試為 GET 響應產生與壓縮無關的 ETag，If-None-Match 相符時返回沒有主體的 304。"""
+    plain = client.get("/articles", headers={"Accept-Encoding": "identity"})
+    compressed = client.get("/articles", headers={"Accept-Encoding": "gzip"})
+    etag = plain.headers["etag"]
+    assert etag.startswith('W/"') and compressed.headers["etag"] == etag
+
+    not_modified = client.get("/articles", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert client.get("/upstream-gzip", headers={"If-None-Match": 'W/"v1"'}).status_code == 304
+    assert client.get("/articles", headers={"If-None-Match": 'W/"other"'}).status_code == 200
+
+
+def test_streaming_responses_are_compressed_incrementally():
+    """測試串流響應以串流編碼器壓縮，每個片段都可立即解碼。"""
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert "etag" not in response.headers
+        text = "".join(response.iter_text())
+    assert text.count("data: ") == 3
+
+
+def test_no_transform_responses_are_not_compressed():
+    """測試 Cache-Control: no-transform 的響應不被壓縮。"""
+    response = client.get("/no-transform", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == ARTICLES
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+from fastapi.testclient import TestClient
+
+from config.config import settings
+from gateway.events import DISCONNECT, SIGNATURE_HEADER, EventHub, StreamTickets, sign_payload, verify_signature
+from main import app, event_hub
+
+client = TestClient(app)
+
+
+def test_webhook_signature_rejects_tampered_and_replayed_payloads():
+    """測試簽章驗證：主體被竄改或時間戳過舊時拒絕。"""
+    body = b'{"tenant_id":"cw"}'
+    header = sign_payload("secret", body, 1000)
+    assert verify_signature("secret", body, header, now=1010)
+    assert not verify_signature("secret", body + b" ", header, now=1010)
+    assert not verify_signature("secret", body, header, tolerance=300, now=2000)
+    assert not verify_signature("secret", body, None)
+
+
+def test_stream_tickets_are_short_lived_single_use_and_tamper_proof(monkeypatch):
+    """測試串流票證只能使用一次、過期或被竄改時拒絕；未設定 WEBHOOK_SECRET 時 Webhook 預設拒絕。"""
+    now = [1000.0]
+    tickets = StreamTickets("jwt-secret", ttl=30, clock=lambda: now[0])
+    ticket = tickets.issue("cw", "u1")
+    payload, _, signature = ticket.partition(".")
+    assert tickets.redeem(payload[:-2] + "xx." + signature) is None
+    assert StreamTickets("other-secret").redeem(ticket) is None
+    assert tickets.redeem(ticket) == ("cw", "u1")
+    assert tickets.redeem(ticket) is None # 已使用
+    expired = tickets.issue("cw", "u1")
+    now[0] += 31
+    assert tickets.redeem(expired) is None and tickets.rejected == 3
+
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "")
+    body = {"tenant_id": "events", "article_id": "1"}
+    assert client.post("/webhook/article-events", json=body).status_code == 503
+    monkeypatch.setattr(settings, "WEBHOOK_ALLOW_UNSIGNED", True)
+    assert client.post("/webhook/article-events", json=body).status_code == 200
+
+
+def test_hub_buffers_are_bounded_and_resume_from_last_event_id():
+    """測試每個連線的緩衝區有上限 (捨棄最舊或中斷連線)，事件只送給同租戶，重新連線時依 Last-Event-ID 補齊。"""
+    async def scenario():
+        hub = EventHub(buffer_size=2, history_size=10)
+        slow = hub.subscribe("cw")
+        other = hub.subscribe("health")
+        published = [hub.create_event("cw", "article.state_changed", {"article_id": str(index)}) for index in range(3)]
+        for event in published:
+            hub.deliver(event)
+        kept = await slow.next_batch(0.01)
+        resumed = hub.subscribe("cw", last_event_id=published[0].id)
+        missed = await resumed.next_batch(0.01)
+        idle = await other.next_batch(0.01)
+
+        strict = EventHub(buffer_size=1, policy=DISCONNECT)
+        subscription = strict.subscribe("cw")
+        for index in range(2):
+            strict.deliver(strict.create_event("cw", "article.published", {}))
+        return hub, kept, missed, idle, strict, subscription
+
+    hub, kept, missed, idle, strict, subscription = asyncio.run(scenario())
+    assert [json.loads(event.data)["article_id"] for event in kept] == ["1", "2"]
+    assert [json.loads(event.data)["article_id"] for event in missed] == ["1", "2"]
+    assert idle == [] and hub.dropped == 1
+    assert subscription.closed and strict.subscribers == 0 and strict.disconnected == 1
+
+
+async def open_stream(path: str, query: str):
+    """直接以 ASGI 呼叫串流端點 (TestClient 會等待無限的事件流結束)，返回 (任務, 收到的訊息佇列, 中斷連線函式)。"""
+    messages: asyncio.Queue = asyncio.Queue()
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"accept-encoding", b"gzip")], "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    task = asyncio.create_task(app(scope, receive, messages.put))
+    return task, messages, disconnected.set
+
+
+def test_signed_webhook_events_are_pushed_to_sse_subscribers(monkeypatch):
+    """測試簽章的 Webhook 事件經 /events/stream (以一次性票證驗證) 推送給同租戶的 SSE 訂閱者 (不壓縮)，未簽章的請求被拒絕。"""
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "events-secret")
+    token = jwt.encode({"sub": "u1", "tenant_id": "events"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    body = json.dumps({"tenant_id": "events", "article_id": "7", "data": {"from": "review", "to": "published"}}).encode("utf-8")
+
+    assert client.post("/webhook/article-events", content=body).status_code == 401
+    assert client.get("/events/stream").status_code == 401
+    assert client.get(f"/events/stream?access_token={token}").status_code == 401 # JWT 不接受放在 URL 中
+    ticket = client.post("/events/ticket", headers={"Authorization": f"Bearer {token}"}).json()["ticket"]
+
+    async def scenario():
+        task, messages, disconnect = await open_stream("/events/stream", f"ticket={ticket}")
+        start = await asyncio.wait_for(messages.get(), 5)
+        retry = await asyncio.wait_for(messages.get(), 5)
+        signed = {SIGNATURE_HEADER: sign_payload("events-secret", body, int(time.time())), "Content-Type": "application/json"}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as webhook_client:
+            published = await webhook_client.post("/webhook/article-events", content=body, headers=signed)
+        frame = await asyncio.wait_for(messages.get(), 5)
+        disconnect()
+        await asyncio.wait_for(task, 5)
+        return start, retry, published, frame
+
+    start, retry, published, frame = asyncio.run(scenario())
+    headers = dict(start["headers"])
+    assert headers[b"content-type"].startswith(b"text/event-stream")
+    assert b"content-encoding" not in headers
+    assert retry["body"].startswith(b"retry:")
+    assert published.status_code == 200 and published.json()["delivered"] == 1
+    lines = frame["body"].decode("utf-8").splitlines()
+    assert "event: article.state_changed" in lines
+    assert json.loads(lines[2][len("data: "):]) == {"article_id": "7", "from": "review", "to": "published"}
+    assert event_hub.connections("events") == 0
+    assert client.get(f"/events/stream?ticket={ticket}").status_code == 401 # 票證只能使用一次
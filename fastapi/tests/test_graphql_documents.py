@@ -0,0 +1,107 @@
+import json
+
+import httpx
+import jwt
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from gateway.graphql_documents import DocumentCache, GraphQLDocumentError, PersistedQueryNotFound, PersistedQueryStore, query_hash
+from main import app
+
+client = TestClient(app)
+
+ARTICLES_QUERY = """
+# 文章列表
+query Articles($first: Int) {
+  articles(first: $first) {
+    id
+    title
+  }
+}
+"""
+
+
+def auth_headers():
+    token = jwt.encode({"sub": "u1", "tenant_id": "cw"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    return {"X-Tenant-ID": "cw", "Authorization": f"Bearer {token}"}
+
+
+def test_document_cache_parses_once_and_reports_operation_type():
+    """測試相同查詢只解析一次，並以解析結果判斷操作類型 (字串中的 mutation 不影響)。"""
+    cache = DocumentCache()
+    info = cache.check(ARTICLES_QUERY)
+    assert cache.check(ARTICLES_QUERY) is info
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert info.operation_type == "query"
+    assert info.depth == 2
+    assert info.minified == "query Articles($first:Int){articles(first:$first){id title}}"
+
+    assert cache.check('{ articles(filter: "mutation { x }") { id } }').operation_type == "query"
+    assert cache.check("mutation Publish($id: ID!) { publish(id: $id) { id } }").operation_type == "mutation"
+    assert cache.check("query A { a } mutation B { b }", "B").operation_type == "mutation"
+
+
+def test_document_cache_rejects_invalid_documents():
+    """測試語法錯誤、過深 (含 fragment 展開)、fragment 循環與缺少 operationName 的查詢被拒絕。"""
+    cache = DocumentCache(max_depth=3)
+    with pytest.raises(GraphQLDocumentError, match="語法錯誤"):
+        cache.check("query { articles { id }")
+    with pytest.raises(GraphQLDocumentError, match="深度 4"):
+        cache.check("{ a { ...F } } fragment F on A { b { c { d } } }")
+    with pytest.raises(GraphQLDocumentError, match="循環"):
+        cache.check("{ a { ...F } } fragment F on A { b { ...F } }")
+    with pytest.raises(GraphQLDocumentError, match="operationName"):
+        cache.check("query A { a } query B { b }")
+    with pytest.raises(GraphQLDocumentError):
+        cache.check("query { articles { id }") # 錯誤結果也會被快取
+    assert cache.hits == 1
+
+
+def test_persisted_query_store_registers_and_verifies_hash():
+    """測試 APQ 存放區：未知雜湊、以完整查詢註冊、雜湊不符，以及 LRU 上限。"""
+    store = PersistedQueryStore(max_entries=1)
+    digest = query_hash(ARTICLES_QUERY)
+    with pytest.raises(PersistedQueryNotFound):
+        store.resolve(digest, None)
+    assert store.resolve(digest, ARTICLES_QUERY) == ARTICLES_QUERY
+    assert store.resolve(digest, None) == ARTICLES_QUERY
+    with pytest.raises(GraphQLDocumentError):
+        store.resolve(digest, "{ other }")
+
+    store.resolve(query_hash("{ other }"), "{ other }")
+    assert len(store) == 1
+    with pytest.raises(PersistedQueryNotFound):
+        store.resolve(digest, None)
+
+
+@respx.mock
+def test_graphql_proxy_automatic_persisted_queries():
+    """測試 APQ 流程：只送雜湊時返回 PersistedQueryNotFound，註冊後只需送雜湊，後端收到精簡後的完整查詢。"""
+    route = respx.post("http://mock-laravel:8000/graphql").mock(
+        return_value=httpx.Response(200, json={"data": {"articles": []}})
+    )
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(ARTICLES_QUERY)}}
+
+    response = client.post("/graphql", headers=auth_headers(), json={"extensions": extensions, "variables": {"first": 5}})
+    assert response.json()["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
+    assert route.call_count == 0
+
+    registered = client.post("/graphql", headers=auth_headers(), json={"query": ARTICLES_QUERY, "extensions": extensions})
+    assert registered.status_code == 200
+
+    response = client.post("/graphql", headers=auth_headers(), json={"extensions": extensions, "variables": {"first": 5}})
+    assert response.json() == {"data": {"articles": []}}
+    forwarded = json.loads(route.calls.last.request.content)
+    assert forwarded == {"query": "query Articles($first:Int){articles(first:$first){id title}}", "variables": {"first": 5}}
+
+
+@respx.mock
+def test_graphql_proxy_rejects_malformed_queries_without_backend_call():
+    """測試語法錯誤的查詢在閘道返回 400，不呼叫後端。"""
+    route = respx.post("http://mock-laravel:8000/graphql").mock(return_value=httpx.Response(200, json={"data": {}}))
+
+    response = client.post("/graphql", headers=auth_headers(), json={"query": "query { articles { id "})
+    assert response.status_code == 400
+    assert "語法錯誤" in response.json()["detail"]
+    assert route.call_count == 0
@@ -0,0 +1,47 @@
+import httpx
+import jwt
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from config.config import settings
+from gateway import jsoncodec
+from gateway.jsoncodec import STDLIB, FastJSONResponse, available_codecs, get_codec
+from main import app
+
+client = TestClient(app)
+
+PAYLOAD = {"articles": [{"id": 1, "title": "標題", "tags": ["a", "b"], "score": 1.5, "draft": None}], "total": 1}
+
+
+@pytest.mark.parametrize("codec", available_codecs(), ids=lambda codec: codec.name)
+def test_codecs_round_trip_and_sort_keys(codec):
+    """測試每個可用的 JSON 實作都能往返編碼，排序鍵的輸出與標準庫一致。"""
+    assert codec.loads(codec.dumps(PAYLOAD, False)) == PAYLOAD
+    assert codec.dumps({"b": 1, "a": "中"}, True) == get_codec(STDLIB).dumps({"b": 1, "a": "中"}, True)
+
+
+def test_unknown_backend_falls_back_to_stdlib_and_response_renders():
+    """測試指定的實作不可用時退回標準庫，FastJSONResponse 以目前的實作序列化。"""
+    assert get_codec("not-installed").name == STDLIB
+    assert jsoncodec.loads(FastJSONResponse(PAYLOAD).body) == PAYLOAD
+
+
+@respx.mock
+def test_buffered_proxy_forwards_raw_json_bytes(monkeypatch):
+    """測試緩衝模式下請求與響應的 JSON 位元組原樣轉發 (不解碼再編碼)，無效的 JSON 仍被拒絕。"""
+    monkeypatch.setattr(settings, "TENANT_API_STREAMING", False)
+    upstream_body = b'{"id": 7,   "title": "\\u6a19\\u984c"}'
+    route = respx.post("http://mock-laravel:8000/tenant-routes/articles").mock(
+        return_value=httpx.Response(201, content=upstream_body, headers={"Content-Type": "application/json"})
+    )
+    token = jwt.encode({"sub": "u1", "tenant_id": "cw"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    headers = {"X-Tenant-ID": "cw", "Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    request_body = b'{"title":  "a", "content": "b"}'
+
+    response = client.post("/tenant-api/articles", headers=headers, content=request_body)
+
+    assert response.status_code == 201
+    assert response.content == upstream_body
+    assert route.calls.last.request.content == request_body
+    assert client.post("/tenant-api/articles", headers=headers, content=b"{not json").status_code == 400
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import jwt
+import respx
+from anyio import to_thread
+from fastapi.testclient import TestClient
+
+from gateway.loopmonitor import LoopMonitor
+from main import app, loop_monitor
+
+client = TestClient(app)
+
+
+def blocking_handler():
+    time.sleep(0.2) # 模擬在事件迴圈中執行的同步呼叫
+
+
+def test_blocking_call_is_detected_and_attributed_with_stack():
+    """測試佔用事件迴圈超過門檻的同步呼叫被偵測，歸因到呼叫位置並擷取堆疊，延遲取樣反映阻塞時間。"""
+    blocked = []
+
+    async def scenario():
+        monitor = LoopMonitor(interval=0.01, block_threshold=0.05, on_block=blocked.append)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_handler()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    assert len(blocked) == 1
+    report = blocked[0]
+    assert report.location.startswith("tests/test_loopmonitor.py:") and report.location.endswith("blocking_handler")
+    assert report.duration >= 0.1 and any("time.sleep(0.2)" in line for line in report.stack)
+    assert monitor.blocked == {report.location: 1} and monitor.lag_percentile(1.0) >= 0.1
+    assert monitor.recent() == [report]
+
+
+def test_threadpool_saturation_and_lag_drive_load_shedding():
+    """測試執行緒池全部忙碌且有工作等待、或延遲移動平均超過門檻時判定過載。"""
+    async def scenario():
+        to_thread.current_default_thread_limiter().total_tokens = 1
+        monitor = LoopMonitor(shed_threadpool_queue=1)
+        workers = [asyncio.create_task(to_thread.run_sync(time.sleep, 0.1)) for _ in range(2)]
+        await asyncio.sleep(0.02)
+        monitor.sample_threadpool()
+        saturated = (monitor.threadpool_size, monitor.threadpool_busy, monitor.threadpool_waiting, monitor.shed_load())
+        await asyncio.gather(*workers)
+        monitor.sample_threadpool()
+        return monitor, saturated
+
+    monitor, saturated = asyncio.run(scenario())
+    assert saturated == (1, 1, 1, True)
+    assert not monitor.overloaded() and monitor.shed == 1 and monitor.threadpool_saturated == 1
+
+    lagging = LoopMonitor(shed_lag=0.05, smoothing=0.5)
+    lagging.record_lag(0.2)
+    assert lagging.overloaded() # 移動平均 0.1 秒
+    for _ in range(5):
+        lagging.record_lag(0.0)
+    assert not lagging.overloaded()
+
+
+@respx.mock
+def test_overloaded_gateway_sheds_laravel_requests_and_exports_metrics(monkeypatch):
+    """測試過載時 /tenant-api 在呼叫上游前以 503 拒絕，指標端點匯出迴圈延遲與執行緒池使用量。"""
+    route = respx.get("http://mock-laravel:8000/tenant-routes/articles")
+    token = jwt.encode({"sub": "u1", "tenant_id": "loop-shed"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    monkeypatch.setattr(loop_monitor, "shed_lag", 0.05)
+    monkeypatch.setattr(loop_monitor, "lag_ewma", 0.5)
+    shed_before = loop_monitor.shed
+
+    response = client.get("/tenant-api/articles", headers={"X-Tenant-ID": "loop-shed", "Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+    assert not route.called and loop_monitor.shed == shed_before + 1
+    exposition = client.get("/metrics").text
+    assert "fastapi_event_loop_lag_seconds 0.5" in exposition
+    assert 'fastapi_threadpool_threads{state="waiting"}' in exposition
+    assert "fastapi_load_shed_total" in exposition
+    assert client.get("/").json()["status"] == "ok"
@@ -0,0 +1,110 @@
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+
+import httpx
+import jwt
+import respx
+from fastapi.testclient import TestClient
+
+import main
+from gateway.metering import OVERFLOW_ROUTE, UNAUTHENTICATED_TENANT, JsonLinesSink, SQLiteSink, UsageMeter
+
+client = TestClient(main.app)
+
+BASE = "http://mock-laravel:8000/tenant-routes"
+
+
+class RecordingSink:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+
+    async def send(self, batch_id, records):
+        if self.fail:
+            raise ConnectionError("sink 無法使用")
+        self.batches.append((batch_id, records))
+
+
+def test_usage_is_aggregated_in_memory_and_flushed_as_one_batch(tmp_path):
+    """測試用量在記憶體中依 (租戶, 用戶, 路由) 彙總，結算時整批寫入 SQLite，重送相同批次不會重複計入。"""
+    database = str(tmp_path / "usage.db")
+    meter = UsageMeter(SQLiteSink(database), max_keys=3)
+    for _ in range(3):
+        meter.record("cw", "u1", "/tenant-api/articles", bytes_out=100, upstream_seconds=0.02)
+    meter.record("cw", "u2", "/tts", bytes_in=40, tts_characters=12)
+    meter.record("health", "u3", "/tenant-api/user", errors=1)
+    meter.record("health", "u4", "/graphql") # 超過鍵數上限，歸入溢位路由
+    assert meter.usage()[("health", "", OVERFLOW_ROUTE)]["requests"] == 1
+
+    assert asyncio.run(meter.flush()) == 1
+    assert meter.usage() == {} and meter.flushed_records == 4
+    batch = sqlite3.connect(database).execute("SELECT batch_id FROM usage LIMIT 1").fetchone()[0]
+    records = [dict(zip(("tenant_id", "user_id", "route", "requests", "bytes_out", "upstream_ms", "tts_characters", "errors"), row)) for row in sqlite3.connect(database).execute(
+        "SELECT tenant_id, user_id, route, requests, bytes_out, upstream_ms, tts_characters, errors FROM usage ORDER BY tenant_id, user_id"
+    )]
+    assert records[0] == {"tenant_id": "cw", "user_id": "u1", "route": "/tenant-api/articles", "requests": 3, "bytes_out": 300, "upstream_ms": 60.0, "tts_characters": 0, "errors": 0}
+    assert records[1]["tts_characters"] == 12 and records[3]["errors"] == 1
+
+    asyncio.run(SQLiteSink(database).send(batch, [{"window_start": 0, "window_end": 1, "tenant_id": "cw", "user_id": "u1", "route": "/tenant-api/articles",
+                                                    "requests": 3, "errors": 0, "bytes_in": 0, "bytes_out": 300, "upstream_ms": 60.0, "tts_characters": 0}]))
+    assert sqlite3.connect(database).execute("SELECT COUNT(*) FROM usage").fetchone()[0] == 4
+
+
+def test_unsent_batches_survive_sink_outage_and_restart(tmp_path):
+    """測試 sink 無法使用時批次保留在暫存目錄，重啟後的進程載入並送出，成功後刪除暫存檔。"""
+    spool = str(tmp_path / "spool")
+    failing = UsageMeter(RecordingSink(fail=True), spool_dir=spool)
+    failing.record("cw", "u1", "/tenant-api/articles", bytes_out=10)
+    assert asyncio.run(failing.flush()) == 0
+    assert failing.pending() == 1 and failing.failures == 1 and len(os.listdir(spool)) == 1
+
+    output = str(tmp_path / "usage.jsonl")
+    restarted = UsageMeter(JsonLinesSink(output), spool_dir=spool)
+
+    async def scenario():
+        recovered = await restarted.recover()
+        restarted.record("cw", "u1", "/tenant-api/articles", bytes_out=5)
+        return recovered, await restarted.flush()
+
+    assert asyncio.run(scenario()) == (1, 2)
+    with open(output, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["bytes_out"] for line in lines] == [10, 5]
+    assert os.listdir(spool) == [] and restarted.pending() == 0
+
+
+@respx.mock
+def test_tenant_api_and_tts_handlers_produce_usage(monkeypatch):
+    """測試 /tenant-api 與 /tts 的每個請求只在記憶體中計量 (租戶、用戶、路由樣式、位元組與 TTS 字元數)。"""
+    meter = UsageMeter(RecordingSink())
+    monkeypatch.setattr(main, "usage_meter", meter)
+    monkeypatch.setattr(main.settings, "RESPONSE_CACHE_ENABLED", False)
+    respx.get(f"{BASE}/articles/5").mock(return_value=httpx.Response(200, json={"id": 5, "title": "計量"}))
+    respx.post(f"{BASE}/articles").mock(return_value=httpx.Response(201, json={"id": 6}))
+    audio = b"ID3" + bytes(29)
+    respx.post("https://texttospeech.googleapis.com/v1/text:synthesize?key=mock_gcp_api_key").mock(
+        return_value=httpx.Response(200, json={"audioContent": base64.b64encode(audio).decode()})
+    )
+    token = jwt.encode({"sub": "editor", "tenant_id": "metered"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    headers = {"X-Tenant-ID": "metered", "Authorization": f"Bearer {token}"}
+
+    read = client.get("/tenant-api/articles/5", headers=headers)
+    write = client.post("/tenant-api/articles", headers=headers, json={"title": "新文章"})
+    tts_client = TestClient(main.app, client=("10.0.0.11", 50000)) # 不佔用其他測試共用的 TTS 速率限制
+    tts_client.post("/tts", headers={"Authorization": f"Bearer {token}"}, json={"text": "計量測試文章。", "tenant_id": "other"})
+    tts_client.post("/tts", json={"text": "未驗證的文章。", "tenant_id": "metered"})
+
+    usage = meter.usage()
+    article = usage[("metered", "editor", "/tenant-api/articles/{article}")]
+    assert article["requests"] == 1 and article["bytes_out"] == len(read.content)
+    created = usage[("metered", "editor", "/tenant-api/articles")]
+    assert created["bytes_in"] == len(b'{"title":"\xe6\x96\xb0\xe6\x96\x87\xe7\xab\xa0"}') and created["bytes_out"] == len(write.content)
+    tts = usage[("metered", "editor", "/tts")]
+    assert tts["tts_characters"] == len("計量測試文章。") and tts["bytes_out"] == len(audio)
+    # 請求主體中的 tenant_id 不影響計量的租戶
+    assert usage[(UNAUTHENTICATED_TENANT, "", "/tts")]["tts_characters"] == len("未驗證的文章。")
+    assert not any(tenant == "other" for tenant, _, _ in usage) and ("metered", "", "/tts") not in usage
+    assert meter.pending() == 0 and meter.flushed_batches == 0 # 請求路徑上沒有任何寫入
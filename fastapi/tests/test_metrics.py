@@ -0,0 +1,105 @@
+import asyncio
+import json
+import os
+
+from gateway.metrics import MetricsRegistry
+
+
+def test_histogram_exposes_cumulative_buckets():
+    """測試直方圖輸出累積桶計數、總和與計數。"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("fastapi_request_duration_seconds", "請求持續時間 (秒)。", ("method", "path"), buckets=(0.1, 0.5, 1.0))
+    child = histogram.labels("GET", "/tenant-api/articles")
+    for value in (0.05, 0.1, 0.3, 2.0):
+        child.observe(value)
+
+    output = registry.expose()
+    assert "# TYPE fastapi_request_duration_seconds histogram" in output
+    assert 'fastapi_request_duration_seconds_bucket{method="GET",path="/tenant-api/articles",le="0.1"} 2' in output
+    assert 'fastapi_request_duration_seconds_bucket{method="GET",path="/tenant-api/articles",le="0.5"} 3' in output
+    assert 'fastapi_request_duration_seconds_bucket{method="GET",path="/tenant-api/articles",le="1"} 3' in output
+    assert 'fastapi_request_duration_seconds_bucket{method="GET",path="/tenant-api/articles",le="+Inf"} 4' in output
+    assert 'fastapi_request_duration_seconds_sum{method="GET",path="/tenant-api/articles"} 2.45' in output
+    assert 'fastapi_request_duration_seconds_count{method="GET",path="/tenant-api/articles"} 4' in output
+
+
+def test_label_names_with_underscores_and_escaping_survive():
+    """測試含底線的指標/標籤名稱不再被拆壞，且標籤值會被跳脫。"""
+    registry = MetricsRegistry()
+    counter = registry.counter("fastapi_http_requests_total", "請求總數。", ("method", "path", "status"))
+    counter.labels("POST", '/tenant-api/a"b', "201").inc()
+    counter.labels("POST", '/tenant-api/a"b', "201").inc(2)
+
+    output = registry.expose()
+    assert 'fastapi_http_requests_total{method="POST",path="/tenant-api/a\\"b",status="201"} 3' in output
+    assert output.count("# TYPE fastapi_http_requests_total counter") == 1
+
+
+def test_multiprocess_aggregation(tmp_path):
+    """測試多個 worker 的計數器與直方圖被加總，已結束 worker 的 gauge 被忽略。"""
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+    counter = registry.counter("fastapi_http_requests_total", "請求總數。", ("method",))
+    histogram = registry.histogram("fastapi_request_duration_seconds", "請求持續時間 (秒)。", buckets=(1.0,))
+    gauge = registry.gauge("fastapi_in_flight", "進行中的請求數。")
+    counter.labels("GET").inc(3)
+    histogram.labels().observe(0.5)
+    gauge.labels().set(2)
+
+    other_worker = registry.snapshot()
+    other_worker["pid"] = 2 ** 22 + 12345 # 不存在的 pid
+    (tmp_path / "metrics_999999.json").write_text(json.dumps(other_worker))
+
+    output = registry.expose()
+    assert 'fastapi_http_requests_total{method="GET"} 6' in output
+    assert 'fastapi_request_duration_seconds_bucket{le="1"} 2' in output
+    assert "fastapi_request_duration_seconds_count 2" in output
+    assert "fastapi_in_flight 2" in output
+    assert os.path.exists(tmp_path / f"metrics_{os.getpid()}.json")
+
+
+def test_dead_worker_snapshots_are_archived_and_removed(tmp_path):
+    """測試已結束 worker 的快照併入歸檔後被刪除，計數器不會因此減少；非同步輸出在執行緒中讀寫檔案。"""
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+    counter = registry.counter("fastapi_http_requests_total", "請求總數。", ("method",))
+    counter.labels("GET").inc(3)
+
+    for index, pid in enumerate((2 ** 22 + 12345, 2 ** 22 + 12346)):
+        dead_worker = registry.snapshot()
+        dead_worker["pid"] = pid
+        (tmp_path / f"metrics_{900000 + index}.json").write_text(json.dumps(dead_worker))
+
+    assert 'fastapi_http_requests_total{method="GET"} 9' in asyncio.run(registry.expose_async())
+    assert {path.name for path in tmp_path.glob("metrics_*.json")} == {"metrics_archive.json", f"metrics_{os.getpid()}.json"}
+
+    counter.labels("GET").inc()
+    assert 'fastapi_http_requests_total{method="GET"} 10' in asyncio.run(registry.expose_async())
+    assert 'fastapi_http_requests_total{method="GET"} 10' in registry.expose()
+
+
+def test_concurrent_snapshot_writes_do_not_collide(tmp_path):
+    """測試定期寫入與抓取同時寫入同一個 worker 的快照時，各自使用獨立的暫存檔，不會失敗或留下暫存檔。"""
+    registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+    registry.counter("fastapi_http_requests_total", "請求總數。", ("method",)).labels("GET").inc()
+
+    async def scenario():
+        await asyncio.gather(*(asyncio.to_thread(registry.write_snapshot) for _ in range(50)))
+
+    asyncio.run(scenario())
+    assert [path.name for path in tmp_path.iterdir()] == [f"metrics_{os.getpid()}.json"]
+    assert json.loads((tmp_path / f"metrics_{os.getpid()}.json").read_text())["pid"] == os.getpid()
+
+
+def test_series_cap_routes_new_label_sets_to_overflow():
+    """測試超過每個指標的序列上限後，新的標籤組合歸入溢出序列。"""
+    registry = MetricsRegistry(max_series_per_metric=2)
+    counter = registry.counter("fastapi_http_requests_total", "請求總數。", ("path",))
+    counter.labels("/a").inc()
+    counter.labels("/b").inc()
+    for index in range(100):
+        counter.labels(f"/articles/{index}").inc()
+    counter.labels("/a").inc()
+
+    output = registry.expose()
+    assert 'fastapi_http_requests_total{path="/a"} 2' in output
+    assert 'fastapi_http_requests_total{path="__overflow__"} 100' in output
+    assert output.count("fastapi_http_requests_total{") == 3
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import httpx
+import jwt
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from gateway.multiplex import FAILED_DEPENDENCY, BatchPlanError, SubResponse, plan_batch, run_batch
+from main import app
+
+client = TestClient(app)
+
+BASE = "http://mock-laravel:8000/tenant-routes"
+
+
+def auth_headers(tenant_id: str, user_id: str = "u1") -> dict:
+    token = jwt.encode({"sub": user_id, "tenant_id": tenant_id}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    return {"X-Tenant-ID": tenant_id, "Authorization": f"Bearer {token}"}
+
+
+def test_plan_rejects_duplicate_ids_and_forward_dependencies():
+    """測試依賴只能指向前面的子請求，ID 不可重複。"""
+    assert plan_batch(["a", "b", "c"], [[], ["a"], ["a", "b"]]) == [[], [0], [0, 1]]
+    with pytest.raises(BatchPlanError):
+        plan_batch(["a", "a"], [[], []])
+    with pytest.raises(BatchPlanError):
+        plan_batch(["a", "b"], [["b"], []])
+
+
+def test_run_batch_bounds_fan_out_and_skips_failed_dependencies():
+    """測試並行數不超過上限、依賴完成後才開始，依賴失敗時以 424 跳過。"""
+    async def scenario():
+        running, peak, started = 0, 0, []
+
+        async def execute(index):
+            nonlocal running, peak
+            started.append(index)
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return SubResponse(500 if index == 0 else 200)
+
+        dependencies = [[], [0], [], [], [], [2]]
+        results = {index: result async for index, result in run_batch(dependencies, execute, max_concurrency=2)}
+        return peak, started, results
+
+    peak, started, results = asyncio.run(scenario())
+    assert peak == 2
+    assert 1 not in started and started.index(5) > started.index(2)
+    assert results[1].status_code == FAILED_DEPENDENCY
+    assert [results[index].status_code for index in (0, 2, 3, 4, 5)] == [500, 200, 200, 200, 200]
+
+
+@respx.mock
+def test_batch_endpoint_returns_results_in_order_under_one_auth():
+    """測試批次端點以一次驗證執行子請求，結果依批次順序返回，寫入後依賴的讀取在其之後執行。"""
+    calls = []
+    respx.post(f"{BASE}/articles").mock(side_effect=lambda request: calls.append("create") or httpx.Response(201, json={"id": 9}))
+    respx.get(f"{BASE}/articles").mock(side_effect=lambda request: calls.append("list") or httpx.Response(200, json={"data": [{"id": 9}]}))
+    respx.get(f"{BASE}/user").mock(return_value=httpx.Response(404, text="not found"))
+    batch = {"requests": [
+        {"id": "create", "method": "POST", "endpoint": "articles", "body": {"title": "新文章"}},
+        {"id": "list", "endpoint": "articles?locale=zh_TW", "depends_on": ["create"]},
+        {"endpoint": "/user"},
+    ]}
+
+    response = client.post("/batch", headers=auth_headers("batch-order"), json=batch)
+
+    assert response.status_code == 200
+    results = response.json()["responses"]
+    assert [(result["id"], result["status"]) for result in results] == [("create", 201), ("list", 200), ("2", 404)]
+    assert results[0]["body"] == {"id": 9} and results[1]["body"] == {"data": [{"id": 9}]}
+    assert results[2]["body"] == "not found"
+    assert calls == ["create", "list"]
+    assert json.loads(respx.calls[0].request.content) == {"title": "新文章"}
+
+
+@respx.mock
+def test_batch_endpoint_streams_ndjson_and_validates_plan():
+    """測試 Accept: application/x-ndjson 時每個子請求完成即串流一行，無效的批次返回 400。"""
+    respx.get(f"{BASE}/articles/1").mock(return_value=httpx.Response(200, json={"id": 1}))
+    respx.get(f"{BASE}/articles/2").mock(return_value=httpx.Response(200, json={"id": 2}))
+    headers = {**auth_headers("batch-stream"), "Accept": "application/x-ndjson"}
+
+    response = client.post("/batch", headers=headers, json={"requests": [{"endpoint": "articles/1"}, {"endpoint": "articles/2"}]})
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted((line["index"], line["body"]["id"]) for line in lines) == [(0, 1), (1, 2)]
+    assert client.post("/batch", headers=headers, json={"requests": []}).status_code == 400
+    assert client.post("/batch", headers=headers, json={"requests": [{"endpoint": "a", "depends_on": ["x"]}]}).status_code == 400
+
+
+@respx.mock
+def test_sub_requests_cannot_escape_tenant_routes():
+    """測試以 .. 或編碼的路徑段離開 /tenant-routes/ 的子請求與 /tenant-api 請求在呼叫 Laravel 前以 400 拒絕。"""
+    system = respx.route(path__regex=r"^/api/")
+    headers = auth_headers("batch-escape")
+
+    for endpoint in ("../api/system/tenants", "articles/%2e%2e/%2e%2e/api/system/tenants"):
+        assert client.post("/batch", headers=headers, json={"requests": [{"endpoint": endpoint}]}).status_code == 400
+    assert client.get("/tenant-api/%2e%2e/api/system/tenants", headers=headers).status_code == 400
+    assert not system.called
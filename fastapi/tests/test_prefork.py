@@ -0,0 +1,70 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.bench_gateway import free_port
+from benchmarks.bench_startup import descendants
+from gateway.prefork import load_app
+from gateway.upstream import GCP_TTS, LARAVEL_REST, UpstreamClients, UpstreamConfig
+
+FASTAPI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_upstream_clients_share_ssl_context_prepared_before_fork():
+    """測試 prepare() 只載入一次 CA 憑證，之後建立的每個上游客戶端都使用同一個 SSL context。"""
+    upstreams = UpstreamClients([UpstreamConfig(LARAVEL_REST), UpstreamConfig(GCP_TTS)])
+    upstreams.prepare()
+    context = upstreams._ssl_context
+    upstreams.prepare()
+    assert upstreams._ssl_context is context
+    pools = [upstreams.get(name)._transport._pool for name in (LARAVEL_REST, GCP_TTS)]
+    assert all(pool._ssl_context is context for pool in pools)
+
+    app, before_fork = load_app("main:app")
+    assert app.title and callable(before_fork)
+
+
+def wait_for(condition, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            value = condition()
+            if value:
+                return value
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise AssertionError("等待逾時")
+
+
+def test_prefork_workers_serve_restart_and_shut_down_gracefully():
+    """測試預載後 fork 的 worker 共用監聽 socket 提供服務，意外結束的 worker 被重新 fork，SIGTERM 時全部優雅結束。"""
+    port = free_port()
+    env = {**os.environ, "SENTRY_DSN": "", "METRICS_MULTIPROC_DIR": "", "EVENTS_REDIS_URL": ""}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gateway.prefork", "--port", str(port), "--workers", "2", "--log-level", "warning", "--no-access-log"],
+        cwd=FASTAPI_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        workers = wait_for(lambda: len(descendants(server.pid)) == 2 and descendants(server.pid))
+        assert wait_for(lambda: httpx.get(f"http://127.0.0.1:{port}/").json()["status"] == "ok")
+
+        os.kill(workers[0], signal.SIGKILL)
+        replaced = wait_for(lambda: (lambda pids: len(pids) == 2 and workers[0] not in pids and pids)(descendants(server.pid)))
+        assert workers[1] in replaced
+        assert wait_for(lambda: httpx.get(f"http://127.0.0.1:{port}/").status_code == 200)
+
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+        assert "已就緒" in server.stdout.read()
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from gateway.ratelimit import MemoryRateLimitStore, RateLimiter, RateLimitExceeded, RateLimitStore, RedisRateLimitStore, parse_rate
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenStore(RateLimitStore):
+    async def incr(self, key, amount, ttl):
+        raise ConnectionError("redis 無法連線")
+
+
+def test_parse_rate():
+    """測試 "次數/單位" 形式的限制解析。"""
+    assert parse_rate("100/minute") == (100, 60)
+    assert parse_rate("10/seconds") == (10, 1)
+    with pytest.raises(ValueError):
+        parse_rate("10/fortnight")
+
+
+def test_local_batches_reduce_store_round_trips():
+    """測試大多數請求只在本地 token bucket 扣除，每個批次才詢問一次共享儲存。"""
+    async def run():
+        limiter = RateLimiter(MemoryRateLimitStore(), batch=10)
+        for _ in range(100):
+            await limiter.hit("tenant_api:user", "t1:u1", "1000/minute")
+        return limiter.store_calls
+
+    assert asyncio.run(run()) == 10
+
+
+def test_shared_store_enforces_limit_across_workers():
+    """測試多個 worker 共用同一個儲存時，全域總數不超過限制。"""
+    async def run():
+        clock = FakeClock()
+        store = MemoryRateLimitStore(clock)
+        workers = [RateLimiter(store, batch=5, clock=clock) for _ in range(3)]
+        allowed = rejected = 0
+        for index in range(200):
+            try:
+                await workers[index % 3].hit("graphql:tenant", "t1", "50/minute")
+                allowed += 1
+            except RateLimitExceeded as e:
+                assert e.retry_after >= 1
+                rejected += 1
+
+        # 下一個視窗重新開始計數
+        clock.now += 60
+        await workers[0].hit("graphql:tenant", "t1", "50/minute")
+        return allowed, rejected
+
+    assert asyncio.run(run()) == (50, 150)
+
+
+def test_store_errors_fall_back_to_local_limit():
+    """測試共享儲存故障時退回進程內的限制，而不是拒絕或放行所有請求。"""
+    async def run():
+        limiter = RateLimiter(BrokenStore(), batch=1)
+        for _ in range(3):
+            await limiter.hit("tts:ip", "10.0.0.1", "3/minute")
+        with pytest.raises(RateLimitExceeded):
+            await limiter.hit("tts:ip", "10.0.0.1", "3/minute")
+        return limiter.store_errors
+
+    assert asyncio.run(run()) == 4
+
+
+def test_unresponsive_redis_times_out_and_falls_back():
+    """測試 Redis 接受連線但不回應時，租用在逾時內失敗並退回本地限制，而不是無限期等待。"""
+    pytest.importorskip("redis")
+
+    async def run():
+        async def hang(reader, writer):
+            await reader.read() # 讀取命令但永遠不回應
+
+        server = await asyncio.start_server(hang, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        limiter = RateLimiter(RedisRateLimitStore(f"redis://127.0.0.1:{port}/0", timeout=0.2), batch=1)
+        try:
+            await asyncio.wait_for(limiter.hit("tts:ip", "10.0.0.1", "3/minute"), timeout=5)
+            return limiter.store_errors
+        finally:
+            await limiter.aclose()
+            server.close()
+
+    assert asyncio.run(run()) == 1
+
+
+def test_weighted_hit_consumes_cost_tokens():
+    """測試批次請求以子請求數扣除配額，配額不足以支付整個批次時拒絕但保留剩餘配額。"""
+    async def run():
+        limiter = RateLimiter(MemoryRateLimitStore(clock=FakeClock()), batch=10, clock=FakeClock())
+        await limiter.hit("tenant_api:user", "t1:u1", "30/minute", cost=25)
+        with pytest.raises(RateLimitExceeded):
+            await limiter.hit("tenant_api:user", "t1:u1", "30/minute", cost=10)
+        for _ in range(5):
+            await limiter.hit("tenant_api:user", "t1:u1", "30/minute")
+        with pytest.raises(RateLimitExceeded):
+            await limiter.hit("tenant_api:user", "t1:u1", "30/minute")
+
+    asyncio.run(run())
@@ -0,0 +1,213 @@
+import asyncio
+
+import httpx
+import jwt
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from gateway.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyTracker, RetryBudget, UpstreamGuard, UpstreamUnavailable,
+)
+from gateway.streaming import send_streaming
+from gateway.upstream import LARAVEL_REST
+from main import app, upstream_guards
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_guard(**kwargs):
+    kwargs.setdefault("breaker_factory", lambda: CircuitBreaker(failure_threshold=3, reset_timeout=10.0))
+    return UpstreamGuard("laravel_rest", LatencyTracker(max_timeout=30.0), **kwargs)
+
+
+def test_circuit_breaker_opens_half_opens_and_closes():
+    """測試斷路器在連續失敗後開啟，重置逾時後只放行一個探測請求，探測成功後關閉。"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=5.0, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_after() == 5.0
+
+    clock.now += 5
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now += 5
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.opened == 2
+
+
+def test_idempotent_calls_retry_on_502_but_writes_do_not():
+    """測試冪等請求遇到 502 時重試並成功，非冪等請求不重試。"""
+    responses = []
+
+    async def send(timeout):
+        responses.append(timeout)
+        return httpx.Response(502 if len(responses) == 1 else 200)
+
+    async def scenario():
+        guard = make_guard()
+        ok = await guard.call(send, idempotent=True)
+        responses.clear()
+        failed = await guard.call(send, idempotent=False)
+        return guard, ok, failed
+
+    guard, ok, failed = asyncio.run(scenario())
+    assert ok.status_code == 200
+    assert failed.status_code == 502
+    assert responses == [30.0] # 樣本不足時使用固定逾時上限
+    assert guard.retries == 1
+
+
+def test_retry_budget_limits_retry_amplification():
+    """測試重試預算耗盡後不再重試。"""
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.5, min_per_second=0.0, max_tokens=1.0, clock=clock)
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_withdraw()
+
+
+def test_open_circuit_and_concurrency_limit_shed_load():
+    """測試斷路器開啟後不呼叫上游直接拋出 UpstreamUnavailable，並行已滿時同樣快速拒絕。"""
+    calls = []
+
+    async def failing(timeout):
+        calls.append(1)
+        raise httpx.ConnectError("refused")
+
+    async def slow(timeout):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    async def scenario():
+        guard = make_guard(max_retries=0)
+        for _ in range(3):
+            with pytest.raises(httpx.ConnectError):
+                await guard.call(failing, idempotent=True)
+        with pytest.raises(UpstreamUnavailable) as open_error:
+            await guard.call(failing)
+
+        limited = make_guard(max_concurrency=1)
+        results = await asyncio.gather(limited.call(slow), limited.call(slow), return_exceptions=True)
+        return guard, open_error.value, results
+
+    guard, open_error, results = asyncio.run(scenario())
+    assert len(calls) == 3
+    assert open_error.reason == "circuit_open" and guard.state() == OPEN
+    assert results[0].status_code == 200
+    assert isinstance(results[1], UpstreamUnavailable) and results[1].reason == "overloaded"
+
+
+def test_streamed_response_holds_concurrency_slot_until_body_is_closed():
+    """測試串流響應在標頭到達後仍佔用並行名額，直到主體讀完或被關閉才歸還。"""
+    async def body():
+        yield b"chunk-1"
+        yield b"chunk-2"
+
+    async def scenario():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        async with httpx.AsyncClient(transport=transport) as upstream:
+            guard = make_guard(max_concurrency=1)
+            send = lambda timeout: send_streaming(upstream, "GET", "http://laravel/articles", {}, None, timeout)
+            response = await guard.call(send)
+            in_flight_after_headers = guard.in_flight
+            with pytest.raises(UpstreamUnavailable) as overloaded:
+                await guard.call(send)
+            chunks = [chunk async for chunk in response.aiter_raw()]
+            in_flight_after_body = guard.in_flight
+
+            abandoned = await guard.call(send)
+            await abandoned.aclose()
+            await abandoned.aclose()
+            return in_flight_after_headers, overloaded.value, chunks, in_flight_after_body, guard.in_flight
+
+    in_flight_after_headers, overloaded, chunks, in_flight_after_body, in_flight_after_abandon = asyncio.run(scenario())
+    assert in_flight_after_headers == 1
+    assert overloaded.reason == "overloaded"
+    assert chunks == [b"chunk-1", b"chunk-2"]
+    assert in_flight_after_body == 0
+    assert in_flight_after_abandon == 0
+
+
+def test_adaptive_timeout_follows_latency_percentile():
+    """測試逾時依延遲百分位數調整，並限制在上下限之間。"""
+    tracker = LatencyTracker(max_timeout=30.0, min_timeout=0.5, percentile=0.99, multiplier=3.0, min_samples=20)
+    assert tracker.timeout() == 30.0
+    for _ in range(20):
+        tracker.observe(0.2)
+    assert tracker.timeout() == pytest.approx(0.6)
+    for _ in range(20):
+        tracker.observe(0.01)
+    assert tracker.timeout() == pytest.approx(0.6) # p99 仍落在較慢的樣本
+    for _ in range(200):
+        tracker.observe(0.01)
+    assert tracker.timeout() == 0.5
+
+
+def test_adaptive_timeout_is_per_route_and_backs_off_without_opening_breaker():
+    """測試快速路由縮短的逾時不影響其他路由與豁免路由；自適應逾時到期時逾時加倍，且不開啟斷路器。"""
+    clock = FakeClock()
+
+    def responding(seconds):
+        async def send(timeout):
+            clock.now += seconds
+            return httpx.Response(200)
+        return send
+
+    timeouts = []
+
+    async def timing_out(timeout):
+        timeouts.append(timeout)
+        raise httpx.ReadTimeout("slow")
+
+    async def scenario():
+        guard = make_guard(max_retries=0, exempt_routes=["reports/{reportType}/export"], clock=clock)
+        for _ in range(40):
+            await guard.call(responding(0.005), route="articles")
+        before = {route: guard.latency_for(route).timeout() for route in ("articles", "reports/user-activity", "reports/{reportType}/export")}
+        for _ in range(5):
+            with pytest.raises(httpx.ReadTimeout):
+                await guard.call(timing_out, route="articles")
+        return guard, before
+
+    guard, before = asyncio.run(scenario())
+    assert before == {"articles": 1.0, "reports/user-activity": 30.0, "reports/{reportType}/export": 30.0}
+    assert timeouts == [1.0, 2.0, 4.0, 8.0, 16.0]
+    assert guard.latency_for("articles").timeout() == 30.0
+    assert guard.state() == CLOSED and guard.adaptive_timeouts == 5
+
+
+@respx.mock
+def test_tenant_api_returns_503_when_circuit_is_open():
+    """測試 Laravel 持續返回 502 時斷路器開啟，之後的請求直接返回 503 與 Retry-After。"""
+    route = respx.get("http://mock-laravel:8000/tenant-routes/users").mock(return_value=httpx.Response(502))
+    token = jwt.encode({"sub": "u1", "tenant_id": "cw"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    headers = {"X-Tenant-ID": "cw", "Authorization": f"Bearer {token}"}
+    try:
+        statuses = [client.get("/tenant-api/users", headers=headers).status_code for _ in range(3)]
+        calls_before_open = route.call_count
+        rejected = client.get("/tenant-api/users", headers=headers)
+
+        assert statuses[0] == 502
+        assert rejected.status_code == 503
+        assert "Retry-After" in rejected.headers
+        assert route.call_count == calls_before_open
+    finally:
+        upstream_guards.get(LARAVEL_REST)._breakers.clear()
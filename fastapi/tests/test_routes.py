@@ -0,0 +1,47 @@
+import httpx
+import jwt
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from gateway.routes import InvalidEndpoint, RouteTemplates, UNMATCHED_ROUTE, checked_endpoint
+from main import app
+
+client = TestClient(app)
+
+
+def test_endpoints_normalize_to_laravel_route_templates():
+    """測試實際端點路徑被正規化為 Laravel 路由樣式，字面段優先於參數段。"""
+    routes = RouteTemplates()
+    assert routes.match("articles") == "articles"
+    assert routes.match("articles/search") == "articles/search"
+    assert routes.match("articles/42") == "articles/{article}"
+    assert routes.match("articles/42/publish") == "articles/{article}/publish"
+    assert routes.match("/articles/42/restore/7/") == "articles/{article}/restore/{snapshot}"
+    assert routes.match("reports/user-activity/export") == "reports/{reportType}/export"
+    assert routes.match("articles/42/unknown/path") == UNMATCHED_ROUTE
+
+
+def test_endpoints_cannot_leave_tenant_routes():
+    """測試端點不能以 . / .. 路徑段 (包括百分比編碼)、空路徑段或反斜線離開 /tenant-routes/。"""
+    assert checked_endpoint("/articles/42?page=2&next=../x") == "articles/42?page=2&next=../x"
+    assert checked_endpoint("articles/") == "articles/"
+    for endpoint in ("../api/system/tenants", "articles/../../api/system/tenants", "articles/./42", "articles//42",
+                     "%2e%2e/api/system/tenants", "articles%2F..%2F..%2Fapi", "articles/%5c..", "articles\\..", "articles/\n"):
+        with pytest.raises(InvalidEndpoint):
+            checked_endpoint(endpoint)
+
+
+@respx.mock
+def test_metrics_use_route_template_labels():
+    """測試 HTTP 指標使用路由樣式標籤，而不是包含 ID 的原始路徑。"""
+    token = jwt.encode({"sub": "u1", "tenant_id": "routes_tenant"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    respx.get(url__regex=r"http://mock-laravel:8000/tenant-routes/articles/\d+/history").mock(
+        return_value=httpx.Response(200, json=[])
+    )
+    for article_id in range(5):
+        client.get(f"/tenant-api/articles/{article_id}/history", headers={"Authorization": f"Bearer {token}"})
+
+    output = client.get("/metrics").text
+    assert 'fastapi_http_requests_total{method="GET",path="/tenant-api/articles/{article}/history",status="200"} 5' in output
+    assert "/tenant-api/articles/3/history" not in output
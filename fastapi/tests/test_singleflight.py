@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import httpx
+import jwt
+import pytest
+import respx
+
+from gateway.singleflight import SingleFlight, body_digest, route_matches, parse_route_patterns
+from main import app, settings
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    """測試相同鍵的並行呼叫只觸發一次上游請求，並統計合併比例。"""
+    flight = SingleFlight("laravel_rest")
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"data": [1, 2, 3]}
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do(("t1", "articles"), upstream) for _ in range(10)))
+        other = await flight.do(("t2", "articles"), upstream)
+        return results, other
+
+    results, other = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert all(result == {"data": [1, 2, 3]} for result, _ in results)
+    assert [shared for _, shared in results].count(False) == 1
+    assert other == ({"data": [1, 2, 3]}, False)
+    assert flight.leaders == 2 and flight.followers == 9
+    assert flight.coalescing_ratio == pytest.approx(9 / 11)
+    assert flight.in_flight() == 0
+
+
+def test_errors_fan_out_and_leader_cancellation_does_not_cancel_followers():
+    """測試上游錯誤會傳遞給所有等待者，且 leader 被取消時 follower 仍取得結果。"""
+    flight = SingleFlight("laravel_graphql")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("backend down")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def scenario():
+        outcomes = await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+
+        leader = asyncio.ensure_future(flight.do("k2", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k2", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("ok", True)
+
+    asyncio.run(scenario())
+
+
+def test_body_digest_and_route_patterns():
+    """測試主體摘要不受鍵順序影響，以及路由樣式比對。"""
+    assert body_digest({"query": "{ a }", "variables": {"x": 1, "y": 2}}) == body_digest({"variables": {"y": 2, "x": 1}, "query": "{ a }"})
+
+    patterns = parse_route_patterns("articles, articles/*")
+    assert route_matches("articles/5", patterns)
+    assert not route_matches("reports/articles-by-status/export", patterns)
+
+
+@respx.mock
+def test_gateway_coalesces_only_requests_of_the_same_user(monkeypatch):
+    """測試不同用戶同時送出的相同 GraphQL 查詢與 /tenant-api GET 不會共享上游響應，各自拿到自己的結果。"""
+    monkeypatch.setattr(settings, "SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+
+    async def whoami(request):
+        await asyncio.sleep(0.05) # 讓兩個請求在上游呼叫期間重疊
+        return httpx.Response(200, json={"data": {"me": {"token": request.headers["authorization"][-8:]}}})
+
+    respx.post("http://mock-laravel:8000/graphql").mock(side_effect=whoami)
+    respx.get("http://mock-laravel:8000/tenant-routes/articles").mock(side_effect=whoami)
+    tokens = [jwt.encode({"sub": user, "tenant_id": "flight"}, "test_jwt_secret_key_for_ci", algorithm="HS256") for user in ("u1", "u2")]
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as gateway:
+            graphql = await asyncio.gather(*(
+                gateway.post("/graphql", json={"query": "{ me { token } }"}, headers={"Authorization": f"Bearer {token}"}) for token in tokens
+            ))
+            rest = await asyncio.gather(*(
+                gateway.get("/tenant-api/articles", headers={"X-Tenant-ID": "flight", "Authorization": f"Bearer {token}"}) for token in tokens
+            ))
+        return graphql, rest
+
+    graphql, rest = asyncio.run(scenario())
+    for responses in (graphql, rest):
+        assert [json.loads(response.content)["data"]["me"]["token"] for response in responses] == [token[-8:] for token in tokens]
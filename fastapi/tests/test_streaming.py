@@ -0,0 +1,73 @@
+import gzip
+
+import httpx
+import jwt
+import respx
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+
+def auth_headers():
+    token = jwt.encode({"sub": "test_user_id", "tenant_id": "test_tenant_id"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+@respx.mock
+def test_streaming_preserves_csv_and_content_encoding():
+    """測試串流模式原樣轉發非 JSON 主體，並保留 content-type 與 content-encoding。"""
+    csv_body = "id,title\n" + "\n".join(f"{i},文章 {i}" for i in range(1000))
+    compressed = gzip.compress(csv_body.encode("utf-8"))
+    route = respx.get("http://mock-laravel:8000/tenant-routes/reports/articles-by-status/export").mock(
+        return_value=httpx.Response(
+            200,
+            content=compressed,
+            headers={"Content-Type": "text/csv; charset=utf-8", "Content-Encoding": "gzip"},
+        )
+    )
+
+    response = client.get("/tenant-api/reports/articles-by-status/export", headers={**auth_headers(), "Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == csv_body
+    assert route.calls.last.request.headers["accept-encoding"] == "gzip"
+
+
+@respx.mock
+def test_streaming_passes_through_no_content_and_error_status():
+    """測試串流模式保留 204 與上游錯誤狀態碼。"""
+    respx.delete("http://mock-laravel:8000/tenant-routes/articles/1").mock(return_value=httpx.Response(204))
+    respx.get("http://mock-laravel:8000/tenant-routes/articles/2").mock(
+        return_value=httpx.Response(404, json={"message": "Not Found"})
+    )
+
+    deleted = client.delete("/tenant-api/articles/1", headers=auth_headers())
+    assert deleted.status_code == 204
+    assert deleted.content == b""
+
+    missing = client.get("/tenant-api/articles/2", headers=auth_headers())
+    assert missing.status_code == 404
+    assert missing.json() == {"message": "Not Found"}
+
+
+@respx.mock
+def test_streaming_forwards_raw_request_body():
+    """測試請求主體以原始位元組轉發，不經過 JSON 解析與重新序列化。"""
+    raw_body = b'{"title":  "\\u6e2c\\u8a66", "content": "b"}'
+    route = respx.put("http://mock-laravel:8000/tenant-routes/articles/1").mock(
+        return_value=httpx.Response(200, json={"id": 1})
+    )
+
+    response = client.put(
+        "/tenant-api/articles/1",
+        headers={**auth_headers(), "Content-Type": "application/json"},
+        content=raw_body,
+    )
+
+    assert response.status_code == 200
+    assert route.calls.last.request.content == raw_body
+    assert route.calls.last.request.headers["x-tenant-id"] == "test_tenant_id"
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+
+import httpx
+import jwt
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from config.config import settings
+from gateway.events import SIGNATURE_HEADER, sign_payload
+from gateway.tenants import SUSPENDED, TenantRecord, TenantRegistry, TenantUnavailable, parse_backend_shards
+from main import app, tenant_admission, tenant_registry
+
+client = TestClient(app)
+
+
+def test_registry_routes_tenants_to_backend_pools():
+    """測試租戶依專屬 URL、後端池或預設後端路由，未知的後端池與不在允許清單中的專屬 URL 被拒絕。"""
+    registry = TenantRegistry(
+        "http://laravel:8000", shards=parse_backend_shards("pool-a=http://laravel-a:8000/, pool-b=http://laravel-b:8000"), allowed_backends=["http://acme-laravel:8000"]
+    )
+    registry.upsert(TenantRecord("cw", shard="pool-b"))
+    registry.upsert(TenantRecord("acme", backend_url="http://acme-laravel:8000/"))
+
+    assert registry.backend_for("cw") == "http://laravel-b:8000"
+    assert registry.backend_for("acme") == "http://acme-laravel:8000"
+    assert registry.backend_for("other") == "http://laravel:8000"
+    with pytest.raises(ValueError):
+        registry.upsert(TenantRecord("bad", shard="pool-z"))
+    with pytest.raises(ValueError):
+        registry.upsert(TenantRecord("evil", backend_url="https://attacker.example"))
+    registry.upsert(TenantRecord("pinned", backend_url="http://laravel-a:8000"))
+    assert registry.get("evil") is None and registry.backend_for("pinned") == "http://laravel-a:8000"
+
+
+def test_registry_rejects_suspended_and_unknown_tenants():
+    """測試已停用的租戶一律被拒絕，未註冊的租戶只在 enforce 模式下被拒絕。"""
+    registry = TenantRegistry("http://laravel:8000")
+    registry.upsert(TenantRecord("cw", status=SUSPENDED))
+    assert registry.check("unknown") is None
+    with pytest.raises(TenantUnavailable) as suspended:
+        registry.check("cw")
+
+    registry.enforce = True
+    with pytest.raises(TenantUnavailable) as unknown:
+        registry.check("unknown")
+    assert (suspended.value.reason, unknown.value.reason) == (SUSPENDED, "unknown")
+    assert registry.rejected == {"unknown": 1, SUSPENDED: 1}
+
+
+def test_snapshot_restores_registry_and_is_shared_between_workers(tmp_path):
+    """測試快照寫入後可在重新啟動時載入，其他 worker 在快照變更後重新載入。"""
+    path = str(tmp_path / "registry" / "tenants.json")
+    writer = TenantRegistry("http://laravel:8000", snapshot_path=path, allowed_backends=["http://laravel-b:8000"])
+    other_worker = TenantRegistry("http://laravel:8000", snapshot_path=path, reload_interval=0.0)
+    writer.upsert(TenantRecord("cw", name="天下", backend_url="http://laravel-b:8000", tier="premium"))
+
+    assert asyncio.run(writer.save_snapshot())
+    assert not asyncio.run(writer.save_snapshot()) # 沒有新的變更
+    restarted = TenantRegistry("http://laravel:8000", snapshot_path=path)
+    assert restarted.get("cw") == writer.get("cw")
+    assert other_worker.get("cw").name == "天下"
+
+
+def test_workers_merge_snapshots_and_see_changes_to_known_tenants(tmp_path):
+    """測試兩個 worker 各自寫入快照時不會刪除對方註冊的租戶，已知租戶被其他 worker 停用後也會重新載入。"""
+    path = str(tmp_path / "tenants.json")
+    first = TenantRegistry("http://laravel:8000", snapshot_path=path, reload_interval=0.0)
+    second = TenantRegistry("http://laravel:8000", snapshot_path=path, reload_interval=0.0)
+    first.upsert(TenantRecord("cw", updated_at=1.0))
+    second.upsert(TenantRecord("acme", updated_at=1.0))
+    assert asyncio.run(first.save_snapshot()) and asyncio.run(second.save_snapshot())
+    with open(path, encoding="utf-8") as handle:
+        assert sorted(item["tenant_id"] for item in json.load(handle)["tenants"]) == ["acme", "cw"]
+    assert second.get("cw") is not None and first.get("acme") is not None
+
+    second.upsert(TenantRecord("cw", status=SUSPENDED, updated_at=2.0))
+    assert asyncio.run(second.save_snapshot())
+    with pytest.raises(TenantUnavailable):
+        first.check("cw")
+
+
+def signed_webhook(path: str, payload: dict):
+    body = json.dumps(payload).encode("utf-8")
+    headers = {SIGNATURE_HEADER: sign_payload("tenants-secret", body, int(time.time())), "Content-Type": "application/json"}
+    return client.post(path, content=body, headers=headers)
+
+
+@respx.mock
+def test_tenant_init_webhook_populates_registry_for_routing(monkeypatch):
+    """測試簽章的 webhook 註冊的租戶立即路由到其後端與套用等級，停用後在閘道直接返回 403；未簽章或指向未知後端的請求被拒絕。"""
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "tenants-secret")
+    monkeypatch.setattr(tenant_registry, "allowed_backends", {*tenant_registry.allowed_backends, "http://tenant-b-laravel:8000"})
+    route = respx.get("http://tenant-b-laravel:8000/tenant-routes/articles/1").mock(return_value=httpx.Response(200, json={"id": 1}))
+    token = jwt.encode({"sub": "u1", "tenant_id": "registered"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+    headers = {"X-Tenant-ID": "registered", "Authorization": f"Bearer {token}"}
+    payload = {"tenant_id": "registered", "tenant_name": "Registered", "backend_url": "http://tenant-b-laravel:8000", "tier": "premium"}
+    try:
+        assert client.post("/webhook/tenant-init", json=payload).status_code == 401
+        assert signed_webhook("/webhook/tenant-init", {**payload, "backend_url": "https://attacker.example"}).status_code == 400
+        assert signed_webhook("/webhook/tenant-init", payload).status_code == 200
+        assert client.get("/tenant-api/articles/1", headers=headers).json() == {"id": 1}
+        assert tenant_admission.tier_for("registered").name == "premium"
+
+        signed_webhook("/webhook/tenant-init", {**payload, "status": SUSPENDED})
+        suspended = client.get("/tenant-api/articles/1", headers=headers)
+        assert suspended.status_code == 403
+        assert route.call_count == 1
+        assert signed_webhook("/webhook/tenant-init", {**payload, "backend_url": None, "shard": "missing"}).status_code == 400
+    finally:
+        tenant_registry._tenants.pop("registered", None)
+        tenant_admission.set_tenant_tier("registered", None)
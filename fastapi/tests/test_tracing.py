@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+import jwt
+import respx
+from fastapi.testclient import TestClient
+
+from config.config import settings
+from gateway.tracing import AUTH, KEEP_ERROR, KEEP_SAMPLED, KEEP_SLOW, UPSTREAM_CONNECT, UPSTREAM_TTFB, Tracer, current_trace, stage
+from gateway.upstream import LARAVEL_REST, UpstreamClients, UpstreamConfig
+from main import app, tracer
+
+client = TestClient(app)
+
+
+def test_head_and_tail_sampling_keep_sampled_slow_and_errored_requests():
+    """測試未取樣的快速請求被捨棄，慢請求與錯誤一律保留；沒有追蹤時階段量測不做任何事。"""
+    decisions = iter([True, False, False, False])
+    local = Tracer(slow_threshold=0.05, sampler=lambda: next(decisions))
+    exported = []
+    local.exporter = exported.append
+
+    with stage(AUTH):
+        pass
+    for status_code, sleep in ((200, 0), (200, 0), (200, 0.06), (502, 0)):
+        trace = local.start("GET", "/tenant-api/articles")
+        with stage(AUTH):
+            pass
+        if sleep:
+            asyncio.run(asyncio.sleep(sleep))
+        local.finish(trace, status_code)
+        assert current_trace() is None
+
+    assert [trace.kept for trace in local.recent()] == [KEEP_ERROR, KEEP_SLOW, KEEP_SAMPLED]
+    assert [trace.kept for trace in exported] == [KEEP_SLOW, KEEP_ERROR] # 頭部取樣的請求不另外匯出
+    assert local.dropped == 1 and local.stage_count[AUTH] == 4
+    assert local.recent(min_duration=0.05)[0].kept == KEEP_SLOW
+
+
+def test_upstream_connect_and_ttfb_stages_from_httpcore_events():
+    """測試共享上游客戶端在請求被追蹤時記錄連線與 TTFB 階段。"""
+    async def scenario():
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(0.02)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        upstreams = UpstreamClients([UpstreamConfig(LARAVEL_REST, http2=False)])
+        local = Tracer(sample_rate=1.0)
+        try:
+            await upstreams.get(LARAVEL_REST).get(f"http://127.0.0.1:{port}/up") # 未追蹤的請求不受影響
+            trace = local.start("GET", "/tenant-api/articles")
+            await upstreams.get(LARAVEL_REST).get(f"http://127.0.0.1:{port}/up")
+            local.finish(trace, 200)
+        finally:
+            await upstreams.aclose()
+            server.close()
+        return trace
+
+    totals = asyncio.run(scenario()).stage_totals()
+    assert set(totals) == {UPSTREAM_CONNECT, UPSTREAM_TTFB}
+    assert totals[UPSTREAM_TTFB] >= 0.015
+
+
+@respx.mock
+def test_debug_endpoint_lists_stage_timings(monkeypatch):
+    """測試 /debug/traces 預設關閉，啟用後列出保留的請求與各階段時間。"""
+    assert client.get("/debug/traces").status_code == 404
+    monkeypatch.setattr(settings, "TRACING_DEBUG_ENDPOINT", True)
+    monkeypatch.setattr(tracer, "slow_threshold", 0.0)
+    respx.get("http://mock-laravel:8000/tenant-routes/articles").mock(return_value=httpx.Response(200, json={"data": []}))
+    token = jwt.encode({"sub": "u1", "tenant_id": "tracing"}, "test_jwt_secret_key_for_ci", algorithm="HS256")
+
+    assert client.get("/tenant-api/articles", headers={"X-Tenant-ID": "tracing", "Authorization": f"Bearer {token}"}).status_code == 200
+    body = client.get("/debug/traces", params={"route": "/tenant-api/articles", "limit": 1}).json()
+
+    assert body["traces"][0]["status_code"] == 200
+    assert AUTH in {item["name"] for item in body["traces"][0]["stages"]}
+    assert body["stats"]["kept"][KEEP_SLOW] >= 1
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from gateway.tts import AudioCache, DISK_HIT, MEMORY_HIT, MISS, chunk_text, parse_byte_range, split_sentences, synthesis_key, synthesize_in_order
+from main import app, settings
+
+client = TestClient(app)
+
+GCP_TTS_URL = "https://texttospeech.googleapis.com/v1/text:synthesize"
+
+
+def payload(text):
+    return {"input": {"text": text}, "voice": {"languageCode": "zh-TW", "name": "cmn-TW-Wavenet-A"}, "audioConfig": {"audioEncoding": "MP3"}}
+
+
+def test_synthesis_key_is_content_addressed():
+    """測試快取鍵只取決於文本、語音與 audioConfig，且與鍵順序無關。"""
+    reordered = {"audioConfig": {"audioEncoding": "MP3"}, "voice": {"name": "cmn-TW-Wavenet-A", "languageCode": "zh-TW"}, "input": {"text": "你好"}}
+    assert synthesis_key(payload("你好")) == synthesis_key(reordered)
+    assert synthesis_key(payload("你好")) != synthesis_key(payload("再見"))
+
+
+def test_concurrent_misses_share_one_synthesis_and_disk_tier_survives_restart(tmp_path):
+    """測試同一文本的並行請求只合成一次，且新的快取實例 (重啟後) 從磁碟層命中。"""
+    calls = []
+
+    async def synthesize():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"ID3-audio"
+
+    async def scenario():
+        cache = AudioCache(disk_dir=str(tmp_path))
+        results = await asyncio.gather(*(cache.get_or_synthesize("a" * 64, synthesize) for _ in range(5)))
+        memory = await cache.get_or_synthesize("a" * 64, synthesize)
+        restarted = await AudioCache(disk_dir=str(tmp_path)).get("a" * 64)
+        return results, memory, restarted
+
+    results, memory, (restarted, restarted_state) = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(audio.data == b"ID3-audio" and state == MISS for audio, state in results)
+    assert memory[1] == MEMORY_HIT
+    assert restarted_state == DISK_HIT
+    assert open(restarted.path, "rb").read() == b"ID3-audio"
+
+
+def test_tiers_are_size_bounded(tmp_path):
+    """測試記憶體層與磁碟層在超過大小上限時淘汰最久未使用的條目。"""
+    async def scenario():
+        cache = AudioCache(memory_max_bytes=10, disk_dir=str(tmp_path), disk_max_bytes=25)
+        for name in "abc":
+            await cache.put(name * 64, name.encode() * 10)
+        return [(await cache.get(name * 64))[1] for name in "abc"]
+
+    states = asyncio.run(scenario())
+    assert states == [MISS, DISK_HIT, MEMORY_HIT]
+    assert not (tmp_path / "aa" / ("a" * 64)).exists()
+
+
+def test_parse_byte_range():
+    """測試 Range 標頭解析 (含後綴範圍與無法滿足的範圍)。"""
+    assert parse_byte_range("bytes=0-3", 10) == (0, 3)
+    assert parse_byte_range("bytes=5-", 10) == (5, 9)
+    assert parse_byte_range("bytes=-4", 10) == (6, 9)
+    assert parse_byte_range("bytes=0-1,4-5", 10) is None
+    with pytest.raises(ValueError):
+        parse_byte_range("bytes=20-", 10)
+
+
+@respx.mock
+def test_tts_endpoint_serves_cached_audio_with_range():
+    """測試 /tts 返回音訊 (非 base64 JSON)，重複請求命中快取，並支援 Range 與內容位址讀取。"""
+    audio = b"ID3" + bytes(range(97))
+    route = respx.post(f"{GCP_TTS_URL}?key=mock_gcp_api_key").mock(
+        return_value=httpx.Response(200, json={"audioContent": base64.b64encode(audio).decode()})
+    )
+    body = {"text": "快取測試文章。", "tenant_id": "cw"}
+
+    first = client.post("/tts", json=body)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "audio/mpeg"
+    assert first.headers["x-cache"] == "MISS"
+    assert first.content == audio
+
+    partial = client.post("/tts", json=body, headers={"Range": "bytes=0-2"})
+    assert partial.status_code == 206
+    assert partial.content == b"ID3"
+    assert partial.headers["content-range"] == "bytes 0-2/100"
+    assert partial.headers["x-cache"] == "MEMORY_HIT"
+
+    legacy = client.post("/tts", json=body, headers={"Accept": "application/json"})
+    assert base64.b64decode(legacy.json()["audioContent"]) == audio
+
+    by_address = client.get(first.headers["content-location"], headers={"Range": "bytes=-3"})
+    assert by_address.status_code == 206
+    assert by_address.content == audio[-3:]
+    assert route.call_count == 1
+    assert client.get("/tts/audio/" + "0" * 64).status_code == 404
+
+
+def test_chunk_text_splits_on_cjk_sentence_boundaries():
+    """測試中文標點 (含收尾引號) 的句子切分，以及第一個片段較短、其餘片段不超過上限。"""
+    text = "第一句話。他說：「引用。」第三句！English sentence. Pi is 3.14 ok? 最後一句"
+    assert split_sentences(text) == ["第一句話。", "他說：「引用。」", "第三句！", "English sentence. ", "Pi is 3.14 ok? ", "最後一句"]
+    assert "".join(split_sentences(text)) == text
+
+    chunks = chunk_text(text * 20, max_bytes=200, first_chunk_bytes=20)
+    assert chunks[0] == "第一句話。"
+    assert all(len(chunk.encode("utf-8")) <= 200 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == (text * 20).replace(" ", "")
+
+
+def test_synthesize_in_order_streams_first_chunk_before_slow_chunks_finish():
+    """測試片段並行合成 (受 semaphore 限制)，依原順序產出，且第一段不必等待整篇完成。"""
+    active, peak, finished = [0], [0], []
+
+    async def synthesize(chunk):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.001 if chunk == "c0" else 0.05)
+        active[0] -= 1
+        finished.append(chunk)
+        return b"ID3\x03\x00\x00\x00\x00\x00\x02xx" + chunk.encode()
+
+    async def scenario():
+        parts = synthesize_in_order([f"c{index}" for index in range(6)], synthesize, concurrency=3)
+        first = await parts.__anext__()
+        finished_before_first = list(finished)
+        rest = [part async for part in parts]
+        return first, finished_before_first, rest
+
+    first, finished_before_first, rest = asyncio.run(scenario())
+    assert finished_before_first == ["c0"]
+    assert first.endswith(b"c0")
+    assert rest == [f"c{index}".encode() for index in range(1, 6)] # 後續片段移除 ID3 標籤後直接串接
+    assert peak[0] == 3
+
+
+@respx.mock
+def test_long_form_tts_streams_concatenated_chunks():
+    """測試長文模式依句子分段呼叫 Google TTS，並串流依序串接的音訊。"""
+    def synthesize(request):
+        text = json.loads(request.content)["input"]["text"]
+        return httpx.Response(200, json={"audioContent": base64.b64encode(text.encode("utf-8")).decode()})
+
+    route = respx.post(f"{GCP_TTS_URL}?key=mock_gcp_api_key").mock(side_effect=synthesize)
+    text = "長文第一句。" + "這是一篇很長的文章內容。" * 40
+
+    with client.stream("POST", "/tts", json={"text": text, "tenant_id": "cw", "long_form": True}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/mpeg"
+        body = b"".join(response.iter_bytes())
+
+    assert int(response.headers["x-tts-chunks"]) == route.call_count > 1
+    assert body.decode("utf-8") == text
+
+
+@respx.mock
+def test_long_form_edge_cases_unpunctuated_text_empty_text_and_json_cache(monkeypatch):
+    """測試沒有標點的長文依位元組數硬切、空白文本返回 422，以及 JSON 長文結果寫入快取。"""
+    unpunctuated = "字" * 20000
+    chunks = chunk_text(unpunctuated, max_bytes=4500, first_chunk_bytes=300)
+    assert "".join(chunks) == unpunctuated
+    assert len(chunks) == 14 and all(len(chunk.encode("utf-8")) <= 4500 for chunk in chunks)
+
+    edge_client = TestClient(app, client=("10.0.0.10", 50000)) # 不與其他測試共用每個客戶端 IP 的 TTS 速率限制
+    assert edge_client.post("/tts", json={"text": "  \n ", "tenant_id": "cw", "long_form": True}).status_code == 422
+
+    monkeypatch.setattr(settings, "TTS_CACHE_ENABLED", True)
+    route = respx.post(f"{GCP_TTS_URL}?key=mock_gcp_api_key").mock(
+        side_effect=lambda request: httpx.Response(200, json={"audioContent": base64.b64encode(b"ID3" + bytes(7) + b"mp3").decode()})
+    )
+    payload = {"text": "JSON 長文第一句。第二句。", "tenant_id": "cw", "long_form": True}
+    first = edge_client.post("/tts", json=payload, headers={"Accept": "application/json"})
+    calls = route.call_count
+    second = edge_client.post("/tts", json=payload, headers={"Accept": "application/json"})
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json() and second.headers["x-cache"] != "MISS"
+    assert route.call_count == calls
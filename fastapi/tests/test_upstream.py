@@ -0,0 +1,55 @@
+import asyncio
+
+from gateway.upstream import UpstreamClients, UpstreamConfig, LARAVEL_REST, GCP_TTS
+
+
+def make_clients():
+    return UpstreamClients([
+        UpstreamConfig(LARAVEL_REST, max_connections=7, max_keepalive_connections=3, timeout=12.0, http2=False),
+        UpstreamConfig(GCP_TTS, max_connections=2),
+    ])
+
+
+def test_client_is_shared_per_upstream():
+    """測試同一上游在多次呼叫之間重複使用相同的連線池。"""
+    clients = make_clients()
+
+    async def scenario():
+        await clients.startup()
+        first = clients.get(LARAVEL_REST)
+        assert clients.get(LARAVEL_REST) is first
+        assert clients.get(GCP_TTS) is not first
+        await clients.aclose()
+        assert first.is_closed
+
+    asyncio.run(scenario())
+
+
+def test_client_uses_configured_limits_and_timeout():
+    """測試連線池限制與逾時設定來自上游配置。"""
+    clients = make_clients()
+
+    async def scenario():
+        client = clients.get(LARAVEL_REST)
+        assert client.timeout.read == 12.0
+        pool = client._transport._pool
+        assert pool._max_connections == 7
+        assert pool._max_keepalive_connections == 3
+        await clients.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_closed_client_is_rebuilt_lazily():
+    """測試在 lifespan 之外呼叫時，已關閉的客戶端會被重新建立。"""
+    clients = make_clients()
+
+    async def scenario():
+        first = clients.get(GCP_TTS)
+        await clients.aclose()
+        second = clients.get(GCP_TTS)
+        assert second is not first
+        assert not second.is_closed
+        await clients.aclose()
+
+    asyncio.run(scenario())
@@ -68,6 +68,64 @@ export default function TenantHome({ tenantId, tenantData }) {
     }
   }, [token, tenantId, currentLocale]); // 確保當 token、tenantId 或語言改變時都觸發
 
+  // 訂閱閘道的文章事件串流 (SSE)，文章狀態變更時重新獲取列表，取代輪詢
+  useEffect(() => {
+    if (!token || typeof EventSource === 'undefined') {
+      return;
+    }
+    // JWT 不放在 URL 中 (會出現在存取日誌)：每次連線先以 Bearer Token 換取短效、一次性的串流票證
+    let source = null;
+    let retryTimer = null;
+    let lastEventId = '';
+    let closed = false;
+
+    const connect = async () => {
+      try {
+        const response = await fetch(`${apiGatewayUrl}/events/ticket`, {
+          method: 'POST',
+          headers: { 'Authorization': `Bearer ${token}`, 'X-Tenant-ID': tenantId },
+        });
+        if (!response.ok) {
+          throw new Error(`${response.status}`);
+        }
+        const { ticket } = await response.json();
+        if (closed) {
+          return;
+        }
+        const resume = lastEventId ? `&last_event_id=${encodeURIComponent(lastEventId)}` : '';
+        source = new EventSource(
+          `${apiGatewayUrl}/events/stream?types=article.state_changed&ticket=${encodeURIComponent(ticket)}${resume}`
+        );
+        source.addEventListener('article.state_changed', (event) => {
+          lastEventId = event.lastEventId || lastEventId;
+          fetchArticles();
+        });
+        source.onerror = () => {
+          // 票證只能使用一次，瀏覽器的自動重連會被拒絕；改為取得新票證後重新連線並補齊錯過的事件
+          source.close();
+          scheduleReconnect();
+        };
+      } catch (e) {
+        scheduleReconnect();
+      }
+    };
+
+    const scheduleReconnect = () => {
+      if (!closed) {
+        retryTimer = setTimeout(connect, 3000);
+      }
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) {
+        source.close();
+      }
+    };
+  }, [token, tenantId, currentLocale]);
+
   const fetchToken = async () => {
     setNotification('');
     try {
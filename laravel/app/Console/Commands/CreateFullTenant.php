@@ -66,12 +66,20 @@ class CreateFullTenant extends Command
 
             # 步驟 2: 觸發 FastAPI 的 webhook
             $this->info("正在向 FastAPI 發送初始化 webhook...");
-            $response = Http::post($fastApiWebhookUrl, [
+            $body = json_encode([
                 'tenant_id' => $id,
                 'tenant_name' => $name,
                 'domain' => $domain,
                 'data' => $data,
             ]);
+            # 閘道只接受簽章的 webhook: t=<unix 秒>,v1=HMAC-SHA256(secret, "<t>." + body)
+            $headers = ['Content-Type' => 'application/json'];
+            $secret = env('FASTAPI_WEBHOOK_SECRET');
+            if ($secret) {
+                $timestamp = time();
+                $headers['X-OrbitPress-Signature'] = "t={$timestamp},v1=" . hash_hmac('sha256', "{$timestamp}.{$body}", $secret);
+            }
+            $response = Http::withHeaders($headers)->withBody($body, 'application/json')->post($fastApiWebhookUrl);
 
             if ($response->successful()) {
                 $this->info("FastAPI 初始化 webhook 成功。響應: " . $response->body());
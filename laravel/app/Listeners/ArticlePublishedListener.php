@@ -6,6 +6,7 @@ use App\Events\ArticlePublished;
 use App\Services\NotificationService;
 use Illuminate\Contracts\Queue\ShouldQueue;
 use Illuminate\Queue\InteractsWithQueue;
+use Illuminate\Support\Facades\Http;
 use Illuminate\Support\Facades\Log;
 
 class ArticlePublishedListener implements ShouldQueue
@@ -39,6 +40,27 @@ class ArticlePublishedListener implements ShouldQueue
             "您的團隊已發布文章 '{$article->title['zh_TW']}'。您可以在此處查看: [文章連結]"
         );
 
+        # 通知 FastAPI 閘道使此租戶的文章響應快取失效
+        $fastApiWebhookUrl = env('FASTAPI_ARTICLE_PUBLISHED_WEBHOOK_URL');
+        if ($fastApiWebhookUrl) {
+            $body = json_encode([
+                'tenant_id' => $article->tenant_id,
+                'article_id' => (string) $article->id,
+            ]);
+            # 簽章: t=<unix 秒>,v1=HMAC-SHA256(secret, "<t>." + body)，與閘道的 WEBHOOK_SECRET 相同
+            $headers = ['Content-Type' => 'application/json'];
+            $secret = env('FASTAPI_WEBHOOK_SECRET');
+            if ($secret) {
+                $timestamp = time();
+                $headers['X-OrbitPress-Signature'] = "t={$timestamp},v1=" . hash_hmac('sha256', "{$timestamp}.{$body}", $secret);
+            }
+            try {
+                Http::timeout(5)->withHeaders($headers)->withBody($body, 'application/json')->post($fastApiWebhookUrl);
+            } catch (\Exception $e) {
+                Log::warning("通知 FastAPI 文章發布失敗，文章 ID: {$article->id}：{$e->getMessage()}");
+            }
+        }
+
         # 範例：發送推送通知 (如果設備 token 可用)
         # $this->notificationService->sendFirebasePushNotification(
         #     ['some_device_token'],
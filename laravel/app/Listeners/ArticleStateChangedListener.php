@@ -0,0 +1,56 @@
+<?php
+
+namespace App\Listeners;
+
+use App\Models\Tenant\Article;
+use Illuminate\Contracts\Queue\ShouldQueue;
+use Illuminate\Queue\InteractsWithQueue;
+use Illuminate\Support\Facades\Http;
+use Illuminate\Support\Facades\Log;
+use Spatie\ModelStates\Events\StateChanged;
+
+class ArticleStateChangedListener implements ShouldQueue
+{
+    use InteractsWithQueue;
+
+    /**
+     * 將文章狀態變更 (草稿/審核/發布) 以簽章的 Webhook 送到 FastAPI 閘道，
+     * 由閘道推送給訂閱事件串流的客戶端，取代客戶端輪詢文章列表與歷史。
+     */
+    public function handle(StateChanged $event): void
+    {
+        if (! $event->model instanceof Article) {
+            return;
+        }
+
+        $webhookUrl = env('FASTAPI_ARTICLE_EVENTS_WEBHOOK_URL');
+        if (! $webhookUrl) {
+            return;
+        }
+
+        $article = $event->model;
+        $body = json_encode([
+            'tenant_id' => $article->tenant_id,
+            'type' => 'article.state_changed',
+            'article_id' => (string) $article->id,
+            'data' => [
+                'from' => $event->initialState ? $event->initialState->getValue() : null,
+                'to' => $event->finalState ? $event->finalState->getValue() : null,
+            ],
+        ]);
+
+        # 簽章: t=<unix 秒>,v1=HMAC-SHA256(secret, "<t>." + body)，與閘道的 WEBHOOK_SECRET 相同
+        $headers = ['Content-Type' => 'application/json'];
+        $secret = env('FASTAPI_WEBHOOK_SECRET');
+        if ($secret) {
+            $timestamp = time();
+            $headers['X-OrbitPress-Signature'] = "t={$timestamp},v1=" . hash_hmac('sha256', "{$timestamp}.{$body}", $secret);
+        }
+
+        try {
+            Http::timeout(5)->withHeaders($headers)->withBody($body, 'application/json')->post($webhookUrl);
+        } catch (\Exception $e) {
+            Log::warning("通知 FastAPI 文章狀態變更失敗，文章 ID: {$article->id}：{$e->getMessage()}");
+        }
+    }
+}
@@ -8,6 +8,8 @@ use Illuminate\Foundation\Support\Providers\EventServiceProvider as ServiceProvi
 use Illuminate\Support\Facades\Event;
 use App\Events\ArticlePublished;
 use App\Listeners\ArticlePublishedListener;
+use App\Listeners\ArticleStateChangedListener;
+use Spatie\ModelStates\Events\StateChanged;
 use App\Events\UserSubscribed; # 假設此事件也可能有監聽器
 
 class EventServiceProvider extends ServiceProvider
@@ -24,6 +26,9 @@ class EventServiceProvider extends ServiceProvider
         ArticlePublished::class => [
             ArticlePublishedListener::class,
         ],
+        StateChanged::class => [
+            ArticleStateChangedListener::class, # 文章狀態變更推送到閘道的事件串流
+        ],
         # UserSubscribed::class => [
         #     UserSubscribedListener::class, # 如果您為此創建監聽器
         # ],